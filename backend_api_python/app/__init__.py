@@ -138,6 +138,25 @@ def restore_running_strategies():
         # Do not raise; avoid breaking app startup.
 
 
+def start_engine_services(app: Flask):
+    """Start strategy loops and background workers (called once this process owns the engine role).
+
+    With ENGINE_SHARDS > 1 only shard 0 runs the global workers, and strategies are
+    assigned to shards by the shard manager instead of being restored all at once.
+    """
+    from app.services.engine import get_engine
+    engine = get_engine()
+    with app.app_context():
+        if not engine.shard_id:
+            start_pending_order_worker()
+            start_reflection_worker()
+        if engine.sharded:
+            from app.services.engine_shards import start_shard
+            engine.shard_manager = start_shard(engine.shard_id, engine.lock_path)
+        else:
+            restore_running_strategies()
+
+
 def create_app(config_name='default'):
     """
     Flask application factory.
@@ -158,12 +177,19 @@ def create_app(config_name='default'):
     
     from app.routes import register_routes
     register_routes(app)
+
+    # 异步回测任务是进程内线程：清理上次进程退出时遗留的 queued/running 记录
+    from app.services.backtest_jobs import fail_orphaned_jobs
+    fail_orphaned_jobs()
+
+    # gunicorn 多进程：各 worker 定期写指标快照，/metrics 合并输出
+    from app.utils.metrics import REGISTRY
+    REGISTRY.start_snapshot_writer()
     
-    # Startup hooks.
-    with app.app_context():
-        start_pending_order_worker()
-        start_reflection_worker()
-        restore_running_strategies()
+    # Startup hooks: background services run only in the elected engine process
+    # (gunicorn workers that lose the election serve HTTP and forward strategy start/stop over IPC).
+    from app.services.engine import get_engine
+    get_engine().start(on_elected=lambda: start_engine_services(app))
     
     return app
 
@@ -60,6 +60,24 @@ class BaseDataSource(ABC):
         Implementations may return a dict compatible with CCXT `fetch_ticker` shape (e.g. {'last': ...}).
         """
         raise NotImplementedError("get_ticker is not implemented for this data source")
+
+    def get_tickers(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get latest tickers for several symbols at once (best-effort).
+
+        Returns a dict keyed by the symbols exactly as passed in; symbols that failed are omitted.
+        The default implementation falls back to one `get_ticker` call per symbol; sources that
+        support a bulk endpoint should override it.
+        """
+        out: Dict[str, Dict[str, Any]] = {}
+        for symbol in symbols or []:
+            try:
+                ticker = self.get_ticker(symbol)
+                if ticker:
+                    out[symbol] = ticker
+            except Exception as e:
+                logger.warning(f"get_ticker failed for {symbol}: {e}")
+        return out
     
     def format_kline(
         self,
@@ -0,0 +1,347 @@
+"""
+本地K线列式存储
+
+按 (market, symbol, timeframe) 把已收盘的K线落盘为按月切分的 NumPy 结构化数组
+(`{root}/{market}/{symbol}/{timeframe}/{YYYY-MM}.npy`)，读取时使用 mmap。
+同目录下的 `coverage.json` 记录已经从远端完整拉取过的时间区间，读取时只对未覆盖的
+区间回源（DataSourceFactory.get_kline），因此对同一段历史的重复回测不再产生网络请求。
+
+说明：
+- 只落盘已收盘K线；最新一根未收盘K线每次都从远端获取，不写入存储。
+- 写入使用临时文件 + os.replace 原子替换；多进程并发写入时最坏情况是丢失一次合并，
+  对应区间会在下次读取时重新回源补齐，不会产生损坏文件。
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.data_sources.base import TIMEFRAME_SECONDS
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DEFAULT_STORE_DIR = os.path.join(_BASE_DIR, 'data', 'klines')
+
+CANDLE_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+# fetcher(limit, before_time) -> [{"time", "open", "high", "low", "close", "volume"}, ...]
+Fetcher = Callable[[int, Optional[int]], List[Dict[str, Any]]]
+
+
+def _safe_name(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(value or '').strip()) or '_'
+
+
+def _month_key(ts: int) -> str:
+    dt = datetime.utcfromtimestamp(int(ts))
+    return f"{dt.year:04d}-{dt.month:02d}"
+
+
+def _month_bounds(month: str) -> Tuple[int, int]:
+    """返回某月 [start, end) 的 Unix 时间戳（UTC）"""
+    year, mon = int(month[:4]), int(month[5:7])
+    start = int((datetime(year, mon, 1) - datetime(1970, 1, 1)).total_seconds())
+    if mon == 12:
+        year, mon = year + 1, 1
+    else:
+        mon += 1
+    end = int((datetime(year, mon, 1) - datetime(1970, 1, 1)).total_seconds())
+    return start, end
+
+
+def _iter_months(start_ts: int, end_ts: int) -> List[str]:
+    """[start_ts, end_ts) 覆盖的所有月份"""
+    months = []
+    if end_ts <= start_ts:
+        return months
+    month = _month_key(start_ts)
+    while True:
+        months.append(month)
+        _, month_end = _month_bounds(month)
+        if month_end >= end_ts:
+            break
+        month = _month_key(month_end)
+    return months
+
+
+def _merge_intervals(intervals: List[List[int]]) -> List[List[int]]:
+    merged = []
+    for start, end in sorted([int(a), int(b)] for a, b in intervals if int(b) > int(a)):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def to_klines(arr: np.ndarray) -> List[Dict[str, Any]]:
+    """结构化数组转为 K线 dict 列表（与数据源返回格式一致）"""
+    times = arr['time'].tolist()
+    opens = arr['open'].tolist()
+    highs = arr['high'].tolist()
+    lows = arr['low'].tolist()
+    closes = arr['close'].tolist()
+    volumes = arr['volume'].tolist()
+    return [
+        {'time': t, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for t, o, h, l, c, v in zip(times, opens, highs, lows, closes, volumes)
+    ]
+
+
+def _to_array(klines: List[Dict[str, Any]]) -> np.ndarray:
+    arr = np.empty(len(klines), dtype=CANDLE_DTYPE)
+    for i, k in enumerate(klines):
+        arr[i] = (
+            int(k['time']), float(k['open']), float(k['high']),
+            float(k['low']), float(k['close']), float(k.get('volume') or 0)
+        )
+    return arr
+
+
+def _dedupe_sorted(arr: np.ndarray) -> np.ndarray:
+    """按时间排序去重（相同时间保留最后写入的一条）"""
+    if len(arr) == 0:
+        return arr
+    order = np.argsort(arr['time'], kind='stable')
+    arr = arr[order]
+    keep = np.ones(len(arr), dtype=bool)
+    keep[:-1] = arr['time'][1:] != arr['time'][:-1]
+    return arr[keep]
+
+
+class CandleStore:
+    """本地K线存储（按月 .npy 文件 + 覆盖区间元数据）"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or (os.getenv('KLINE_STORE_DIR') or '').strip() or _DEFAULT_STORE_DIR
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # 路径 / 元数据
+    # ------------------------------------------------------------------
+
+    def _key_dir(self, market: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, _safe_name(market), _safe_name(symbol), _safe_name(timeframe))
+
+    def _month_path(self, key_dir: str, month: str) -> str:
+        return os.path.join(key_dir, f"{month}.npy")
+
+    def _load_coverage(self, key_dir: str) -> List[List[int]]:
+        path = os.path.join(key_dir, 'coverage.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return _merge_intervals(json.load(f).get('intervals') or [])
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            logger.warning(f"CandleStore: invalid coverage file {path}: {e}")
+            return []
+
+    def _save_coverage(self, key_dir: str, intervals: List[List[int]]) -> None:
+        os.makedirs(key_dir, exist_ok=True)
+        path = os.path.join(key_dir, 'coverage.json')
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'intervals': intervals, 'updated_at': int(time.time())}, f)
+        os.replace(tmp, path)
+
+    def missing_ranges(self, market: str, symbol: str, timeframe: str, start_ts: int, end_ts: int) -> List[Tuple[int, int]]:
+        """[start_ts, end_ts) 中尚未覆盖的区间"""
+        gaps = []
+        cursor = int(start_ts)
+        for a, b in self._load_coverage(self._key_dir(market, symbol, timeframe)):
+            if b <= cursor:
+                continue
+            if a >= end_ts:
+                break
+            if a > cursor:
+                gaps.append((cursor, min(a, end_ts)))
+            cursor = max(cursor, b)
+            if cursor >= end_ts:
+                break
+        if cursor < end_ts:
+            gaps.append((cursor, int(end_ts)))
+        return gaps
+
+    def mark_covered(self, market: str, symbol: str, timeframe: str, start_ts: int, end_ts: int) -> None:
+        if end_ts <= start_ts:
+            return
+        key_dir = self._key_dir(market, symbol, timeframe)
+        with self._lock:
+            intervals = self._load_coverage(key_dir)
+            intervals.append([int(start_ts), int(end_ts)])
+            self._save_coverage(key_dir, _merge_intervals(intervals))
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+
+    def read(self, market: str, symbol: str, timeframe: str, start_ts: int, end_ts: int) -> np.ndarray:
+        """读取 [start_ts, end_ts) 内已落盘的K线（结构化数组，按时间升序）"""
+        key_dir = self._key_dir(market, symbol, timeframe)
+        chunks = []
+        for month in _iter_months(int(start_ts), int(end_ts)):
+            path = self._month_path(key_dir, month)
+            if not os.path.exists(path):
+                continue
+            try:
+                data = np.load(path, mmap_mode='r')
+            except Exception as e:
+                logger.warning(f"CandleStore: failed to load {path}: {e}")
+                continue
+            times = data['time']
+            lo = int(np.searchsorted(times, start_ts, side='left'))
+            hi = int(np.searchsorted(times, end_ts, side='left'))
+            if hi > lo:
+                chunks.append(np.array(data[lo:hi]))
+        if not chunks:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        return np.concatenate(chunks)
+
+    def write(self, market: str, symbol: str, timeframe: str, klines: List[Dict[str, Any]]) -> int:
+        """合并写入已收盘K线，返回写入条数"""
+        tf_seconds = TIMEFRAME_SECONDS.get(timeframe)
+        if not klines or not tf_seconds:
+            return 0
+        closed_before = int(time.time()) // tf_seconds * tf_seconds
+        rows = [k for k in klines if int(k['time']) < closed_before]
+        if not rows:
+            return 0
+
+        arr = _to_array(rows)
+        key_dir = self._key_dir(market, symbol, timeframe)
+        months = np.array([_month_key(t) for t in arr['time'].tolist()])
+        with self._lock:
+            os.makedirs(key_dir, exist_ok=True)
+            for month in np.unique(months):
+                path = self._month_path(key_dir, month)
+                part = arr[months == month]
+                if os.path.exists(path):
+                    try:
+                        part = np.concatenate([np.load(path), part])
+                    except Exception as e:
+                        logger.warning(f"CandleStore: rewriting unreadable file {path}: {e}")
+                part = _dedupe_sorted(part)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, 'wb') as f:
+                    np.save(f, part)
+                os.replace(tmp, path)
+        return len(arr)
+
+    # ------------------------------------------------------------------
+    # 读穿（缺失区间回源补齐）
+    # ------------------------------------------------------------------
+
+    def get_range_array(
+        self,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        start_ts: int,
+        end_ts: int,
+        fetcher: Fetcher
+    ) -> np.ndarray:
+        """
+        获取 [start_ts, end_ts) 内的K线：先读本地，未覆盖的区间通过 fetcher 回源并落盘。
+
+        返回结果包含回源得到的未收盘K线（不落盘）。
+        """
+        tf_seconds = TIMEFRAME_SECONDS.get(timeframe)
+        if not tf_seconds:
+            return _to_array(fetcher(max(1, int(math.ceil((end_ts - start_ts) / 86400))), end_ts))
+
+        now = int(time.time())
+        closed_before = now // tf_seconds * tf_seconds
+        live_rows = []
+        for gap_start, gap_end in self.missing_ranges(market, symbol, timeframe, start_ts, end_ts):
+            reaches_now = gap_end > closed_before
+            limit = int(math.ceil((min(gap_end, now + tf_seconds) - gap_start) / tf_seconds)) + 2
+            try:
+                klines = fetcher(limit, None if reaches_now else gap_end)
+            except Exception as e:
+                logger.warning(f"CandleStore: remote fetch failed {market}:{symbol}:{timeframe}: {e}")
+                continue
+            if not klines:
+                continue
+            self.write(market, symbol, timeframe, klines)
+            if reaches_now:
+                live_rows.extend(k for k in klines if int(k['time']) >= closed_before)
+
+            # 覆盖区间只取实际返回的跨度 [最早, 最晚 + 周期)：分页中断、回退单页等情况下
+            # 条数不足并不代表远端没有更多数据，未返回的部分下次继续回源。
+            times = [int(k['time']) for k in klines]
+            self.mark_covered(market, symbol, timeframe, max(gap_start, min(times)),
+                              min(gap_end, closed_before, max(times) + tf_seconds))
+
+        arr = self.read(market, symbol, timeframe, start_ts, end_ts)
+        if live_rows:
+            live = _to_array([k for k in live_rows if start_ts <= int(k['time']) < end_ts])
+            arr = _dedupe_sorted(np.concatenate([arr, live]))
+        return arr
+
+    def get_kline(
+        self,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        limit: int,
+        before_time: Optional[int],
+        fetcher: Fetcher
+    ) -> List[Dict[str, Any]]:
+        """
+        与 DataSourceFactory.get_kline 语义一致：返回 before_time 之前（或最新）的 limit 条K线。
+
+        本地数据不足 limit 条（例如股票非交易时段较多）时退回到直接回源，并把结果落盘。
+        """
+        tf_seconds = TIMEFRAME_SECONDS.get(timeframe)
+        if not tf_seconds or limit <= 0:
+            return fetcher(limit, before_time)
+
+        end_ts = int(before_time) if before_time else int(time.time()) + tf_seconds
+        start_ts = end_ts - (int(limit) + 1) * tf_seconds
+        arr = self.get_range_array(market, symbol, timeframe, start_ts, end_ts, fetcher)
+        if len(arr) >= limit:
+            return to_klines(arr[-int(limit):])
+
+        klines = fetcher(limit, before_time)
+        if klines:
+            self.write(market, symbol, timeframe, klines)
+            closed_before = int(time.time()) // tf_seconds * tf_seconds
+            times = [int(k['time']) for k in klines]
+            self.mark_covered(market, symbol, timeframe, min(times), min(end_ts, closed_before, max(times) + tf_seconds))
+        return klines
+
+
+_store: Optional[CandleStore] = None
+_store_lock = threading.Lock()
+
+
+def candle_store_enabled() -> bool:
+    return str(os.getenv('KLINE_STORE_ENABLED', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_candle_store() -> Optional[CandleStore]:
+    """返回全局K线存储；KLINE_STORE_ENABLED=false 时返回 None"""
+    global _store
+    if not candle_store_enabled():
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CandleStore()
+    return _store
@@ -53,6 +53,39 @@ class CryptoDataSource(BaseDataSource):
         - BTCUSDT
         - BTC/USDT:USDT (swap-style suffix, will be normalized)
         """
+        return self.exchange.fetch_ticker(self.normalize_ticker_symbol(symbol))
+
+    def get_tickers(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Bulk tickers via CCXT `fetch_tickers` (one request for all symbols) when the exchange
+        supports it; otherwise falls back to per-symbol `fetch_ticker`.
+        """
+        if not symbols:
+            return {}
+        if not (getattr(self.exchange, 'has', None) or {}).get('fetchTickers'):
+            return super().get_tickers(symbols)
+
+        by_pair: Dict[str, List[str]] = {}
+        for symbol in symbols:
+            by_pair.setdefault(self.normalize_ticker_symbol(symbol), []).append(symbol)
+        try:
+            tickers = self.exchange.fetch_tickers(list(by_pair.keys())) or {}
+        except Exception as e:
+            logger.warning(f"fetch_tickers failed ({len(by_pair)} symbols), falling back to fetch_ticker: {e}")
+            return super().get_tickers(symbols)
+
+        out: Dict[str, Dict[str, Any]] = {}
+        for pair, originals in by_pair.items():
+            ticker = tickers.get(pair)
+            if not ticker:
+                continue
+            for symbol in originals:
+                out[symbol] = ticker
+        return out
+
+    @staticmethod
+    def normalize_ticker_symbol(symbol: str) -> str:
+        """BTCUSDT / btc/usdt:usdt -> BTC/USDT（CCXT 现货交易对写法）"""
         sym = (symbol or "").strip()
         if ":" in sym:
             sym = sym.split(":", 1)[0]
@@ -63,7 +96,7 @@ class CryptoDataSource(BaseDataSource):
                 sym = f"{sym[:-4]}/USDT"
             elif sym.endswith("USD") and len(sym) > 3:
                 sym = f"{sym[:-3]}/USD"
-        return self.exchange.fetch_ticker(sym)
+        return sym
     
     def get_kline(
         self,
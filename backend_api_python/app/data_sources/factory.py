@@ -2,13 +2,18 @@
 数据源工厂
 根据市场类型返回对应的数据源
 """
+import time
 from typing import Dict, List, Any, Optional
 
 from app.data_sources.base import BaseDataSource
 from app.utils.logger import get_logger
+from app.utils import metrics
 
 logger = get_logger(__name__)
 
+_GET_KLINE_SECONDS = metrics.histogram(
+    'qd_data_source_kline_seconds', 'Remote data source K-line fetch latency', ['market', 'outcome'])
+
 
 class DataSourceFactory:
     """数据源工厂"""
@@ -92,6 +97,7 @@ class DataSourceFactory:
         Returns:
             K线数据列表
         """
+        started = time.perf_counter()
         try:
             source = cls.get_source(market)
             klines = source.get_kline(symbol, timeframe, limit, before_time)
@@ -99,8 +105,10 @@ class DataSourceFactory:
             # 确保数据按时间排序
             klines.sort(key=lambda x: x['time'])
             
+            _GET_KLINE_SECONDS.labels(market, 'ok' if klines else 'empty').observe(time.perf_counter() - started)
             return klines
         except Exception as e:
+            _GET_KLINE_SECONDS.labels(market, 'error').observe(time.perf_counter() - started)
             logger.error(f"Failed to fetch K-lines {market}:{symbol} - {str(e)}")
             return []
 
@@ -1,14 +1,16 @@
 """
 Backtest API routes
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from datetime import datetime
 import traceback
+import hashlib
 import json
 import time
 import os
 
 from app.services.backtest import BacktestService
+from app.services.backtest_jobs import TERMINAL_STATUSES, get_backtest_job_manager, read_job_row
 from app.utils.logger import get_logger
 from app.utils.db import get_db_connection
 import requests
@@ -82,6 +84,95 @@ def _normalize_lang(lang: str | None) -> str:
     return l2 if l2 in supported else "zh-CN"
 
 
+def _parse_backtest_request(data: dict) -> dict:
+    """
+    Parse and validate common backtest request params (shared by /backtest and /backtest/sweep).
+
+    Raises:
+        ValueError: missing params or date range exceeds timeframe limit
+    """
+    user_id = int(data.get('userid') or data.get('userId') or 1)
+    indicator_code = data.get('indicatorCode', '')
+    indicator_id = data.get('indicatorId')
+    symbol = data.get('symbol', '')
+    market = data.get('market', '')
+    timeframe = data.get('timeframe', '1D')
+    start_date_str = data.get('startDate', '')
+    end_date_str = data.get('endDate', '')
+    initial_capital = float(data.get('initialCapital', 10000))
+    commission = float(data.get('commission', 0.001))
+    slippage = float(data.get('slippage', 0.0))
+    leverage = int(data.get('leverage', 1))
+    trade_direction = data.get('tradeDirection', 'long')  # long, short, both
+    strategy_config = data.get('strategyConfig') or {}
+
+    # If frontend only provides indicatorId, load code from local DB.
+    if (not indicator_code or not str(indicator_code).strip()) and indicator_id:
+        try:
+            iid = int(indicator_id)
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute("SELECT code FROM qd_indicator_codes WHERE id = ?", (iid,))
+                row = cur.fetchone()
+                cur.close()
+            if row and row.get('code'):
+                indicator_code = row.get('code')
+        except Exception:
+            pass
+
+    # 参数验证
+    if not all([indicator_code, symbol, market, timeframe, start_date_str, end_date_str]):
+        raise ValueError('Missing required parameters')
+
+    # 转换日期
+    # 开始日期：当天的 00:00:00
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+    # 结束日期：当天的 23:59:59，确保包含整天的数据
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+
+    # 验证时间范围限制
+    days_diff = (end_date - start_date).days
+
+    # 根据周期设置不同的时间限制
+    if timeframe == '1m':
+        max_days = 30  # 1分钟K线最多1个月
+        max_range_text = '1 month'
+    elif timeframe == '5m':
+        max_days = 180  # 5分钟K线最多6个月
+        max_range_text = '6 months'
+    elif timeframe in ['15m', '30m']:
+        max_days = 365  # 15分钟和30分钟K线最多1年
+        max_range_text = '1 year'
+    else:  # 1H, 4H, 1D, 1W
+        max_days = 1095  # 1小时及以上最多3年
+        max_range_text = '3 years'
+
+    if days_diff > max_days:
+        raise ValueError(
+            f'Backtest range exceeds limit: timeframe {timeframe} supports up to {max_range_text} '
+            f'({max_days} days), but you selected {days_diff} days'
+        )
+
+    return {
+        'user_id': user_id,
+        'indicator_code': indicator_code,
+        'indicator_id': indicator_id,
+        'symbol': symbol,
+        'market': market,
+        'timeframe': timeframe,
+        'start_date_str': start_date_str,
+        'end_date_str': end_date_str,
+        'start_date': start_date,
+        'end_date': end_date,
+        'initial_capital': initial_capital,
+        'commission': commission,
+        'slippage': slippage,
+        'leverage': leverage,
+        'trade_direction': trade_direction,
+        'strategy_config': strategy_config,
+    }
+
+
 @backtest_bp.route('/backtest', methods=['POST'])
 def run_backtest():
     """
@@ -97,7 +188,12 @@ def run_backtest():
         endDate: End date (YYYY-MM-DD)
         initialCapital: Initial capital (default 10000)
         commission: Commission rate (default 0.001)
+        useCache: Reuse a cached result for identical inputs and kline data (default true)
+        async: Queue the backtest as a background job and return the runId immediately
+               (poll /backtest/get or stream /backtest/progress for status)
     """
+    data = None
+    params = None
     try:
         data = request.get_json()
         if not data:
@@ -107,76 +203,34 @@ def run_backtest():
                 'data': None
             }), 400
         
-        # Extract params
-        user_id = int(data.get('userid') or data.get('userId') or 1)
-        indicator_code = data.get('indicatorCode', '')
-        indicator_id = data.get('indicatorId')
-        symbol = data.get('symbol', '')
-        market = data.get('market', '')
-        timeframe = data.get('timeframe', '1D')
-        start_date_str = data.get('startDate', '')
-        end_date_str = data.get('endDate', '')
-        initial_capital = float(data.get('initialCapital', 10000))
-        commission = float(data.get('commission', 0.001))
-        slippage = float(data.get('slippage', 0.0))
-        leverage = int(data.get('leverage', 1))
-        trade_direction = data.get('tradeDirection', 'long')  # long, short, both
-        strategy_config = data.get('strategyConfig') or {}
-        
-        # (Debug) log received params if needed
-        
-        # If frontend only provides indicatorId, load code from local DB.
-        if (not indicator_code or not str(indicator_code).strip()) and indicator_id:
-            try:
-                iid = int(indicator_id)
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    cur.execute("SELECT code FROM qd_indicator_codes WHERE id = ?", (iid,))
-                    row = cur.fetchone()
-                    cur.close()
-                if row and row.get('code'):
-                    indicator_code = row.get('code')
-            except Exception:
-                pass
+        params = _parse_backtest_request(data)
+        indicator_code = params['indicator_code']
+        symbol = params['symbol']
+        market = params['market']
+        timeframe = params['timeframe']
+        start_date = params['start_date']
+        end_date = params['end_date']
+        initial_capital = params['initial_capital']
+        commission = params['commission']
+        slippage = params['slippage']
+        leverage = params['leverage']
+        trade_direction = params['trade_direction']
+        strategy_config = params['strategy_config']
+        use_cache = data.get('useCache', True) is not False
 
-        # 参数验证
-        if not all([indicator_code, symbol, market, timeframe, start_date_str, end_date_str]):
+        if data.get('async'):
+            run_id = _persist_backtest_run(params, 'queued', '', None)
+            if not run_id:
+                raise RuntimeError('Failed to create backtest job')
+            get_backtest_job_manager(backtest_service).submit(run_id, {**params, 'use_cache': use_cache})
             return jsonify({
-                'code': 0,
-                'msg': 'Missing required parameters',
-                'data': None
-            }), 400
-        
-        # 转换日期
-        # 开始日期：当天的 00:00:00
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        # 结束日期：当天的 23:59:59，确保包含整天的数据
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-        
-        # 验证时间范围限制
-        days_diff = (end_date - start_date).days
-        
-        # 根据周期设置不同的时间限制
-        if timeframe == '1m':
-            max_days = 30  # 1分钟K线最多1个月
-            max_range_text = '1 month'
-        elif timeframe == '5m':
-            max_days = 180  # 5分钟K线最多6个月
-            max_range_text = '6 months'
-        elif timeframe in ['15m', '30m']:
-            max_days = 365  # 15分钟和30分钟K线最多1年
-            max_range_text = '1 year'
-        else:  # 1H, 4H, 1D, 1W
-            max_days = 1095  # 1小时及以上最多3年
-            max_range_text = '3 years'
-        
-        if days_diff > max_days:
-            return jsonify({
-                'code': 0,
-                'msg': f'Backtest range exceeds limit: timeframe {timeframe} supports up to {max_range_text} ({max_days} days), but you selected {days_diff} days',
-                'data': None
-            }), 400
-        
+                'code': 1,
+                'msg': 'Backtest queued',
+                'data': {
+                    'runId': run_id,
+                    'status': 'queued'
+                }
+            })
         
         # 执行回测
         result = backtest_service.run(
@@ -191,49 +245,12 @@ def run_backtest():
             slippage=slippage,
             leverage=leverage,
             trade_direction=trade_direction,
-            strategy_config=strategy_config
+            strategy_config=strategy_config,
+            use_cache=use_cache
         )
 
         # Persist backtest run for AI optimization / history
-        run_id = None
-        try:
-            now_ts = int(time.time())
-            with get_db_connection() as db:
-                cur = db.cursor()
-                cur.execute(
-                    """
-                    INSERT INTO qd_backtest_runs
-                    (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
-                     initial_capital, commission, slippage, leverage, trade_direction,
-                     strategy_config, status, error_message, result_json, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        user_id,
-                        int(indicator_id) if indicator_id is not None else None,
-                        market,
-                        symbol,
-                        timeframe,
-                        start_date_str,
-                        end_date_str,
-                        initial_capital,
-                        commission,
-                        slippage,
-                        leverage,
-                        trade_direction,
-                        json.dumps(strategy_config or {}, ensure_ascii=False),
-                        'success',
-                        '',
-                        json.dumps(result or {}, ensure_ascii=False),
-                        now_ts
-                    )
-                )
-                run_id = cur.lastrowid
-                db.commit()
-                cur.close()
-        except Exception:
-            # Do not break the main backtest response if persistence fails.
-            logger.warning("Failed to persist backtest run", exc_info=True)
+        run_id = _persist_backtest_run(params, 'success', '', result or {})
         
         return jsonify({
             'code': 1,
@@ -255,45 +272,28 @@ def run_backtest():
         logger.error(f"Backtest failed: {str(e)}")
         logger.error(traceback.format_exc())
         # Best-effort persist failed run (if we have enough context)
-        try:
-            data = data if isinstance(data, dict) else {}
-            user_id = int(data.get('userid') or data.get('userId') or 1)
-            indicator_id = data.get('indicatorId')
-            now_ts = int(time.time())
-            with get_db_connection() as db:
-                cur = db.cursor()
-                cur.execute(
-                    """
-                    INSERT INTO qd_backtest_runs
-                    (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
-                     initial_capital, commission, slippage, leverage, trade_direction,
-                     strategy_config, status, error_message, result_json, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        user_id,
-                        int(indicator_id) if indicator_id is not None else None,
-                        str(data.get('market', '') or ''),
-                        str(data.get('symbol', '') or ''),
-                        str(data.get('timeframe', '') or ''),
-                        str(data.get('startDate', '') or ''),
-                        str(data.get('endDate', '') or ''),
-                        float(data.get('initialCapital', 0) or 0),
-                        float(data.get('commission', 0) or 0),
-                        float(data.get('slippage', 0) or 0),
-                        int(data.get('leverage', 1) or 1),
-                        str(data.get('tradeDirection', 'long') or 'long'),
-                        json.dumps(data.get('strategyConfig') or {}, ensure_ascii=False),
-                        'failed',
-                        str(e),
-                        '',
-                        now_ts
-                    )
-                )
-                db.commit()
-                cur.close()
-        except Exception:
-            pass
+        if params is None:
+            try:
+                raw = data if isinstance(data, dict) else {}
+                params = {
+                    'user_id': int(raw.get('userid') or raw.get('userId') or 1),
+                    'indicator_id': raw.get('indicatorId'),
+                    'market': str(raw.get('market', '') or ''),
+                    'symbol': str(raw.get('symbol', '') or ''),
+                    'timeframe': str(raw.get('timeframe', '') or ''),
+                    'start_date_str': str(raw.get('startDate', '') or ''),
+                    'end_date_str': str(raw.get('endDate', '') or ''),
+                    'initial_capital': float(raw.get('initialCapital', 0) or 0),
+                    'commission': float(raw.get('commission', 0) or 0),
+                    'slippage': float(raw.get('slippage', 0) or 0),
+                    'leverage': int(raw.get('leverage', 1) or 1),
+                    'trade_direction': str(raw.get('tradeDirection', 'long') or 'long'),
+                    'strategy_config': raw.get('strategyConfig') or {},
+                }
+            except Exception:
+                params = None
+        if params is not None:
+            _persist_backtest_run(params, 'failed', str(e), None)
         return jsonify({
             'code': 0,
             'msg': f'Backtest failed: {str(e)}',
@@ -301,6 +301,389 @@ def run_backtest():
         }), 500
 
 
+@backtest_bp.route('/backtest/sweep', methods=['POST'])
+def run_backtest_sweep():
+    """
+    Parameter sweep backtest: fetch klines and run the indicator once,
+    then simulate every strategyConfig variant in a process pool.
+
+    Params:
+        (same as /backtest)
+        sweep: {
+            mode: 'grid' | 'random',
+            params: {'risk.stopLossPct': [0.02, 0.05], 'risk.trailing.pct': {'min': 0.01, 'max': 0.05, 'step': 0.01}},
+            samples: random search samples (default 50),
+            seed: random seed,
+            sortBy: metric to rank by (default totalReturn),
+            order: 'desc' | 'asc',
+            topN: return only the top N rows,
+            maxWorkers: process count
+        }
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'code': 0,
+                'msg': 'Request body is required',
+                'data': None
+            }), 400
+
+        params = _parse_backtest_request(data)
+        sweep = data.get('sweep') or {}
+        if not isinstance(sweep, dict):
+            raise ValueError('sweep must be an object')
+
+        result = backtest_service.run_sweep(
+            indicator_code=params['indicator_code'],
+            market=params['market'],
+            symbol=params['symbol'],
+            timeframe=params['timeframe'],
+            start_date=params['start_date'],
+            end_date=params['end_date'],
+            initial_capital=params['initial_capital'],
+            commission=params['commission'],
+            slippage=params['slippage'],
+            leverage=params['leverage'],
+            trade_direction=params['trade_direction'],
+            strategy_config=params['strategy_config'],
+            sweep=sweep
+        )
+
+        return jsonify({
+            'code': 1,
+            'msg': 'Sweep succeeded',
+            'data': result
+        })
+
+    except ValueError as e:
+        logger.warning(f"Invalid sweep parameters: {str(e)}")
+        return jsonify({
+            'code': 0,
+            'msg': str(e),
+            'data': None
+        }), 400
+    except Exception as e:
+        logger.error(f"Backtest sweep failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'code': 0,
+            'msg': f'Backtest sweep failed: {str(e)}',
+            'data': None
+        }), 500
+
+
+def _persist_backtest_run(params: dict, status: str, error_message: str, result: dict, run_type: str = 'single'):
+    """Insert a row into qd_backtest_runs and return its id (None on failure)."""
+    try:
+        now_ts = int(time.time())
+        indicator_id = params.get('indicator_id')
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                """
+                INSERT INTO qd_backtest_runs
+                (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
+                 initial_capital, commission, slippage, leverage, trade_direction,
+                 strategy_config, status, error_message, result_json, run_type, worker_pid, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    params.get('user_id') or 1,
+                    int(indicator_id) if indicator_id is not None else None,
+                    params.get('market') or '',
+                    params.get('symbol') or '',
+                    params.get('timeframe') or '',
+                    params.get('start_date_str') or '',
+                    params.get('end_date_str') or '',
+                    params.get('initial_capital'),
+                    params.get('commission'),
+                    params.get('slippage'),
+                    params.get('leverage'),
+                    params.get('trade_direction'),
+                    json.dumps(params.get('strategy_config') or {}, ensure_ascii=False),
+                    status,
+                    error_message or '',
+                    json.dumps(result, ensure_ascii=False) if result else '',
+                    run_type,
+                    os.getpid(),
+                    now_ts
+                )
+            )
+            run_id = cur.lastrowid
+            db.commit()
+            cur.close()
+        return run_id
+    except Exception:
+        # Do not break the main response if persistence fails.
+        logger.warning("Failed to persist backtest run", exc_info=True)
+        return None
+
+
+@backtest_bp.route('/backtest/walkForward', methods=['POST'])
+def run_backtest_walk_forward():
+    """
+    Walk-forward backtest: optimize strategyConfig on rolling in-sample windows,
+    validate on the following out-of-sample windows and stitch the OOS equity curve.
+
+    Params:
+        (same as /backtest)
+        walkForward: {
+            inSampleDays: in-sample window length (days, required),
+            outOfSampleDays: out-of-sample window length (days, required),
+            stepDays: roll step (days, default outOfSampleDays),
+            anchored: keep in-sample start fixed (expanding window),
+            sweep: parameter sweep spec (same as /backtest/sweep),
+            maxWorkers: process count
+        }
+    """
+    params = None
+    walk_forward = None
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'code': 0,
+                'msg': 'Request body is required',
+                'data': None
+            }), 400
+
+        params = _parse_backtest_request(data)
+        walk_forward = data.get('walkForward') or {}
+        if not isinstance(walk_forward, dict):
+            raise ValueError('walkForward must be an object')
+
+        result = backtest_service.run_walk_forward(
+            indicator_code=params['indicator_code'],
+            market=params['market'],
+            symbol=params['symbol'],
+            timeframe=params['timeframe'],
+            start_date=params['start_date'],
+            end_date=params['end_date'],
+            initial_capital=params['initial_capital'],
+            commission=params['commission'],
+            slippage=params['slippage'],
+            leverage=params['leverage'],
+            trade_direction=params['trade_direction'],
+            strategy_config=params['strategy_config'],
+            walk_forward=walk_forward
+        )
+
+        run_id = _persist_backtest_run(params, 'success', '', result, run_type='walk_forward')
+
+        return jsonify({
+            'code': 1,
+            'msg': 'Walk-forward backtest succeeded',
+            'data': {
+                'runId': run_id,
+                'result': result
+            }
+        })
+
+    except ValueError as e:
+        logger.warning(f"Invalid walk-forward parameters: {str(e)}")
+        return jsonify({
+            'code': 0,
+            'msg': str(e),
+            'data': None
+        }), 400
+    except Exception as e:
+        logger.error(f"Walk-forward backtest failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        if params:
+            _persist_backtest_run(params, 'failed', str(e), None, run_type='walk_forward')
+        return jsonify({
+            'code': 0,
+            'msg': f'Walk-forward backtest failed: {str(e)}',
+            'data': None
+        }), 500
+
+
+@backtest_bp.route('/backtest/portfolio', methods=['POST'])
+def run_backtest_portfolio():
+    """
+    Multi-symbol portfolio backtest with a shared capital pool.
+
+    Params:
+        (same as /backtest, except symbol)
+        symbols: list of symbols (or comma separated string), max BACKTEST_PORTFOLIO_MAX_SYMBOLS
+    """
+    params = None
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'code': 0,
+                'msg': 'Request body is required',
+                'data': None
+            }), 400
+
+        symbols = data.get('symbols') or []
+        if isinstance(symbols, str):
+            symbols = [x.strip() for x in symbols.split(',')]
+        symbols = [str(x).strip() for x in symbols if str(x).strip()]
+        if not symbols:
+            raise ValueError('symbols is required')
+
+        params = _parse_backtest_request({**data, 'symbol': ','.join(symbols)})
+
+        result = backtest_service.run_portfolio(
+            indicator_code=params['indicator_code'],
+            market=params['market'],
+            symbols=symbols,
+            timeframe=params['timeframe'],
+            start_date=params['start_date'],
+            end_date=params['end_date'],
+            initial_capital=params['initial_capital'],
+            commission=params['commission'],
+            slippage=params['slippage'],
+            leverage=params['leverage'],
+            trade_direction=params['trade_direction'],
+            strategy_config=params['strategy_config'],
+            max_workers=data.get('maxWorkers')
+        )
+
+        run_id = _persist_backtest_run(params, 'success', '', result, run_type='portfolio')
+
+        return jsonify({
+            'code': 1,
+            'msg': 'Portfolio backtest succeeded',
+            'data': {
+                'runId': run_id,
+                'result': result
+            }
+        })
+
+    except ValueError as e:
+        logger.warning(f"Invalid portfolio backtest parameters: {str(e)}")
+        return jsonify({
+            'code': 0,
+            'msg': str(e),
+            'data': None
+        }), 400
+    except Exception as e:
+        logger.error(f"Portfolio backtest failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        if params:
+            _persist_backtest_run(params, 'failed', str(e), None, run_type='portfolio')
+        return jsonify({
+            'code': 0,
+            'msg': f'Portfolio backtest failed: {str(e)}',
+            'data': None
+        }), 500
+
+
+def _progress_request_args():
+    """(run_id, user_id) from the query string; raises ValueError on bad input."""
+    try:
+        run_id = int(request.args.get('runId') or 0)
+        user_id = int(request.args.get('userid') or request.args.get('userId') or 1)
+    except Exception:
+        raise ValueError('invalid runId')
+    if not run_id:
+        raise ValueError('runId is required')
+    return run_id, user_id
+
+
+def _progress_event_id(payload: dict) -> str:
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+@backtest_bp.route('/backtest/status', methods=['GET'])
+def get_backtest_status():
+    """
+    Current async backtest job progress as plain JSON (polling alternative to /backtest/progress).
+
+    Query:
+        runId: Backtest run id (required)
+        userid: User ID (default 1)
+    """
+    try:
+        run_id, user_id = _progress_request_args()
+    except ValueError as e:
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 400
+    try:
+        p = get_backtest_job_manager(backtest_service).wait_progress(run_id, 0, timeout=0)
+        if p is None:
+            # Job runs in another worker process (or already finished): read persisted progress.
+            p = read_job_row(run_id, user_id)
+    except Exception as e:
+        logger.error(f"get_backtest_status failed: {e}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+    if p is None:
+        return jsonify({'code': 0, 'msg': 'run not found', 'data': None}), 404
+    return jsonify({'code': 1, 'msg': 'success', 'data': {k: v for k, v in p.items() if k != 'version'}})
+
+
+@backtest_bp.route('/backtest/progress', methods=['GET'])
+def stream_backtest_progress():
+    """
+    Stream async backtest job progress as Server-Sent Events.
+
+    Query:
+        runId: Backtest run id (required)
+        userid: User ID (default 1)
+
+    Each event is a JSON object: runId, status (queued/running/success/failed), stage,
+    barsProcessed, totalBars, trades, percent, error. The stream ends after a terminal
+    status, or after BACKTEST_SSE_MAX_SECONDS (default 5): with sync gunicorn workers every open
+    stream occupies a whole worker, so streams are kept short and the client reconnects
+    (EventSource does this automatically and sends Last-Event-ID, so unchanged progress is not
+    re-sent). Clients that cannot keep reconnecting can poll /backtest/status instead.
+    """
+    try:
+        run_id, user_id = _progress_request_args()
+    except ValueError as e:
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 400
+
+    try:
+        initial = read_job_row(run_id, user_id)
+    except Exception as e:
+        logger.error(f"stream_backtest_progress failed: {e}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+    if initial is None:
+        return jsonify({'code': 0, 'msg': 'run not found', 'data': None}), 404
+
+    manager = get_backtest_job_manager(backtest_service)
+    max_seconds = float(os.getenv('BACKTEST_SSE_MAX_SECONDS', '5') or 5)
+    poll_seconds = 1.0
+    last_event_id = request.headers.get('Last-Event-ID') or ''
+
+    def stream():
+        deadline = time.time() + max_seconds
+        last_version = 0
+        last_sent = None
+        yield "retry: 1000\n\n"
+        while True:
+            p = manager.wait_progress(run_id, last_version, timeout=poll_seconds)
+            local = p is not None
+            if local:
+                last_version = int(p.get('version') or 0)
+            else:
+                # Job runs in another worker process (or already finished): read persisted progress.
+                try:
+                    p = read_job_row(run_id, user_id) or initial
+                except Exception:
+                    p = last_sent or initial
+            payload = {k: v for k, v in p.items() if k != 'version'}
+            terminal = payload.get('status') in TERMINAL_STATUSES
+            if payload != last_sent:
+                last_sent = payload
+                event_id = _progress_event_id(payload)
+                # Reconnect with nothing new since the previous stream: skip the duplicate event
+                if event_id != last_event_id or terminal:
+                    yield f"id: {event_id}\ndata: " + json.dumps(payload, ensure_ascii=False) + "\n\n"
+            if terminal:
+                yield "event: done\ndata: {}\n\n"
+                return
+            if time.time() >= deadline:
+                return
+            if not local:
+                time.sleep(poll_seconds)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @backtest_bp.route('/backtest/history', methods=['POST'])
 def get_backtest_history():
     """
@@ -314,6 +697,7 @@ def get_backtest_history():
         symbol: Optional symbol filter
         market: Optional market filter
         timeframe: Optional timeframe filter
+        runType: Optional run type filter (single / walk_forward / portfolio)
     """
     try:
         data = request.get_json() or {}
@@ -327,6 +711,7 @@ def get_backtest_history():
         symbol = (data.get('symbol') or '').strip()
         market = (data.get('market') or '').strip()
         timeframe = (data.get('timeframe') or '').strip()
+        run_type = (data.get('runType') or '').strip()
 
         where = ["user_id = ?"]
         params = [user_id]
@@ -345,6 +730,9 @@ def get_backtest_history():
         if timeframe:
             where.append("timeframe = ?")
             params.append(timeframe)
+        if run_type:
+            where.append("run_type = ?")
+            params.append(run_type)
         where_sql = " AND ".join(where)
 
         with get_db_connection() as db:
@@ -354,7 +742,7 @@ def get_backtest_history():
                 SELECT id, user_id, indicator_id, market, symbol, timeframe,
                        start_date, end_date, initial_capital, commission, slippage,
                        leverage, trade_direction, strategy_config, status, error_message,
-                       created_at
+                       run_type, created_at
                 FROM qd_backtest_runs
                 WHERE {where_sql}
                 ORDER BY id DESC
@@ -402,7 +790,7 @@ def get_backtest_run():
                 SELECT id, user_id, indicator_id, market, symbol, timeframe,
                        start_date, end_date, initial_capital, commission, slippage,
                        leverage, trade_direction, strategy_config, status, error_message,
-                       result_json, created_at
+                       result_json, run_type, progress_json, created_at, updated_at
                 FROM qd_backtest_runs
                 WHERE id = ? AND user_id = ?
                 """,
@@ -423,6 +811,11 @@ def get_backtest_run():
         except Exception:
             row['result'] = {}
         row.pop('result_json', None)
+        try:
+            row['progress'] = json.loads(row.get('progress_json') or '{}')
+        except Exception:
+            row['progress'] = {}
+        row.pop('progress_json', None)
 
         return jsonify({'code': 1, 'msg': 'OK', 'data': row})
     except Exception as e:
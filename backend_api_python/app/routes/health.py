@@ -1,12 +1,24 @@
 """
 健康检查路由
 """
-from flask import Blueprint, jsonify
+import os
+from flask import Blueprint, Response, jsonify
 from datetime import datetime
 
+from app.services.engine import get_engine
+from app.utils.metrics import REGISTRY
+from app.utils.safe_exec import get_code_cache
+
 health_bp = Blueprint('health', __name__)
 
 
+def _engine_stats_timeout() -> float:
+    try:
+        return max(float(os.getenv('ENGINE_HEALTH_TIMEOUT_SEC', '2') or 2), 0.1)
+    except Exception:
+        return 2.0
+
+
 @health_bp.route('/', methods=['GET'])
 def index():
     """API 首页"""
@@ -20,14 +32,25 @@ def index():
 
 @health_bp.route('/health', methods=['GET'])
 def health_check():
-    """健康检查"""
-    return jsonify({
+    """健康检查（策略/行情相关状态来自引擎进程，web worker 经 IPC 查询；超过 ENGINE_HEALTH_TIMEOUT_SEC 则省略）"""
+    engine = get_engine()
+    payload = {
         'status': 'healthy',
-        'timestamp': datetime.now().isoformat()
-    })
+        'timestamp': datetime.now().isoformat(),
+        'indicatorCodeCache': get_code_cache().stats(),
+        'engine': engine.describe(),
+    }
+    payload.update(engine.executor_stats(timeout=_engine_stats_timeout()) or {})
+    return jsonify(payload)
 
 
 @health_bp.route('/api/health', methods=['GET'])
 def api_health_check():
     """兼容路径：用于容器健康检查/反代探针等场景。"""
     return health_check()
+
+
+@health_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式指标（gunicorn 多进程时合并各 worker 的快照）"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
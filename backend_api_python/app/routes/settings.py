@@ -73,6 +73,8 @@ CONFIG_SCHEMA = {
         'items': [
             {'key': 'DISABLE_RESTORE_RUNNING_STRATEGIES', 'label': '禁用自动恢复策略', 'type': 'boolean', 'default': 'False'},
             {'key': 'STRATEGY_TICK_INTERVAL_SEC', 'label': '策略Tick间隔(秒)', 'type': 'number', 'default': '10'},
+            {'key': 'STRATEGY_WORKER_THREADS', 'label': '策略调度工作线程数', 'type': 'number', 'default': '8'},
+            {'key': 'MARKET_STREAM_TRANSPORT', 'label': '行情推送方式', 'type': 'select', 'options': ['ws', 'rest', 'replay', 'off'], 'default': 'ws'},
             {'key': 'PRICE_CACHE_TTL_SEC', 'label': '价格缓存TTL(秒)', 'type': 'number', 'default': '10'},
         ]
     },
@@ -8,7 +8,8 @@ import time
 from app.services.strategy import StrategyService
 from app.services.strategy_compiler import StrategyCompiler
 from app.services.backtest import BacktestService
-from app import get_trading_executor
+from app.services.signal_trace import latency_summary
+from app.services.engine import EngineUnavailable, get_engine
 from app.utils.logger import get_logger
 from app.utils.db import get_db_connection
 from app.data_sources import DataSourceFactory
@@ -306,11 +307,15 @@ def stop_strategy():
         if strategy_type == 'PromptBasedStrategy':
             return jsonify({'code': 0, 'msg': 'AI strategy has been removed; local edition does not support starting/stopping AI strategies', 'data': None}), 400
 
-        # 指标策略
-        get_trading_executor().stop_strategy(strategy_id)
-        
-        # 更新策略状态
+        # 先持久化状态：引擎不可达（切换中 / 未启动）时，下一个引擎也不会再恢复该策略，
+        # 仍在运行的策略循环检查到状态后自行退出
         get_strategy_service().update_strategy_status(strategy_id, 'stopped')
+
+        # 指标策略（策略循环只在引擎进程中运行，web worker 经 IPC 转发）
+        try:
+            get_engine().stop_strategy(strategy_id)
+        except EngineUnavailable as e:
+            logger.warning(f"Strategy {strategy_id} marked stopped; engine unavailable: {e}")
         
         return jsonify({
             'code': 1,
@@ -356,8 +361,18 @@ def start_strategy():
         if strategy_type == 'PromptBasedStrategy':
             return jsonify({'code': 0, 'msg': 'AI strategy has been removed; local edition does not support starting AI strategies', 'data': None}), 400
 
-        # 指标策略
-        success = get_trading_executor().start_strategy(strategy_id)
+        # 指标策略（策略循环只在引擎进程中运行，web worker 经 IPC 转发）
+        try:
+            success = get_engine().start_strategy(strategy_id)
+        except EngineUnavailable as e:
+            # 不留下 'running' 记录，否则之后启动的引擎会恢复一个用户看到启动失败的策略
+            get_strategy_service().update_strategy_status(strategy_id, 'stopped')
+            logger.warning(f"Strategy {strategy_id} not started; engine unavailable: {e}")
+            return jsonify({
+                'code': 0,
+                'msg': f'Strategy engine unavailable: {str(e)}',
+                'data': None
+            }), 503
         
         if not success:
             # 如果启动失败，恢复状态
@@ -587,4 +602,29 @@ def get_strategy_notifications():
     except Exception as e:
         logger.error(f"get_strategy_notifications failed: {str(e)}")
         logger.error(traceback.format_exc())
-        return jsonify({'code': 0, 'msg': str(e), 'data': {'items': []}}), 500
\ No newline at end of file
+        return jsonify({'code': 0, 'msg': str(e), 'data': {'items': []}}), 500
+
+
+@strategy_bp.route('/strategies/latency', methods=['GET'])
+def get_signal_latency():
+    """
+    Signal latency breakdown (bar close -> emit -> enqueue -> claim -> dispatch -> exchange ack -> fill).
+
+    Query:
+      - id: strategy id (optional)
+      - hours: look-back window, default 24 (0 = all)
+
+    Returns p50/p95/p99/max in milliseconds per stage, overall and per exchange.
+    """
+    try:
+        strategy_id = request.args.get('id', type=int)
+        hours = request.args.get('hours', type=float)
+        if hours is None:
+            hours = 24.0
+        since_ts = int(time.time() - hours * 3600) if hours > 0 else None
+        data = latency_summary(since_ts=since_ts, strategy_id=strategy_id)
+        return jsonify({'code': 1, 'msg': 'success', 'data': data})
+    except Exception as e:
+        logger.error(f"get_signal_latency failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
@@ -1,15 +1,28 @@
 """
 回测服务
 """
+import copy
 import math
+import multiprocessing
+import os
+import random
+import threading
+import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from itertools import product
+from typing import Callable, Dict, List, Any, Optional, Tuple
 
 import pandas as pd
 import numpy as np
 
 from app.data_sources import DataSourceFactory
+from app.data_sources.base import TIMEFRAME_SECONDS
+from app.data_sources.candle_store import get_candle_store
+from app.services.backtest_cache import get_backtest_cache, kline_data_version
+from app.utils.indicator_sandbox import SandboxUnavailableError, get_indicator_sandbox
+from app.utils.safe_exec import get_code_cache, safe_exec_code
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -23,6 +36,15 @@ class BacktestService:
         '1m': 60, '5m': 300, '15m': 900, '30m': 1800,
         '1H': 3600, '4H': 14400, '1D': 86400, '1W': 604800
     }
+
+    # 撮合引擎：array（默认，数组版）/ legacy（iterrows 版，用于回归对比）
+    SIM_ENGINES = ('array', 'legacy')
+
+    # 可用于参数扫描排序的指标（与 _calculate_metrics 输出一致）
+    SWEEP_METRICS = (
+        'totalReturn', 'annualReturn', 'maxDrawdown', 'sharpeRatio', 'winRate',
+        'profitFactor', 'totalTrades', 'totalProfit', 'totalCommission'
+    )
     
     def run_code_strategy(
         self,
@@ -92,7 +114,10 @@ class BacktestService:
         slippage: float = 0.0,  # 理想回测环境，不考虑滑点
         leverage: int = 1,
         trade_direction: str = 'long',
-        strategy_config: Optional[Dict[str, Any]] = None
+        strategy_config: Optional[Dict[str, Any]] = None,
+        engine: Optional[str] = None,
+        use_cache: bool = True,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
     ) -> Dict[str, Any]:
         """
         运行回测
@@ -107,37 +132,831 @@ class BacktestService:
             initial_capital: 初始资金
             commission: 手续费率
             slippage: 滑点
+            engine: 撮合引擎 ('array' / 'legacy')，默认读取 BACKTEST_ENGINE
+            use_cache: 是否使用结果缓存（见 backtest_cache）
+            progress_callback: 进度回调，参数为 {'stage', 'barsProcessed', 'totalBars', 'trades'}
             
         Returns:
-            回测结果
+            回测结果（cached 字段表示是否命中缓存）
         """
         
+        def report(stage: str, bars: int = 0, total: int = 0, trade_count: int = 0) -> None:
+            if progress_callback is None:
+                return
+            try:
+                progress_callback({'stage': stage, 'barsProcessed': bars, 'totalBars': total, 'trades': trade_count})
+            except Exception as e:
+                logger.debug(f"Backtest progress callback failed: {e}")
+
         # 1. 获取K线数据
+        report('fetching')
         df = self._fetch_kline_data(market, symbol, timeframe, start_date, end_date)
         if df.empty:
             raise ValueError("回测日期范围内没有K线数据")
         
+        # 命中结果缓存则跳过指标执行与撮合（K线数据指纹参与缓存键，数据变化自动失效）
+        cache = get_backtest_cache() if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key({
+                'indicator_code': indicator_code,
+                'market': market,
+                'symbol': symbol,
+                'timeframe': timeframe,
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'initial_capital': initial_capital,
+                'commission': commission,
+                'slippage': slippage,
+                'leverage': leverage,
+                'trade_direction': trade_direction,
+                'strategy_config': strategy_config or {}
+            }, kline_data_version(df))
+            cached = cache.get(cache_key)
+            if cached is not None:
+                cached['cached'] = True
+                report('done', len(df), len(df), len(cached.get('trades') or []))
+                return cached
         
         # 2. 执行指标代码获取信号（传入回测参数）
+        report('indicator', 0, len(df))
         backtest_params = {
             'leverage': leverage,
             'initial_capital': initial_capital,
             'commission': commission,
             'trade_direction': trade_direction
         }
-        signals = self._execute_indicator(indicator_code, df, backtest_params)
+        # 执行失败直接抛出原始错误：沙箱超时、进程崩溃等可能是暂时性的，失败的结果不能按内容键写入缓存
+        signals = self._execute_indicator(indicator_code, df, backtest_params, raise_errors=True)
         
         # 3. 模拟交易
+        report('simulating', 0, len(df))
         equity_curve, trades, total_commission = self._simulate_trading(
-            df, signals, initial_capital, commission, slippage, leverage, trade_direction, strategy_config
+            df, signals, initial_capital, commission, slippage, leverage, trade_direction, strategy_config,
+            engine=engine,
+            progress_callback=(lambda i, n, t: report('simulating', i, n, t)) if progress_callback else None
         )
         
         # 4. 计算指标
         metrics = self._calculate_metrics(equity_curve, trades, initial_capital, timeframe, start_date, end_date, total_commission)
         
         # 5. 格式化结果
-        return self._format_result(metrics, equity_curve, trades)
+        result = self._format_result(metrics, equity_curve, trades)
+        if cache is not None:
+            cache.put(cache_key, result)
+        result['cached'] = False
+        report('done', len(df), len(df), len(trades))
+        return result
     
+    def run_sweep(
+        self,
+        indicator_code: str,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        start_date: datetime,
+        end_date: datetime,
+        initial_capital: float = 10000.0,
+        commission: float = 0.001,
+        slippage: float = 0.0,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        sweep: Optional[Dict[str, Any]] = None,
+        engine: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        参数扫描回测（网格 / 随机搜索）
+
+        K线只获取一次、指标只执行一次，然后把不同 strategy_config 组合的撮合模拟
+        分发到进程池并行计算，返回按指标排序的结果表。
+
+        Args:
+            strategy_config: 基础策略配置，扫描参数会覆盖其中对应字段
+            sweep: 扫描配置
+                - mode: 'grid'（默认）或 'random'
+                - params: {'risk.stopLossPct': [0.02, 0.05], 'scale.trendAdd.stepPct': {'min': 0.01, 'max': 0.05, 'step': 0.01}}
+                  键为 strategy_config 中的点分路径；值为候选列表，或 {min, max[, step]} 区间
+                - samples: 随机搜索采样次数（默认 50）
+                - seed: 随机种子
+                - sortBy: 排序指标（默认 totalReturn），order: 'desc'（默认）/ 'asc'
+                - topN: 返回前 N 条（默认全部）
+                - maxWorkers: 进程数（不超过 BACKTEST_SWEEP_WORKERS）
+
+        Returns:
+            {'mode', 'sortBy', 'order', 'totalCombinations', 'evaluated', 'failed', 'bars', 'elapsedSec', 'results': [...]}
+        """
+        started = time.time()
+        sweep = sweep or {}
+        sort_by = str(sweep.get('sortBy') or 'totalReturn')
+        if sort_by not in self.SWEEP_METRICS:
+            raise ValueError(f"Unsupported sortBy: {sort_by}")
+        order = str(sweep.get('order') or 'desc').strip().lower()
+        if order not in ('asc', 'desc'):
+            order = 'desc'
+
+        variants, total_combinations = self._build_sweep_variants(strategy_config, sweep)
+
+        # 1-2. 获取K线、执行指标（仅一次）
+        df, signals = self._prepare_backtest_data(
+            indicator_code, market, symbol, timeframe, start_date, end_date,
+            initial_capital, commission, leverage, trade_direction
+        )
+
+        # 3. 并行撮合
+        sim_ctx = {
+            'df': df,
+            'signals': signals,
+            'initial_capital': initial_capital,
+            'commission': commission,
+            'slippage': slippage,
+            'leverage': leverage,
+            'trade_direction': trade_direction,
+            'timeframe': timeframe,
+            'start_date': start_date,
+            'end_date': end_date,
+            'engine': engine,
+        }
+        outcomes = self._run_sim_variants(sim_ctx, [cfg for _, cfg in variants], sweep.get('maxWorkers'))
+
+        # 4. 排序
+        rows = []
+        for (params, _), outcome in zip(variants, outcomes):
+            row = {'rank': 0, 'params': params}
+            row.update(outcome)
+            rows.append(row)
+        ok_rows = [r for r in rows if 'error' not in r]
+        failed_rows = [r for r in rows if 'error' in r]
+        ok_rows.sort(key=lambda r: r.get(sort_by, 0), reverse=(order == 'desc'))
+        rows = ok_rows + failed_rows
+        for i, r in enumerate(rows):
+            r['rank'] = i + 1
+
+        top_n = int(sweep.get('topN') or 0)
+        if top_n > 0:
+            rows = rows[:top_n]
+
+        return {
+            'mode': str(sweep.get('mode') or 'grid').lower(),
+            'sortBy': sort_by,
+            'order': order,
+            'totalCombinations': total_combinations,
+            'evaluated': len(variants),
+            'failed': len(failed_rows),
+            'bars': len(df),
+            'elapsedSec': round(time.time() - started, 3),
+            'results': rows
+        }
+
+    def run_walk_forward(
+        self,
+        indicator_code: str,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        start_date: datetime,
+        end_date: datetime,
+        initial_capital: float = 10000.0,
+        commission: float = 0.001,
+        slippage: float = 0.0,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        walk_forward: Optional[Dict[str, Any]] = None,
+        engine: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Walk-forward 回测
+
+        把日期区间切分为滚动的 样本内(IS) / 样本外(OOS) 窗口：在每个 IS 窗口上用参数扫描
+        选出最优 strategy_config，再在紧随其后的 OOS 窗口上验证，最后把各 OOS 权益曲线
+        按复利拼接为一条曲线。K线只获取一次、指标只执行一次，各窗口从内存切片并在进程池中并行。
+
+        Args:
+            walk_forward: Walk-forward 配置
+                - inSampleDays: 样本内天数（必填）
+                - outOfSampleDays: 样本外天数（必填）
+                - stepDays: 窗口滚动步长，默认等于 outOfSampleDays（不能小于 outOfSampleDays）
+                - anchored: True 时样本内起点固定为回测开始日期（扩张窗口）
+                - sweep: 参数扫描配置，格式同 run_sweep 的 sweep（sortBy 为样本内择优指标）
+                - maxWorkers: 进程数
+
+        Returns:
+            与 run() 相同结构的结果（拼接后的 OOS 曲线与交易），并附带 walkForward 窗口明细
+        """
+        wf = walk_forward or {}
+        try:
+            is_days = float(wf.get('inSampleDays') or 0)
+            oos_days = float(wf.get('outOfSampleDays') or 0)
+            step_days = float(wf.get('stepDays') or oos_days)
+        except (TypeError, ValueError):
+            raise ValueError("walkForward.inSampleDays / outOfSampleDays / stepDays must be numbers")
+        if is_days <= 0 or oos_days <= 0:
+            raise ValueError("walkForward.inSampleDays and walkForward.outOfSampleDays are required")
+        if step_days < oos_days:
+            raise ValueError("walkForward.stepDays must be >= outOfSampleDays (OOS windows must not overlap)")
+        anchored = bool(wf.get('anchored'))
+
+        sweep = wf.get('sweep') or {}
+        sort_by = str(sweep.get('sortBy') or 'totalReturn')
+        if sort_by not in self.SWEEP_METRICS:
+            raise ValueError(f"Unsupported sortBy: {sort_by}")
+        order = str(sweep.get('order') or 'desc').strip().lower()
+        if order not in ('asc', 'desc'):
+            order = 'desc'
+        variants, _ = self._build_sweep_variants(strategy_config, sweep)
+
+        # 切分窗口（按日期），转换为K线下标区间 [start, end)
+        df, signals = self._prepare_backtest_data(
+            indicator_code, market, symbol, timeframe, start_date, end_date,
+            initial_capital, commission, leverage, trade_direction
+        )
+        windows = []
+        cursor = start_date
+        while True:
+            is_start = start_date if anchored else cursor
+            is_end = cursor + timedelta(days=is_days)
+            oos_end = min(is_end + timedelta(days=oos_days), end_date + timedelta(seconds=1))
+            if is_end >= end_date:
+                break
+            a, b, c = df.index.searchsorted([is_start, is_end, oos_end])
+            if b - a >= 2 and c - b >= 1:
+                windows.append({'isStart': int(a), 'isEnd': int(b), 'oosStart': int(b), 'oosEnd': int(c)})
+            cursor = cursor + timedelta(days=step_days)
+        if not windows:
+            raise ValueError("Date range is too short for the given walk-forward windows")
+
+        # 并行执行各窗口：IS 择优 + OOS 验证
+        sim_ctx = {
+            'df': df,
+            'signals': signals,
+            'initial_capital': initial_capital,
+            'commission': commission,
+            'slippage': slippage,
+            'leverage': leverage,
+            'trade_direction': trade_direction,
+            'timeframe': timeframe,
+            'engine': engine,
+            'configs': [cfg for _, cfg in variants],
+            'sort_by': sort_by,
+            'order': order,
+        }
+        outcomes = _pool_map(sim_ctx, _evaluate_walk_forward_window, windows, wf.get('maxWorkers'))
+
+        # 拼接 OOS 权益曲线（按复利缩放：每个窗口以上一窗口的期末权益为起点）
+        time_fmt = '%Y-%m-%d %H:%M'
+        equity_curve = []
+        trades = []
+        total_commission = 0.0
+        running = float(initial_capital)
+        window_rows = []
+        for i, (window, outcome) in enumerate(zip(windows, outcomes)):
+            row = {
+                'index': i,
+                'isStart': df.index[window['isStart']].strftime(time_fmt),
+                'isEnd': df.index[window['isEnd'] - 1].strftime(time_fmt),
+                'oosStart': df.index[window['oosStart']].strftime(time_fmt),
+                'oosEnd': df.index[window['oosEnd'] - 1].strftime(time_fmt),
+            }
+            if 'error' in outcome:
+                row['error'] = outcome['error']
+                window_rows.append(row)
+                continue
+
+            row['params'] = variants[outcome['bestIndex']][0]
+            row['isMetrics'] = outcome['isMetrics']
+            row['oosMetrics'] = outcome['oosMetrics']
+            window_rows.append(row)
+
+            factor = running / initial_capital if initial_capital else 1.0
+            for point in outcome['equityCurve']:
+                equity_curve.append({'time': point['time'], 'value': round(point['value'] * factor, 2)})
+            for trade in outcome['trades']:
+                scaled = dict(trade)
+                for key in ('amount', 'profit', 'balance'):
+                    scaled[key] = round(trade[key] * factor, 4 if key == 'amount' else 2)
+                scaled['window'] = i
+                trades.append(scaled)
+            total_commission += outcome['totalCommission'] * factor
+            if outcome['equityCurve']:
+                running = outcome['equityCurve'][-1]['value'] * factor
+
+        if not equity_curve:
+            raise ValueError("All walk-forward windows failed")
+
+        oos_start = df.index[windows[0]['oosStart']].to_pydatetime()
+        metrics = self._calculate_metrics(
+            equity_curve, trades, initial_capital, timeframe, oos_start, end_date, total_commission
+        )
+        result = self._format_result(metrics, equity_curve, trades)
+        result['walkForward'] = {
+            'inSampleDays': is_days,
+            'outOfSampleDays': oos_days,
+            'stepDays': step_days,
+            'anchored': anchored,
+            'sortBy': sort_by,
+            'order': order,
+            'combinations': len(variants),
+            'windows': window_rows
+        }
+        return result
+
+    def run_portfolio(
+        self,
+        indicator_code: str,
+        market: str,
+        symbols: List[str],
+        timeframe: str,
+        start_date: datetime,
+        end_date: datetime,
+        initial_capital: float = 10000.0,
+        commission: float = 0.001,
+        slippage: float = 0.0,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        max_workers: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        多标的组合回测（共享资金池）
+
+        同一指标在多个标的上运行：K线并发获取、指标在进程池中并行执行，然后把各标的K线
+        对齐到统一时间轴，在对齐后的矩阵上单次撮合（共享资金、逐仓保证金），输出组合权益、
+        回撤以及各标的收益归因。
+
+        Args:
+            symbols: 标的列表
+            strategy_config: 与单标的回测相同；组合模式支持 execution / risk / position.entryPct，
+                entryPct 为组合总资金的使用比例，按标的数等权分配（scale 加减仓规则不适用于组合模式）
+            max_workers: 指标执行进程数
+
+        Returns:
+            与 run() 相同结构的组合结果，并附带 portfolio 归因明细
+        """
+        symbols = [str(sym).strip() for sym in (symbols or []) if str(sym).strip()]
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            raise ValueError("symbols is required")
+        max_symbols = int(os.getenv('BACKTEST_PORTFOLIO_MAX_SYMBOLS', '50'))
+        if len(symbols) > max_symbols:
+            raise ValueError(f"Too many symbols: {len(symbols)} (max {max_symbols})")
+
+        # 1. 并发获取K线（IO 密集，使用线程）
+        frames = {}
+        with ThreadPoolExecutor(max_workers=min(8, len(symbols))) as pool:
+            futures = {
+                pool.submit(self._fetch_kline_data, market, sym, timeframe, start_date, end_date): sym
+                for sym in symbols
+            }
+            for fut in futures:
+                sym = futures[fut]
+                try:
+                    df = fut.result()
+                except Exception as e:
+                    logger.warning(f"Portfolio backtest: failed to fetch {sym}: {e}")
+                    continue
+                if df is not None and not df.empty:
+                    frames[sym] = df
+
+        missing = [sym for sym in symbols if sym not in frames]
+        symbols = [sym for sym in symbols if sym in frames]
+        if not symbols:
+            raise ValueError("回测日期范围内没有K线数据")
+
+        # 2. 并行执行指标（CPU 密集，使用进程池）
+        exec_ctx = {
+            'frames': frames,
+            'indicator_code': indicator_code,
+            'backtest_params': {
+                'leverage': leverage,
+                'initial_capital': initial_capital,
+                'commission': commission,
+                'trade_direction': trade_direction
+            }
+        }
+        outcomes = _pool_map(exec_ctx, _execute_portfolio_indicator, symbols, max_workers)
+        signals_by_symbol = {}
+        for sym, signals in zip(symbols, outcomes):
+            if isinstance(signals, dict) and signals:
+                signals_by_symbol[sym] = signals
+            else:
+                missing.append(sym)
+        symbols = [sym for sym in symbols if sym in signals_by_symbol]
+        if not symbols:
+            raise ValueError("Indicator execution failed: no valid signals produced")
+
+        # 3. 对齐后单次撮合
+        equity_curve, trades, total_commission, attribution = self._simulate_portfolio(
+            {sym: frames[sym] for sym in symbols}, signals_by_symbol, symbols,
+            initial_capital, commission, slippage, leverage, trade_direction, strategy_config
+        )
+
+        metrics = self._calculate_metrics(
+            equity_curve, trades, initial_capital, timeframe, start_date, end_date, total_commission
+        )
+        result = self._format_result(metrics, equity_curve, trades)
+        result['portfolio'] = {
+            'symbols': attribution,
+            'missingSymbols': missing,
+            'bars': len(equity_curve)
+        }
+        return result
+
+    def _simulate_portfolio(
+        self,
+        frames: Dict[str, pd.DataFrame],
+        signals_by_symbol: Dict[str, dict],
+        symbols: List[str],
+        initial_capital: float,
+        commission: float,
+        slippage: float,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None
+    ) -> tuple:
+        """
+        组合撮合：在对齐后的 (K线数 x 标的数) 矩阵上单次遍历。
+
+        资金模型：共享现金池 + 逐仓保证金。开仓占用 保证金 = 组合已实现资金 * entryPct / 标的数
+        （不超过可用现金），单个仓位最多亏损其保证金（触及爆仓线即强平）。
+        每根K线的止损/止盈/移动止盈/爆仓判断对所有标的做向量化掩码计算，只对触发的标的逐个处理。
+        止损 > 移动止盈 > 止盈 的优先级、信号执行时机与单标的引擎一致；同一根K线触及爆仓线时，
+        除非止损价位于爆仓线之前，否则按爆仓处理。
+
+        Returns:
+            (equity_curve, trades, total_commission, attribution)
+        """
+        cfg = strategy_config or {}
+        exec_cfg = cfg.get('execution') or {}
+        signal_timing = str(exec_cfg.get('signalTiming') or 'next_bar_open').strip().lower()
+        next_open = signal_timing in ['next_bar_open', 'next_open', 'nextopen', 'next']
+        risk_cfg = cfg.get('risk') or {}
+        trailing_cfg = risk_cfg.get('trailing') or {}
+        trailing_enabled = bool(trailing_cfg.get('enabled'))
+
+        lev = max(int(leverage or 1), 1)
+        stop_loss_pct_eff = float(risk_cfg.get('stopLossPct') or 0.0) / lev
+        take_profit_pct_eff = float(risk_cfg.get('takeProfitPct') or 0.0) / lev
+        trailing_pct_eff = float(trailing_cfg.get('pct') or 0.0) / lev
+        trailing_activation_pct_eff = float(trailing_cfg.get('activationPct') or 0.0) / lev
+        use_trailing = trailing_enabled and trailing_pct_eff > 0
+        use_take_profit = (not trailing_enabled) and take_profit_pct_eff > 0
+
+        pos_cfg = cfg.get('position') or {}
+        entry_pct_cfg = float(pos_cfg.get('entryPct') or 1.0)
+        if entry_pct_cfg > 1:
+            entry_pct_cfg = entry_pct_cfg / 100.0
+        entry_pct_cfg = max(0.0, min(entry_pct_cfg, 1.0)) or 1.0
+        min_capital_to_trade = 1.0
+
+        # --- 对齐到统一时间轴 ---
+        index = frames[symbols[0]].index
+        for sym in symbols[1:]:
+            index = index.union(frames[sym].index)
+        T, N = len(index), len(symbols)
+        O = np.full((T, N), np.nan)
+        H = np.full((T, N), np.nan)
+        L = np.full((T, N), np.nan)
+        C = np.full((T, N), np.nan)
+        sig = {name: np.zeros((T, N), dtype=bool) for name in ('open_long', 'close_long', 'open_short', 'close_short')}
+        td = str(trade_direction or 'both').lower()
+        for j, sym in enumerate(symbols):
+            df = frames[sym]
+            rows = index.get_indexer(df.index)
+            C[rows, j] = df['close'].to_numpy(dtype=float)
+            O[rows, j] = df['open'].to_numpy(dtype=float) if 'open' in df.columns else C[rows, j]
+            H[rows, j] = df['high'].to_numpy(dtype=float)
+            L[rows, j] = df['low'].to_numpy(dtype=float)
+            norm = self._normalize_signals(df, signals_by_symbol[sym], trade_direction)
+            for name, mat in sig.items():
+                if (td == 'long' and name.endswith('short')) or (td == 'short' and name.endswith('long')):
+                    continue
+                arr = np.asarray(pd.Series(norm[name]).fillna(False).astype(bool).to_numpy())
+                if next_open:
+                    # 信号在该标的自身的下一根K线开盘执行
+                    arr = np.insert(arr[:-1], 0, False)
+                mat[rows, j] = arr
+        OL, CL, OS, CS = sig['open_long'], sig['close_long'], sig['open_short'], sig['close_short']
+        # 估值价格：缺失K线沿用该标的最近收盘价
+        C_val = pd.DataFrame(C).ffill().to_numpy()
+
+        # --- 仓位状态（每个标的一列） ---
+        side = np.zeros(N, dtype=np.int8)  # 1=多, -1=空, 0=空仓
+        qty = np.zeros(N)
+        entry = np.zeros(N)
+        margin = np.zeros(N)
+        liq = np.zeros(N)
+        hi = np.zeros(N)
+        lo = np.zeros(N)
+        cash = float(initial_capital)
+        total_commission_paid = 0.0
+
+        attribution = [
+            {'symbol': sym, 'bars': int(len(frames[sym])), 'trades': 0, 'wins': 0, 'losses': 0,
+             'realizedPnl': 0.0, 'commission': 0.0}
+            for sym in symbols
+        ]
+        trades = []  # time 字段暂存K线下标，结束时统一格式化
+        equity_values = []
+
+        def _open(j: int, t: int, direction: int, base_price: float) -> None:
+            nonlocal cash, total_commission_paid
+            realized = cash + float(margin.sum())
+            alloc = min(realized * entry_pct_cfg / N, cash / (1 + lev * commission))
+            if alloc < min_capital_to_trade:
+                return
+            exec_price = base_price * (1 + slippage) if direction > 0 else base_price * (1 - slippage)
+            shares = alloc * lev / exec_price
+            fee = shares * exec_price * commission
+            cash -= alloc + fee
+            total_commission_paid += fee
+            side[j], qty[j], entry[j], margin[j] = direction, shares, exec_price, alloc
+            liq[j] = exec_price * (1 - 1.0 / lev) if direction > 0 else exec_price * (1 + 1.0 / lev)
+            hi[j] = lo[j] = exec_price
+            # 开仓手续费计入该标的的已实现盈亏，保证各标的归因之和等于组合总盈亏
+            attribution[j]['commission'] += fee
+            attribution[j]['realizedPnl'] -= fee
+            trades.append({
+                'time': t,
+                'symbol': symbols[j],
+                'type': 'open_long' if direction > 0 else 'open_short',
+                'price': round(exec_price, 4),
+                'amount': round(shares, 4),
+                'profit': 0,
+                'balance': round(cash + float(margin.sum()), 2)
+            })
+
+        def _close(j: int, t: int, trigger_price: float, trade_type: str) -> None:
+            nonlocal cash, total_commission_paid
+            if trade_type == 'liquidation':
+                exec_price, fee, profit = trigger_price, 0.0, -float(margin[j])
+            else:
+                exec_price = trigger_price * (1 - slippage) if side[j] > 0 else trigger_price * (1 + slippage)
+                fee = qty[j] * exec_price * commission
+                # 逐仓：单个仓位最多亏损其保证金
+                profit = max((exec_price - entry[j]) * qty[j] * side[j] - fee, -float(margin[j]))
+            cash += float(margin[j]) + profit
+            total_commission_paid += fee
+            attr = attribution[j]
+            attr['trades'] += 1
+            attr['realizedPnl'] += profit
+            attr['commission'] += fee
+            if profit > 0:
+                attr['wins'] += 1
+            elif profit < 0:
+                attr['losses'] += 1
+            amount = qty[j]
+            side[j], qty[j], entry[j], margin[j], liq[j], hi[j], lo[j] = 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+            trades.append({
+                'time': t,
+                'symbol': symbols[j],
+                'type': trade_type,
+                'price': round(float(exec_price), 4),
+                'amount': round(float(amount), 4),
+                'profit': round(float(profit), 2),
+                'balance': round(cash + float(margin.sum()), 2)
+            })
+
+        for t in range(T):
+            o, h, l, c = O[t], H[t], L[t], C[t]
+            valid = ~np.isnan(c)
+            held = (side != 0) & valid
+            exited = np.zeros(N, dtype=bool)
+
+            # --- 风控：止损 / 移动止盈 / 止盈 / 爆仓（向量化判断） ---
+            if held.any():
+                hi[held] = np.maximum(hi[held], h[held])
+                lo[held] = np.minimum(lo[held], l[held])
+                is_long = held & (side == 1)
+                is_short = held & (side == -1)
+                with np.errstate(invalid='ignore'):
+                    sl_px = np.where(is_long, entry * (1 - stop_loss_pct_eff), entry * (1 + stop_loss_pct_eff))
+                    tp_px = np.where(is_long, entry * (1 + take_profit_pct_eff), entry * (1 - take_profit_pct_eff))
+                    tr_px = np.where(is_long, hi * (1 - trailing_pct_eff), lo * (1 + trailing_pct_eff))
+                    hit_sl = np.zeros(N, dtype=bool)
+                    if stop_loss_pct_eff > 0:
+                        hit_sl = (is_long & (l <= sl_px)) | (is_short & (h >= sl_px))
+                    hit_tp = np.zeros(N, dtype=bool)
+                    if use_take_profit:
+                        hit_tp = (is_long & (h >= tp_px)) | (is_short & (l <= tp_px))
+                    hit_tr = np.zeros(N, dtype=bool)
+                    if use_trailing:
+                        active = held.copy()
+                        if trailing_activation_pct_eff > 0:
+                            active = (is_long & (hi >= entry * (1 + trailing_activation_pct_eff))) | \
+                                     (is_short & (lo <= entry * (1 - trailing_activation_pct_eff)))
+                        hit_tr = active & ((is_long & (l <= tr_px)) | (is_short & (h >= tr_px)))
+                    hit_liq = (is_long & (l <= liq)) | (is_short & (h >= liq))
+
+                for j in np.flatnonzero(hit_sl | hit_tp | hit_tr | hit_liq):
+                    name = 'long' if side[j] > 0 else 'short'
+                    # 触及爆仓线时，只有位于爆仓线之前的止损能先成交；否则按爆仓处理（保守）
+                    sl_before_liq = hit_sl[j] and ((sl_px[j] > liq[j]) if side[j] > 0 else (sl_px[j] < liq[j]))
+                    if hit_liq[j] and not sl_before_liq:
+                        _close(j, t, liq[j], 'liquidation')
+                    elif hit_sl[j]:
+                        _close(j, t, sl_px[j], f'close_{name}_stop')
+                    elif hit_tr[j]:
+                        _close(j, t, tr_px[j], f'close_{name}_trailing')
+                    else:
+                        _close(j, t, tp_px[j], f'close_{name}_profit')
+                    exited[j] = True
+
+                # --- 信号平仓 ---
+                exit_px = o if next_open else c
+                for j in np.flatnonzero(held & ~exited & (((side == 1) & CL[t]) | ((side == -1) & CS[t]))):
+                    _close(j, t, exit_px[j], 'close_long' if side[j] > 0 else 'close_short')
+
+            # --- 开仓（按标的顺序分配资金） ---
+            entry_px = o if next_open else c
+            for j in np.flatnonzero(valid & (side == 0) & ~exited & (OL[t] | OS[t])):
+                direction = 1 if OL[t, j] else -1
+                _open(j, t, direction, entry_px[j])
+                if side[j] == 0:
+                    continue
+                # 开仓当根K线的止损 / 爆仓检查（与单标的引擎一致）
+                if direction > 0:
+                    sl_price = entry[j] * (1 - stop_loss_pct_eff) if stop_loss_pct_eff > 0 else None
+                    hit_sl_j = sl_price is not None and l[j] <= sl_price
+                    hit_liq_j = l[j] <= liq[j]
+                    liq_first = hit_liq_j and (not hit_sl_j or sl_price <= liq[j])
+                else:
+                    sl_price = entry[j] * (1 + stop_loss_pct_eff) if stop_loss_pct_eff > 0 else None
+                    hit_sl_j = sl_price is not None and h[j] >= sl_price
+                    hit_liq_j = h[j] >= liq[j]
+                    liq_first = hit_liq_j and (not hit_sl_j or sl_price >= liq[j])
+                if liq_first:
+                    _close(j, t, liq[j], 'liquidation')
+                elif hit_sl_j:
+                    _close(j, t, sl_price, 'close_long_stop' if direction > 0 else 'close_short_stop')
+
+            # --- 组合权益：现金 + 各仓位(保证金 + 浮动盈亏)，单仓最低为 0 ---
+            open_mask = side != 0
+            total_value = cash
+            if open_mask.any():
+                upnl = (C_val[t, open_mask] - entry[open_mask]) * qty[open_mask] * side[open_mask]
+                total_value += float(np.maximum(margin[open_mask] + upnl, 0).sum())
+            equity_values.append(round(max(total_value, 0), 2))
+
+        # 回测结束时按最后收盘价强制平仓
+        last_t = T - 1
+        for j in np.flatnonzero(side != 0):
+            _close(j, last_t, C_val[last_t, j], 'close_long' if side[j] > 0 else 'close_short')
+        if equity_values:
+            equity_values[-1] = round(cash, 2)
+
+        time_strs = self._format_bar_times(index)
+        for trade in trades:
+            trade['time'] = time_strs[trade['time']]
+        equity_curve = [{'time': ts, 'value': v} for ts, v in zip(time_strs, equity_values)]
+
+        for attr in attribution:
+            closed = attr['wins'] + attr['losses']
+            attr['winRate'] = round(attr['wins'] / closed * 100, 2) if closed else 0
+            attr['realizedPnl'] = round(attr['realizedPnl'], 2)
+            attr['commission'] = round(attr['commission'], 2)
+            attr['contributionPct'] = round(attr['realizedPnl'] / initial_capital * 100, 2) if initial_capital else 0
+
+        return equity_curve, trades, total_commission_paid, attribution
+
+    def _build_sweep_variants(
+        self,
+        base_config: Optional[Dict[str, Any]],
+        sweep: Dict[str, Any]
+    ) -> Tuple[List[Tuple[Dict[str, Any], Dict[str, Any]]], int]:
+        """
+        根据扫描配置生成参数组合
+
+        Returns:
+            ([(params, strategy_config), ...], 网格总组合数)
+        """
+        params_spec = sweep.get('params') or {}
+        if not isinstance(params_spec, dict) or not params_spec:
+            raise ValueError("sweep.params is required (e.g. {'risk.stopLossPct': [0.02, 0.05]})")
+
+        max_combos = int(os.getenv('BACKTEST_SWEEP_MAX_COMBOS', '500'))
+        mode = str(sweep.get('mode') or 'grid').strip().lower()
+        if mode not in ('grid', 'random'):
+            raise ValueError(f"Unsupported sweep mode: {mode}")
+
+        keys = list(params_spec.keys())
+        grids = {}
+        for key in keys:
+            grids[key] = self._expand_sweep_values(key, params_spec[key])
+
+        total_combinations = 1
+        for key in keys:
+            values = grids[key]
+            total_combinations *= len(values) if values is not None else 0
+
+        if mode == 'grid':
+            if any(grids[k] is None for k in keys):
+                raise ValueError("Grid sweep requires a list or {min, max, step} for every parameter")
+            if total_combinations > max_combos:
+                raise ValueError(f"Sweep has {total_combinations} combinations, exceeds limit {max_combos}")
+            combos = [dict(zip(keys, values)) for values in product(*(grids[k] for k in keys))]
+        else:
+            samples = int(sweep.get('samples') or 50)
+            samples = max(1, min(samples, max_combos))
+            rng = random.Random(sweep.get('seed'))
+            if total_combinations and total_combinations <= samples:
+                # 离散空间小于采样数时直接退化为网格
+                combos = [dict(zip(keys, values)) for values in product(*(grids[k] for k in keys))]
+            else:
+                combos = []
+                for _ in range(samples):
+                    combo = {}
+                    for key in keys:
+                        if grids[key] is not None:
+                            combo[key] = rng.choice(grids[key])
+                        else:
+                            spec = params_spec[key]
+                            combo[key] = round(rng.uniform(float(spec['min']), float(spec['max'])), 6)
+                    combos.append(combo)
+
+        variants = []
+        for combo in combos:
+            cfg = copy.deepcopy(base_config or {})
+            for path, value in combo.items():
+                self._set_config_path(cfg, path, value)
+            variants.append((combo, cfg))
+        return variants, total_combinations
+
+    @staticmethod
+    def _expand_sweep_values(key: str, spec: Any) -> Optional[List[Any]]:
+        """把单个参数的扫描定义展开为候选值列表；连续区间（无 step）返回 None"""
+        if isinstance(spec, (list, tuple)):
+            if not spec:
+                raise ValueError(f"sweep.params.{key} is empty")
+            return list(spec)
+        if isinstance(spec, dict):
+            if 'min' not in spec or 'max' not in spec:
+                raise ValueError(f"sweep.params.{key} requires min and max")
+            lo, hi = float(spec['min']), float(spec['max'])
+            if hi < lo:
+                raise ValueError(f"sweep.params.{key}: max < min")
+            step = float(spec.get('step') or 0)
+            if step <= 0:
+                return None
+            count = int(math.floor((hi - lo) / step + 1e-9)) + 1
+            return [round(lo + i * step, 10) for i in range(count)]
+        return [spec]
+
+    @staticmethod
+    def _set_config_path(cfg: Dict[str, Any], path: str, value: Any) -> None:
+        """按点分路径写入 strategy_config，例如 'risk.trailing.pct'"""
+        parts = [p for p in str(path).split('.') if p]
+        if not parts:
+            raise ValueError(f"Invalid sweep parameter path: {path}")
+        node = cfg
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = {}
+                node[part] = child
+            node = child
+        node[parts[-1]] = value
+
+    def _run_sim_variants(
+        self,
+        sim_ctx: Dict[str, Any],
+        configs: List[Dict[str, Any]],
+        max_workers: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        在同一份K线与信号上并行执行多组撮合模拟，按输入顺序返回每组的指标（失败时为 {'error': ...}）。
+        """
+        return _pool_map(sim_ctx, _evaluate_sim_variant, configs, max_workers)
+
+    def _prepare_backtest_data(
+        self,
+        indicator_code: str,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        start_date: datetime,
+        end_date: datetime,
+        initial_capital: float,
+        commission: float,
+        leverage: int,
+        trade_direction: str
+    ) -> Tuple[pd.DataFrame, dict]:
+        """获取K线并执行指标，返回 (df, signals)，供参数扫描 / Walk-forward 复用"""
+        df = self._fetch_kline_data(market, symbol, timeframe, start_date, end_date)
+        if df.empty:
+            raise ValueError("回测日期范围内没有K线数据")
+
+        backtest_params = {
+            'leverage': leverage,
+            'initial_capital': initial_capital,
+            'commission': commission,
+            'trade_direction': trade_direction
+        }
+        signals = self._execute_indicator(indicator_code, df, backtest_params)
+        if not isinstance(signals, dict):
+            raise ValueError("Indicator execution failed: no valid signals produced")
+        return df, signals
+
     def _fetch_kline_data(
         self,
         market: str,
@@ -156,23 +975,34 @@ class BacktestService:
         before_time = int((end_date + timedelta(days=1)).timestamp())
         
         
-        # 获取数据
-        kline_data = DataSourceFactory.get_kline(
-            market=market,
-            symbol=symbol,
-            timeframe=timeframe,
-            limit=limit,
-            before_time=before_time
-        )
+        def fetcher(n: int, before: Optional[int]) -> List[Dict[str, Any]]:
+            return DataSourceFactory.get_kline(
+                market=market,
+                symbol=symbol,
+                timeframe=timeframe,
+                limit=n,
+                before_time=before
+            )
+
+        # 获取数据：优先读本地K线存储，只回源缺失区间
+        kline_data = None
+        store = get_candle_store()
+        if store is not None and timeframe in TIMEFRAME_SECONDS:
+            try:
+                # 多取一天以覆盖本地时区与 UTC 的偏差，下方再按日期过滤
+                start_ts = int(start_date.timestamp()) - 86400
+                arr = store.get_range_array(market, symbol, timeframe, start_ts, before_time, fetcher)
+                kline_data = {name: arr[name] for name in arr.dtype.names} if len(arr) else []
+            except Exception as e:
+                logger.warning(f"Kline store read failed, falling back to remote: {e}")
+                kline_data = None
+        if kline_data is None:
+            kline_data = fetcher(limit, before_time)
         
         if not kline_data:
             logger.warning("未获取到K线数据")
             return pd.DataFrame()
         
-        if kline_data:
-            first_time = datetime.fromtimestamp(kline_data[0]['time'])
-            last_time = datetime.fromtimestamp(kline_data[-1]['time'])
-        
         # 转换为DataFrame
         df = pd.DataFrame(kline_data)
         df['time'] = pd.to_datetime(df['time'], unit='s')
@@ -189,13 +1019,17 @@ class BacktestService:
         
         return df
     
-    def _execute_indicator(self, code: str, df: pd.DataFrame, backtest_params: dict = None):
+    def _execute_indicator(self, code: str, df: pd.DataFrame, backtest_params: dict = None, raise_errors: bool = False):
         """执行指标代码获取信号
         
         Args:
             code: 指标代码
             df: K线数据
             backtest_params: 回测参数字典（leverage, initial_capital, commission, trade_direction）
+            raise_errors: 代码执行失败（不安全、报错、超时、缺少信号列）时抛出异常，而不是返回全 0 的 pd.Series
+
+        Returns:
+            信号 dict；失败且 raise_errors=False 时返回全 0 的 pd.Series
         """
         # Supported indicator signal formats:
         # - Preferred (simple): df['buy'], df['sell'] as boolean
@@ -203,85 +1037,83 @@ class BacktestService:
         signals = pd.Series(0, index=df.index)
         
         try:
-            # 准备执行环境
-            local_vars = {
-                'df': df.copy(),
-                'open': df['open'],
-                'high': df['high'],
-                'low': df['low'],
-                'close': df['close'],
-                'volume': df['volume'],
-                'signals': signals,
-                'np': np,
-                'pd': pd,
-            }
-            
-            # 添加回测参数到执行环境（如果提供了）
-            if backtest_params:
-                local_vars['backtest_params'] = backtest_params
-                local_vars['leverage'] = backtest_params.get('leverage', 1)
-                local_vars['initial_capital'] = backtest_params.get('initial_capital', 10000)
-                local_vars['commission'] = backtest_params.get('commission', 0.0002)
-                local_vars['trade_direction'] = backtest_params.get('trade_direction', 'both')
-            
-            # 添加技术指标函数
-            local_vars.update(self._get_indicator_functions())
-            
-            # 添加安全的内置函数（保留完整的 builtins 以支持 lambda 等语法）
-            # 但移除危险的函数如 eval, exec, open 等
-            import builtins
-            
-            # 创建受限的 __import__ 函数，只允许导入已经加载的安全模块
-            def safe_import(name, *args, **kwargs):
-                """只允许导入 numpy, pandas, math, json 等安全模块"""
-                allowed_modules = ['numpy', 'pandas', 'math', 'json', 'datetime', 'time']
-                if name in allowed_modules or name.split('.')[0] in allowed_modules:
-                    return builtins.__import__(name, *args, **kwargs)
-                raise ImportError(f"不允许导入模块: {name}")
-            
-            safe_builtins = {k: getattr(builtins, k) for k in dir(builtins) 
-                           if not k.startswith('_') and k not in [
-                               'eval', 'exec', 'compile', 'open', 'input',
-                               'help', 'exit', 'quit',
-                               'copyright', 'credits', 'license'
-                           ]}
-            
-            # 添加受限的 __import__
-            safe_builtins['__import__'] = safe_import
-            
-            # 创建统一的执行环境（globals 和 locals 使用同一个字典）
-            # 这样函数内部才能访问到 np, pd 等变量
-            exec_env = local_vars.copy()
-            exec_env['__builtins__'] = safe_builtins
-            
-            # 预执行 import 语句，确保 np 和 pd 可用
-            pre_import_code = """
-import numpy as np
-import pandas as pd
-"""
-            exec(pre_import_code, exec_env)
-            
-            # 安全检查：验证代码不包含危险操作
-            from app.utils.safe_exec import validate_code_safety
-            is_safe, error_msg = validate_code_safety(code)
+            code_cache = get_code_cache()
+
+            # 安全检查：验证代码不包含危险操作（结论按代码哈希缓存）
+            is_safe, error_msg = code_cache.validate(code)
             if not is_safe:
                 logger.error(f"回测代码安全检查失败: {error_msg}")
                 raise ValueError(f"代码包含不安全操作: {error_msg}")
-            
-            # 安全执行用户代码（带超时）
-            from app.utils.safe_exec import safe_exec_code
-            exec_result = safe_exec_code(
-                code=code,
-                exec_globals=exec_env,
-                exec_locals=exec_env,
-                timeout=60  # 回测允许更长时间（60秒）
-            )
-            
-            if not exec_result['success']:
-                raise RuntimeError(f"代码执行失败: {exec_result['error']}")
-            
-            # Get the executed df
-            executed_df = exec_env.get('df', df)
+
+            # 回测参数（如果提供了）
+            param_vars = {}
+            if backtest_params:
+                param_vars['backtest_params'] = backtest_params
+                param_vars['leverage'] = backtest_params.get('leverage', 1)
+                param_vars['initial_capital'] = backtest_params.get('initial_capital', 10000)
+                param_vars['commission'] = backtest_params.get('commission', 0.0002)
+                param_vars['trade_direction'] = backtest_params.get('trade_direction', 'both')
+
+            # 只允许导入 numpy, pandas, math, json 等安全模块
+            allowed_modules = ('numpy', 'pandas', 'math', 'json', 'datetime', 'time')
+
+            sandbox = get_indicator_sandbox()
+            if sandbox is not None:
+                # 在沙箱进程中执行（真实的墙钟超时与内存上限）
+                try:
+                    executed_df, exec_env = sandbox.execute(
+                        code,
+                        df,
+                        env=param_vars,
+                        helpers='backtest',
+                        allowed_modules=allowed_modules,
+                        return_keys=('output',),
+                        timeout=60  # 回测允许更长时间（60秒）
+                    )
+                except SandboxUnavailableError as e:
+                    logger.warning(f"Indicator sandbox unavailable, executing in-process: {e}")
+                    sandbox = None
+            if sandbox is None:
+                # 准备执行环境
+                local_vars = {
+                    'df': df.copy(),
+                    'open': df['open'],
+                    'high': df['high'],
+                    'low': df['low'],
+                    'close': df['close'],
+                    'volume': df['volume'],
+                    'signals': signals,
+                    'np': np,
+                    'pd': pd,
+                }
+                local_vars.update(param_vars)
+                
+                # 添加技术指标函数
+                local_vars.update(self._get_indicator_functions())
+                
+                # 创建统一的执行环境（globals 和 locals 使用同一个字典）
+                # 这样函数内部才能访问到 np, pd 等变量
+                # 安全的内置函数：保留完整的 builtins 以支持 lambda 等语法，移除 eval, exec, open 等，
+                # __import__ 替换为白名单导入
+                exec_env = local_vars.copy()
+                exec_env['__builtins__'] = code_cache.safe_builtins(allowed_modules)
+                
+                # 预执行 import 语句，确保 np 和 pd 可用
+                exec(code_cache.compile("import numpy as np\nimport pandas as pd\n"), exec_env)
+                
+                # 安全执行用户代码（带超时）
+                exec_result = safe_exec_code(
+                    code=code_cache.compile(code),
+                    exec_globals=exec_env,
+                    exec_locals=exec_env,
+                    timeout=60  # 回测允许更长时间（60秒）
+                )
+                
+                if not exec_result['success']:
+                    raise RuntimeError(f"代码执行失败: {exec_result['error']}")
+                
+                # Get the executed df
+                executed_df = exec_env.get('df', df)
 
             # Validation: if chart signals are provided, df['buy']/df['sell'] must exist for backtest normalization.
             # This keeps indicator scripts simple and consistent (chart=buy/sell, execution=normalized in backend).
@@ -322,6 +1154,8 @@ import pandas as pd
         except Exception as e:
             logger.error(f"指标代码执行错误: {e}")
             logger.error(traceback.format_exc())
+            if raise_errors:
+                raise
         
         return signals
     
@@ -368,84 +1202,1285 @@ import pandas as pd
         def CROSSUNDER(series1, series2):
             return (series1 < series2) & (series1.shift(1) >= series2.shift(1))
         
-        return {
-            'SMA': SMA,
-            'EMA': EMA,
-            'RSI': RSI,
-            'MACD': MACD,
-            'BOLL': BOLL,
-            'ATR': ATR,
-            'CROSSOVER': CROSSOVER,
-            'CROSSUNDER': CROSSUNDER,
-        }
-    
-    def _simulate_trading(
-        self,
-        df: pd.DataFrame,
-        signals,
-        initial_capital: float,
-        commission: float,
-        slippage: float,
-        leverage: int = 1,
-        trade_direction: str = 'long',
-        strategy_config: Optional[Dict[str, Any]] = None
-    ) -> tuple:
-        """
-        模拟交易
+        return {
+            'SMA': SMA,
+            'EMA': EMA,
+            'RSI': RSI,
+            'MACD': MACD,
+            'BOLL': BOLL,
+            'ATR': ATR,
+            'CROSSOVER': CROSSOVER,
+            'CROSSUNDER': CROSSUNDER,
+        }
+    
+    def _simulate_trading(
+        self,
+        df: pd.DataFrame,
+        signals,
+        initial_capital: float,
+        commission: float,
+        slippage: float,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        engine: Optional[str] = None,
+        progress_callback: Optional[Callable[[int, int, int], None]] = None
+    ) -> tuple:
+        """
+        模拟交易
+        
+        Args:
+            signals: 信号，可以是 pd.Series (旧格式) 或 dict (新格式四种信号)
+            trade_direction: 交易方向
+                - 'long': 只做多 (buy->sell)
+                - 'short': 只做空 (sell->buy, 收益反向)
+                - 'both': 双向 (buy->sell做多 + sell->buy做空)
+            engine: 撮合引擎
+                - 'array': 数组版撮合核心（默认）
+                - 'legacy': 原 iterrows 版，结果与 array 逐位一致，用于回归对比
+            progress_callback: 撮合进度回调 (bars_processed, total_bars, trades_so_far)，仅 array 引擎支持
+        """
+        norm = self._normalize_signals(df, signals, trade_direction)
+
+        if self._resolve_engine(engine) == 'legacy':
+            return self._simulate_trading_new_format(df, norm, initial_capital, commission, slippage, leverage, trade_direction, strategy_config)
+        return self._simulate_trading_array(
+            df, norm, initial_capital, commission, slippage, leverage, trade_direction, strategy_config,
+            progress_callback=progress_callback
+        )
+
+    def _normalize_signals(self, df: pd.DataFrame, signals, trade_direction: str = 'long') -> dict:
+        """把 buy/sell 信号按交易方向归一化为四种信号（open/close long/short）；四向信号原样返回"""
+        # Normalize supported signal formats into 4-way signals.
+        if not isinstance(signals, dict):
+            raise ValueError("signals must be a dict (either 4-way or buy/sell).")
+
+        if all(k in signals for k in ['open_long', 'close_long', 'open_short', 'close_short']):
+            norm = signals
+        elif all(k in signals for k in ['buy', 'sell']):
+            buy = signals['buy'].fillna(False).astype(bool)
+            sell = signals['sell'].fillna(False).astype(bool)
+
+            td = (trade_direction or 'both')
+            td = str(td).lower()
+            if td not in ['long', 'short', 'both']:
+                td = 'both'
+
+            # Mapping rules:
+            # - long: buy=open_long, sell=close_long
+            # - short: sell=open_short, buy=close_short
+            # - both: buy=open_long+close_short, sell=open_short+close_long
+            if td == 'long':
+                norm = {
+                    'open_long': buy,
+                    'close_long': sell,
+                    'open_short': pd.Series([False] * len(df), index=df.index),
+                    'close_short': pd.Series([False] * len(df), index=df.index),
+                }
+            elif td == 'short':
+                norm = {
+                    'open_long': pd.Series([False] * len(df), index=df.index),
+                    'close_long': pd.Series([False] * len(df), index=df.index),
+                    'open_short': sell,
+                    'close_short': buy,
+                }
+            else:
+                norm = {
+                    'open_long': buy,
+                    'close_long': sell,
+                    'open_short': sell,
+                    'close_short': buy,
+                }
+        else:
+            raise ValueError("signals dict must contain either 4-way keys or buy/sell keys.")
+
+        return norm
+
+    def _resolve_engine(self, engine: Optional[str] = None) -> str:
+        """解析撮合引擎：显式参数优先，其次环境变量 BACKTEST_ENGINE，默认 array"""
+        name = str(engine or os.getenv('BACKTEST_ENGINE') or 'array').strip().lower()
+        if name not in self.SIM_ENGINES:
+            logger.warning(f"Unknown backtest engine '{name}', falling back to 'array'")
+            name = 'array'
+        return name
+
+    @staticmethod
+    def _format_bar_times(index) -> List[str]:
+        """将K线索引一次性格式化为 'YYYY-MM-DD HH:MM' 字符串列表"""
+        try:
+            return list(index.strftime('%Y-%m-%d %H:%M'))
+        except AttributeError:
+            return [ts.strftime('%Y-%m-%d %H:%M') for ts in index]
+    
+    def _simulate_trading_new_format(
+        self,
+        df: pd.DataFrame,
+        signals: dict,
+        initial_capital: float,
+        commission: float,
+        slippage: float,
+        leverage: int = 1,
+        trade_direction: str = 'both',
+        strategy_config: Optional[Dict[str, Any]] = None
+    ) -> tuple:
+        """
+        使用新格式四种信号进行交易模拟（支持仓位管理和加仓）
+        
+        Args:
+            trade_direction: 交易方向 ('long', 'short', 'both')
+        """
+        equity_curve = []
+        trades = []
+        total_commission_paid = 0
+        is_liquidated = False
+        liquidation_price = 0
+        min_capital_to_trade = 1.0  # 余额低于该值则视为赔光，不再开新单
+        
+        capital = initial_capital
+        position = 0  # 正数=多头持仓，负数=空头持仓
+        entry_price = 0  # 平均开仓价格
+        position_type = None  # 'long' or 'short'
+        
+        # 仓位管理相关
+        has_position_management = 'add_long' in signals and 'add_short' in signals
+        position_batches = []  # 存储每批持仓：[{'price': xxx, 'amount': xxx}, ...]
+
+        # --- Strategy config: signals + parameters = strategy (sent from BacktestModal as strategyConfig) ---
+        cfg = strategy_config or {}
+        exec_cfg = cfg.get('execution') or {}
+        # Signal confirmation / execution timing:
+        # - bar_close: execute on the same bar close (more aggressive)
+        # - next_bar_open: execute on next bar open after signal is confirmed on bar close (recommended, closer to live)
+        signal_timing = str(exec_cfg.get('signalTiming') or 'next_bar_open').strip().lower()
+        risk_cfg = cfg.get('risk') or {}
+        stop_loss_pct = float(risk_cfg.get('stopLossPct') or 0.0)
+        take_profit_pct = float(risk_cfg.get('takeProfitPct') or 0.0)
+        trailing_cfg = risk_cfg.get('trailing') or {}
+        trailing_enabled = bool(trailing_cfg.get('enabled'))
+        trailing_pct = float(trailing_cfg.get('pct') or 0.0)
+        trailing_activation_pct = float(trailing_cfg.get('activationPct') or 0.0)
+
+        # Risk percentages are defined on margin PnL; convert to price move thresholds by leverage.
+        lev = max(int(leverage or 1), 1)
+        stop_loss_pct_eff = stop_loss_pct / lev
+        take_profit_pct_eff = take_profit_pct / lev
+        trailing_pct_eff = trailing_pct / lev
+        trailing_activation_pct_eff = trailing_activation_pct / lev
+
+        # Conflict rule (TP vs trailing):
+        # - If trailing is enabled, it takes precedence.
+        # - If activationPct is not provided, reuse takeProfitPct as the trailing activation threshold.
+        # - When trailing is enabled, fixed take-profit exits are disabled to avoid ambiguity.
+        if trailing_enabled and trailing_pct_eff > 0:
+            if trailing_activation_pct_eff <= 0 and take_profit_pct_eff > 0:
+                trailing_activation_pct_eff = take_profit_pct_eff
+
+        # IMPORTANT: risk percentages are defined on margin PnL (user expectation):
+        # e.g. 10x leverage + 5% SL means ~0.5% adverse price move.
+        lev = max(int(leverage or 1), 1)
+        stop_loss_pct_eff = stop_loss_pct / lev
+        take_profit_pct_eff = take_profit_pct / lev
+        trailing_pct_eff = trailing_pct / lev
+        trailing_activation_pct_eff = trailing_activation_pct / lev
+
+        pos_cfg = cfg.get('position') or {}
+        entry_pct_cfg = float(pos_cfg.get('entryPct') or 1.0)  # expected 0~1
+        # Accept both 0~1 and 0~100 inputs (some clients may send percent units).
+        if entry_pct_cfg > 1:
+            entry_pct_cfg = entry_pct_cfg / 100.0
+        entry_pct_cfg = max(0.0, min(entry_pct_cfg, 1.0))
+
+        scale_cfg = cfg.get('scale') or {}
+        trend_add_cfg = scale_cfg.get('trendAdd') or {}
+        dca_add_cfg = scale_cfg.get('dcaAdd') or {}
+        trend_reduce_cfg = scale_cfg.get('trendReduce') or {}
+        adverse_reduce_cfg = scale_cfg.get('adverseReduce') or {}
+
+        trend_add_enabled = bool(trend_add_cfg.get('enabled'))
+        trend_add_step_pct = float(trend_add_cfg.get('stepPct') or 0.0)
+        trend_add_size_pct = float(trend_add_cfg.get('sizePct') or 0.0)
+        trend_add_max_times = int(trend_add_cfg.get('maxTimes') or 0)
+
+        dca_add_enabled = bool(dca_add_cfg.get('enabled'))
+        dca_add_step_pct = float(dca_add_cfg.get('stepPct') or 0.0)
+        dca_add_size_pct = float(dca_add_cfg.get('sizePct') or 0.0)
+        dca_add_max_times = int(dca_add_cfg.get('maxTimes') or 0)
+
+        # Prevent logical conflict: trend scale-in and mean-reversion scale-in should not run together.
+        # Otherwise both may trigger in the same candle (high/low both hit), causing double scaling unexpectedly.
+        if trend_add_enabled and dca_add_enabled:
+            dca_add_enabled = False
+
+        trend_reduce_enabled = bool(trend_reduce_cfg.get('enabled'))
+        trend_reduce_step_pct = float(trend_reduce_cfg.get('stepPct') or 0.0)
+        trend_reduce_size_pct = float(trend_reduce_cfg.get('sizePct') or 0.0)
+        trend_reduce_max_times = int(trend_reduce_cfg.get('maxTimes') or 0)
+
+        adverse_reduce_enabled = bool(adverse_reduce_cfg.get('enabled'))
+        adverse_reduce_step_pct = float(adverse_reduce_cfg.get('stepPct') or 0.0)
+        adverse_reduce_size_pct = float(adverse_reduce_cfg.get('sizePct') or 0.0)
+        adverse_reduce_max_times = int(adverse_reduce_cfg.get('maxTimes') or 0)
+
+        # 触发百分比按“杠杆后的保证金阈值”理解：换算为价格触发阈值需要除以杠杆倍数
+        # 例如 10x + 5% 触发，意味着约 0.5% 的价格波动触发
+        trend_add_step_pct_eff = trend_add_step_pct / lev
+        dca_add_step_pct_eff = dca_add_step_pct / lev
+        trend_reduce_step_pct_eff = trend_reduce_step_pct / lev
+        adverse_reduce_step_pct_eff = adverse_reduce_step_pct / lev
+
+        # State: used for trailing exits and scale-in/scale-out anchor levels
+        highest_since_entry = None
+        lowest_since_entry = None
+        trend_add_times = 0
+        dca_add_times = 0
+        trend_reduce_times = 0
+        adverse_reduce_times = 0
+        last_trend_add_anchor = None
+        last_dca_add_anchor = None
+        last_trend_reduce_anchor = None
+        last_adverse_reduce_anchor = None
+        
+        # 转换信号为数组
+        open_long_arr = signals['open_long'].values
+        close_long_arr = signals['close_long'].values
+        open_short_arr = signals['open_short'].values
+        close_short_arr = signals['close_short'].values
+
+        # Apply execution timing to avoid look-ahead bias:
+        # If signals are computed using bar close, realistic execution is next bar open.
+        if signal_timing in ['next_bar_open', 'next_open', 'nextopen', 'next']:
+            open_long_arr = np.insert(open_long_arr[:-1], 0, False)
+            close_long_arr = np.insert(close_long_arr[:-1], 0, False)
+            open_short_arr = np.insert(open_short_arr[:-1], 0, False)
+            close_short_arr = np.insert(close_short_arr[:-1], 0, False)
+        
+        # 根据交易方向过滤信号
+        if trade_direction == 'long':
+            # 只做多：禁用所有做空信号
+            open_short_arr = np.zeros(len(df), dtype=bool)
+            close_short_arr = np.zeros(len(df), dtype=bool)
+        elif trade_direction == 'short':
+            # 只做空：禁用所有做多信号
+            open_long_arr = np.zeros(len(df), dtype=bool)
+            close_long_arr = np.zeros(len(df), dtype=bool)
+        else:
+            pass
+        
+        # 加仓信号
+        if has_position_management:
+            add_long_arr = signals['add_long'].values
+            add_short_arr = signals['add_short'].values
+            position_size_arr = signals.get('position_size', pd.Series([0.0] * len(df))).values
+            
+            # 根据交易方向过滤加仓信号
+            if trade_direction == 'long':
+                add_short_arr = np.zeros(len(df), dtype=bool)
+            elif trade_direction == 'short':
+                add_long_arr = np.zeros(len(df), dtype=bool)
+        
+        # 开仓触发价格（如果指标提供了精确开仓价格）
+        open_long_price_arr = signals.get('open_long_price', pd.Series([0.0] * len(df))).values
+        open_short_price_arr = signals.get('open_short_price', pd.Series([0.0] * len(df))).values
+        
+        # 平仓目标价格（如果指标提供了精确平仓价格）
+        close_long_price_arr = signals.get('close_long_price', pd.Series([0.0] * len(df))).values
+        close_short_price_arr = signals.get('close_short_price', pd.Series([0.0] * len(df))).values
+        
+        # 加仓目标价格（如果指标提供了精确加仓价格）
+        add_long_price_arr = signals.get('add_long_price', pd.Series([0.0] * len(df))).values
+        add_short_price_arr = signals.get('add_short_price', pd.Series([0.0] * len(df))).values
+        
+        for i, (timestamp, row) in enumerate(df.iterrows()):
+            if is_liquidated:
+                equity_curve.append({
+                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'value': 0
+                })
+                continue
+
+            # 若已无持仓且余额过低，视为赔光并停止后续交易
+            if position == 0 and capital < min_capital_to_trade:
+                is_liquidated = True
+                capital = 0
+                trades.append({
+                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'type': 'liquidation',
+                    'price': round(float(row.get('close', 0) or 0), 4),
+                    'amount': 0,
+                    'profit': round(-initial_capital, 2),
+                    'balance': 0
+                })
+                equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': 0})
+                continue
+            
+            # Use OHLC to evaluate triggers.
+            high = row['high']
+            low = row['low']
+            close = row['close']
+            open_ = row.get('open', close)
+            
+            # Default execution price depends on timing mode
+            # - bar_close: close
+            # - next_bar_open: open (this bar is the next bar for a prior signal)
+            exec_price = open_ if signal_timing in ['next_bar_open', 'next_open', 'nextopen', 'next'] else close
+
+            # --- Risk controls: SL / TP / trailing exit (highest priority) ---
+            if position != 0 and position_type in ['long', 'short']:
+                # 更新持仓期间极值（用于移动止盈止损）
+                if position_type == 'long':
+                    if highest_since_entry is None:
+                        highest_since_entry = entry_price
+                    if lowest_since_entry is None:
+                        lowest_since_entry = entry_price
+                    highest_since_entry = max(highest_since_entry, high)
+                    lowest_since_entry = min(lowest_since_entry, low)
+                else:  # short
+                    if lowest_since_entry is None:
+                        lowest_since_entry = entry_price
+                    if highest_since_entry is None:
+                        highest_since_entry = entry_price
+                    lowest_since_entry = min(lowest_since_entry, low)
+                    highest_since_entry = max(highest_since_entry, high)
+
+                # 收集同一根K线内触发的强制平仓点
+                # 回测为K线级别，无法确定同一根K线内的真实触发顺序；这里按“确定性优先级”处理：
+                # 止损 > 移动止盈(回撤) > 固定止盈
+                candidates = []  # [(trade_type, trigger_price)]
+                if position_type == 'long' and position > 0:
+                    if stop_loss_pct_eff > 0:
+                        sl_price = entry_price * (1 - stop_loss_pct_eff)
+                        if low <= sl_price:
+                            candidates.append(('close_long_stop', sl_price))
+                    # Fixed take-profit exit is disabled when trailing is enabled (see conflict rule above).
+                    if (not trailing_enabled) and take_profit_pct_eff > 0:
+                        tp_price = entry_price * (1 + take_profit_pct_eff)
+                        if high >= tp_price:
+                            candidates.append(('close_long_profit', tp_price))
+                    if trailing_enabled and trailing_pct_eff > 0 and highest_since_entry is not None:
+                        trail_active = True
+                        if trailing_activation_pct_eff > 0:
+                            trail_active = highest_since_entry >= entry_price * (1 + trailing_activation_pct_eff)
+                        if trail_active:
+                            tr_price = highest_since_entry * (1 - trailing_pct_eff)
+                            if low <= tr_price:
+                                candidates.append(('close_long_trailing', tr_price))
+
+                    if candidates:
+                        # 按优先级选择触发点：止损 > 移动止盈 > 止盈
+                        pri = {'close_long_stop': 0, 'close_long_trailing': 1, 'close_long_profit': 2}
+                        trade_type, trigger_price = sorted(candidates, key=lambda x: (pri.get(x[0], 99), x[1]))[0]
+                        exec_price_close = trigger_price * (1 - slippage)
+                        commission_fee_close = position * exec_price_close * commission
+                        # 开仓手续费已在开仓时扣除，这里只扣平仓手续费
+                        profit = (exec_price_close - entry_price) * position - commission_fee_close
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+
+                        trades.append({
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'type': trade_type,
+                            'price': round(exec_price_close, 4),
+                            'amount': round(position, 4),
+                            'profit': round(profit, 2),
+                            'balance': round(capital, 2)
+                        })
+
+                        position = 0
+                        position_type = None
+                        liquidation_price = 0
+                        highest_since_entry = None
+                        lowest_since_entry = None
+                        trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
+                        last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
+
+                        equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': round(capital, 2)})
+                        continue
+
+                if position_type == 'short' and position < 0:
+                    shares = abs(position)
+                    if stop_loss_pct_eff > 0:
+                        sl_price = entry_price * (1 + stop_loss_pct_eff)
+                        if high >= sl_price:
+                            candidates.append(('close_short_stop', sl_price))
+                    # Fixed take-profit exit is disabled when trailing is enabled (see conflict rule above).
+                    if (not trailing_enabled) and take_profit_pct_eff > 0:
+                        tp_price = entry_price * (1 - take_profit_pct_eff)
+                        if low <= tp_price:
+                            candidates.append(('close_short_profit', tp_price))
+                    if trailing_enabled and trailing_pct_eff > 0 and lowest_since_entry is not None:
+                        trail_active = True
+                        if trailing_activation_pct_eff > 0:
+                            trail_active = lowest_since_entry <= entry_price * (1 - trailing_activation_pct_eff)
+                        if trail_active:
+                            tr_price = lowest_since_entry * (1 + trailing_pct_eff)
+                            if high >= tr_price:
+                                candidates.append(('close_short_trailing', tr_price))
+
+                    if candidates:
+                        # 按优先级选择触发点：止损 > 移动止盈 > 止盈
+                        pri = {'close_short_stop': 0, 'close_short_trailing': 1, 'close_short_profit': 2}
+                        trade_type, trigger_price = sorted(candidates, key=lambda x: (pri.get(x[0], 99), -x[1]))[0]
+                        exec_price_close = trigger_price * (1 + slippage)
+                        commission_fee_close = shares * exec_price_close * commission
+                        # 开仓手续费已在开仓时扣除，这里只扣平仓手续费
+                        profit = (entry_price - exec_price_close) * shares - commission_fee_close
+
+                        if capital + profit <= 0:
+                            capital = 0
+                            is_liquidated = True
+                            trades.append({
+                                'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                'type': 'liquidation',
+                                'price': round(exec_price_close, 4),
+                                'amount': round(shares, 4),
+                                'profit': round(-initial_capital, 2),
+                                'balance': 0
+                            })
+                            position = 0
+                            position_type = None
+                            liquidation_price = 0
+                            equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': 0})
+                            continue
+
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+
+                        trades.append({
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'type': trade_type,
+                            'price': round(exec_price_close, 4),
+                            'amount': round(shares, 4),
+                            'profit': round(profit, 2),
+                            'balance': round(capital, 2)
+                        })
+
+                        position = 0
+                        position_type = None
+                        liquidation_price = 0
+                        highest_since_entry = None
+                        lowest_since_entry = None
+                        trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
+                        last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
+
+                        equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': round(capital, 2)})
+                        continue
+            
+            # 处理平仓信号（优先处理，包括止损/止盈）
+            if position > 0 and close_long_arr[i]:
+                # 平多：使用指标提供的目标价格（如果有），否则使用收盘价
+                if signal_timing in ['next_bar_open', 'next_open', 'nextopen', 'next']:
+                    target_price = open_
+                else:
+                    target_price = close_long_price_arr[i] if close_long_price_arr[i] > 0 else close
+                exec_price = target_price * (1 - slippage)
+                commission_fee = position * exec_price * commission
+                profit = (exec_price - entry_price) * position - commission_fee
+                capital += profit
+                total_commission_paid += commission_fee
+
+                # NOTE:
+                # This is a "signal close" (not a forced stop-loss/take-profit/trailing exit).
+                # Do NOT label it as *_stop/*_profit based on PnL sign, otherwise it looks like a stop-loss happened
+                # even when risk controls are disabled (stopLossPct/takeProfitPct == 0).
+                trade_type = 'close_long'
+
+                trades.append({
+                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'type': trade_type,
+                    'price': round(exec_price, 4),
+                    'amount': round(position, 4),
+                    'profit': round(profit, 2),
+                    'balance': round(capital, 2)
+                })
+                
+                position = 0
+                position_type = None
+                liquidation_price = 0
+                highest_since_entry = None
+                lowest_since_entry = None
+                trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
+                last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
+
+                # 平仓后余额过低则停止交易（避免同K线反手开仓）
+                if capital < min_capital_to_trade:
+                    is_liquidated = True
+                    capital = 0
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'liquidation',
+                        'price': round(exec_price, 4),
+                        'amount': 0,
+                        'profit': round(-initial_capital, 2),
+                        'balance': 0
+                    })
+            
+            elif position < 0 and close_short_arr[i]:
+                # 平空：使用指标提供的目标价格（如果有），否则使用收盘价
+                if signal_timing in ['next_bar_open', 'next_open', 'nextopen', 'next']:
+                    target_price = open_
+                else:
+                    target_price = close_short_price_arr[i] if close_short_price_arr[i] > 0 else close
+                exec_price = target_price * (1 + slippage)
+                shares = abs(position)
+                commission_fee = shares * exec_price * commission
+                profit = (entry_price - exec_price) * shares - commission_fee
+                
+                if capital + profit <= 0:
+                    logger.warning(f"平空时资金不足爆仓")
+                    capital = 0
+                    is_liquidated = True
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'liquidation',
+                        'price': round(exec_price, 4),
+                        'amount': round(shares, 4),
+                        'profit': round(-capital, 2),
+                        'balance': 0
+                    })
+                    position = 0
+                    position_type = None
+                    equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': 0})
+                    continue
+                
+                capital += profit
+                total_commission_paid += commission_fee
+
+                # Signal close (not forced TP/SL/trailing).
+                trade_type = 'close_short'
+
+                trades.append({
+                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'type': trade_type,
+                    'price': round(exec_price, 4),
+                    'amount': round(shares, 4),
+                    'profit': round(profit, 2),
+                    'balance': round(capital, 2)
+                })
+                
+                position = 0
+                position_type = None
+                liquidation_price = 0
+                highest_since_entry = None
+                lowest_since_entry = None
+                trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
+                last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
+
+                if capital < min_capital_to_trade:
+                    is_liquidated = True
+                    capital = 0
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'liquidation',
+                        'price': round(exec_price, 4),
+                        'amount': 0,
+                        'profit': round(-initial_capital, 2),
+                        'balance': 0
+                    })
+            
+            # If this candle has a main strategy signal (open/close long/short),
+            # we must NOT apply any scale-in/scale-out actions on the same candle.
+            main_signal_on_bar = bool(open_long_arr[i] or open_short_arr[i] or close_long_arr[i] or close_short_arr[i])
+
+            # --- Parameterized scaling rules (no strategy code needed) ---
+            # Rules:
+            # - Trend scale-in: long triggers when price rises stepPct from anchor; short triggers when price falls stepPct from anchor
+            # - Mean-reversion DCA: long triggers when price falls stepPct from anchor; short triggers when price rises stepPct from anchor
+            # - Trend reduce: long reduces on rise; short reduces on fall
+            # - Adverse reduce: long reduces on fall; short reduces on rise
+            if (not main_signal_on_bar) and position != 0 and position_type in ['long', 'short'] and capital >= min_capital_to_trade:
+                # 做多
+                if position_type == 'long' and position > 0:
+                    # Trend scale-in (trigger on higher price)
+                    if trend_add_enabled and trend_add_step_pct_eff > 0 and trend_add_size_pct > 0 and (trend_add_max_times == 0 or trend_add_times < trend_add_max_times):
+                        anchor = last_trend_add_anchor if last_trend_add_anchor is not None else entry_price
+                        trigger = anchor * (1 + trend_add_step_pct_eff)
+                        if high >= trigger:
+                            order_pct = trend_add_size_pct
+                            if order_pct > 0:
+                                exec_price_add = trigger * (1 + slippage)
+                                use_capital = capital * order_pct
+                                # 手续费按成交名义价值扣除；下单数量不再除以(1+commission)
+                                shares_add = (use_capital * leverage) / exec_price_add
+                                commission_fee = shares_add * exec_price_add * commission
+
+                                total_cost_before = position * entry_price
+                                total_cost_after = total_cost_before + shares_add * exec_price_add
+                                position += shares_add
+                                entry_price = total_cost_after / position
+
+                                capital -= commission_fee
+                                total_commission_paid += commission_fee
+                                liquidation_price = entry_price * (1 - 1.0 / leverage)
+
+                                trend_add_times += 1
+                                last_trend_add_anchor = trigger
+
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'add_long',
+                                    'price': round(exec_price_add, 4),
+                                    'amount': round(shares_add, 4),
+                                    'profit': 0,
+                                    'balance': round(capital, 2)
+                                })
+
+                    # Mean-reversion DCA (trigger on lower price)
+                    if dca_add_enabled and dca_add_step_pct_eff > 0 and dca_add_size_pct > 0 and (dca_add_max_times == 0 or dca_add_times < dca_add_max_times):
+                        anchor = last_dca_add_anchor if last_dca_add_anchor is not None else entry_price
+                        trigger = anchor * (1 - dca_add_step_pct_eff)
+                        if low <= trigger:
+                            order_pct = dca_add_size_pct
+                            if order_pct > 0:
+                                exec_price_add = trigger * (1 + slippage)
+                                use_capital = capital * order_pct
+                                shares_add = (use_capital * leverage) / exec_price_add
+                                commission_fee = shares_add * exec_price_add * commission
+
+                                total_cost_before = position * entry_price
+                                total_cost_after = total_cost_before + shares_add * exec_price_add
+                                position += shares_add
+                                entry_price = total_cost_after / position
+
+                                capital -= commission_fee
+                                total_commission_paid += commission_fee
+                                liquidation_price = entry_price * (1 - 1.0 / leverage)
+
+                                dca_add_times += 1
+                                last_dca_add_anchor = trigger
+
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'add_long',
+                                    'price': round(exec_price_add, 4),
+                                    'amount': round(shares_add, 4),
+                                    'profit': 0,
+                                    'balance': round(capital, 2)
+                                })
+
+                    # Trend reduce (trigger on higher price)
+                    if trend_reduce_enabled and trend_reduce_step_pct_eff > 0 and trend_reduce_size_pct > 0 and (trend_reduce_max_times == 0 or trend_reduce_times < trend_reduce_max_times):
+                        anchor = last_trend_reduce_anchor if last_trend_reduce_anchor is not None else entry_price
+                        trigger = anchor * (1 + trend_reduce_step_pct_eff)
+                        if high >= trigger:
+                            reduce_pct = max(trend_reduce_size_pct, 0.0)
+                            reduce_shares = position * reduce_pct
+                            if reduce_shares > 0:
+                                exec_price_reduce = trigger * (1 - slippage)
+                                commission_fee = reduce_shares * exec_price_reduce * commission
+                                profit = (exec_price_reduce - entry_price) * reduce_shares - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                position -= reduce_shares
+                                if position <= 1e-12:
+                                    position = 0
+                                    position_type = None
+                                    liquidation_price = 0
+                                else:
+                                    liquidation_price = entry_price * (1 - 1.0 / leverage)
+
+                                trend_reduce_times += 1
+                                last_trend_reduce_anchor = trigger
+
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'reduce_long',
+                                    'price': round(exec_price_reduce, 4),
+                                    'amount': round(reduce_shares, 4),
+                                    'profit': round(profit, 2),
+                                    'balance': round(capital, 2)
+                                })
+
+                    # Adverse reduce (trigger on lower price)
+                    if position_type == 'long' and position > 0 and adverse_reduce_enabled and adverse_reduce_step_pct_eff > 0 and adverse_reduce_size_pct > 0 and (adverse_reduce_max_times == 0 or adverse_reduce_times < adverse_reduce_max_times):
+                        anchor = last_adverse_reduce_anchor if last_adverse_reduce_anchor is not None else entry_price
+                        trigger = anchor * (1 - adverse_reduce_step_pct_eff)
+                        if low <= trigger:
+                            reduce_pct = max(adverse_reduce_size_pct, 0.0)
+                            reduce_shares = position * reduce_pct
+                            if reduce_shares > 0:
+                                exec_price_reduce = trigger * (1 - slippage)
+                                commission_fee = reduce_shares * exec_price_reduce * commission
+                                profit = (exec_price_reduce - entry_price) * reduce_shares - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                position -= reduce_shares
+                                if position <= 1e-12:
+                                    position = 0
+                                    position_type = None
+                                    liquidation_price = 0
+                                else:
+                                    liquidation_price = entry_price * (1 - 1.0 / leverage)
+
+                                adverse_reduce_times += 1
+                                last_adverse_reduce_anchor = trigger
+
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'reduce_long',
+                                    'price': round(exec_price_reduce, 4),
+                                    'amount': round(reduce_shares, 4),
+                                    'profit': round(profit, 2),
+                                    'balance': round(capital, 2)
+                                })
+
+                # 做空
+                if position_type == 'short' and position < 0:
+                    shares_total = abs(position)
+
+                    # Trend scale-in (trigger on lower price)
+                    if trend_add_enabled and trend_add_step_pct_eff > 0 and trend_add_size_pct > 0 and (trend_add_max_times == 0 or trend_add_times < trend_add_max_times):
+                        anchor = last_trend_add_anchor if last_trend_add_anchor is not None else entry_price
+                        trigger = anchor * (1 - trend_add_step_pct_eff)
+                        if low <= trigger:
+                            order_pct = trend_add_size_pct
+                            if order_pct > 0:
+                                exec_price_add = trigger * (1 - slippage)  # 卖出加空，滑点不利
+                                use_capital = capital * order_pct
+                                shares_add = (use_capital * leverage) / exec_price_add
+                                commission_fee = shares_add * exec_price_add * commission
+
+                                total_cost_before = shares_total * entry_price
+                                total_cost_after = total_cost_before + shares_add * exec_price_add
+                                position -= shares_add
+                                shares_total = abs(position)
+                                entry_price = total_cost_after / shares_total
+
+                                capital -= commission_fee
+                                total_commission_paid += commission_fee
+                                liquidation_price = entry_price * (1 + 1.0 / leverage)
+
+                                trend_add_times += 1
+                                last_trend_add_anchor = trigger
+
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'add_short',
+                                    'price': round(exec_price_add, 4),
+                                    'amount': round(shares_add, 4),
+                                    'profit': 0,
+                                    'balance': round(capital, 2)
+                                })
+
+                    # Mean-reversion DCA (trigger on higher price)
+                    if dca_add_enabled and dca_add_step_pct_eff > 0 and dca_add_size_pct > 0 and (dca_add_max_times == 0 or dca_add_times < dca_add_max_times):
+                        anchor = last_dca_add_anchor if last_dca_add_anchor is not None else entry_price
+                        trigger = anchor * (1 + dca_add_step_pct_eff)
+                        if high >= trigger:
+                            order_pct = dca_add_size_pct
+                            if order_pct > 0:
+                                exec_price_add = trigger * (1 - slippage)
+                                use_capital = capital * order_pct
+                                shares_add = (use_capital * leverage) / exec_price_add
+                                commission_fee = shares_add * exec_price_add * commission
+
+                                total_cost_before = shares_total * entry_price
+                                total_cost_after = total_cost_before + shares_add * exec_price_add
+                                position -= shares_add
+                                shares_total = abs(position)
+                                entry_price = total_cost_after / shares_total
+
+                                capital -= commission_fee
+                                total_commission_paid += commission_fee
+                                liquidation_price = entry_price * (1 + 1.0 / leverage)
+
+                                dca_add_times += 1
+                                last_dca_add_anchor = trigger
+
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'add_short',
+                                    'price': round(exec_price_add, 4),
+                                    'amount': round(shares_add, 4),
+                                    'profit': 0,
+                                    'balance': round(capital, 2)
+                                })
+
+                    # Trend reduce (trigger on lower price)
+                    if trend_reduce_enabled and trend_reduce_step_pct_eff > 0 and trend_reduce_size_pct > 0 and (trend_reduce_max_times == 0 or trend_reduce_times < trend_reduce_max_times):
+                        anchor = last_trend_reduce_anchor if last_trend_reduce_anchor is not None else entry_price
+                        trigger = anchor * (1 - trend_reduce_step_pct_eff)
+                        if low <= trigger:
+                            reduce_pct = max(trend_reduce_size_pct, 0.0)
+                            reduce_shares = shares_total * reduce_pct
+                            if reduce_shares > 0:
+                                exec_price_reduce = trigger * (1 + slippage)  # 回补更贵
+                                commission_fee = reduce_shares * exec_price_reduce * commission
+                                profit = (entry_price - exec_price_reduce) * reduce_shares - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                position += reduce_shares
+                                shares_total = abs(position)
+                                if shares_total <= 1e-12:
+                                    position = 0
+                                    position_type = None
+                                    liquidation_price = 0
+                                else:
+                                    liquidation_price = entry_price * (1 + 1.0 / leverage)
+
+                                trend_reduce_times += 1
+                                last_trend_reduce_anchor = trigger
+
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'reduce_short',
+                                    'price': round(exec_price_reduce, 4),
+                                    'amount': round(reduce_shares, 4),
+                                    'profit': round(profit, 2),
+                                    'balance': round(capital, 2)
+                                })
+
+                    # Adverse reduce (trigger on higher price)
+                    if position_type == 'short' and position < 0 and adverse_reduce_enabled and adverse_reduce_step_pct_eff > 0 and adverse_reduce_size_pct > 0 and (adverse_reduce_max_times == 0 or adverse_reduce_times < adverse_reduce_max_times):
+                        anchor = last_adverse_reduce_anchor if last_adverse_reduce_anchor is not None else entry_price
+                        trigger = anchor * (1 + adverse_reduce_step_pct_eff)
+                        if high >= trigger:
+                            reduce_pct = max(adverse_reduce_size_pct, 0.0)
+                            reduce_shares = shares_total * reduce_pct
+                            if reduce_shares > 0:
+                                exec_price_reduce = trigger * (1 + slippage)
+                                commission_fee = reduce_shares * exec_price_reduce * commission
+                                profit = (entry_price - exec_price_reduce) * reduce_shares - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                position += reduce_shares
+                                shares_total = abs(position)
+                                if shares_total <= 1e-12:
+                                    position = 0
+                                    position_type = None
+                                    liquidation_price = 0
+                                else:
+                                    liquidation_price = entry_price * (1 + 1.0 / leverage)
+
+                                adverse_reduce_times += 1
+                                last_adverse_reduce_anchor = trigger
+
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'reduce_short',
+                                    'price': round(exec_price_reduce, 4),
+                                    'amount': round(reduce_shares, 4),
+                                    'profit': round(profit, 2),
+                                    'balance': round(capital, 2)
+                                })
+
+            # 处理加仓信号（仓位管理模式）
+            if has_position_management and (not main_signal_on_bar):
+                if position > 0 and add_long_arr[i] and capital >= min_capital_to_trade:
+                    # 加多仓：使用指标提供的目标价格（如果有），否则使用收盘价
+                    target_price = add_long_price_arr[i] if add_long_price_arr[i] > 0 else close
+                    exec_price = target_price * (1 + slippage)
+                    
+                    # 使用指定比例的资金加仓
+                    position_pct = position_size_arr[i] if position_size_arr[i] > 0 else 0.1
+                    use_capital = capital * position_pct
+                    shares = (use_capital * leverage) / exec_price
+                    commission_fee = shares * exec_price * commission
+                    
+                    # 更新平均成本
+                    total_cost_before = position * entry_price
+                    total_cost_after = total_cost_before + shares * exec_price
+                    position += shares
+                    entry_price = total_cost_after / position
+                    
+                    capital -= commission_fee
+                    total_commission_paid += commission_fee
+                    
+                    # 重新计算爆仓线
+                    liquidation_price = entry_price * (1 - 1.0 / leverage)
+                    
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'add_long',
+                        'price': round(exec_price, 4),
+                        'amount': round(shares, 4),
+                        'profit': 0,
+                        'balance': round(capital, 2)
+                    })
+                
+                elif position < 0 and add_short_arr[i] and capital >= min_capital_to_trade:
+                    # 加空仓：使用指标提供的目标价格（如果有），否则使用收盘价
+                    target_price = add_short_price_arr[i] if add_short_price_arr[i] > 0 else close
+                    exec_price = target_price * (1 - slippage)
+                    
+                    # 使用指定比例的资金加仓
+                    position_pct = position_size_arr[i] if position_size_arr[i] > 0 else 0.1
+                    use_capital = capital * position_pct
+                    shares = (use_capital * leverage) / exec_price
+                    commission_fee = shares * exec_price * commission
+                    
+                    # 更新平均成本
+                    current_shares = abs(position)
+                    total_cost_before = current_shares * entry_price
+                    total_cost_after = total_cost_before + shares * exec_price
+                    position -= shares  # 空头是负数
+                    current_shares = abs(position)
+                    entry_price = total_cost_after / current_shares
+                    
+                    capital -= commission_fee
+                    total_commission_paid += commission_fee
+                    
+                    # 重新计算爆仓线
+                    liquidation_price = entry_price * (1 + 1.0 / leverage)
+                    
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'add_short',
+                        'price': round(exec_price, 4),
+                        'amount': round(shares, 4),
+                        'profit': 0,
+                        'balance': round(capital, 2)
+                    })
+            
+            # 处理开仓信号
+            # 注意：code6.py已经处理了反转（先平后开），所以这里只需要处理position==0的情况
+            if open_long_arr[i] and position == 0 and capital >= min_capital_to_trade:
+                    # 使用指标提供的开仓触发价格（如果有），否则使用收盘价
+                    if signal_timing in ['next_bar_open', 'next_open', 'nextopen', 'next']:
+                        base_price = open_
+                    else:
+                        base_price = open_long_price_arr[i] if open_long_price_arr[i] > 0 else close
+                    exec_price = base_price * (1 + slippage)
+                    
+                    # 使用指定比例的资金开仓（优先采用回测弹窗的 entryPct；其次采用指标提供的 position_size；否则全仓）
+                    position_pct = None
+                    if entry_pct_cfg and entry_pct_cfg > 0:
+                        position_pct = entry_pct_cfg
+                    elif has_position_management and position_size_arr[i] > 0:
+                        position_pct = position_size_arr[i]
+                    if position_pct is not None and position_pct > 0 and position_pct < 1:
+                        use_capital = capital * position_pct
+                        shares = (use_capital * leverage) / exec_price
+                    else:
+                        shares = (capital * leverage) / exec_price
+                    
+                    commission_fee = shares * exec_price * commission
+                    
+                    position = shares
+                    entry_price = exec_price
+                    position_type = 'long'
+                    capital -= commission_fee
+                    total_commission_paid += commission_fee
+                    liquidation_price = entry_price * (1 - 1.0 / leverage)
+                    highest_since_entry = entry_price
+                    lowest_since_entry = entry_price
+                    last_trend_add_anchor = entry_price
+                    last_dca_add_anchor = entry_price
+                    last_trend_reduce_anchor = entry_price
+                    last_adverse_reduce_anchor = entry_price
+                    
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'open_long',
+                        'price': round(exec_price, 4),
+                        'amount': round(shares, 4),
+                        'profit': 0,
+                        'balance': round(capital, 2)
+                    })
+                    
+                    # Strict intrabar stop-loss / liquidation check right after entry (closer to live trading).
+                    # If this bar touches stop-loss price, close immediately at stop price (with slippage).
+                    # If this bar also touches liquidation price, assume stop-loss triggers first only if it is above liquidation.
+                    if position_type == 'long' and position > 0:
+                        sl_price = entry_price * (1 - stop_loss_pct_eff) if stop_loss_pct_eff > 0 else None
+                        hit_sl = (sl_price is not None) and (low <= sl_price)
+                        hit_liq = liquidation_price > 0 and (low <= liquidation_price)
+                        if hit_sl or hit_liq:
+                            if hit_liq and (not hit_sl or (sl_price is not None and sl_price <= liquidation_price)):
+                                # Liquidation happens before stop-loss (or stop-loss not configured).
+                                is_liquidated = True
+                                capital = 0
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'liquidation',
+                                    'price': round(liquidation_price, 4),
+                                    'amount': round(position, 4),
+                                    'profit': round(-initial_capital, 2),
+                                    'balance': 0
+                                })
+                            else:
+                                # Stop-loss triggers first.
+                                exec_price_close = sl_price * (1 - slippage)
+                                commission_fee_close = position * exec_price_close * commission
+                                profit = (exec_price_close - entry_price) * position - commission_fee_close
+                                capital += profit
+                                total_commission_paid += commission_fee_close
+                                if capital <= 0:
+                                    is_liquidated = True
+                                    capital = 0
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'close_long_stop',
+                                    'price': round(exec_price_close, 4),
+                                    'amount': round(position, 4),
+                                    'profit': round(profit, 2),
+                                    'balance': round(capital, 2)
+                                })
+
+                            position = 0
+                            position_type = None
+                            liquidation_price = 0
+                            highest_since_entry = None
+                            lowest_since_entry = None
+                            equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': round(capital, 2)})
+                            continue
+            
+            elif open_short_arr[i] and position == 0 and capital >= min_capital_to_trade:
+                    # 使用指标提供的开仓触发价格（如果有），否则使用收盘价
+                    if signal_timing in ['next_bar_open', 'next_open', 'nextopen', 'next']:
+                        base_price = open_
+                    else:
+                        base_price = open_short_price_arr[i] if open_short_price_arr[i] > 0 else close
+                    exec_price = base_price * (1 - slippage)
+                    
+                    # 使用指定比例的资金开仓（优先采用回测弹窗的 entryPct；其次采用指标提供的 position_size；否则全仓）
+                    position_pct = None
+                    if entry_pct_cfg and entry_pct_cfg > 0:
+                        position_pct = entry_pct_cfg
+                    elif has_position_management and position_size_arr[i] > 0:
+                        position_pct = position_size_arr[i]
+                    if position_pct is not None and position_pct > 0 and position_pct < 1:
+                        use_capital = capital * position_pct
+                        shares = (use_capital * leverage) / exec_price
+                    else:
+                        shares = (capital * leverage) / exec_price
+                    
+                    commission_fee = shares * exec_price * commission
+                    
+                    position = -shares
+                    entry_price = exec_price
+                    position_type = 'short'
+                    capital -= commission_fee
+                    total_commission_paid += commission_fee
+                    liquidation_price = entry_price * (1 + 1.0 / leverage)
+                    highest_since_entry = entry_price
+                    lowest_since_entry = entry_price
+                    last_trend_add_anchor = entry_price
+                    last_dca_add_anchor = entry_price
+                    last_trend_reduce_anchor = entry_price
+                    last_adverse_reduce_anchor = entry_price
+                    
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'open_short',
+                        'price': round(exec_price, 4),
+                        'amount': round(shares, 4),
+                        'profit': 0,
+                        'balance': round(capital, 2)
+                    })
+                    
+                    # Strict intrabar stop-loss / liquidation check right after entry (closer to live trading).
+                    if position_type == 'short' and position < 0:
+                        sl_price = entry_price * (1 + stop_loss_pct_eff) if stop_loss_pct_eff > 0 else None
+                        hit_sl = (sl_price is not None) and (high >= sl_price)
+                        hit_liq = liquidation_price > 0 and (high >= liquidation_price)
+                        if hit_sl or hit_liq:
+                            if hit_liq and (not hit_sl or (sl_price is not None and sl_price >= liquidation_price)):
+                                # Liquidation happens before stop-loss (or stop-loss not configured).
+                                is_liquidated = True
+                                capital = 0
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'liquidation',
+                                    'price': round(liquidation_price, 4),
+                                    'amount': round(abs(position), 4),
+                                    'profit': round(-initial_capital, 2),
+                                    'balance': 0
+                                })
+                            else:
+                                # Stop-loss triggers first.
+                                exec_price_close = sl_price * (1 + slippage)
+                                shares_close = abs(position)
+                                commission_fee_close = shares_close * exec_price_close * commission
+                                profit = (entry_price - exec_price_close) * shares_close - commission_fee_close
+                                capital += profit
+                                total_commission_paid += commission_fee_close
+                                if capital <= 0:
+                                    is_liquidated = True
+                                    capital = 0
+                                trades.append({
+                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'type': 'close_short_stop',
+                                    'price': round(exec_price_close, 4),
+                                    'amount': round(shares_close, 4),
+                                    'profit': round(profit, 2),
+                                    'balance': round(capital, 2)
+                                })
+
+                            position = 0
+                            position_type = None
+                            liquidation_price = 0
+                            highest_since_entry = None
+                            lowest_since_entry = None
+                            equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': round(capital, 2)})
+                            continue
+            
+            # 检测持仓期间是否触及爆仓线（作为兜底保护）
+            # 注意：这个检查在所有主动平仓信号处理之后
+            # 如果触及爆仓线，检查是否有止损信号，止损优先
+            if position != 0 and not is_liquidated:
+                if position_type == 'long' and low <= liquidation_price:
+                    # 做多触及爆仓线：检查是否有止损信号
+                    has_stop_loss = close_long_arr[i] and close_long_price_arr[i] > 0
+                    stop_loss_price = close_long_price_arr[i] if has_stop_loss else 0
+                    
+                    # 判断先触发止损还是爆仓
+                    if has_stop_loss and stop_loss_price > liquidation_price:
+                        # 止损在爆仓前触发，使用止损价平仓
+                        exec_price_close = stop_loss_price * (1 - slippage)
+                        commission_fee_close = position * exec_price_close * commission
+                        profit = (exec_price_close - entry_price) * position - commission_fee_close
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+                        
+                        trades.append({
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'type': 'close_long_stop',
+                            'price': round(exec_price_close, 4),
+                            'amount': round(position, 4),
+                            'profit': round(profit, 2),
+                            'balance': round(capital, 2)
+                        })
+                    else:
+                        # 止损不够严格或无止损，触发爆仓
+                        logger.warning(f"做多爆仓！开仓价={entry_price:.2f}, 最低价={low:.2f}, "
+                                     f"爆仓线={liquidation_price:.2f}, 止损价={stop_loss_price:.2f}")
+                        is_liquidated = True
+                        capital = 0
+                        trades.append({
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'type': 'liquidation',
+                            'price': round(liquidation_price, 4),
+                            'amount': round(abs(position), 4),
+                            'profit': round(-initial_capital, 2),
+                            'balance': 0
+                        })
+                    
+                    position = 0
+                    position_type = None
+                    equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': capital})
+                    continue
+                    
+                elif position_type == 'short' and high >= liquidation_price:
+                    # 做空触及爆仓线：检查是否有止损信号
+                    has_stop_loss = close_short_arr[i] and close_short_price_arr[i] > 0
+                    stop_loss_price = close_short_price_arr[i] if has_stop_loss else 0
+                    
+                    logger.warning(f"[K线{i}] 做空触及爆仓线！开仓={entry_price:.2f}, 最高={high:.2f}, 爆仓线={liquidation_price:.2f}, "
+                              f"止损信号={close_short_arr[i]}, 止损价={stop_loss_price:.4f}, 时间={timestamp}")
+                    
+                    # 判断先触发止损还是爆仓
+                    if has_stop_loss and stop_loss_price < liquidation_price:
+                        # 止损在爆仓前触发，使用止损价平仓
+                        exec_price_close = stop_loss_price * (1 + slippage)
+                        shares_close = abs(position)
+                        commission_fee_close = shares_close * exec_price_close * commission
+                        profit = (entry_price - exec_price_close) * shares_close - commission_fee_close
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+                        
+                        trades.append({
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'type': 'close_short_stop',
+                            'price': round(exec_price_close, 4),
+                            'amount': round(shares_close, 4),
+                            'profit': round(profit, 2),
+                            'balance': round(capital, 2)
+                        })
+                    else:
+                        # 止损不够严格或无止损，触发爆仓
+                        logger.warning(f"做空爆仓！开仓价={entry_price:.2f}, 最高价={high:.2f}, "
+                                     f"爆仓线={liquidation_price:.2f}, 止损价={stop_loss_price:.2f}")
+                        is_liquidated = True
+                        capital = 0
+                        trades.append({
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'type': 'liquidation',
+                            'price': round(liquidation_price, 4),
+                            'amount': round(abs(position), 4),
+                            'profit': round(-initial_capital, 2),
+                            'balance': 0
+                        })
+                    
+                    position = 0
+                    position_type = None
+                    equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': capital})
+                    continue
+            
+            # 记录权益（使用收盘价计算未实现盈亏）
+            if position_type == 'long':
+                unrealized_pnl = (close - entry_price) * position
+                total_value = capital + unrealized_pnl
+            elif position_type == 'short':
+                shares = abs(position)
+                unrealized_pnl = (entry_price - close) * shares
+                total_value = capital + unrealized_pnl
+            else:
+                total_value = capital
+            
+            if total_value < 0:
+                total_value = 0
+            
+            equity_curve.append({
+                'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                'value': round(total_value, 2)
+            })
+        
+        # 回测结束时强制平仓
+        if position != 0:
+            timestamp = df.index[-1]
+            final_close = df.iloc[-1]['close']
+            
+            if position > 0:  # 平多
+                exec_price = final_close * (1 - slippage)
+                commission_fee = position * exec_price * commission
+                profit = (exec_price - entry_price) * position - commission_fee
+                capital += profit
+                total_commission_paid += commission_fee
+                
+                trades.append({
+                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'type': 'close_long',
+                    'price': round(exec_price, 4),
+                    'amount': round(position, 4),
+                    'profit': round(profit, 2),
+                    'balance': round(capital, 2)
+                })
+            else:  # 平空
+                exec_price = final_close * (1 + slippage)
+                shares = abs(position)
+                commission_fee = shares * exec_price * commission
+                profit = (entry_price - exec_price) * shares - commission_fee
+                
+                if capital + profit <= 0:
+                    logger.warning(f"回测结束爆仓！")
+                    capital = 0
+                    is_liquidated = True
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'liquidation',
+                        'price': round(exec_price, 4),
+                        'amount': round(shares, 4),
+                        'profit': round(-capital, 2),
+                        'balance': 0
+                    })
+                else:
+                    capital += profit
+                    total_commission_paid += commission_fee
+                    trades.append({
+                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'type': 'close_short',
+                        'price': round(exec_price, 4),
+                        'amount': round(shares, 4),
+                        'profit': round(profit, 2),
+                        'balance': round(capital, 2)
+                    })
+            
+            if equity_curve:
+                equity_curve[-1]['value'] = round(capital, 2)
         
-        Args:
-            signals: 信号，可以是 pd.Series (旧格式) 或 dict (新格式四种信号)
-            trade_direction: 交易方向
-                - 'long': 只做多 (buy->sell)
-                - 'short': 只做空 (sell->buy, 收益反向)
-                - 'both': 双向 (buy->sell做多 + sell->buy做空)
-        """
-        # Normalize supported signal formats into 4-way signals.
-        if not isinstance(signals, dict):
-            raise ValueError("signals must be a dict (either 4-way or buy/sell).")
-
-        if all(k in signals for k in ['open_long', 'close_long', 'open_short', 'close_short']):
-            norm = signals
-        elif all(k in signals for k in ['buy', 'sell']):
-            buy = signals['buy'].fillna(False).astype(bool)
-            sell = signals['sell'].fillna(False).astype(bool)
-
-            td = (trade_direction or 'both')
-            td = str(td).lower()
-            if td not in ['long', 'short', 'both']:
-                td = 'both'
-
-            # Mapping rules:
-            # - long: buy=open_long, sell=close_long
-            # - short: sell=open_short, buy=close_short
-            # - both: buy=open_long+close_short, sell=open_short+close_long
-            if td == 'long':
-                norm = {
-                    'open_long': buy,
-                    'close_long': sell,
-                    'open_short': pd.Series([False] * len(df), index=df.index),
-                    'close_short': pd.Series([False] * len(df), index=df.index),
-                }
-            elif td == 'short':
-                norm = {
-                    'open_long': pd.Series([False] * len(df), index=df.index),
-                    'close_long': pd.Series([False] * len(df), index=df.index),
-                    'open_short': sell,
-                    'close_short': buy,
-                }
-            else:
-                norm = {
-                    'open_long': buy,
-                    'close_long': sell,
-                    'open_short': sell,
-                    'close_short': buy,
-                }
-        else:
-            raise ValueError("signals dict must contain either 4-way keys or buy/sell keys.")
-
-        return self._simulate_trading_new_format(df, norm, initial_capital, commission, slippage, leverage, trade_direction, strategy_config)
+        return equity_curve, trades, total_commission_paid
     
-    def _simulate_trading_new_format(
+    def _simulate_trading_array(
         self,
         df: pd.DataFrame,
         signals: dict,
@@ -454,16 +2489,18 @@ import pandas as pd
         slippage: float,
         leverage: int = 1,
         trade_direction: str = 'both',
-        strategy_config: Optional[Dict[str, Any]] = None
+        strategy_config: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[[int, int, int], None]] = None
     ) -> tuple:
         """
-        使用新格式四种信号进行交易模拟（支持仓位管理和加仓）
-        
-        Args:
-            trade_direction: 交易方向 ('long', 'short', 'both')
+        数组版撮合引擎（与 _simulate_trading_new_format 结果逐位一致）
+
+        直接在预先提取的 NumPy 数组上逐K线撮合，不再为每根K线构造 iterrows() 的 Series，
+        时间戳也只在结束时统一格式化一次。撮合规则、触发优先级与舍入方式与旧引擎完全相同，
+        修改撮合逻辑时需要两个引擎同步修改（可用 BACKTEST_ENGINE=legacy 对比回归）。
         """
-        equity_curve = []
-        trades = []
+        equity_values = []  # 每根K线一个权益值，时间戳最后统一补齐
+        trades = []  # time 字段暂存K线下标
         total_commission_paid = 0
         is_liquidated = False
         liquidation_price = 0
@@ -502,19 +2539,10 @@ import pandas as pd
 
         # Conflict rule (TP vs trailing):
         # - If trailing is enabled, it takes precedence.
-        # - If activationPct is not provided, reuse takeProfitPct as the trailing activation threshold.
         # - When trailing is enabled, fixed take-profit exits are disabled to avoid ambiguity.
-        if trailing_enabled and trailing_pct_eff > 0:
-            if trailing_activation_pct_eff <= 0 and take_profit_pct_eff > 0:
-                trailing_activation_pct_eff = take_profit_pct_eff
-
-        # IMPORTANT: risk percentages are defined on margin PnL (user expectation):
-        # e.g. 10x leverage + 5% SL means ~0.5% adverse price move.
-        lev = max(int(leverage or 1), 1)
-        stop_loss_pct_eff = stop_loss_pct / lev
-        take_profit_pct_eff = take_profit_pct / lev
-        trailing_pct_eff = trailing_pct / lev
-        trailing_activation_pct_eff = trailing_activation_pct / lev
+        # NOTE: the legacy engine's "reuse takeProfitPct as activation threshold" fallback is overwritten by a
+        # second leverage conversion right after it, so it never takes effect; it is intentionally not applied
+        # here either to keep both engines bit-identical.
 
         pos_cfg = cfg.get('position') or {}
         entry_pct_cfg = float(pos_cfg.get('entryPct') or 1.0)  # expected 0~1
@@ -573,6 +2601,17 @@ import pandas as pd
         last_trend_reduce_anchor = None
         last_adverse_reduce_anchor = None
         
+        # 预先提取 OHLC 数组。
+        # 取值方式与 df.iterrows() 一致（同一个 df.values 矩阵按列切片），保证逐K线标量类型
+        # （np.float64 / python float）与旧引擎相同，从而 round() 结果逐位一致。
+        n = len(df)
+        values = df.values
+        col_pos = {col: k for k, col in enumerate(df.columns)}
+        high_arr = values[:, col_pos['high']]
+        low_arr = values[:, col_pos['low']]
+        close_arr = values[:, col_pos['close']]
+        open_arr = values[:, col_pos['open']] if 'open' in col_pos else close_arr
+
         # 转换信号为数组
         open_long_arr = signals['open_long'].values
         close_long_arr = signals['close_long'].values
@@ -590,12 +2629,12 @@ import pandas as pd
         # 根据交易方向过滤信号
         if trade_direction == 'long':
             # 只做多：禁用所有做空信号
-            open_short_arr = np.zeros(len(df), dtype=bool)
-            close_short_arr = np.zeros(len(df), dtype=bool)
+            open_short_arr = np.zeros(n, dtype=bool)
+            close_short_arr = np.zeros(n, dtype=bool)
         elif trade_direction == 'short':
             # 只做空：禁用所有做多信号
-            open_long_arr = np.zeros(len(df), dtype=bool)
-            close_long_arr = np.zeros(len(df), dtype=bool)
+            open_long_arr = np.zeros(n, dtype=bool)
+            close_long_arr = np.zeros(n, dtype=bool)
         else:
             pass
         
@@ -603,32 +2642,43 @@ import pandas as pd
         if has_position_management:
             add_long_arr = signals['add_long'].values
             add_short_arr = signals['add_short'].values
-            position_size_arr = signals.get('position_size', pd.Series([0.0] * len(df))).values
+            position_size_arr = signals.get('position_size', pd.Series([0.0] * n)).values
             
             # 根据交易方向过滤加仓信号
             if trade_direction == 'long':
-                add_short_arr = np.zeros(len(df), dtype=bool)
+                add_short_arr = np.zeros(n, dtype=bool)
             elif trade_direction == 'short':
-                add_long_arr = np.zeros(len(df), dtype=bool)
+                add_long_arr = np.zeros(n, dtype=bool)
         
         # 开仓触发价格（如果指标提供了精确开仓价格）
-        open_long_price_arr = signals.get('open_long_price', pd.Series([0.0] * len(df))).values
-        open_short_price_arr = signals.get('open_short_price', pd.Series([0.0] * len(df))).values
+        open_long_price_arr = signals.get('open_long_price', pd.Series([0.0] * n)).values
+        open_short_price_arr = signals.get('open_short_price', pd.Series([0.0] * n)).values
         
         # 平仓目标价格（如果指标提供了精确平仓价格）
-        close_long_price_arr = signals.get('close_long_price', pd.Series([0.0] * len(df))).values
-        close_short_price_arr = signals.get('close_short_price', pd.Series([0.0] * len(df))).values
+        close_long_price_arr = signals.get('close_long_price', pd.Series([0.0] * n)).values
+        close_short_price_arr = signals.get('close_short_price', pd.Series([0.0] * n)).values
         
         # 加仓目标价格（如果指标提供了精确加仓价格）
-        add_long_price_arr = signals.get('add_long_price', pd.Series([0.0] * len(df))).values
-        add_short_price_arr = signals.get('add_short_price', pd.Series([0.0] * len(df))).values
-        
-        for i, (timestamp, row) in enumerate(df.iterrows()):
+        add_long_price_arr = signals.get('add_long_price', pd.Series([0.0] * n)).values
+        add_short_price_arr = signals.get('add_short_price', pd.Series([0.0] * n)).values
+
+        # 布尔信号只参与条件判断，转为 list 加快逐K线下标访问；价格类数组保持 ndarray，
+        # 以保证参与运算的标量类型与旧引擎一致。
+        open_long_arr = np.asarray(open_long_arr).tolist()
+        close_long_arr = np.asarray(close_long_arr).tolist()
+        open_short_arr = np.asarray(open_short_arr).tolist()
+        close_short_arr = np.asarray(close_short_arr).tolist()
+        if has_position_management:
+            add_long_arr = np.asarray(add_long_arr).tolist()
+            add_short_arr = np.asarray(add_short_arr).tolist()
+
+        progress_every = max(n // 100, 1000)
+        for i in range(n):
+            if progress_callback is not None and i % progress_every == 0:
+                progress_callback(i, n, len(trades))
+
             if is_liquidated:
-                equity_curve.append({
-                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
-                    'value': 0
-                })
+                equity_values.append(0)
                 continue
 
             # 若已无持仓且余额过低，视为赔光并停止后续交易
@@ -636,21 +2686,21 @@ import pandas as pd
                 is_liquidated = True
                 capital = 0
                 trades.append({
-                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'time': i,
                     'type': 'liquidation',
-                    'price': round(float(row.get('close', 0) or 0), 4),
+                    'price': round(float(close_arr[i] or 0), 4),
                     'amount': 0,
                     'profit': round(-initial_capital, 2),
                     'balance': 0
                 })
-                equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': 0})
+                equity_values.append(0)
                 continue
             
             # Use OHLC to evaluate triggers.
-            high = row['high']
-            low = row['low']
-            close = row['close']
-            open_ = row.get('open', close)
+            high = high_arr[i]
+            low = low_arr[i]
+            close = close_arr[i]
+            open_ = open_arr[i]
             
             # Default execution price depends on timing mode
             # - bar_close: close
@@ -710,7 +2760,7 @@ import pandas as pd
                         total_commission_paid += commission_fee_close
 
                         trades.append({
-                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'time': i,
                             'type': trade_type,
                             'price': round(exec_price_close, 4),
                             'amount': round(position, 4),
@@ -726,7 +2776,7 @@ import pandas as pd
                         trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
                         last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
 
-                        equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': round(capital, 2)})
+                        equity_values.append(round(capital, 2))
                         continue
 
                 if position_type == 'short' and position < 0:
@@ -762,7 +2812,7 @@ import pandas as pd
                             capital = 0
                             is_liquidated = True
                             trades.append({
-                                'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                'time': i,
                                 'type': 'liquidation',
                                 'price': round(exec_price_close, 4),
                                 'amount': round(shares, 4),
@@ -772,14 +2822,14 @@ import pandas as pd
                             position = 0
                             position_type = None
                             liquidation_price = 0
-                            equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': 0})
+                            equity_values.append(0)
                             continue
 
                         capital += profit
                         total_commission_paid += commission_fee_close
 
                         trades.append({
-                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'time': i,
                             'type': trade_type,
                             'price': round(exec_price_close, 4),
                             'amount': round(shares, 4),
@@ -795,7 +2845,7 @@ import pandas as pd
                         trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
                         last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
 
-                        equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': round(capital, 2)})
+                        equity_values.append(round(capital, 2))
                         continue
             
             # 处理平仓信号（优先处理，包括止损/止盈）
@@ -818,7 +2868,7 @@ import pandas as pd
                 trade_type = 'close_long'
 
                 trades.append({
-                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'time': i,
                     'type': trade_type,
                     'price': round(exec_price, 4),
                     'amount': round(position, 4),
@@ -839,7 +2889,7 @@ import pandas as pd
                     is_liquidated = True
                     capital = 0
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': i,
                         'type': 'liquidation',
                         'price': round(exec_price, 4),
                         'amount': 0,
@@ -863,7 +2913,7 @@ import pandas as pd
                     capital = 0
                     is_liquidated = True
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': i,
                         'type': 'liquidation',
                         'price': round(exec_price, 4),
                         'amount': round(shares, 4),
@@ -872,7 +2922,7 @@ import pandas as pd
                     })
                     position = 0
                     position_type = None
-                    equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': 0})
+                    equity_values.append(0)
                     continue
                 
                 capital += profit
@@ -882,7 +2932,7 @@ import pandas as pd
                 trade_type = 'close_short'
 
                 trades.append({
-                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'time': i,
                     'type': trade_type,
                     'price': round(exec_price, 4),
                     'amount': round(shares, 4),
@@ -902,7 +2952,7 @@ import pandas as pd
                     is_liquidated = True
                     capital = 0
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': i,
                         'type': 'liquidation',
                         'price': round(exec_price, 4),
                         'amount': 0,
@@ -949,7 +2999,7 @@ import pandas as pd
                                 last_trend_add_anchor = trigger
 
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'add_long',
                                     'price': round(exec_price_add, 4),
                                     'amount': round(shares_add, 4),
@@ -982,7 +3032,7 @@ import pandas as pd
                                 last_dca_add_anchor = trigger
 
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'add_long',
                                     'price': round(exec_price_add, 4),
                                     'amount': round(shares_add, 4),
@@ -1015,7 +3065,7 @@ import pandas as pd
                                 last_trend_reduce_anchor = trigger
 
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'reduce_long',
                                     'price': round(exec_price_reduce, 4),
                                     'amount': round(reduce_shares, 4),
@@ -1048,7 +3098,7 @@ import pandas as pd
                                 last_adverse_reduce_anchor = trigger
 
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'reduce_long',
                                     'price': round(exec_price_reduce, 4),
                                     'amount': round(reduce_shares, 4),
@@ -1086,7 +3136,7 @@ import pandas as pd
                                 last_trend_add_anchor = trigger
 
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'add_short',
                                     'price': round(exec_price_add, 4),
                                     'amount': round(shares_add, 4),
@@ -1120,7 +3170,7 @@ import pandas as pd
                                 last_dca_add_anchor = trigger
 
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'add_short',
                                     'price': round(exec_price_add, 4),
                                     'amount': round(shares_add, 4),
@@ -1154,7 +3204,7 @@ import pandas as pd
                                 last_trend_reduce_anchor = trigger
 
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'reduce_short',
                                     'price': round(exec_price_reduce, 4),
                                     'amount': round(reduce_shares, 4),
@@ -1188,7 +3238,7 @@ import pandas as pd
                                 last_adverse_reduce_anchor = trigger
 
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'reduce_short',
                                     'price': round(exec_price_reduce, 4),
                                     'amount': round(reduce_shares, 4),
@@ -1222,7 +3272,7 @@ import pandas as pd
                     liquidation_price = entry_price * (1 - 1.0 / leverage)
                     
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': i,
                         'type': 'add_long',
                         'price': round(exec_price, 4),
                         'amount': round(shares, 4),
@@ -1256,7 +3306,7 @@ import pandas as pd
                     liquidation_price = entry_price * (1 + 1.0 / leverage)
                     
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': i,
                         'type': 'add_short',
                         'price': round(exec_price, 4),
                         'amount': round(shares, 4),
@@ -1302,7 +3352,7 @@ import pandas as pd
                     last_adverse_reduce_anchor = entry_price
                     
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': i,
                         'type': 'open_long',
                         'price': round(exec_price, 4),
                         'amount': round(shares, 4),
@@ -1323,7 +3373,7 @@ import pandas as pd
                                 is_liquidated = True
                                 capital = 0
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'liquidation',
                                     'price': round(liquidation_price, 4),
                                     'amount': round(position, 4),
@@ -1341,7 +3391,7 @@ import pandas as pd
                                     is_liquidated = True
                                     capital = 0
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'close_long_stop',
                                     'price': round(exec_price_close, 4),
                                     'amount': round(position, 4),
@@ -1354,7 +3404,7 @@ import pandas as pd
                             liquidation_price = 0
                             highest_since_entry = None
                             lowest_since_entry = None
-                            equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': round(capital, 2)})
+                            equity_values.append(round(capital, 2))
                             continue
             
             elif open_short_arr[i] and position == 0 and capital >= min_capital_to_trade:
@@ -1393,7 +3443,7 @@ import pandas as pd
                     last_adverse_reduce_anchor = entry_price
                     
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': i,
                         'type': 'open_short',
                         'price': round(exec_price, 4),
                         'amount': round(shares, 4),
@@ -1412,7 +3462,7 @@ import pandas as pd
                                 is_liquidated = True
                                 capital = 0
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'liquidation',
                                     'price': round(liquidation_price, 4),
                                     'amount': round(abs(position), 4),
@@ -1431,7 +3481,7 @@ import pandas as pd
                                     is_liquidated = True
                                     capital = 0
                                 trades.append({
-                                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                                    'time': i,
                                     'type': 'close_short_stop',
                                     'price': round(exec_price_close, 4),
                                     'amount': round(shares_close, 4),
@@ -1444,7 +3494,7 @@ import pandas as pd
                             liquidation_price = 0
                             highest_since_entry = None
                             lowest_since_entry = None
-                            equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': round(capital, 2)})
+                            equity_values.append(round(capital, 2))
                             continue
             
             # 检测持仓期间是否触及爆仓线（作为兜底保护）
@@ -1466,7 +3516,7 @@ import pandas as pd
                         total_commission_paid += commission_fee_close
                         
                         trades.append({
-                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'time': i,
                             'type': 'close_long_stop',
                             'price': round(exec_price_close, 4),
                             'amount': round(position, 4),
@@ -1480,7 +3530,7 @@ import pandas as pd
                         is_liquidated = True
                         capital = 0
                         trades.append({
-                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'time': i,
                             'type': 'liquidation',
                             'price': round(liquidation_price, 4),
                             'amount': round(abs(position), 4),
@@ -1490,7 +3540,7 @@ import pandas as pd
                     
                     position = 0
                     position_type = None
-                    equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': capital})
+                    equity_values.append(capital)
                     continue
                     
                 elif position_type == 'short' and high >= liquidation_price:
@@ -1499,7 +3549,7 @@ import pandas as pd
                     stop_loss_price = close_short_price_arr[i] if has_stop_loss else 0
                     
                     logger.warning(f"[K线{i}] 做空触及爆仓线！开仓={entry_price:.2f}, 最高={high:.2f}, 爆仓线={liquidation_price:.2f}, "
-                              f"止损信号={close_short_arr[i]}, 止损价={stop_loss_price:.4f}, 时间={timestamp}")
+                              f"止损信号={close_short_arr[i]}, 止损价={stop_loss_price:.4f}, 时间={df.index[i]}")
                     
                     # 判断先触发止损还是爆仓
                     if has_stop_loss and stop_loss_price < liquidation_price:
@@ -1512,7 +3562,7 @@ import pandas as pd
                         total_commission_paid += commission_fee_close
                         
                         trades.append({
-                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'time': i,
                             'type': 'close_short_stop',
                             'price': round(exec_price_close, 4),
                             'amount': round(shares_close, 4),
@@ -1526,7 +3576,7 @@ import pandas as pd
                         is_liquidated = True
                         capital = 0
                         trades.append({
-                            'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                            'time': i,
                             'type': 'liquidation',
                             'price': round(liquidation_price, 4),
                             'amount': round(abs(position), 4),
@@ -1536,7 +3586,7 @@ import pandas as pd
                     
                     position = 0
                     position_type = None
-                    equity_curve.append({'time': timestamp.strftime('%Y-%m-%d %H:%M'), 'value': capital})
+                    equity_values.append(capital)
                     continue
             
             # 记录权益（使用收盘价计算未实现盈亏）
@@ -1553,14 +3603,11 @@ import pandas as pd
             if total_value < 0:
                 total_value = 0
             
-            equity_curve.append({
-                'time': timestamp.strftime('%Y-%m-%d %H:%M'),
-                'value': round(total_value, 2)
-            })
+            equity_values.append(round(total_value, 2))
         
         # 回测结束时强制平仓
         if position != 0:
-            timestamp = df.index[-1]
+            last_i = n - 1
             final_close = df.iloc[-1]['close']
             
             if position > 0:  # 平多
@@ -1571,7 +3618,7 @@ import pandas as pd
                 total_commission_paid += commission_fee
                 
                 trades.append({
-                    'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                    'time': last_i,
                     'type': 'close_long',
                     'price': round(exec_price, 4),
                     'amount': round(position, 4),
@@ -1589,7 +3636,7 @@ import pandas as pd
                     capital = 0
                     is_liquidated = True
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': last_i,
                         'type': 'liquidation',
                         'price': round(exec_price, 4),
                         'amount': round(shares, 4),
@@ -1600,7 +3647,7 @@ import pandas as pd
                     capital += profit
                     total_commission_paid += commission_fee
                     trades.append({
-                        'time': timestamp.strftime('%Y-%m-%d %H:%M'),
+                        'time': last_i,
                         'type': 'close_short',
                         'price': round(exec_price, 4),
                         'amount': round(shares, 4),
@@ -1608,11 +3655,18 @@ import pandas as pd
                         'balance': round(capital, 2)
                     })
             
-            if equity_curve:
-                equity_curve[-1]['value'] = round(capital, 2)
-        
+            if equity_values:
+                equity_values[-1] = round(capital, 2)
+
+        # 统一格式化时间戳（每根K线只格式化一次）
+        time_strs = self._format_bar_times(df.index)
+        for trade in trades:
+            trade['time'] = time_strs[trade['time']]
+        equity_curve = [{'time': t, 'value': v} for t, v in zip(time_strs, equity_values)]
+
         return equity_curve, trades, total_commission_paid
     
+
     def _simulate_trading_old_format(
         self,
         df: pd.DataFrame,
@@ -2865,3 +4919,174 @@ import pandas as pd
             'trades': cleaned_trades
         }
 
+
+# ---------------------------------------------------------------------------
+# 进程池辅助函数（需为模块级函数以便子进程调用）
+# ---------------------------------------------------------------------------
+
+# 子进程内的撮合上下文（df / signals / 回测参数），由 _sim_worker_init 设置
+_SIM_WORKER_CTX: Dict[str, Any] = {}
+
+
+def _backtest_pool_context():
+    """返回 fork 启动的 multiprocessing 上下文；不支持 fork 的平台返回 None（串行执行）"""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def _resolve_pool_workers(requested: Optional[int], task_count: int) -> int:
+    """计算进程数：min(请求值, BACKTEST_SWEEP_WORKERS, 任务数)"""
+    try:
+        limit = int(os.getenv('BACKTEST_SWEEP_WORKERS') or 0)
+    except Exception:
+        limit = 0
+    if limit <= 0:
+        limit = os.cpu_count() or 1
+    try:
+        req = int(requested or 0)
+    except Exception:
+        req = 0
+    workers = min(req, limit) if req > 0 else limit
+    return max(1, min(workers, task_count))
+
+
+def _pool_map(sim_ctx: Dict[str, Any], func, items: List[Any], max_workers: Optional[int] = None) -> List[Any]:
+    """
+    以 func(sim_ctx, item) 处理 items，按输入顺序返回结果。
+
+    进程池使用 fork 方式启动：子进程直接继承已加载的 df/signals，且不会重新 import run.py
+    触发 create_app。平台不支持 fork 或任务过少时在当前进程串行执行。
+    """
+    workers = _resolve_pool_workers(max_workers, len(items))
+    ctx = _backtest_pool_context()
+    if workers <= 1 or ctx is None:
+        return [func(sim_ctx, item) for item in items]
+
+    chunksize = max(1, len(items) // (workers * 4))
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_sim_worker_init,
+            initargs=(sim_ctx,)
+        ) as pool:
+            return list(pool.map(_sim_worker_call, [(func, item) for item in items], chunksize=chunksize))
+    except Exception as e:
+        logger.warning(f"Backtest process pool failed, falling back to serial execution: {e}")
+        return [func(sim_ctx, item) for item in items]
+
+
+def _sim_worker_init(sim_ctx: Dict[str, Any]) -> None:
+    _SIM_WORKER_CTX.clear()
+    _SIM_WORKER_CTX.update(sim_ctx)
+    # 父进程（引擎 / web 进程）被 SIGKILL 时进程池不会通知子进程：发现父进程不在了就直接退出。
+    # 引擎锁、IPC socket 等 fd 已在 fork 时关闭（见 engine.close_in_children）
+    parent_pid = os.getppid()
+    threading.Thread(target=_exit_with_parent, args=(parent_pid,), name='BacktestPoolWatchdog', daemon=True).start()
+
+
+def _exit_with_parent(parent_pid: int) -> None:
+    while os.getppid() == parent_pid:
+        time.sleep(1.0)
+    os._exit(1)
+
+
+def _sim_worker_call(task: Tuple[Any, Any]) -> Any:
+    func, item = task
+    return func(_SIM_WORKER_CTX, item)
+
+
+def _clean_metrics(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """NaN/Inf 置 0，numpy 标量转为 python 类型（便于跨进程传递与 JSON 序列化）"""
+    cleaned = {}
+    for key, value in metrics.items():
+        if isinstance(value, float) and not np.isfinite(value):
+            value = 0
+        cleaned[key] = float(value) if isinstance(value, np.floating) else value
+    return cleaned
+
+
+def _slice_sim_ctx(sim_ctx: Dict[str, Any], start: int, end: int) -> Dict[str, Any]:
+    """按K线下标区间 [start, end) 切片 df / signals，并把回测起止时间设为切片首尾"""
+    sliced = dict(sim_ctx)
+    df = sim_ctx['df'].iloc[start:end]
+    sliced['df'] = df
+    sliced['signals'] = {k: v.iloc[start:end] for k, v in sim_ctx['signals'].items()}
+    sliced['start_date'] = df.index[0].to_pydatetime()
+    sliced['end_date'] = df.index[-1].to_pydatetime()
+    return sliced
+
+
+def _simulate_sim_variant(sim_ctx: Dict[str, Any], strategy_config: Dict[str, Any]) -> tuple:
+    """对一组 strategy_config 执行撮合，返回 (equity_curve, trades, total_commission, metrics)"""
+    service = BacktestService()
+    equity_curve, trades, total_commission = service._simulate_trading(
+        sim_ctx['df'],
+        sim_ctx['signals'],
+        sim_ctx['initial_capital'],
+        sim_ctx['commission'],
+        sim_ctx['slippage'],
+        sim_ctx['leverage'],
+        sim_ctx['trade_direction'],
+        strategy_config,
+        engine=sim_ctx.get('engine')
+    )
+    metrics = service._calculate_metrics(
+        equity_curve, trades, sim_ctx['initial_capital'], sim_ctx['timeframe'],
+        sim_ctx['start_date'], sim_ctx['end_date'], total_commission
+    )
+    return equity_curve, trades, total_commission, _clean_metrics(metrics)
+
+
+def _evaluate_sim_variant(sim_ctx: Dict[str, Any], strategy_config: Dict[str, Any]) -> Dict[str, Any]:
+    """对一组 strategy_config 执行撮合并计算指标"""
+    try:
+        return _simulate_sim_variant(sim_ctx, strategy_config)[3]
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def _evaluate_walk_forward_window(sim_ctx: Dict[str, Any], window: Dict[str, int]) -> Dict[str, Any]:
+    """Walk-forward 单个窗口：样本内逐组撮合择优，再用最优参数跑样本外"""
+    try:
+        sort_by = sim_ctx['sort_by']
+        descending = sim_ctx.get('order', 'desc') == 'desc'
+        is_ctx = _slice_sim_ctx(sim_ctx, window['isStart'], window['isEnd'])
+        best_index, best_metrics = None, None
+        for idx, cfg in enumerate(sim_ctx['configs']):
+            metrics = _evaluate_sim_variant(is_ctx, cfg)
+            if 'error' in metrics:
+                continue
+            score = metrics.get(sort_by, 0)
+            if best_metrics is None or (score > best_metrics.get(sort_by, 0) if descending else score < best_metrics.get(sort_by, 0)):
+                best_index, best_metrics = idx, metrics
+        if best_index is None:
+            return {'error': 'No valid in-sample result'}
+
+        oos_ctx = _slice_sim_ctx(sim_ctx, window['oosStart'], window['oosEnd'])
+        equity_curve, trades, total_commission, oos_metrics = _simulate_sim_variant(
+            oos_ctx, sim_ctx['configs'][best_index]
+        )
+        return {
+            'bestIndex': best_index,
+            'isMetrics': best_metrics,
+            'oosMetrics': oos_metrics,
+            'equityCurve': equity_curve,
+            'trades': trades,
+            'totalCommission': float(total_commission)
+        }
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def _execute_portfolio_indicator(exec_ctx: Dict[str, Any], symbol: str) -> Optional[dict]:
+    """组合回测：在单个标的的K线上执行指标，返回信号（失败返回 None）"""
+    try:
+        signals = BacktestService()._execute_indicator(
+            exec_ctx['indicator_code'], exec_ctx['frames'][symbol], exec_ctx['backtest_params']
+        )
+        return signals if isinstance(signals, dict) else None
+    except Exception as e:
+        logger.warning(f"Portfolio backtest: indicator failed for {symbol}: {e}")
+        return None
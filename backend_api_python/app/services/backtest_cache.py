@@ -0,0 +1,158 @@
+"""
+回测结果缓存（内容寻址）
+
+缓存键 = sha256(回测输入参数 + 指标代码 + K线数据指纹)。K线数据指纹由实际参与回测的
+OHLCV 数据计算，所以底层K线发生变化（补数据、修正、数据源切换）时键自动变化，旧结果不会再命中。
+结果存放在 SQLite 表 qd_backtest_cache 中，总大小超过 BACKTEST_CACHE_MAX_MB 时按最近命中时间淘汰。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 撮合逻辑或结果格式变化时递增，使旧缓存整体失效
+CACHE_SCHEMA_VERSION = 1
+
+
+def backtest_cache_enabled() -> bool:
+    return str(os.getenv('BACKTEST_CACHE_ENABLED', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def kline_data_version(df: pd.DataFrame) -> str:
+    """K线数据指纹（时间索引 + OHLCV）"""
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(df.index.asi8 if hasattr(df.index, 'asi8') else df.index.values).tobytes())
+    for col in ('open', 'high', 'low', 'close', 'volume'):
+        if col in df.columns:
+            h.update(np.ascontiguousarray(df[col].to_numpy(dtype='float64')).tobytes())
+    return h.hexdigest()
+
+
+class BacktestResultCache:
+    """回测结果缓存（SQLite 持久化，按总大小 LRU 淘汰）"""
+
+    def __init__(self):
+        try:
+            max_mb = float(os.getenv('BACKTEST_CACHE_MAX_MB', '256') or 256)
+        except Exception:
+            max_mb = 256.0
+        self.max_bytes = int(max(max_mb, 0) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(inputs: Dict[str, Any], data_version: str) -> str:
+        payload = json.dumps(
+            {'v': CACHE_SCHEMA_VERSION, 'inputs': inputs, 'data': data_version},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute("SELECT result_json FROM qd_backtest_cache WHERE cache_key = ?", (key,))
+                row = cur.fetchone()
+                if row and row.get('result_json'):
+                    cur.execute(
+                        "UPDATE qd_backtest_cache SET hit_count = hit_count + 1, last_hit_at = ? WHERE cache_key = ?",
+                        (int(time.time()), key)
+                    )
+                    db.commit()
+                cur.close()
+            if not row or not row.get('result_json'):
+                with self._lock:
+                    self.misses += 1
+                return None
+            result = json.loads(row['result_json'])
+            with self._lock:
+                self.hits += 1
+            return result
+        except Exception as e:
+            logger.warning(f"Backtest cache read failed: {e}")
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        if self.max_bytes <= 0:
+            return
+        try:
+            payload = json.dumps(result, ensure_ascii=False)
+            size = len(payload.encode('utf-8'))
+            if size > self.max_bytes:
+                return
+            now_ts = int(time.time())
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(
+                    """
+                    INSERT OR REPLACE INTO qd_backtest_cache
+                    (cache_key, result_json, size_bytes, hit_count, created_at, last_hit_at)
+                    VALUES (?, ?, ?, 0, ?, ?)
+                    """,
+                    (key, payload, size, now_ts, now_ts)
+                )
+                db.commit()
+                self._evict(cur, db)
+                cur.close()
+        except Exception as e:
+            logger.warning(f"Backtest cache write failed: {e}")
+
+    def _evict(self, cur, db) -> None:
+        """超出容量时按 last_hit_at 从旧到新删除"""
+        cur.execute("SELECT COALESCE(SUM(size_bytes), 0) AS total FROM qd_backtest_cache")
+        total = int((cur.fetchone() or {}).get('total') or 0)
+        if total <= self.max_bytes:
+            return
+        cur.execute("SELECT cache_key, size_bytes FROM qd_backtest_cache ORDER BY last_hit_at ASC, created_at ASC")
+        victims = []
+        for row in cur.fetchall() or []:
+            if total <= self.max_bytes:
+                break
+            victims.append(row['cache_key'])
+            total -= int(row.get('size_bytes') or 0)
+        for key in victims:
+            cur.execute("DELETE FROM qd_backtest_cache WHERE cache_key = ?", (key,))
+        db.commit()
+        logger.info(f"Backtest cache evicted {len(victims)} entries")
+
+    def clear(self) -> None:
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute("DELETE FROM qd_backtest_cache")
+                db.commit()
+                cur.close()
+        except Exception as e:
+            logger.warning(f"Backtest cache clear failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'maxBytes': self.max_bytes}
+
+
+_cache: Optional[BacktestResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_backtest_cache() -> Optional[BacktestResultCache]:
+    """返回全局回测结果缓存；BACKTEST_CACHE_ENABLED=false 时返回 None"""
+    global _cache
+    if not backtest_cache_enabled():
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = BacktestResultCache()
+    return _cache
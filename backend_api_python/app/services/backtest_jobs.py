@@ -0,0 +1,304 @@
+"""
+异步回测任务队列
+
+POST /backtest 在 async=true 时只写入一条 status=queued 的 qd_backtest_runs 记录并立即返回 runId，
+回测在本进程的有界线程池中执行，状态流转 queued -> running -> success / failed。
+
+进度同时保存在内存和 qd_backtest_runs.progress_json（限频写入）中：
+同一进程内的 SSE 连接直接读内存并被条件变量唤醒，其他 gunicorn worker 的连接回退为读数据库。
+
+任务是进程内线程：队列已满被拒绝的任务直接标记 failed；进程退出后遗留的 queued/running 记录
+（worker_pid 对应的进程已不存在）由 fail_orphaned_jobs() 在启动时标记为 failed，避免 SSE 客户端无限轮询。
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TERMINAL_STATUSES = ('success', 'failed')
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+class BacktestJobManager:
+    """有界回测任务池"""
+
+    def __init__(self, backtest_service=None):
+        if backtest_service is None:
+            from app.services.backtest import BacktestService
+            backtest_service = BacktestService()
+        self.backtest_service = backtest_service
+
+        # 默认只占用 1 个线程，避免长回测与实盘策略线程争抢 CPU
+        self.max_workers = max(1, _env_int('BACKTEST_JOB_WORKERS', 1))
+        self.max_pending = max(1, _env_int('BACKTEST_JOB_MAX_PENDING', 20))
+        self.progress_flush_sec = max(0.2, float(_env_int('BACKTEST_JOB_PROGRESS_FLUSH_MS', 1000)) / 1000.0)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='BacktestJob')
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._progress: Dict[int, Dict[str, Any]] = {}
+
+    # ------------------------------------------------------------------
+    # 提交 / 执行
+    # ------------------------------------------------------------------
+
+    def submit(self, run_id: int, params: Dict[str, Any]) -> None:
+        """提交一个已写入 qd_backtest_runs（status=queued）的任务"""
+        with self._cond:
+            if self._pending >= self.max_pending:
+                msg = f"Too many pending backtest jobs (max {self.max_pending}), please retry later"
+                self._write_row(run_id, status='failed', error_message=msg)
+                raise ValueError(msg)
+            self._pending += 1
+            self._progress[run_id] = {
+                'runId': run_id,
+                'status': 'queued',
+                'stage': 'queued',
+                'barsProcessed': 0,
+                'totalBars': 0,
+                'trades': 0,
+                'percent': 0,
+                'error': '',
+                'version': 1,
+            }
+            self._cond.notify_all()
+        try:
+            self._executor.submit(self._run_job, run_id, params)
+        except Exception as e:
+            with self._cond:
+                self._pending -= 1
+                self._progress.pop(run_id, None)
+            self._write_row(run_id, status='failed', error_message=str(e))
+            raise
+
+    def _run_job(self, run_id: int, params: Dict[str, Any]) -> None:
+        last_flush = [0.0]
+
+        def on_progress(p: Dict[str, Any]) -> None:
+            total = int(p.get('totalBars') or 0)
+            bars = int(p.get('barsProcessed') or 0)
+            self._update(run_id, {
+                'stage': p.get('stage') or '',
+                'barsProcessed': bars,
+                'totalBars': total,
+                'trades': int(p.get('trades') or 0),
+                'percent': round(bars * 100.0 / total, 1) if total else 0,
+            })
+            now = time.time()
+            if now - last_flush[0] >= self.progress_flush_sec:
+                last_flush[0] = now
+                self._write_row(run_id, progress=self.get_progress(run_id))
+
+        try:
+            self._update(run_id, {'status': 'running', 'stage': 'starting'})
+            self._write_row(run_id, status='running', progress=self.get_progress(run_id))
+
+            result = self.backtest_service.run(
+                indicator_code=params['indicator_code'],
+                market=params['market'],
+                symbol=params['symbol'],
+                timeframe=params['timeframe'],
+                start_date=params['start_date'],
+                end_date=params['end_date'],
+                initial_capital=params['initial_capital'],
+                commission=params['commission'],
+                slippage=params['slippage'],
+                leverage=params['leverage'],
+                trade_direction=params['trade_direction'],
+                strategy_config=params['strategy_config'],
+                use_cache=params.get('use_cache', True),
+                progress_callback=on_progress
+            )
+
+            # 先落库再更新内存：SSE 收到终态时 /backtest/get 已能读到结果
+            done = {'status': 'success', 'stage': 'done', 'percent': 100}
+            self._write_row(run_id, status='success', result=result, progress={**(self.get_progress(run_id) or {}), **done})
+            self._update(run_id, done)
+        except Exception as e:
+            if not isinstance(e, ValueError):
+                logger.error(f"Backtest job {run_id} failed: {e}")
+                logger.error(traceback.format_exc())
+            failed = {'status': 'failed', 'stage': 'failed', 'error': str(e)}
+            self._write_row(run_id, status='failed', error_message=str(e), progress={**(self.get_progress(run_id) or {}), **failed})
+            self._update(run_id, failed)
+        finally:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
+            self._expire_later(run_id)
+
+    def _expire_later(self, run_id: int, delay: float = 300.0) -> None:
+        """任务结束一段时间后释放内存中的进度（之后 SSE 从数据库读取终态）"""
+        def _drop():
+            with self._cond:
+                self._progress.pop(run_id, None)
+        timer = threading.Timer(delay, _drop)
+        timer.daemon = True
+        timer.start()
+
+    # ------------------------------------------------------------------
+    # 进度
+    # ------------------------------------------------------------------
+
+    def _update(self, run_id: int, fields: Dict[str, Any]) -> None:
+        with self._cond:
+            p = self._progress.get(run_id)
+            if p is None:
+                return
+            p.update(fields)
+            p['version'] = int(p.get('version') or 0) + 1
+            self._cond.notify_all()
+
+    def get_progress(self, run_id: int) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            p = self._progress.get(run_id)
+            return dict(p) if p is not None else None
+
+    def wait_progress(self, run_id: int, last_version: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """阻塞直到本进程内该任务的进度版本超过 last_version 或超时；任务不在本进程时返回 None"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                p = self._progress.get(run_id)
+                if p is None:
+                    return None
+                if int(p.get('version') or 0) > last_version or p.get('status') in TERMINAL_STATUSES:
+                    return dict(p)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return dict(p)
+                self._cond.wait(remaining)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            running = sum(1 for p in self._progress.values() if p.get('status') == 'running')
+            return {'workers': self.max_workers, 'pending': self._pending, 'running': running, 'maxPending': self.max_pending}
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def _write_row(
+        self,
+        run_id: int,
+        status: Optional[str] = None,
+        error_message: Optional[str] = None,
+        result: Optional[Dict[str, Any]] = None,
+        progress: Optional[Dict[str, Any]] = None
+    ) -> None:
+        sets, args = [], []
+        if status is not None:
+            sets.append("status = ?")
+            args.append(status)
+        if error_message is not None:
+            sets.append("error_message = ?")
+            args.append(error_message)
+        if result is not None:
+            sets.append("result_json = ?")
+            args.append(json.dumps(result, ensure_ascii=False))
+        if progress is not None:
+            sets.append("progress_json = ?")
+            args.append(json.dumps({k: v for k, v in progress.items() if k != 'version'}, ensure_ascii=False))
+        sets.append("updated_at = ?")
+        args.append(int(time.time()))
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(f"UPDATE qd_backtest_runs SET {', '.join(sets)} WHERE id = ?", (*args, run_id))
+                db.commit()
+                cur.close()
+        except Exception:
+            logger.warning(f"Failed to update backtest job {run_id}", exc_info=True)
+
+
+def read_job_row(run_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """从数据库读取任务状态与进度（跨进程 SSE / 轮询使用）"""
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            "SELECT id, status, error_message, progress_json FROM qd_backtest_runs WHERE id = ? AND user_id = ?",
+            (run_id, user_id)
+        )
+        row = cur.fetchone()
+        cur.close()
+    if not row:
+        return None
+    try:
+        progress = json.loads(row.get('progress_json') or '{}')
+    except Exception:
+        progress = {}
+    progress.update({'runId': row['id'], 'status': row.get('status') or '', 'error': row.get('error_message') or ''})
+    return progress
+
+
+def _pid_alive(pid: int) -> bool:
+    if sys.platform == 'win32':
+        # Windows 只有单进程部署，启动时不存在其他进程的任务
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def fail_orphaned_jobs() -> int:
+    """
+    启动时调用：把所属进程已退出（或就是本进程的旧 pid）的 queued/running 任务标记为 failed。
+    其他仍存活的 gunicorn worker 的任务不受影响。返回标记的条数。
+    """
+    try:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute("SELECT id, worker_pid FROM qd_backtest_runs WHERE status IN ('queued', 'running')")
+            rows = cur.fetchall() or []
+            orphaned = [
+                int(r['id']) for r in rows
+                if not r.get('worker_pid') or int(r['worker_pid']) == os.getpid() or not _pid_alive(int(r['worker_pid']))
+            ]
+            if orphaned:
+                cur.execute(
+                    f"UPDATE qd_backtest_runs SET status = 'failed', error_message = ?, updated_at = ? "
+                    f"WHERE id IN ({','.join('?' * len(orphaned))}) AND status IN ('queued', 'running')",
+                    ('Backtest worker restarted before the job finished', int(time.time()), *orphaned)
+                )
+                db.commit()
+            cur.close()
+    except Exception as e:
+        logger.warning(f"Failed to sweep orphaned backtest jobs: {e}")
+        return 0
+    if orphaned:
+        logger.info(f"Marked {len(orphaned)} orphaned backtest job(s) as failed")
+    return len(orphaned)
+
+
+_manager: Optional[BacktestJobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_backtest_job_manager(backtest_service=None) -> BacktestJobManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = BacktestJobManager(backtest_service)
+    return _manager
@@ -0,0 +1,286 @@
+"""
+实时K线滚动缓冲（按 symbol + timeframe 共享）
+
+运行中的策略不再每个K线周期各自拉取 500 根K线并重建 DataFrame，也不再每个 tick 做
+df.copy() + pd.concat：
+- 每个 (symbol, timeframe) 一个 CandleRing，预分配 NumPy 数组（time: int64, ohlcv: float64[n, 5]），
+  同一市场上的所有策略共享；
+- 行情（行情流 / 共享价格源）到达时原地更新最后一根K线，跨越周期边界时追加新K线；
+- 只在滚动后或间隔 CANDLE_RING_RECONCILE_SEC 后向交易所对账一次（用交易所的已收盘K线覆盖本地，
+  同时补齐成交量——ticker 行情没有逐根成交量），同一 ring 的并发对账只会执行一次；
+- frame() 返回对底层数组的零拷贝 DataFrame 视图。
+
+并发约定：写入只会原地修改最后一根K线，或写到所有已发出视图的末尾之后；缓冲区写满或对账时
+分配新数组而不是覆盖旧数组，所以已发出的视图除"最后一根未收盘K线"外不会再变化。
+指标执行前（_execute_indicator_df）本来就会 copy 一次，作为隔离边界。
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.data_sources.base import TIMEFRAME_SECONDS
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+_O, _H, _L, _C, _V = range(5)
+
+KlineFetcher = Callable[[str, str, int], List[Dict[str, Any]]]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+def _timeframe_seconds(timeframe: str) -> int:
+    for key in (timeframe, str(timeframe).upper(), str(timeframe).lower()):
+        if key in TIMEFRAME_SECONDS:
+            return TIMEFRAME_SECONDS[key]
+    return 60
+
+
+class CandleRing:
+    """单个 (symbol, timeframe) 的滚动K线缓冲"""
+
+    def __init__(self, symbol: str, timeframe: str, window: int, fetcher: KlineFetcher,
+                 reconcile_sec: Optional[float] = None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.tf_seconds = _timeframe_seconds(timeframe)
+        self.window = max(int(window), 2)
+        # 预留 3 倍窗口的追加空间，写满时才重新分配（已发出的视图不受影响）
+        self.capacity = self.window * 4
+        self.fetcher = fetcher
+        self.reconcile_sec = reconcile_sec if reconcile_sec is not None else _env_float('CANDLE_RING_RECONCILE_SEC', 300)
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._time = np.zeros(self.capacity, dtype='i8')
+        self._ohlcv = np.zeros((self.capacity, 5), dtype='f8')
+        self._end = 0
+        self.loaded = False
+        self.version = 0
+        self.last_reconcile = 0.0
+        self._rolled_since_reconcile = False
+        self._reconciling = False
+
+        self.ticks = 0
+        self.rollovers = 0
+        self.reconciles = 0
+
+    # ------------------------------------------------------------------
+    # 加载 / 对账
+    # ------------------------------------------------------------------
+
+    def ensure_loaded(self) -> bool:
+        """首次使用时从交易所加载 window 根K线（并发调用只加载一次）"""
+        if self.loaded:
+            return True
+        with self._load_lock:
+            if self.loaded:
+                return True
+            return self._reconcile()
+
+    def maybe_reconcile(self) -> None:
+        """滚动后（或超过 reconcile_sec）与交易所对账；其他线程正在对账时直接返回"""
+        now = time.time()
+        with self._lock:
+            if self._reconciling or not self.loaded:
+                return
+            due = now - self.last_reconcile >= self.reconcile_sec
+            if self._rolled_since_reconcile:
+                # 新K线刚开始时交易所可能还没收盘上一根，至少间隔 5s
+                due = due or now - self._time[self._end - 1] >= 5
+            if not due:
+                return
+            self._reconciling = True
+        try:
+            self._reconcile()
+        finally:
+            with self._lock:
+                self._reconciling = False
+
+    def _reconcile(self) -> bool:
+        try:
+            klines = self.fetcher(self.symbol, self.timeframe, self.window)
+        except Exception as e:
+            logger.warning(f"CandleRing {self.symbol} {self.timeframe} fetch failed: {e}")
+            klines = []
+        rows = []
+        for k in klines or []:
+            try:
+                rows.append((int(k['time']), float(k['open']), float(k['high']), float(k['low']),
+                             float(k['close']), float(k.get('volume') or 0.0)))
+            except Exception:
+                continue
+        rows.sort(key=lambda r: r[0])
+        if len(rows) < 2:
+            with self._lock:
+                # 失败时也推迟下一次对账，避免每个 tick 都回源
+                self.last_reconcile = time.time()
+            return False
+
+        times = np.fromiter((r[0] for r in rows), dtype='i8', count=len(rows))
+        values = np.array([r[1:] for r in rows], dtype='f8')
+
+        with self._lock:
+            if self._end > 0:
+                last_fetched = int(times[-1])
+                local_times = self._time[:self._end]
+                # 交易所返回的最后一根（未收盘）与本地同一根：保留本地更新的价格
+                pos = int(np.searchsorted(local_times, last_fetched))
+                if pos < self._end and local_times[pos] == last_fetched:
+                    local = self._ohlcv[pos]
+                    values[-1, _H] = max(values[-1, _H], local[_H])
+                    values[-1, _L] = min(values[-1, _L], local[_L])
+                    values[-1, _C] = local[_C]
+                    pos += 1
+                # 对账期间本地已经滚动出的新K线
+                if pos < self._end:
+                    times = np.concatenate([times, local_times[pos:]])
+                    values = np.concatenate([values, self._ohlcv[pos:self._end]])
+
+            n = min(len(times), self.window)
+            new_time = np.zeros(self.capacity, dtype='i8')
+            new_ohlcv = np.zeros((self.capacity, 5), dtype='f8')
+            new_time[:n] = times[-n:]
+            new_ohlcv[:n] = values[-n:]
+            self._time, self._ohlcv, self._end = new_time, new_ohlcv, n
+            self.loaded = True
+            self.version += 1
+            self.last_reconcile = time.time()
+            self._rolled_since_reconcile = False
+            self.reconciles += 1
+        return True
+
+    # ------------------------------------------------------------------
+    # 行情更新
+    # ------------------------------------------------------------------
+
+    def on_price(self, price: float, ts: Optional[float] = None) -> None:
+        """用最新价原地更新最后一根K线，跨越周期边界时追加新K线"""
+        if not price or price <= 0:
+            return
+        bucket = int(float(ts or time.time()) // self.tf_seconds) * self.tf_seconds
+        with self._lock:
+            if self._end == 0:
+                return
+            self.ticks += 1
+            last = int(self._time[self._end - 1])
+            if bucket == last:
+                row = self._ohlcv[self._end - 1]
+                if price > row[_H]:
+                    row[_H] = price
+                if price < row[_L]:
+                    row[_L] = price
+                row[_C] = price
+            elif bucket > last:
+                if self._end >= self.capacity:
+                    # 写满：把最后 window-1 根搬到新数组（旧视图仍指向旧数组）
+                    keep = self.window - 1
+                    new_time = np.zeros(self.capacity, dtype='i8')
+                    new_ohlcv = np.zeros((self.capacity, 5), dtype='f8')
+                    new_time[:keep] = self._time[self._end - keep:self._end]
+                    new_ohlcv[:keep] = self._ohlcv[self._end - keep:self._end]
+                    self._time, self._ohlcv, self._end = new_time, new_ohlcv, keep
+                self._time[self._end] = bucket
+                self._ohlcv[self._end] = (price, price, price, price, 0.0)
+                self._end += 1
+                self.version += 1
+                self.rollovers += 1
+                self._rolled_since_reconcile = True
+            # bucket < last：迟到的行情，忽略
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def arrays(self, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (time[n], ohlcv[n, 5]) 的零拷贝视图"""
+        n = min(int(limit or self.window), self.window)
+        with self._lock:
+            start = max(self._end - n, 0)
+            return self._time[start:self._end], self._ohlcv[start:self._end]
+
+    def frame(self, limit: Optional[int] = None) -> pd.DataFrame:
+        """零拷贝 DataFrame 视图（UTC DatetimeIndex，列为 float64 的 open/high/low/close/volume）"""
+        times, ohlcv = self.arrays(limit)
+        index = pd.to_datetime(times, unit='s', utc=True)
+        return pd.DataFrame(ohlcv, index=index, columns=OHLCV_COLUMNS, copy=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'symbol': self.symbol, 'timeframe': self.timeframe, 'bars': self._end,
+                'ticks': self.ticks, 'rollovers': self.rollovers, 'reconciles': self.reconciles,
+                'lastReconcileAgoSec': round(time.time() - self.last_reconcile, 1) if self.last_reconcile else None,
+            }
+
+
+class CandleRingStore:
+    """按 (symbol, timeframe) 管理共享的 CandleRing，按订阅者引用计数释放"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rings: Dict[Tuple[str, str], CandleRing] = {}
+        self._holders: Dict[Tuple[str, str], set] = {}
+
+    @staticmethod
+    def _key(symbol: str, timeframe: str) -> Tuple[str, str]:
+        return (symbol or '').strip().upper(), str(timeframe or '')
+
+    def acquire(self, holder: Any, symbol: str, timeframe: str, window: int, fetcher: KlineFetcher) -> CandleRing:
+        key = self._key(symbol, timeframe)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = self._rings[key] = CandleRing(symbol, timeframe, window, fetcher)
+            self._holders.setdefault(key, set()).add(holder)
+            return ring
+
+    def release(self, holder: Any, symbol: str, timeframe: str) -> None:
+        key = self._key(symbol, timeframe)
+        with self._lock:
+            holders = self._holders.get(key)
+            if holders is None:
+                return
+            holders.discard(holder)
+            if not holders:
+                del self._holders[key]
+                self._rings.pop(key, None)
+
+    def rings_for_symbol(self, symbol: str) -> List[CandleRing]:
+        sym = (symbol or '').strip().upper()
+        with self._lock:
+            return [r for (s, _), r in self._rings.items() if s == sym]
+
+    def on_price(self, symbol: str, price: float, ts: Optional[float] = None) -> None:
+        """行情流回调：更新该交易对所有周期的K线"""
+        for ring in self.rings_for_symbol(symbol):
+            ring.on_price(price, ts)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rings = list(self._rings.values())
+        return {'rings': len(rings), 'ringStats': [r.stats() for r in rings]}
+
+
+_store: Optional[CandleRingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_candle_rings() -> CandleRingStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CandleRingStore()
+    return _store
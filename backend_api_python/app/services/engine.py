@@ -0,0 +1,451 @@
+"""
+后台引擎归属（策略循环 + 挂单分发只在一个进程中运行）
+
+gunicorn 多 worker 时每个进程都会执行 create_app；如果每个进程都恢复运行中的策略、轮询 pending_orders，
+会成倍增加 CPU / 交易所请求，并可能重复下单。这里用文件锁做 leader 选举：
+- 拿到锁（fcntl.flock，进程退出时由内核自动释放）的进程成为引擎：恢复策略、启动 PendingOrderWorker 等后台任务，
+  并在本地 IPC 通道（multiprocessing.connection，POSIX 上为 Unix socket）上接收其他进程的控制命令；
+- 其他进程只处理 HTTP 请求，后台线程定期重试拿锁，引擎进程退出后由其中一个接管；
+- web 进程的策略启动/停止、运行状态查询通过 IPC 转发给引擎。
+
+ENGINE_ROLE=auto（默认，参与选举）| web（从不运行后台任务，配合独立引擎进程 run_engine.py 使用）
+| engine（run_engine.py 设置：不处理 HTTP 的专用引擎进程，同样参与选举，拿不到锁时作为 standby 等待接管）。
+gunicorn_config.py 把 worker 固定为 web，并由 master 启动 run_engine.py。
+ENGINE_SHARDS=N（默认 1）> 1 时最多 N 个进程各持有一个分片锁，运行中的策略按哈希分散到各分片（见 engine_shards），
+web 进程把启动/停止命令转发给对应分片；分片 0 另外运行全局后台任务。
+锁文件与 IPC 地址文件默认放在 SQLite 主库所在目录：共享同一个库的进程才需要互斥。
+不支持 fcntl 的平台（Windows）只有单进程部署，直接作为引擎运行。
+"""
+import json
+import os
+import secrets
+import socket
+import struct
+import threading
+import time
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class EngineUnavailable(RuntimeError):
+    """当前没有可用的引擎进程（正在切换或未启动）"""
+
+
+# 引擎进程持有的 fd（引擎锁、IPC 监听 socket、挂单唤醒 socket）。引擎进程之后 fork 的子进程
+# （指标沙箱、回测进程池）会继承它们：引擎被杀后子进程仍持有锁 / socket，standby 永远拿不到锁。
+# 在 fork 后的子进程里立即关闭（flock 锁属于打开的文件描述，子进程关闭自己的副本不影响父进程）
+_child_close_fds: set = set()
+
+
+def close_in_children(fd: int) -> None:
+    """登记一个只属于本进程的 fd：之后 fork 出的子进程启动时关闭它"""
+    _child_close_fds.add(int(fd))
+
+
+def _close_fds_after_fork() -> None:
+    for fd in list(_child_close_fds):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    _child_close_fds.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_close_fds_after_fork)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+def _set_io_timeout(conn: Connection, timeout: float) -> None:
+    """给 Connection 底层 socket 设置收发超时（recv/send 超时抛 OSError），避免握手 / 读写无限期阻塞"""
+    sock = socket.socket(fileno=conn.fileno())
+    try:
+        tv = struct.pack('ll', int(timeout), int((timeout - int(timeout)) * 1e6))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, tv)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, tv)
+    finally:
+        sock.detach()
+
+
+def _connect(address: Any, authkey: bytes, timeout: float) -> Connection:
+    """带超时的 multiprocessing.connection.Client：连接、认证握手都不超过 timeout"""
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.setblocking(True)
+    except Exception:
+        sock.close()
+        raise
+    conn = Connection(sock.detach())
+    try:
+        _set_io_timeout(conn, timeout)
+        answer_challenge(conn, authkey)
+        deliver_challenge(conn, authkey)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def _default_lock_file() -> str:
+    from app.utils.db import _get_db_file
+    return os.path.join(os.path.dirname(os.path.abspath(_get_db_file())), 'engine.lock')
+
+
+def executor_stats() -> Dict[str, Any]:
+    """引擎进程内各组件的运行状态（/health 展示）"""
+    import app as app_module
+    from app import get_trading_executor
+    from app.services.indicator_dedup import dedup_enabled, get_indicator_dedup
+    from app.services.price_feed import get_price_feed
+
+    executor = get_trading_executor()
+    stream = executor.market_stream
+    return {
+        'runningStrategies': len(executor.running_strategies),
+        'strategyScheduler': executor.scheduler.stats(),
+        'priceFeed': get_price_feed().stats(),
+        'marketStream': stream.stats() if stream is not None else None,
+        'candleRings': executor.candle_rings.stats(),
+        'positionBook': executor.position_book.stats(),
+        'indicatorDedup': get_indicator_dedup().stats() if dedup_enabled() else None,
+        'pendingOrderDispatch': app_module._pending_order_worker.dispatch_stats()
+        if app_module._pending_order_worker is not None else None,
+        'notifications': app_module._pending_order_worker.notification_stats()
+        if app_module._pending_order_worker is not None else None,
+    }
+
+
+class EngineCoordinator:
+    """引擎 leader 选举 + 本地 IPC；start/stop/stats 在引擎进程内直接执行，其他进程经 IPC 转发"""
+
+    def __init__(self):
+        self.role = (os.getenv('ENGINE_ROLE') or 'auto').strip().lower()
+        if self.role not in ('auto', 'web', 'engine'):
+            logger.warning(f"Unknown ENGINE_ROLE={self.role!r}, using 'auto'")
+            self.role = 'auto'
+        self.lock_path = (os.getenv('ENGINE_LOCK_FILE') or '').strip() or _default_lock_file()
+        self.shards = max(int(_env_float('ENGINE_SHARDS', 1)), 1) if fcntl is not None else 1
+        self.ipc_timeout_sec = max(_env_float('ENGINE_IPC_TIMEOUT_SEC', 10.0), 1.0)
+        self.standby_retry_sec = max(_env_float('ENGINE_STANDBY_RETRY_SEC', 5.0), 0.5)
+
+        self.is_leader = False
+        self.shard_id: Optional[int] = None
+        self.shard_manager = None
+        self.elected_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._lock_fd: Optional[int] = None
+        self._listener: Optional[Listener] = None
+        self._authkey: Optional[bytes] = None
+        self._started = False
+
+        self._handlers: Dict[str, Callable[..., Any]] = {
+            'start_strategy': self._local_start_strategy,
+            'stop_strategy': self._local_stop_strategy,
+            'stats': self._local_stats,
+            'invalidate_positions': self._local_invalidate_positions,
+        }
+
+    @property
+    def sharded(self) -> bool:
+        return self.shards > 1
+
+    def _shard_lock_path(self, shard_id: int) -> str:
+        return self.lock_path if shard_id == 0 else f"{self.lock_path}.{shard_id}"
+
+    def _addr_path(self, shard_id: int) -> str:
+        return self._shard_lock_path(shard_id) + '.addr'
+
+    # ------------------------------------------------------------------
+    # 选举
+    # ------------------------------------------------------------------
+
+    def start(self, on_elected: Callable[[], None]) -> None:
+        """参与选举；当选（立即或之后接管）时调用 on_elected 启动后台任务"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if self.role == 'web':
+            logger.info("Engine role: web (background services run in a separate engine process)")
+            return
+        if self._try_acquire():
+            self._become_leader(on_elected)
+            return
+        logger.info(f"Engine role: standby (engine lock held by another process: {self.lock_path})")
+        threading.Thread(target=self._standby_loop, args=(on_elected,), name='EngineStandby', daemon=True).start()
+
+    def _try_acquire(self) -> bool:
+        """依次尝试各分片锁，拿到任意一个即成为该分片的引擎"""
+        if fcntl is None:
+            self.shard_id = 0
+            return True
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        for shard_id in range(self.shards):
+            fd = None
+            try:
+                fd = os.open(self._shard_lock_path(shard_id), os.O_RDWR | os.O_CREAT | getattr(os, 'O_CLOEXEC', 0), 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                if fd is not None:
+                    os.close(fd)
+                continue
+            # 锁在进程生命周期内一直持有，fd 不能关闭（fork 出的子进程里关闭）
+            self._lock_fd = fd
+            close_in_children(fd)
+            self.shard_id = shard_id
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode())
+            return True
+        return False
+
+    def _standby_loop(self, on_elected: Callable[[], None]) -> None:
+        # 分片模式下任意一个分片锁空出来（对应进程退出）都会被接管
+        while not self.is_leader:
+            time.sleep(self.standby_retry_sec)
+            if self._try_acquire():
+                logger.info("Engine lock acquired: taking over background services")
+                self._become_leader(on_elected)
+
+    def _become_leader(self, on_elected: Callable[[], None]) -> None:
+        self.is_leader = True
+        self.elected_at = time.time()
+        logger.info(f"Engine role: leader (pid={os.getpid()}, shard={self.shard_id}/{self.shards})")
+        try:
+            self._start_ipc_server()
+        except Exception as e:
+            # IPC 不可用不影响本进程运行后台任务，只是其他进程无法转发控制命令
+            logger.error(f"Engine IPC server failed to start: {e}")
+        try:
+            on_elected()
+        except Exception as e:
+            logger.error(f"Engine background services failed to start: {e}")
+
+    # ------------------------------------------------------------------
+    # IPC
+    # ------------------------------------------------------------------
+
+    def _start_ipc_server(self) -> None:
+        authkey = secrets.token_bytes(32)
+        # 不让 Listener 在 accept 里做认证：握手放到每个连接自己的线程里并带超时，
+        # 一个卡住的客户端不会阻塞其他 IPC
+        listener = Listener()
+        self._listener = listener
+        self._authkey = authkey
+        try:
+            close_in_children(listener._listener._socket.fileno())
+        except Exception:
+            pass
+        info = {'pid': os.getpid(), 'address': listener.address, 'authkey': authkey.hex()}
+        addr_path = self._addr_path(self.shard_id or 0)
+        tmp = f"{addr_path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        os.replace(tmp, addr_path)
+        threading.Thread(target=self._accept_loop, name='EngineIPC', daemon=True).start()
+
+    def _accept_loop(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                logger.debug(f"Engine IPC accept failed: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), name='EngineIPCConn', daemon=True).start()
+
+    def _handle(self, conn: Any) -> None:
+        try:
+            _set_io_timeout(conn, self.ipc_timeout_sec)
+            deliver_challenge(conn, self._authkey)
+            answer_challenge(conn, self._authkey)
+        except Exception as e:
+            # 认证失败 / 握手超时
+            logger.debug(f"Engine IPC handshake failed: {e}")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        try:
+            while conn.poll(self.ipc_timeout_sec):
+                msg = conn.recv()
+                op = (msg or {}).get('op')
+                handler = self._handlers.get(op)
+                if handler is None:
+                    conn.send({'ok': False, 'error': f'unknown op: {op}'})
+                    continue
+                try:
+                    conn.send({'ok': True, 'result': handler(*(msg.get('args') or ()))})
+                except Exception as e:
+                    conn.send({'ok': False, 'error': str(e)})
+        except (EOFError, OSError):
+            pass
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _call(self, op: str, *args: Any, shard_id: int = 0, timeout: Optional[float] = None) -> Any:
+        if self.is_leader and shard_id == self.shard_id:
+            return self._handlers[op](*args)
+        timeout = self.ipc_timeout_sec if timeout is None else max(float(timeout), 0.1)
+        deadline = time.time() + timeout
+        try:
+            with open(self._addr_path(shard_id), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            address = info['address']
+            if isinstance(address, list):
+                address = tuple(address)
+            conn = _connect(address, bytes.fromhex(info['authkey']), timeout)
+        except Exception as e:
+            raise EngineUnavailable(f"engine process not reachable: {e}")
+        try:
+            conn.send({'op': op, 'args': list(args)})
+            if not conn.poll(max(0.0, deadline - time.time())):
+                raise EngineUnavailable(f"engine did not answer '{op}' within {timeout:.0f}s")
+            reply = conn.recv()
+        except EngineUnavailable:
+            raise
+        except Exception as e:
+            raise EngineUnavailable(f"engine IPC failed: {e}")
+        finally:
+            conn.close()
+        if not reply.get('ok'):
+            raise RuntimeError(reply.get('error') or f'engine {op} failed')
+        return reply.get('result')
+
+    # ------------------------------------------------------------------
+    # 控制命令
+    # ------------------------------------------------------------------
+
+    def _local_start_strategy(self, strategy_id: int) -> bool:
+        if self.shard_manager is not None:
+            return self.shard_manager.start_strategy(int(strategy_id))
+        from app import get_trading_executor
+        return bool(get_trading_executor().start_strategy(int(strategy_id)))
+
+    def _local_stop_strategy(self, strategy_id: int) -> bool:
+        if self.shard_manager is not None:
+            return self.shard_manager.stop_strategy(int(strategy_id))
+        from app import get_trading_executor
+        return bool(get_trading_executor().stop_strategy(int(strategy_id)))
+
+    @staticmethod
+    def _local_invalidate_positions(strategy_id: int) -> bool:
+        from app.services.position_book import invalidate_local_positions
+        invalidate_local_positions(int(strategy_id))
+        return True
+
+    def _local_stats(self) -> Dict[str, Any]:
+        stats = executor_stats()
+        if self.shard_manager is not None:
+            from app.services.engine_shards import shared_feed_stats
+            stats['shard'] = self.shard_manager.stats()
+            stats['sharedFeed'] = shared_feed_stats()
+        return stats
+
+    def start_strategy(self, strategy_id: int) -> bool:
+        if not self.sharded:
+            return bool(self._call('start_strategy', int(strategy_id)))
+        from app.services.engine_shards import live_shards, pick_shard
+        shard_id = pick_shard(int(strategy_id), live_shards())
+        if shard_id is None:
+            raise EngineUnavailable("no live engine shard")
+        return bool(self._call('start_strategy', int(strategy_id), shard_id=shard_id))
+
+    def stop_strategy(self, strategy_id: int) -> bool:
+        if not self.sharded:
+            return bool(self._call('stop_strategy', int(strategy_id)))
+        from app.services.engine_shards import lease_owner
+        shard_id = lease_owner(int(strategy_id))
+        if shard_id is None:
+            # 没有分片在运行该策略；调用方更新数据库状态后，再平衡也不会再启动它
+            return False
+        return bool(self._call('stop_strategy', int(strategy_id), shard_id=shard_id))
+
+    def invalidate_positions(self, strategy_id: int) -> None:
+        """持仓被直接改库后通知运行该策略的引擎进程丢弃账本缓存（调用方已处理本进程的账本）"""
+        if not self.sharded:
+            shard_id: Optional[int] = 0
+        else:
+            from app.services.engine_shards import lease_owner
+            shard_id = lease_owner(int(strategy_id))
+            if shard_id is None:
+                # 没有分片在运行该策略：下次启动时从数据库加载
+                return
+        if self.is_leader and shard_id == self.shard_id:
+            return
+        self._call('invalidate_positions', int(strategy_id), shard_id=shard_id)
+
+    def executor_stats(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """引擎组件状态；引擎不可达或超过 timeout（秒，分片模式下为总时长）时返回 None。分片模式下汇总各存活分片"""
+        deadline = time.time() + (self.ipc_timeout_sec if timeout is None else timeout)
+        if not self.sharded:
+            try:
+                return self._call('stats', timeout=timeout)
+            except Exception as e:
+                logger.debug(f"engine stats unavailable: {e}")
+                return None
+        try:
+            from app.services.engine_shards import live_shards
+            shard_ids = live_shards()
+        except Exception as e:
+            logger.debug(f"engine shards unavailable: {e}")
+            return None
+        shards: Dict[str, Any] = {}
+        for shard_id in shard_ids:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                shards[str(shard_id)] = None
+                continue
+            try:
+                shards[str(shard_id)] = self._call('stats', shard_id=shard_id, timeout=remaining)
+            except Exception as e:
+                logger.debug(f"engine shard {shard_id} stats unavailable: {e}")
+                shards[str(shard_id)] = None
+        return {
+            'runningStrategies': sum((s or {}).get('runningStrategies') or 0 for s in shards.values()),
+            'shards': shards,
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'role': self.role,
+            'leader': self.is_leader,
+            'pid': os.getpid(),
+            'electedAt': int(self.elected_at) if self.elected_at else None,
+            'shard': self.shard_id,
+            'shards': self.shards,
+        }
+
+
+_engine: Optional[EngineCoordinator] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> EngineCoordinator:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EngineCoordinator()
+    return _engine
@@ -0,0 +1,338 @@
+"""
+引擎分片（ENGINE_SHARDS > 1：运行中的策略分散到多个引擎进程）
+
+单个引擎进程的策略调度、指标计算都受 GIL 限制，策略多时 tick 延迟会上升。分片模式下：
+- 每个引擎进程持有一个分片锁（engine.lock / engine.lock.1 / ...），即一个 shard_id；
+- 各分片定期把心跳写入 qd_engine_shards，心跳未过期的分片为存活分片；
+- 策略归属用 rendezvous（HRW）哈希在存活分片中选取：分片加入/退出时只有落在该分片上的策略会迁移；
+- 分片在 qd_strategy_leases 中登记自己运行的策略（租约）；再平衡时先由旧分片释放（不改数据库状态），
+  新分片看到租约释放或旧分片心跳过期后再启动，避免同一策略在两个进程中同时运行；
+- 分片自己的心跳写入失败或间隔超过过期时间（数据库故障、进程长时间卡住）时，其他分片可能已经接管：
+  先停掉本地运行的策略并撤销租约（fencing），之后按正常再平衡重新获得归属；
+- web 进程按哈希把启动命令发给归属分片，按租约把停止命令发给当前运行的分片。
+
+分片 0 同时运行 PendingOrderWorker 等全局后台任务，并作为共享行情的 feeder（见 shared_feed）。
+"""
+import atexit
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+def rebalance_interval_sec() -> float:
+    return max(_env_float('ENGINE_REBALANCE_SEC', 10.0), 1.0)
+
+
+def shard_ttl_sec() -> float:
+    """心跳过期时间：默认 3 个再平衡周期"""
+    return max(_env_float('ENGINE_SHARD_TTL_SEC', rebalance_interval_sec() * 3), rebalance_interval_sec() * 2)
+
+
+def pick_shard(strategy_id: int, shards: List[int]) -> Optional[int]:
+    """rendezvous 哈希：每个 (策略, 分片) 打分，取最高分的分片"""
+    if not shards:
+        return None
+
+    def score(shard_id: int) -> int:
+        return int(hashlib.sha1(f"{int(strategy_id)}:{int(shard_id)}".encode('utf-8')).hexdigest()[:16], 16)
+
+    return max(shards, key=score)
+
+
+def live_shards() -> List[int]:
+    cutoff = int(time.time() - shard_ttl_sec())
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute("SELECT shard_id FROM qd_engine_shards WHERE heartbeat_at >= %s ORDER BY shard_id", (cutoff,))
+        rows = cur.fetchall() or []
+        cur.close()
+    return [int(r['shard_id']) for r in rows]
+
+
+def lease_owner(strategy_id: int) -> Optional[int]:
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute("SELECT shard_id FROM qd_strategy_leases WHERE strategy_id = %s", (int(strategy_id),))
+        row = cur.fetchone()
+        cur.close()
+    return int(row['shard_id']) if row else None
+
+
+class ShardManager:
+    """本分片的心跳与策略再平衡"""
+
+    def __init__(self, shard_id: int):
+        self.shard_id = int(shard_id)
+        self.rebalance_sec = rebalance_interval_sec()
+        self.started_at = int(time.time())
+        self.rebalances = 0
+        self.moved_in = 0
+        self.moved_out = 0
+        self.fenced = 0
+        self._attempted: Set[int] = set()
+        # 最近一次成功写入的心跳时间（与 qd_engine_shards.heartbeat_at 一致）
+        self._heartbeat_at: Optional[int] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.heartbeat()
+        atexit.register(self.retire)
+        self._thread = threading.Thread(target=self._loop, name=f'EngineShard-{self.shard_id}', daemon=True)
+        self._thread.start()
+        logger.info(f"Engine shard {self.shard_id} started (rebalance every {self.rebalance_sec:.0f}s)")
+
+    def _loop(self) -> None:
+        while True:
+            previous = self._heartbeat_at
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning(f"Engine shard {self.shard_id} heartbeat failed: {e}")
+            try:
+                if self._lease_lost(previous):
+                    self.fence()
+                if self._heartbeat_at is not None and self._heartbeat_at != previous:
+                    self.rebalance()
+            except Exception as e:
+                logger.warning(f"Engine shard {self.shard_id} rebalance failed: {e}")
+            time.sleep(self.rebalance_sec)
+
+    def _lease_lost(self, previous: Optional[int]) -> bool:
+        """其他分片是否可能已把本分片视为过期（与 live_shards 的判定一致，留 1 秒余量）"""
+        if previous is None:
+            return False
+        ttl = shard_ttl_sec()
+        if self._heartbeat_at == previous:
+            # 本轮心跳没写成
+            return time.time() - ttl >= previous - 1
+        return self._heartbeat_at - ttl >= previous - 1
+
+    def fence(self) -> None:
+        """心跳过期：停掉本地策略（不改数据库状态）并撤销租约，等下一次再平衡重新分配"""
+        from app import get_trading_executor
+        executor = get_trading_executor()
+        with self._lock:
+            local = sorted(executor.running_strategies)
+            for sid in local:
+                executor.stop_strategy(sid, mark_stopped=False)
+            self._attempted.clear()
+            if local:
+                self.fenced += 1
+                logger.warning(f"Engine shard {self.shard_id}: heartbeat expired, stopped {len(local)} local strategies")
+            try:
+                with get_db_connection() as db:
+                    cur = db.cursor()
+                    cur.execute("DELETE FROM qd_strategy_leases WHERE shard_id = %s AND pid = %s",
+                                (self.shard_id, os.getpid()))
+                    db.commit()
+                    cur.close()
+            except Exception as e:
+                # 数据库不可用：租约随心跳一起过期，其他分片照样可以接管
+                logger.debug(f"Engine shard {self.shard_id} lease cleanup failed: {e}")
+
+    # ------------------------------------------------------------------
+    # 心跳 / 租约
+    # ------------------------------------------------------------------
+
+    def heartbeat(self) -> None:
+        from app import get_trading_executor
+        now = int(time.time())
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                """
+                INSERT OR REPLACE INTO qd_engine_shards (shard_id, pid, strategies, started_at, heartbeat_at)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                (self.shard_id, os.getpid(), len(get_trading_executor().running_strategies),
+                 self.started_at, now),
+            )
+            db.commit()
+            cur.close()
+        self._heartbeat_at = now
+
+    def retire(self) -> None:
+        """进程正常退出：撤销心跳与租约，其他分片下一轮即可接管（不必等心跳过期）"""
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute("DELETE FROM qd_engine_shards WHERE shard_id = %s AND pid = %s", (self.shard_id, os.getpid()))
+                cur.execute("DELETE FROM qd_strategy_leases WHERE shard_id = %s AND pid = %s", (self.shard_id, os.getpid()))
+                db.commit()
+                cur.close()
+        except Exception as e:
+            logger.debug(f"Engine shard {self.shard_id} retire failed: {e}")
+
+    def _set_lease(self, strategy_id: int) -> None:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                "INSERT OR REPLACE INTO qd_strategy_leases (strategy_id, shard_id, pid, updated_at) VALUES (%s, %s, %s, %s)",
+                (int(strategy_id), self.shard_id, os.getpid(), int(time.time())),
+            )
+            db.commit()
+            cur.close()
+
+    def _drop_leases(self, strategy_ids: List[int]) -> None:
+        if not strategy_ids:
+            return
+        with get_db_connection() as db:
+            cur = db.cursor()
+            for sid in strategy_ids:
+                cur.execute("DELETE FROM qd_strategy_leases WHERE strategy_id = %s AND shard_id = %s",
+                            (int(sid), self.shard_id))
+            db.commit()
+            cur.close()
+
+    # ------------------------------------------------------------------
+    # 控制命令（IPC 转发到本分片）
+    # ------------------------------------------------------------------
+
+    def start_strategy(self, strategy_id: int) -> bool:
+        from app import get_trading_executor
+        with self._lock:
+            ok = bool(get_trading_executor().start_strategy(int(strategy_id)))
+            self._attempted.add(int(strategy_id))
+            if ok:
+                self._set_lease(strategy_id)
+            return ok
+
+    def stop_strategy(self, strategy_id: int) -> bool:
+        from app import get_trading_executor
+        with self._lock:
+            ok = bool(get_trading_executor().stop_strategy(int(strategy_id)))
+            self._drop_leases([int(strategy_id)])
+            return ok
+
+    # ------------------------------------------------------------------
+    # 再平衡
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _running_strategy_ids() -> Set[int]:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute("SELECT id, strategy_type FROM qd_strategies_trading WHERE status = 'running'")
+            rows = cur.fetchall() or []
+            cur.close()
+        # 与启动恢复一致：本地版只运行 IndicatorStrategy
+        return {int(r['id']) for r in rows if not r.get('strategy_type') or r.get('strategy_type') == 'IndicatorStrategy'}
+
+    @staticmethod
+    def _leases() -> Dict[int, int]:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute("SELECT strategy_id, shard_id FROM qd_strategy_leases")
+            rows = cur.fetchall() or []
+            cur.close()
+        return {int(r['strategy_id']): int(r['shard_id']) for r in rows}
+
+    def rebalance(self) -> None:
+        from app import get_trading_executor
+        executor = get_trading_executor()
+        with self._lock:
+            live = live_shards()
+            if self.shard_id not in live:
+                live = sorted(set(live) | {self.shard_id})
+            running = self._running_strategy_ids()
+            leases = self._leases()
+            local = set(executor.running_strategies)
+
+            # 1) 释放不再归属本分片（或已被停止）的策略；数据库状态不变，由新分片接着运行
+            released = []
+            for sid in sorted(local):
+                if sid in running and pick_shard(sid, live) == self.shard_id:
+                    continue
+                # 已在数据库中停止的策略（例如 web 进程在本分片不可达时直接改了状态）同样在这里清理
+                executor.stop_strategy(sid, mark_stopped=False)
+                if sid in running:
+                    self.moved_out += 1
+                released.append(sid)
+            stale_own = [sid for sid, shard in leases.items() if shard == self.shard_id and sid not in local]
+            self._drop_leases(released + [sid for sid in stale_own if sid not in released])
+
+            # 2) 启动归属本分片的策略；租约仍由其他存活分片持有时等它先释放。
+            #    每次获得归属只自动启动一次：初始化失败退出的策略与启动恢复一样不反复重试
+            owned = {sid for sid in running if pick_shard(sid, live) == self.shard_id}
+            self._attempted &= owned
+            for sid in sorted(owned):
+                holder = leases.get(sid)
+                if holder is not None and holder != self.shard_id and holder in live:
+                    continue
+                if sid in local:
+                    self._attempted.add(sid)
+                    if holder != self.shard_id:
+                        self._set_lease(sid)
+                    continue
+                if sid in self._attempted:
+                    continue
+                self._attempted.add(sid)
+                if executor.start_strategy(sid):
+                    self._set_lease(sid)
+                    if self.rebalances:
+                        self.moved_in += 1
+                else:
+                    logger.warning(f"Engine shard {self.shard_id}: strategy {sid} failed to start")
+            self.rebalances += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'shardId': self.shard_id,
+            'rebalances': self.rebalances,
+            'movedIn': self.moved_in,
+            'movedOut': self.moved_out,
+            'fenced': self.fenced,
+            'heartbeatAt': self._heartbeat_at,
+        }
+
+
+_publisher = None
+
+
+def shared_feed_stats() -> Optional[Dict[str, Any]]:
+    if _publisher is not None:
+        return _publisher.stats()
+    from app import get_trading_executor
+    stream = get_trading_executor().market_stream
+    return next((t.stats() for t in (stream.transports if stream is not None else ()) if t.name == 'shm'), None)
+
+
+def start_shard(shard_id: int, lock_path: str) -> ShardManager:
+    """分片进程启动：先配置共享行情（须在执行器创建行情 hub 之前），再启动心跳与再平衡"""
+    global _publisher
+    from app.services.market_stream import get_market_stream, market_stream_mode, use_transport_factory
+    from app.services.shared_feed import SharedFeedPublisher, SharedMemoryTransport, SharedPriceTable
+
+    if market_stream_mode() in ('ws', 'rest'):
+        try:
+            if shard_id == 0:
+                hub = get_market_stream()
+                if hub is not None:
+                    _publisher = SharedFeedPublisher(hub, SharedPriceTable(lock_path, create=True))
+                    _publisher.start()
+            else:
+                use_transport_factory(lambda: [SharedMemoryTransport(lock_path)])
+        except Exception as e:
+            # 共享内存不可用时各分片各自接入行情
+            logger.warning(f"Shared market feed unavailable, shard {shard_id} uses its own transports: {e}")
+
+    manager = ShardManager(shard_id)
+    manager.start()
+    return manager
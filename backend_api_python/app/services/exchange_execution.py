@@ -10,8 +10,9 @@ Notes:
 
 from __future__ import annotations
 
+import hashlib
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Tuple
 
 from app.utils.db import get_db_connection
 from app.utils.logger import get_logger
@@ -55,21 +56,10 @@ def safe_exchange_config_for_log(cfg: Dict[str, Any]) -> Dict[str, Any]:
     return out
 
 
-def load_strategy_configs(strategy_id: int) -> Dict[str, Any]:
-    """Load strategy config fields needed for live execution."""
-    with get_db_connection() as db:
-        cur = db.cursor()
-        cur.execute(
-            """
-            SELECT id, exchange_config, trading_config, market_type, leverage, execution_mode
-            FROM qd_strategies_trading
-            WHERE id = %s
-            """,
-            (int(strategy_id),),
-        )
-        row = cur.fetchone() or {}
-        cur.close()
+_STRATEGY_CONFIG_COLUMNS = "id, exchange_config, trading_config, market_type, leverage, execution_mode"
+
 
+def _parse_strategy_configs(strategy_id: int, row: Dict[str, Any]) -> Dict[str, Any]:
     exchange_config = _safe_json_loads(row.get("exchange_config"), {})
     trading_config = _safe_json_loads(row.get("trading_config"), {})
 
@@ -87,6 +77,55 @@ def load_strategy_configs(strategy_id: int) -> Dict[str, Any]:
     }
 
 
+def load_strategy_configs(strategy_id: int) -> Dict[str, Any]:
+    """Load strategy config fields needed for live execution."""
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            f"""
+            SELECT {_STRATEGY_CONFIG_COLUMNS}
+            FROM qd_strategies_trading
+            WHERE id = %s
+            """,
+            (int(strategy_id),),
+        )
+        row = cur.fetchone() or {}
+        cur.close()
+
+    return _parse_strategy_configs(strategy_id, row)
+
+
+def load_strategy_configs_many(strategy_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Batch variant of load_strategy_configs: one query for all ids (missing ids are omitted)."""
+    ids = sorted({int(x) for x in strategy_ids if x})
+    if not ids:
+        return {}
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            f"SELECT {_STRATEGY_CONFIG_COLUMNS} FROM qd_strategies_trading WHERE id IN ({','.join(['%s'] * len(ids))})",
+            tuple(ids),
+        )
+        rows = cur.fetchall() or []
+        cur.close()
+    return {int(r["id"]): _parse_strategy_configs(int(r["id"]), r) for r in rows}
+
+
+def exchange_account_key(exchange_config: Dict[str, Any], strategy_id: int = 0) -> Tuple[str, str]:
+    """
+    Identify the exchange account behind a resolved exchange config: (exchange_id, account).
+
+    The account is the credential id when the config references one, otherwise a hash of the API key,
+    so strategies sharing the same keys map to the same account.
+    """
+    exchange_id = str(exchange_config.get("exchange_id") or "").strip().lower() or "unknown"
+    account = str(exchange_config.get("credential_id") or exchange_config.get("credentials_id") or "")
+    if not account:
+        api_key = str(exchange_config.get("api_key") or "")
+        account = hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:12] if api_key else f"strategy:{int(strategy_id or 0)}"
+    return exchange_id, account
+
+
 def _load_credential_config(credential_id: int, user_id: int = 1) -> Dict[str, Any]:
     """Load credential JSON from qd_exchange_credentials (plaintext in local mode)."""
     with get_db_connection() as db:
@@ -0,0 +1,266 @@
+"""
+指标计算去重（按分组共享）
+
+生产环境中很多策略使用同一个指标（相同代码）跑在同一 symbol + timeframe 上，只是交易配置不同，
+但每个策略每个 tick 都单独执行一次指标脚本。这里把策略按
+    (代码哈希, symbol, timeframe, 脚本实际引用到的参数取值)
+分组，同一分组在同一根K线数据上只执行一次，结果（执行后的 df 与执行环境）分发给组内各策略，
+各策略再用自己的 trading_config 提取信号 / 处理持仓。
+
+- "脚本实际引用到的参数"通过 AST 分析得到：只引用 trading_config['x'] / config.get('x') 时只取这些键，
+  整体使用 trading_config/config/cfg 时取整个配置；未引用的注入变量（leverage、initial_position 等）不参与分组；
+- 同一分组的结果在 INDICATOR_DEDUP_MAX_AGE_MS 内、且K线缓冲未滚动/对账时复用；并发请求合并为一次执行；
+- 执行器把同周期策略的完整 tick 对齐到整数倍时间点，组内策略因此在同一批次里命中同一份结果。
+"""
+import ast
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 指标执行环境中注入的、与策略相关的变量（见 TradingExecutor._execute_indicator_df）
+CONFIG_NAMES = ('trading_config', 'config', 'cfg')
+SCALAR_NAMES = (
+    'leverage', 'initial_capital', 'trade_direction',
+    'initial_highest_price', 'initial_position', 'initial_avg_entry_price',
+    'initial_position_count', 'initial_last_add_price',
+)
+
+
+def dedup_enabled() -> bool:
+    return str(os.getenv('INDICATOR_DEDUP_ENABLED', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+class _CodeDependencies:
+    """指标代码引用的策略变量：scalars 为引用到的标量名；config_keys 为 None 表示依赖整个配置"""
+
+    __slots__ = ('scalars', 'config_keys', 'uses_config')
+
+    def __init__(self, scalars: Set[str], config_keys: Optional[Set[str]], uses_config: bool):
+        self.scalars = scalars
+        self.config_keys = config_keys
+        self.uses_config = uses_config
+
+
+def analyze_dependencies(code: str) -> _CodeDependencies:
+    """分析指标代码依赖的策略变量；解析失败时保守地认为依赖全部"""
+    try:
+        tree = ast.parse(code)
+    except Exception:
+        return _CodeDependencies(set(SCALAR_NAMES), None, True)
+
+    scalars: Set[str] = set()
+    keys: Set[str] = set()
+    whole_config = False
+    uses_config = False
+    # 以 trading_config['x'] / config.get('x') 形式出现的 Name 节点，不视为整体使用
+    keyed_nodes: Set[int] = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) \
+                and node.value.id in ('trading_config', 'config'):
+            sl = node.slice
+            if isinstance(sl, ast.Constant) and isinstance(sl.value, str):
+                keys.add(sl.value)
+                keyed_nodes.add(id(node.value))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                and node.func.attr == 'get' and isinstance(node.func.value, ast.Name) \
+                and node.func.value.id in ('trading_config', 'config'):
+            if node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str):
+                keys.add(node.args[0].value)
+                keyed_nodes.add(id(node.func.value))
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if node.id in SCALAR_NAMES:
+                scalars.add(node.id)
+            elif node.id in CONFIG_NAMES:
+                uses_config = True
+                if id(node) not in keyed_nodes:
+                    # cfg.xxx、把整个配置传给函数、迭代等：依赖整个配置
+                    whole_config = True
+
+    return _CodeDependencies(scalars, None if whole_config else keys, uses_config)
+
+
+class _GroupResult:
+    __slots__ = ('event', 'value', 'stamp', 'computed_at')
+
+    def __init__(self, stamp: Any):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.stamp = stamp
+        self.computed_at = 0.0
+
+
+class IndicatorDeduplicator:
+    """按分组缓存/合并指标执行结果，并统计分组规模与节省的执行次数"""
+
+    def __init__(self, max_age_sec: Optional[float] = None, max_groups: int = 1024):
+        self.max_age_sec = max_age_sec if max_age_sec is not None else \
+            max(_env_float('INDICATOR_DEDUP_MAX_AGE_MS', 1000), 0.0) / 1000.0
+        self.wait_timeout_sec = 60.0
+        self.max_groups = max_groups
+
+        self._lock = threading.Lock()
+        self._deps: 'OrderedDict[str, _CodeDependencies]' = OrderedDict()
+        self._results: 'OrderedDict[str, _GroupResult]' = OrderedDict()
+        self._members: Dict[str, Set[Any]] = {}
+        self._member_group: Dict[Any, str] = {}
+
+        self.executions = 0
+        self.reused = 0
+        self.coalesced = 0
+
+    # ------------------------------------------------------------------
+    # 分组
+    # ------------------------------------------------------------------
+
+    def _dependencies(self, code_hash: str, code: str) -> _CodeDependencies:
+        with self._lock:
+            deps = self._deps.get(code_hash)
+            if deps is not None:
+                self._deps.move_to_end(code_hash)
+                return deps
+        deps = analyze_dependencies(code)
+        with self._lock:
+            self._deps[code_hash] = deps
+            while len(self._deps) > 256:
+                self._deps.popitem(last=False)
+        return deps
+
+    def group_key(self, code: str, symbol: str, timeframe: str, env: Dict[str, Any]) -> str:
+        """分组键：代码哈希 + symbol + timeframe + 代码实际引用到的参数取值"""
+        code_hash = hashlib.sha256(code.encode('utf-8', errors='surrogatepass')).hexdigest()
+        deps = self._dependencies(code_hash, code)
+        params: Dict[str, Any] = {name: env.get(name) for name in sorted(deps.scalars)}
+        if deps.uses_config:
+            config = env.get('trading_config') or {}
+            if deps.config_keys is None:
+                params['__config__'] = config
+            else:
+                params['__config__'] = {k: config.get(k) for k in sorted(deps.config_keys)}
+        params_json = json.dumps(params, sort_keys=True, default=str)
+        raw = f"{code_hash}|{(symbol or '').upper()}|{timeframe}|{params_json}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def assign(self, member: Any, key: str) -> None:
+        """记录策略当前所属分组（持仓状态变化可能使策略换组）"""
+        with self._lock:
+            old = self._member_group.get(member)
+            if old == key:
+                return
+            if old is not None:
+                self._discard_member(member, old)
+            self._member_group[member] = key
+            self._members.setdefault(key, set()).add(member)
+
+    def remove_member(self, member: Any) -> None:
+        with self._lock:
+            old = self._member_group.pop(member, None)
+            if old is not None:
+                self._discard_member(member, old)
+
+    def _discard_member(self, member: Any, key: str) -> None:
+        # 调用方持有 self._lock
+        members = self._members.get(key)
+        if members is None:
+            return
+        members.discard(member)
+        if not members:
+            del self._members[key]
+            self._results.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # 计算
+    # ------------------------------------------------------------------
+
+    def compute(self, key: str, stamp: Any, fn: Callable[[], Any]) -> Any:
+        """
+        返回分组在数据版本 stamp 上的执行结果：未过期的结果直接复用，正在执行时等待，否则执行 fn。
+        fn 返回 None（执行失败）时不缓存。
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry.stamp == stamp:
+                if not entry.event.is_set():
+                    owner = False
+                    self.coalesced += 1
+                elif entry.value is not None and time.time() - entry.computed_at <= self.max_age_sec:
+                    self._results.move_to_end(key)
+                    self.reused += 1
+                    return entry.value
+                else:
+                    entry = None
+            else:
+                entry = None
+            if entry is None:
+                owner = True
+                entry = _GroupResult(stamp)
+                self._results[key] = entry
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_groups:
+                    self._results.popitem(last=False)
+
+        if not owner:
+            entry.event.wait(self.wait_timeout_sec)
+            if entry.value is not None:
+                return entry.value
+            # 执行方失败/超时：自己执行一次
+            return fn()
+
+        value = None
+        try:
+            value = fn()
+        finally:
+            with self._lock:
+                self.executions += 1
+                entry.value = value
+                entry.computed_at = time.time()
+                if value is None and self._results.get(key) is entry:
+                    del self._results[key]
+            entry.event.set()
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = sorted((len(m) for m in self._members.values()), reverse=True)
+            total = self.executions + self.reused + self.coalesced
+            return {
+                'groups': len(sizes),
+                'strategies': sum(sizes),
+                'largestGroups': sizes[:10],
+                'executions': self.executions,
+                'reused': self.reused,
+                'coalesced': self.coalesced,
+                'savedExecutions': self.reused + self.coalesced,
+                'savedRatio': round((self.reused + self.coalesced) / total, 3) if total else 0.0,
+                'maxAgeMs': int(self.max_age_sec * 1000),
+            }
+
+
+_dedup: Optional[IndicatorDeduplicator] = None
+_dedup_lock = threading.Lock()
+
+
+def get_indicator_dedup() -> IndicatorDeduplicator:
+    global _dedup
+    if _dedup is None:
+        with _dedup_lock:
+            if _dedup is None:
+                _dedup = IndicatorDeduplicator()
+    return _dedup
@@ -1,15 +1,21 @@
 """
 K线数据服务
 """
+import time
 from typing import Dict, List, Any, Optional
 
 from app.data_sources import DataSourceFactory
+from app.data_sources.candle_store import get_candle_store
 from app.utils.cache import CacheManager
 from app.utils.logger import get_logger
+from app.utils import metrics
 from app.config import CacheConfig
 
 logger = get_logger(__name__)
 
+_GET_KLINE_SECONDS = metrics.histogram(
+    'qd_kline_service_seconds', 'KlineService.get_kline latency by cache result', ['market', 'result'])
+
 
 class KlineService:
     """K线数据服务"""
@@ -39,22 +45,19 @@ class KlineService:
         Returns:
             K线数据列表
         """
+        started = time.perf_counter()
         # 构建缓存键（历史数据不缓存）
         if not before_time:
             cache_key = f"kline:{market}:{symbol}:{timeframe}:{limit}"
             cached = self.cache.get(cache_key)
             if cached:
                 # logger.info(f"命中缓存: {cache_key}")
+                _GET_KLINE_SECONDS.labels(market, 'hit').observe(time.perf_counter() - started)
                 return cached
         
         # 获取数据
-        klines = DataSourceFactory.get_kline(
-            market=market,
-            symbol=symbol,
-            timeframe=timeframe,
-            limit=limit,
-            before_time=before_time
-        )
+        klines = self._fetch_klines(market, symbol, timeframe, limit, before_time)
+        _GET_KLINE_SECONDS.labels(market, 'history' if before_time else 'miss').observe(time.perf_counter() - started)
         
         # 设置缓存（仅最新数据）
         if klines and not before_time:
@@ -64,6 +67,45 @@ class KlineService:
         
         return klines
     
+    def _fetch_klines(
+        self,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        limit: int,
+        before_time: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        """
+        历史数据（before_time）优先读本地K线存储，只回源缺失区间；
+        最新数据始终回源，并把已收盘K线写入存储。
+        """
+        def fetcher(n: int, before: Optional[int]) -> List[Dict[str, Any]]:
+            return DataSourceFactory.get_kline(
+                market=market,
+                symbol=symbol,
+                timeframe=timeframe,
+                limit=n,
+                before_time=before
+            )
+
+        store = get_candle_store()
+        if store is None:
+            return fetcher(limit, before_time)
+
+        try:
+            if before_time:
+                return store.get_kline(market, symbol, timeframe, limit, before_time, fetcher)
+        except Exception as e:
+            logger.warning(f"Kline store read failed, falling back to remote: {e}")
+            return fetcher(limit, before_time)
+
+        klines = fetcher(limit, before_time)
+        try:
+            store.write(market, symbol, timeframe, klines)
+        except Exception as e:
+            logger.warning(f"Kline store write failed: {e}")
+        return klines
+
     def get_latest_price(self, market: str, symbol: str) -> Optional[Dict[str, Any]]:
         """获取最新价格"""
         klines = self.get_kline(market, symbol, '1m', 1)
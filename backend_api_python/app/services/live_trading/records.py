@@ -11,6 +11,7 @@ from __future__ import annotations
 import time
 from typing import Any, Dict, Optional, Tuple
 
+from app.services.position_book import invalidate_positions
 from app.utils.db import get_db_connection
 
 
@@ -74,6 +75,7 @@ def _delete_position(strategy_id: int, symbol: str, side: str) -> None:
         )
         db.commit()
         cur.close()
+    invalidate_positions(strategy_id)
 
 
 def upsert_position(
@@ -108,6 +110,7 @@ def upsert_position(
         )
         db.commit()
         cur.close()
+    invalidate_positions(strategy_id)
 
 
 def apply_fill_to_local_position(
@@ -0,0 +1,480 @@
+"""
+行情流接入（Market data ingestion）
+
+可插拔的传输层把逐笔/ticker 行情推入内存中的按交易对状态（MarketDataHub），
+订阅者（运行中的策略）在行情到达时被回调，而不是等固定的 tick 间隔：
+
+- CcxtProTransport    交易所 WebSocket（ccxt.pro watch_ticker / watch_trades），断线指数退避重连
+- RestPollingTransport REST 轮询兜底：复用共享价格源 PriceFeed 的批量轮询，行情流正常时轮询会自动跳过
+- ReplayTransport     从文件回放行情（CSV: ts,symbol,price 或 JSONL），用于离线测试与基准
+
+MARKET_STREAM_TRANSPORT:
+- ws（默认）  WebSocket + REST 兜底
+- rest        只用 REST 轮询（PRICE_FEED_POLL_SEC）
+- replay      只回放 MARKET_STREAM_REPLAY_FILE（不访问网络）
+- off         关闭；策略只按 STRATEGY_TICK_INTERVAL_SEC 轮询价格
+"""
+import asyncio
+import csv
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.services.price_feed import get_price_feed
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TickCallback = Callable[[str, float], None]
+
+TRANSPORT_MODES = ('ws', 'rest', 'replay', 'off')
+
+
+def market_stream_mode() -> str:
+    mode = str(os.getenv('MARKET_STREAM_TRANSPORT', 'ws') or 'ws').strip().lower()
+    return mode if mode in TRANSPORT_MODES else 'ws'
+
+
+class SymbolState:
+    """单个交易对的最新行情"""
+
+    __slots__ = ('symbol', 'price', 'ts', 'recv_ts', 'seq', 'source')
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.price = 0.0
+        self.ts = 0.0        # 行情自带时间戳（秒）
+        self.recv_ts = 0.0   # 本地接收时间
+        self.seq = 0
+        self.source = ''
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'symbol': self.symbol, 'price': self.price, 'ts': self.ts,
+            'recvTs': self.recv_ts, 'seq': self.seq, 'source': self.source,
+        }
+
+
+# ----------------------------------------------------------------------
+# 传输层
+# ----------------------------------------------------------------------
+
+class MarketTransport(ABC):
+    """行情传输层接口：收到行情后调用 hub.on_tick(symbol, price, ts, source)"""
+
+    name = 'base'
+
+    def __init__(self):
+        self.hub: Optional['MarketDataHub'] = None
+        self.errors = 0
+
+    @abstractmethod
+    def start(self, hub: 'MarketDataHub') -> None:
+        pass
+
+    @abstractmethod
+    def stop(self) -> None:
+        pass
+
+    def set_symbols(self, symbols: List[str]) -> None:
+        """订阅集合变化时调用（回放传输可以忽略）"""
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {'name': self.name, 'errors': self.errors}
+
+
+class RestPollingTransport(MarketTransport):
+    """REST 轮询兜底：把订阅交易对挂到共享价格源上，轮询结果作为 tick 推入 hub"""
+
+    name = 'rest'
+    SUBSCRIBER_ID = '__market_stream__'
+
+    def __init__(self):
+        super().__init__()
+        self._symbols: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def start(self, hub: 'MarketDataHub') -> None:
+        self.hub = hub
+
+    def stop(self) -> None:
+        get_price_feed().unsubscribe(self.SUBSCRIBER_ID)
+        with self._lock:
+            self._symbols.clear()
+
+    def _on_price(self, symbol: str, price: float) -> None:
+        if self.hub is not None:
+            self.hub.on_tick(symbol, price, source=self.name)
+
+    def set_symbols(self, symbols: List[str]) -> None:
+        feed = get_price_feed()
+        with self._lock:
+            wanted = set(symbols)
+            for sym in self._symbols - wanted:
+                feed.unsubscribe(self.SUBSCRIBER_ID, sym)
+            for sym in wanted - self._symbols:
+                feed.subscribe(self.SUBSCRIBER_ID, sym, self._on_price)
+            self._symbols = wanted
+
+
+class CcxtProTransport(MarketTransport):
+    """交易所 WebSocket 行情（ccxt.pro），在独立线程的 asyncio 事件循环中运行"""
+
+    name = 'ws'
+
+    def __init__(self, exchange_id: Optional[str] = None, channel: Optional[str] = None):
+        super().__init__()
+        from app.config import CCXTConfig
+        self.exchange_id = exchange_id or CCXTConfig.DEFAULT_EXCHANGE
+        self.proxy = CCXTConfig.PROXY
+        self.timeout = CCXTConfig.TIMEOUT
+        self.channel = (channel or os.getenv('MARKET_STREAM_CHANNEL', 'ticker') or 'ticker').strip().lower()
+        self._symbols: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_error_log = 0.0
+        self.connected_symbols = 0
+        self.available = True
+
+    def start(self, hub: 'MarketDataHub') -> None:
+        self.hub = hub
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._thread_main, name='MarketStream-ws', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def set_symbols(self, symbols: List[str]) -> None:
+        with self._lock:
+            self._symbols = set(symbols)
+
+    def _thread_main(self) -> None:
+        try:
+            import ccxt.pro as ccxtpro
+        except Exception as e:
+            self.available = False
+            logger.warning(f"ccxt.pro unavailable, market stream falls back to REST polling: {e}")
+            return
+        if not hasattr(ccxtpro, self.exchange_id):
+            self.available = False
+            logger.warning(f"ccxt.pro has no exchange '{self.exchange_id}', market stream falls back to REST polling")
+            return
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._main(ccxtpro))
+        except Exception as e:
+            logger.error(f"Market stream websocket loop crashed: {e}")
+        finally:
+            loop.close()
+
+    async def _main(self, ccxtpro) -> None:
+        config: Dict[str, Any] = {'timeout': self.timeout, 'enableRateLimit': True}
+        if self.proxy:
+            config['wsSocksProxy' if str(self.proxy).startswith('socks') else 'wssProxy'] = self.proxy
+        exchange = getattr(ccxtpro, self.exchange_id)(config)
+        tasks: Dict[str, asyncio.Task] = {}
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    wanted = set(self._symbols)
+                for sym in wanted - tasks.keys():
+                    tasks[sym] = asyncio.ensure_future(self._watch(exchange, sym))
+                for sym in set(tasks.keys()) - wanted:
+                    tasks.pop(sym).cancel()
+                self.connected_symbols = len(tasks)
+                await asyncio.sleep(0.5)
+        finally:
+            for t in tasks.values():
+                t.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            try:
+                await exchange.close()
+            except Exception:
+                pass
+
+    async def _watch(self, exchange, symbol: str) -> None:
+        from app.data_sources.crypto import CryptoDataSource
+        pair = CryptoDataSource.normalize_ticker_symbol(symbol)
+        backoff = 1.0
+        while True:
+            try:
+                if self.channel == 'trades':
+                    trades = await exchange.watch_trades(pair)
+                    if not trades:
+                        continue
+                    last = trades[-1]
+                    price, ts = last.get('price'), last.get('timestamp')
+                else:
+                    ticker = await exchange.watch_ticker(pair)
+                    price, ts = (ticker.get('last') or ticker.get('close')), ticker.get('timestamp')
+                if price:
+                    self.hub.on_tick(symbol, float(price), (ts / 1000.0) if ts else None, source=self.name)
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                now = time.time()
+                if now - self._last_error_log >= 60:
+                    self._last_error_log = now
+                    logger.warning(f"Market stream {self.channel} {pair} error (retry in {backoff:.0f}s): {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name, 'errors': self.errors, 'exchange': self.exchange_id,
+            'channel': self.channel, 'symbols': self.connected_symbols, 'available': self.available,
+        }
+
+
+class ReplayTransport(MarketTransport):
+    """
+    从文件回放行情。
+
+    文件格式：
+    - CSV（带表头）：ts,symbol,price
+    - JSONL：每行 {"ts": ..., "symbol": ..., "price": ...}
+    ts 为秒或毫秒时间戳；speed=1 按原始时间间隔回放，speed=0 尽可能快，loop=True 时循环回放。
+    """
+
+    name = 'replay'
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        super().__init__()
+        self.path = path
+        self.speed = max(float(speed), 0.0)
+        self.loop = bool(loop)
+        self.replayed = 0
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def load(path: str) -> List[tuple]:
+        rows: List[tuple] = []
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith('.jsonl') or path.endswith('.json'):
+                items = (json.loads(line) for line in f if line.strip())
+            else:
+                items = csv.DictReader(f)
+            for item in items:
+                ts = float(item.get('ts') or item.get('time') or item.get('timestamp') or 0)
+                if ts > 1e12:
+                    ts /= 1000.0
+                rows.append((ts, str(item['symbol']), float(item['price'])))
+        rows.sort(key=lambda r: r[0])
+        return rows
+
+    def start(self, hub: 'MarketDataHub') -> None:
+        self.hub = hub
+        self._stop.clear()
+        self.done.clear()
+        self._thread = threading.Thread(target=self._run, name='MarketStream-replay', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        try:
+            rows = self.load(self.path)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Market replay failed to load {self.path}: {e}")
+            self.done.set()
+            return
+        logger.info(f"Market replay started: {len(rows)} ticks from {self.path} (speed={self.speed})")
+        while not self._stop.is_set():
+            wall_start = time.time()
+            first_ts = rows[0][0] if rows else 0.0
+            for ts, symbol, price in rows:
+                if self._stop.is_set():
+                    break
+                if self.speed > 0:
+                    delay = (ts - first_ts) / self.speed - (time.time() - wall_start)
+                    if delay > 0:
+                        self._stop.wait(delay)
+                self.hub.on_tick(symbol, price, ts, source=self.name)
+                self.replayed += 1
+            if not self.loop:
+                break
+        self.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'name': self.name, 'errors': self.errors, 'replayed': self.replayed, 'done': self.done.is_set()}
+
+
+# ----------------------------------------------------------------------
+# Hub
+# ----------------------------------------------------------------------
+
+class MarketDataHub:
+    """按交易对的内存行情状态 + 订阅回调"""
+
+    def __init__(self, transports: List[MarketTransport]):
+        self.transports = list(transports)
+        self._lock = threading.Lock()
+        self._states: Dict[str, SymbolState] = {}
+        self._subscriptions: Dict[Any, Dict[str, TickCallback]] = {}   # subscriber -> {key: callback}
+        self._listeners: Dict[str, Dict[Any, TickCallback]] = {}       # key -> {subscriber: callback}
+        self._symbols: Dict[str, str] = {}                             # key -> 原始 symbol
+        self._started = False
+        self.ticks = 0
+        self.callback_errors = 0
+
+    @staticmethod
+    def _key(symbol: str) -> str:
+        return (symbol or '').strip().upper()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            symbols = list(self._symbols.values())
+        for t in self.transports:
+            t.start(self)
+            t.set_symbols(symbols)
+        logger.info(f"MarketDataHub started (transports={[t.name for t in self.transports]})")
+
+    def stop(self) -> None:
+        with self._lock:
+            self._started = False
+        for t in self.transports:
+            try:
+                t.stop()
+            except Exception:
+                pass
+
+    # ---------------- 订阅 ----------------
+
+    def subscribe(self, subscriber_id: Any, symbol: str, callback: TickCallback) -> None:
+        key = self._key(symbol)
+        if not key:
+            return
+        with self._lock:
+            self._subscriptions.setdefault(subscriber_id, {})[key] = callback
+            self._listeners.setdefault(key, {})[subscriber_id] = callback
+            changed = key not in self._symbols
+            self._symbols.setdefault(key, symbol)
+            symbols = list(self._symbols.values())
+        if changed:
+            self._push_symbols(symbols)
+
+    def unsubscribe(self, subscriber_id: Any) -> None:
+        with self._lock:
+            subs = self._subscriptions.pop(subscriber_id, None) or {}
+            changed = False
+            for key in subs:
+                listeners = self._listeners.get(key)
+                if listeners is not None:
+                    listeners.pop(subscriber_id, None)
+                    if not listeners:
+                        del self._listeners[key]
+                        self._symbols.pop(key, None)
+                        changed = True
+            symbols = list(self._symbols.values())
+        if changed:
+            self._push_symbols(symbols)
+
+    def _push_symbols(self, symbols: List[str]) -> None:
+        if not self._started:
+            return
+        for t in self.transports:
+            try:
+                t.set_symbols(symbols)
+            except Exception as e:
+                logger.warning(f"Market transport {t.name} set_symbols failed: {e}")
+
+    # ---------------- 行情 ----------------
+
+    def on_tick(self, symbol: str, price: float, ts: Optional[float] = None, source: str = '') -> None:
+        """传输层回调：更新交易对状态，写入共享价格源，并通知订阅者"""
+        key = self._key(symbol)
+        if not key or not price or price <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            st = self._states.get(key)
+            if st is None:
+                st = self._states[key] = SymbolState(key)
+            st.price = float(price)
+            st.ts = float(ts or now)
+            st.recv_ts = now
+            st.seq += 1
+            st.source = source
+            self.ticks += 1
+            listeners = list((self._listeners.get(key) or {}).values())
+        get_price_feed().update(symbol, float(price), now)
+        for cb in listeners:
+            try:
+                cb(symbol, float(price))
+            except Exception as e:
+                self.callback_errors += 1
+                logger.warning(f"Market tick callback failed for {symbol}: {e}")
+
+    def get_state(self, symbol: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            st = self._states.get(self._key(symbol))
+            return st.to_dict() if st is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'symbols': len(self._symbols),
+                'subscribers': len(self._subscriptions),
+                'ticks': self.ticks,
+                'callbackErrors': self.callback_errors,
+                'transports': [t.stats() for t in self.transports],
+            }
+
+
+_transport_factory: Optional[Callable[[], List[MarketTransport]]] = None
+
+
+def use_transport_factory(factory: Optional[Callable[[], List[MarketTransport]]]) -> None:
+    """替换 ws/rest 模式下的传输层（引擎分片时非 feeder 进程改读共享内存行情）；须在 hub 创建前调用"""
+    global _transport_factory
+    _transport_factory = factory
+
+
+def build_transports(mode: Optional[str] = None) -> List[MarketTransport]:
+    mode = mode or market_stream_mode()
+    if mode in ('ws', 'rest') and _transport_factory is not None:
+        return _transport_factory()
+    if mode == 'replay':
+        path = os.getenv('MARKET_STREAM_REPLAY_FILE', '')
+        if not path:
+            raise ValueError("MARKET_STREAM_TRANSPORT=replay requires MARKET_STREAM_REPLAY_FILE")
+        speed = float(os.getenv('MARKET_STREAM_REPLAY_SPEED', '1') or 1)
+        loop = str(os.getenv('MARKET_STREAM_REPLAY_LOOP', 'false')).strip().lower() in ('1', 'true', 'yes', 'on')
+        return [ReplayTransport(path, speed=speed, loop=loop)]
+    if mode == 'rest':
+        return [RestPollingTransport()]
+    return [CcxtProTransport(), RestPollingTransport()]
+
+
+_hub: Optional[MarketDataHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_market_stream() -> Optional[MarketDataHub]:
+    """返回全局行情 hub（首次调用时启动传输层）；MARKET_STREAM_TRANSPORT=off 时返回 None"""
+    global _hub
+    if market_stream_mode() == 'off':
+        return None
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                hub = MarketDataHub(build_transports())
+                hub.start()
+                _hub = hub
+    return _hub
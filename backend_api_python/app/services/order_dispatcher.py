@@ -0,0 +1,147 @@
+"""
+挂单并发分发（PendingOrderWorker 使用）
+
+一个慢交易所（下单后 wait_for_fill 轮询数秒）不应阻塞其他策略的订单。KeyedDispatcher 在固定大小的线程池上
+并发执行任务，同时保证：
+- 同一 key（交易所账户 + 交易对）的任务严格按提交顺序串行执行；
+- 每个 group（交易所）同时执行的任务数不超过上限，避免触发交易所限频；
+- 可运行的任务中优先执行 priority 高的，同优先级先提交先执行。
+
+调度在一个 Condition 下完成：空闲线程从各 key 队首中挑选 (priority, 提交顺序) 最优、key 未在执行且
+group 未满的任务。队列规模是一批挂单（几十条），线性扫描足够。
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Set
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class _Task:
+    __slots__ = ('key', 'group', 'priority', 'seq', 'fn')
+
+    def __init__(self, key: Hashable, group: str, priority: int, seq: int, fn: Callable[[], Any]):
+        self.key = key
+        self.group = group
+        self.priority = priority
+        self.seq = seq
+        self.fn = fn
+
+
+class KeyedDispatcher:
+    """有界线程池 + 按 key 串行 + 按 group 限流"""
+
+    def __init__(self, max_workers: int = 8, group_limit: int = 4, name: str = 'OrderDispatch',
+                 on_done: Optional[Callable[[], None]] = None):
+        self.max_workers = max(int(max_workers), 1)
+        self.group_limit = max(int(group_limit), 1)
+        self.name = name
+        self.on_done = on_done
+        self._cond = threading.Condition()
+        self._queues: Dict[Hashable, Deque[_Task]] = {}
+        self._active_keys: Set[Hashable] = set()
+        self._group_inflight: Dict[str, int] = {}
+        # key -> 最近一次提交 / 完成任务的时间（time.monotonic），见 keys_busy_since
+        self._touched: Dict[Hashable, float] = {}
+        self._seq = itertools.count()
+        self._queued = 0
+        self._running = 0
+        self._threads = []
+        self.completed = 0
+        self.errors = 0
+
+    def _ensure_threads(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker, name=f'{self.name}-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, key: Hashable, group: str, priority: int, fn: Callable[[], Any]) -> None:
+        with self._cond:
+            self._ensure_threads()
+            task = _Task(key, str(group or ''), int(priority or 0), next(self._seq), fn)
+            self._queues.setdefault(key, deque()).append(task)
+            self._touched[key] = time.monotonic()
+            self._queued += 1
+            self._cond.notify()
+
+    def _pick(self) -> Optional[_Task]:
+        best: Optional[_Task] = None
+        for key, q in self._queues.items():
+            if key in self._active_keys:
+                continue
+            head = q[0]
+            if self._group_inflight.get(head.group, 0) >= self.group_limit:
+                continue
+            if best is None or (head.priority, -head.seq) > (best.priority, -best.seq):
+                best = head
+        return best
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                task = self._pick()
+                while task is None:
+                    self._cond.wait()
+                    task = self._pick()
+                q = self._queues[task.key]
+                q.popleft()
+                if not q:
+                    del self._queues[task.key]
+                self._queued -= 1
+                self._running += 1
+                self._active_keys.add(task.key)
+                self._group_inflight[task.group] = self._group_inflight.get(task.group, 0) + 1
+            try:
+                task.fn()
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"{self.name} task failed: key={task.key}, err={e}")
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self.completed += 1
+                    self._active_keys.discard(task.key)
+                    self._touched[task.key] = time.monotonic()
+                    left = self._group_inflight.get(task.group, 1) - 1
+                    if left > 0:
+                        self._group_inflight[task.group] = left
+                    else:
+                        self._group_inflight.pop(task.group, None)
+                    # key / group 释放后其他线程可能有任务可运行
+                    self._cond.notify_all()
+                if self.on_done is not None:
+                    try:
+                        self.on_done()
+                    except Exception:
+                        pass
+
+    def pending(self) -> int:
+        """排队 + 执行中的任务数"""
+        with self._cond:
+            return self._queued + self._running
+
+    def keys_busy_since(self, since: float) -> Set[Hashable]:
+        """排队 / 执行中的 key，以及 since（time.monotonic()）之后提交过或完成过任务的 key"""
+        with self._cond:
+            for key in [k for k, ts in self._touched.items() if ts < since]:
+                del self._touched[key]
+            return set(self._queues) | set(self._active_keys) | set(self._touched)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'groupLimit': self.group_limit,
+                'queued': self._queued,
+                'running': self._running,
+                'inflightByGroup': dict(self._group_inflight),
+                'completed': self.completed,
+                'errors': self.errors,
+            }
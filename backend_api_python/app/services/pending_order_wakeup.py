@@ -0,0 +1,115 @@
+"""
+挂单入队唤醒（pending_orders 生产者 -> PendingOrderWorker）
+
+PendingOrderWorker 原来每秒轮询一次 pending_orders，信号最多要多等 1 秒才被分发。现在入队事务提交后调用
+notify_pending_orders()：
+- worker 在同一进程内：直接 set 一个 threading.Event；
+- worker 在其他进程（引擎分片、独立引擎进程）：向 worker 绑定的 Unix 数据报 socket 发一个字节，
+  worker 的接收线程收到后 set 同一个 Event。发送是非阻塞的，worker 不存在或缓冲区已满时直接忽略，
+  由 worker 的兜底轮询（PENDING_ORDER_POLL_SEC）保证最终分发。
+
+socket 默认放在引擎锁文件旁（<engine.lock>.wake），只有持有引擎锁的进程运行 worker，绑定前可安全删除旧文件。
+不支持 AF_UNIX 的平台只有单进程部署，只用进程内 Event。
+"""
+import os
+import socket
+import threading
+import time
+from typing import Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _default_socket_path() -> str:
+    from app.services.engine import get_engine
+    return get_engine().lock_path + '.wake'
+
+
+class PendingOrderWakeup:
+    """进程内 Event + 跨进程 Unix 数据报 socket"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = (path or os.getenv('PENDING_ORDER_WAKE_SOCKET') or '').strip() or _default_socket_path()
+        self.event = threading.Event()
+        self.listening = False
+        self._sender: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self.notified = 0
+        self.received = 0
+
+    def listen(self) -> None:
+        """worker 进程调用：绑定 socket 并在后台线程中把收到的唤醒转成 Event"""
+        with self._lock:
+            if self.listening:
+                return
+            self.listening = True
+        if not hasattr(socket, 'AF_UNIX'):
+            return
+        try:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(self.path)
+            from app.services.engine import close_in_children
+            close_in_children(sock.fileno())
+        except OSError as e:
+            # 只影响其他进程的唤醒，兜底轮询仍然有效
+            logger.warning(f"Pending order wakeup socket unavailable ({self.path}): {e}")
+            return
+        threading.Thread(target=self._recv_loop, args=(sock,), name='PendingOrderWakeup', daemon=True).start()
+
+    def _recv_loop(self, sock: socket.socket) -> None:
+        while True:
+            try:
+                sock.recv(64)
+            except OSError:
+                time.sleep(0.1)
+                continue
+            self.received += 1
+            self.event.set()
+
+    def notify(self) -> None:
+        self.notified += 1
+        self.event.set()
+        if self.listening or not hasattr(socket, 'AF_UNIX'):
+            return
+        try:
+            with self._lock:
+                if self._sender is None:
+                    self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                    self._sender.setblocking(False)
+                self._sender.sendto(b'1', self.path)
+        except OSError:
+            # worker 未运行 / 接收缓冲区已满（已有未处理的唤醒）
+            pass
+
+    def wait(self, timeout: float) -> bool:
+        """等待唤醒或超时；返回是否被唤醒。返回前清除 Event，之后到达的通知会触发下一轮"""
+        woken = self.event.wait(timeout)
+        self.event.clear()
+        return woken
+
+
+_wakeup: Optional[PendingOrderWakeup] = None
+_wakeup_lock = threading.Lock()
+
+
+def get_pending_order_wakeup() -> PendingOrderWakeup:
+    global _wakeup
+    if _wakeup is None:
+        with _wakeup_lock:
+            if _wakeup is None:
+                _wakeup = PendingOrderWakeup()
+    return _wakeup
+
+
+def notify_pending_orders() -> None:
+    """入队事务提交后调用（best-effort，不抛异常）"""
+    try:
+        get_pending_order_wakeup().notify()
+    except Exception as e:
+        logger.debug(f"pending order wakeup failed: {e}")
@@ -1,24 +1,39 @@
 """
 Pending order worker.
 
-This worker polls `pending_orders` periodically and dispatches orders based on `execution_mode`:
-- signal: send notifications (no real trading).
+This worker dispatches `pending_orders` based on `execution_mode`. It is woken by producers right after
+an order is enqueued (see pending_order_wakeup) and also polls every PENDING_ORDER_POLL_SEC as a safety net.
+Orders are dispatched concurrently (see order_dispatcher), serialized per exchange account + symbol:
+- signal: send notifications (no real trading). Delivery runs on the notifier's own pool, so dispatch threads
+  never wait on notification I/O; failed channels go to the notification retry queue.
 - live: not implemented (paper mode only).
 """
 
 from __future__ import annotations
 
+import functools
 import json
 import os
 import threading
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from app.services.signal_notifier import SignalNotifier
-from app.services.exchange_execution import load_strategy_configs, resolve_exchange_config, safe_exchange_config_for_log
+from app.services.exchange_execution import (
+    exchange_account_key,
+    load_strategy_configs,
+    load_strategy_configs_many,
+    resolve_exchange_config,
+    safe_exchange_config_for_log,
+)
 from app.services.live_trading.execution import place_order_from_signal
 from app.services.live_trading.factory import create_client
 from app.services.live_trading.records import apply_fill_to_local_position, record_trade
+from app.services.position_book import invalidate_positions
+from app.services.signal_trace import OrderTrace
+from app.services.pending_order_wakeup import get_pending_order_wakeup
+from app.services.order_dispatcher import KeyedDispatcher
 from app.services.live_trading.base import LiveTradingError
 from app.services.live_trading.binance import BinanceFuturesClient
 from app.services.live_trading.binance_spot import BinanceSpotClient
@@ -36,15 +51,54 @@ from app.services.live_trading.bitfinex import BitfinexClient
 from app.services.live_trading.bitfinex import BitfinexDerivativesClient
 from app.services.live_trading.symbols import to_okx_swap_inst_id
 from app.services.live_trading.symbols import to_gate_currency_pair
-from app.utils.db import get_db_connection
+from app.utils.db import claim_pending_orders, get_db_connection
 from app.utils.logger import get_logger
+from app.utils import metrics
 
 logger = get_logger(__name__)
 
+_TICK_SECONDS = metrics.histogram(
+    "qd_pending_worker_tick_seconds", "PendingOrderWorker poll iteration duration (idle: queue was empty)", ["state"])
+_DISPATCH_SECONDS = metrics.histogram(
+    "qd_pending_order_dispatch_seconds", "Time spent dispatching one pending order", ["mode", "outcome"])
+_QUEUE_WAIT_SECONDS = metrics.histogram(
+    "qd_pending_order_queue_wait_seconds", "Delay between enqueue (created_at) and dispatch start",
+    buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0))
+_WAKEUPS = metrics.counter(
+    "qd_pending_worker_wakeups_total", "PendingOrderWorker loop iterations by trigger", ["reason"])
+
+
+def _pending_orders_by_status() -> Dict[Any, float]:
+    # 抓取时查询一次，队列深度对所有 worker 进程都一样，无需合并
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute("SELECT status, COUNT(*) AS cnt FROM pending_orders GROUP BY status")
+        rows = cur.fetchall() or []
+        cur.close()
+    return {str(r.get("status") or ""): float(r.get("cnt") or 0) for r in rows}
+
+
+metrics.gauge("qd_pending_orders", "Rows in pending_orders by status", ["status"]).set_function(_pending_orders_by_status)
+
+
+def _meta_value(meta: Any, *fields: str) -> float:
+    """First non-empty numeric field of an instrument/contract metadata dict."""
+    meta = meta if isinstance(meta, dict) else {}
+    for f in fields:
+        if meta.get(f):
+            return float(meta.get(f))
+    return 0.0
+
 
 class PendingOrderWorker:
-    def __init__(self, poll_interval_sec: float = 1.0, batch_size: int = 50):
-        self.poll_interval_sec = float(poll_interval_sec)
+    def __init__(self, poll_interval_sec: Optional[float] = None, batch_size: int = 50):
+        # Safety-net poll only: enqueues wake the worker immediately.
+        if poll_interval_sec is None:
+            try:
+                poll_interval_sec = float(os.getenv("PENDING_ORDER_POLL_SEC", "5"))
+            except Exception:
+                poll_interval_sec = 5.0
+        self.poll_interval_sec = max(float(poll_interval_sec), 0.05)
         self.batch_size = int(batch_size)
         self._stop_event = threading.Event()
         self._thread: Optional[threading.Thread] = None
@@ -56,11 +110,51 @@ class PendingOrderWorker:
             self._stale_processing_sec = int(os.getenv("PENDING_ORDER_STALE_SEC", "90"))
         except Exception:
             self._stale_processing_sec = 90
+        try:
+            self._stale_scan_interval_sec = float(os.getenv("PENDING_ORDER_STALE_SCAN_SEC", "30"))
+        except Exception:
+            self._stale_scan_interval_sec = 30.0
+        self._last_stale_scan_ts = 0.0
+        self._wakeup = get_pending_order_wakeup()
+
+        # Concurrent dispatch: orders for the same (exchange account, symbol) stay strictly ordered,
+        # and at most PENDING_ORDER_MAX_INFLIGHT_PER_EXCHANGE orders per exchange run at once.
+        try:
+            concurrency = int(os.getenv("PENDING_ORDER_CONCURRENCY", "8"))
+        except Exception:
+            concurrency = 8
+        try:
+            per_exchange = int(os.getenv("PENDING_ORDER_MAX_INFLIGHT_PER_EXCHANGE", "4"))
+        except Exception:
+            per_exchange = 4
+        self._dispatcher = KeyedDispatcher(max_workers=concurrency, group_limit=per_exchange,
+                                           name="PendingOrderDispatch", on_done=self._on_order_done)
+        self._inflight_ids: Set[int] = set()
+        # Signal orders whose notifications are still being delivered (status stays 'processing').
+        self._notifying_ids: Set[int] = set()
+        self._inflight_lock = threading.Lock()
+        try:
+            self._notify_retry_scan_sec = float(os.getenv("SIGNAL_NOTIFY_RETRY_SCAN_SEC", "5"))
+        except Exception:
+            self._notify_retry_scan_sec = 5.0
+        self._last_notify_retry_ts = 0.0
+        self._backlog_capped = False
 
         # Position sync self-check (best-effort): keep local positions aligned with exchange.
         self._position_sync_enabled = os.getenv("POSITION_SYNC_ENABLED", "true").lower() == "true"
         self._position_sync_interval_sec = float(os.getenv("POSITION_SYNC_INTERVAL_SEC", "10"))
         self._last_position_sync_ts = 0.0
+        try:
+            self._position_sync_concurrency = max(int(os.getenv("POSITION_SYNC_CONCURRENCY", "4")), 1)
+        except Exception:
+            self._position_sync_concurrency = 4
+        # Contract multipliers rarely change; cache them instead of one instrument request per position per sync.
+        try:
+            self._contract_meta_ttl_sec = float(os.getenv("POSITION_SYNC_META_TTL_SEC", "3600"))
+        except Exception:
+            self._contract_meta_ttl_sec = 3600.0
+        self._contract_meta: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._contract_meta_lock = threading.Lock()
 
     def start(self) -> bool:
         with self._lock:
@@ -75,40 +169,138 @@ class PendingOrderWorker:
     def stop(self, timeout_sec: float = 5.0) -> None:
         with self._lock:
             self._stop_event.set()
+            self._wakeup.event.set()
             th = self._thread
         if th and th.is_alive():
             th.join(timeout=timeout_sec)
         logger.info("PendingOrderWorker stopped")
 
     def _run_loop(self) -> None:
+        self._wakeup.listen()
+        reason = "start"
         while not self._stop_event.is_set():
+            _WAKEUPS.labels(reason).inc()
+            more = False
             try:
-                self._tick()
+                more = self._tick()
             except Exception as e:
                 logger.warning(f"PendingOrderWorker tick error: {e}")
-            time.sleep(self.poll_interval_sec)
+            if more:
+                # Batch was full: keep draining without waiting.
+                reason = "backlog"
+                continue
+            reason = "notify" if self._wakeup.wait(self.poll_interval_sec) else "poll"
+
+    def _tick(self) -> bool:
+        """Hand one batch to the dispatcher; returns True when the batch was full (more orders may be waiting)."""
+        started = time.perf_counter()
+        self._maybe_requeue_stale()
+        self._maybe_retry_notifications()
+        with self._inflight_lock:
+            room = self.batch_size - len(self._inflight_ids)
+        self._backlog_capped = room <= 0
+        if self._backlog_capped:
+            # Local queue is full; a finishing order wakes the loop again.
+            _TICK_SECONDS.labels("busy").observe(time.perf_counter() - started)
+            return False
 
-    def _tick(self) -> None:
-        orders = self._fetch_pending_orders(limit=self.batch_size)
+        # Claimed rows are already 'processing' (atomically, safe across worker processes).
+        orders = [o for o in self._claim_pending_orders(limit=room) if o.get("id")]
+        claimed_at = time.time()
         if not orders:
             self._maybe_sync_positions()
-            return
+            _TICK_SECONDS.labels("idle").observe(time.perf_counter() - started)
+            return False
 
+        configs: Dict[int, Dict[str, Any]] = {}
         for o in orders:
-            oid = o.get("id")
-            if not oid:
-                continue
+            oid = int(o["id"])
+            key, group = self._dispatch_key(o, configs)
+            with self._inflight_lock:
+                self._inflight_ids.add(oid)
+            self._dispatcher.submit(key, group, int(o.get("priority") or 0),
+                                    functools.partial(self._run_order, o, claimed_at))
 
-            # Mark processing (best-effort)
-            if not self._mark_processing(order_id=int(oid)):
-                continue
+        self._maybe_sync_positions()
+        _TICK_SECONDS.labels("busy").observe(time.perf_counter() - started)
+        return len(orders) >= room
+
+    def _dispatch_key(self, order_row: Dict[str, Any], configs: Dict[int, Dict[str, Any]]) -> Tuple[Tuple[Any, ...], str]:
+        """
+        Serialization key and rate-limit group for one order.
 
+        Live orders: key = (exchange, account, symbol), group = exchange; the account is the credential id or a
+        hash of the API key, so strategies sharing an account are serialized too.
+        Signal orders: key = ('signal', strategy_id, symbol), group = 'signal'.
+        """
+        strategy_id = int(order_row.get("strategy_id") or 0)
+        symbol = str(order_row.get("symbol") or "")
+        mode = str(order_row.get("execution_mode") or "signal").strip().lower()
+        try:
+            sc = configs.get(strategy_id)
+            if sc is None and strategy_id:
+                sc = configs[strategy_id] = load_strategy_configs(strategy_id)
+            sc = sc or {}
+            # Same upgrade rule as _dispatch_payload: legacy signal rows of a live strategy execute live.
+            if mode != "live" and (sc.get("execution_mode") or "").strip().lower() == "live":
+                mode = "live"
+            if mode != "live":
+                return ("signal", strategy_id, symbol), "signal"
+            exchange_id, account = exchange_account_key(
+                resolve_exchange_config(sc.get("exchange_config") or {}), strategy_id)
+            return (exchange_id, account, symbol), exchange_id
+        except Exception as e:
+            logger.debug(f"dispatch key fallback: strategy_id={strategy_id}, err={e}")
+            return ("strategy", strategy_id, symbol), "unknown"
+
+    def _run_order(self, o: Dict[str, Any], claimed_at: float) -> None:
+        """Dispatcher thread: dispatch one claimed order."""
+        oid = int(o["id"])
+        try:
+            try:
+                created_at = int(o.get("created_at") or 0)
+                if created_at > 0:
+                    _QUEUE_WAIT_SECONDS.observe(max(time.time() - created_at, 0.0))
+            except Exception:
+                pass
+
+            dispatch_started = time.perf_counter()
+            outcome = "ok"
             try:
-                self._dispatch_one(o)
+                self._dispatch_one(o, claimed_at=claimed_at)
             except Exception as e:
-                self._mark_failed(order_id=int(oid), error=str(e))
+                outcome = "error"
+                self._mark_failed(order_id=oid, error=str(e))
+            _DISPATCH_SECONDS.labels(str(o.get("execution_mode") or "signal").strip().lower(), outcome).observe(
+                time.perf_counter() - dispatch_started
+            )
+        finally:
+            with self._inflight_lock:
+                self._inflight_ids.discard(oid)
 
-        self._maybe_sync_positions()
+    def dispatch_stats(self) -> Dict[str, Any]:
+        return self._dispatcher.stats()
+
+    def notification_stats(self) -> Dict[str, Any]:
+        stats = self._notifier.stats()
+        with self._inflight_lock:
+            stats["notifyingOrders"] = len(self._notifying_ids)
+        return stats
+
+    def _maybe_retry_notifications(self) -> None:
+        """Hand due notification retries to the notifier pool (non-blocking)."""
+        now = time.time()
+        if now - self._last_notify_retry_ts < self._notify_retry_scan_sec:
+            return
+        self._last_notify_retry_ts = now
+        try:
+            self._notifier.process_retries()
+        except Exception as e:
+            logger.warning(f"notification retry scan failed: {e}")
+
+    def _on_order_done(self) -> None:
+        if self._backlog_capped:
+            self._wakeup.event.set()
 
     def _maybe_sync_positions(self) -> None:
         if not self._position_sync_enabled:
@@ -131,7 +323,15 @@ class PendingOrderWorker:
         - If exchange position size differs, update local size (optional best-effort).
 
         This prevents "ghost positions" when positions are closed externally on the exchange.
+
+        Positions are fetched once per exchange account (in parallel across accounts, POSITION_SYNC_CONCURRENCY)
+        and the snapshot is applied to every strategy trading on that account.
+
+        Accounts with orders queued or running are skipped for this round, and so are accounts whose orders were
+        submitted or finished while the snapshot was being fetched (the snapshot may predate the fill); all other
+        accounts are reconciled, so steady order flow on one account cannot starve the rest.
         """
+        sync_started = time.monotonic()
         # 1) Load local positions
         with get_db_connection() as db:
             cur = db.cursor()
@@ -150,332 +350,401 @@ class PendingOrderWorker:
                 continue
             sid_to_rows.setdefault(sid, []).append(r)
 
-        # 2) Reconcile per strategy
-        for sid, plist in sid_to_rows.items():
+        # 2) Group live strategies by exchange account
+        configs = load_strategy_configs_many(sid_to_rows.keys())
+        accounts: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        for sid in sid_to_rows:
+            sc = configs.get(sid) or {}
+            if (sc.get("execution_mode") or "").strip().lower() != "live":
+                continue
             try:
-                sc = load_strategy_configs(int(sid))
-                if (sc.get("execution_mode") or "").strip().lower() != "live":
-                    continue
                 exchange_config = resolve_exchange_config(sc.get("exchange_config") or {})
-                safe_cfg = safe_exchange_config_for_log(exchange_config)
-                market_type = (sc.get("market_type") or exchange_config.get("market_type") or "swap")
-                market_type = str(market_type or "swap").strip().lower()
-                if market_type in ("futures", "future", "perp", "perpetual"):
-                    market_type = "swap"
-
-                client = create_client(exchange_config, market_type=market_type)
-
-                # Build an "exchange snapshot" per symbol+side
-                exch_size: Dict[str, Dict[str, float]] = {}  # {symbol: {long: size, short: size}}
-
-                if isinstance(client, BinanceFuturesClient) and market_type == "swap":
-                    all_pos = client.get_positions() or []
-                    if isinstance(all_pos, list):
-                        for p in all_pos:
-                            sym = str(p.get("symbol") or "").strip().upper()
-                            try:
-                                amt = float(p.get("positionAmt") or 0.0)
-                            except Exception:
-                                amt = 0.0
-                            if not sym or abs(amt) <= 0:
-                                continue
-                            # Map to our symbol format: BTCUSDT -> BTC/USDT (best-effort)
-                            hb_sym = sym
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if amt > 0 else "short"
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
-
-                elif isinstance(client, OkxClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    data = (resp.get("data") or []) if isinstance(resp, dict) else []
-                    if isinstance(data, list):
-                        for p in data:
-                            inst_id = str(p.get("instId") or "")
-                            pos_side = str(p.get("posSide") or "").lower()
-                            try:
-                                pos = float(p.get("pos") or 0.0)
-                            except Exception:
-                                pos = 0.0
-                            if not inst_id or abs(pos) <= 0:
-                                continue
-                            # instId: BTC-USDT-SWAP -> BTC/USDT
-                            hb_sym = inst_id.replace("-SWAP", "").replace("-", "/")
-                            side = "long" if pos_side == "long" else ("short" if pos_side == "short" else ("long" if pos > 0 else "short"))
-                            # IMPORTANT: OKX swap positions `pos` is in contracts (张数), but our system uses base-asset quantity.
-                            # Convert contracts -> base using ctVal when available.
-                            qty_base = abs(float(pos))
-                            try:
-                                inst = client.get_instrument(inst_type="SWAP", inst_id=inst_id) or {}
-                                ct_val = float(inst.get("ctVal") or 0.0)
-                                if ct_val > 0:
-                                    qty_base = qty_base * ct_val
-                            except Exception:
-                                pass
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, BitgetMixClient) and market_type == "swap":
-                    product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "USDT-FUTURES")
-                    resp = client.get_positions(product_type=product_type)
-                    data = resp.get("data") if isinstance(resp, dict) else None
-                    if isinstance(data, list):
-                        for p in data:
-                            sym = str(p.get("symbol") or "")
-                            hold_side = str(p.get("holdSide") or "").lower()
-                            try:
-                                total = float(p.get("total") or 0.0)
-                            except Exception:
-                                total = 0.0
-                            if not sym or abs(total) <= 0:
-                                continue
-                            # Symbol is like BTCUSDT -> BTC/USDT best-effort
-                            hb_sym = sym.upper()
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if hold_side == "long" else "short"
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(total))
-
-                elif isinstance(client, BybitClient) and market_type == "swap":
-                    # Bybit linear positions
-                    resp = client.get_positions()
-                    lst = (((resp.get("result") or {}).get("list")) if isinstance(resp, dict) else None) or []
-                    if isinstance(lst, list):
-                        for p in lst:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or "").strip().upper()
-                            side0 = str(p.get("side") or "").strip().lower()  # Buy/Sell
-                            try:
-                                sz = float(p.get("size") or 0.0)
-                            except Exception:
-                                sz = 0.0
-                            if not sym or abs(sz) <= 0:
-                                continue
-                            hb_sym = sym
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if side0 == "buy" else ("short" if side0 == "sell" else ("long" if sz > 0 else "short"))
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
-
-                elif isinstance(client, GateUsdtFuturesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    items = resp if isinstance(resp, list) else []
-                    if isinstance(items, list):
-                        for p in items:
-                            if not isinstance(p, dict):
-                                continue
-                            contract = str(p.get("contract") or "").strip()
-                            try:
-                                sz_ct = float(p.get("size") or 0.0)  # contracts, signed
-                            except Exception:
-                                sz_ct = 0.0
-                            if not contract or abs(sz_ct) <= 0:
-                                continue
-                            hb_sym = contract.replace("_", "/")
-                            side = "long" if sz_ct > 0 else "short"
-                            # Convert contracts -> base using quanto_multiplier.
-                            qty_base = abs(sz_ct)
-                            try:
-                                meta = client.get_contract(contract=contract) or {}
-                                qm = float(meta.get("quanto_multiplier") or meta.get("contract_size") or 0.0)
-                                if qm > 0:
-                                    qty_base = qty_base * qm
-                            except Exception:
-                                pass
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, KucoinFuturesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    data = (resp.get("data") if isinstance(resp, dict) else None) or []
-                    if isinstance(data, list):
-                        for p in data:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or "").strip()
-                            try:
-                                qty_ct = float(p.get("currentQty") or p.get("quantity") or 0.0)
-                            except Exception:
-                                qty_ct = 0.0
-                            if not sym or abs(qty_ct) <= 0:
-                                continue
-                            side = "long" if qty_ct > 0 else "short"
-                            # Convert contracts -> base using multiplier.
-                            qty_base = abs(qty_ct)
-                            try:
-                                meta = client.get_contract(symbol=sym) or {}
-                                mult = float(meta.get("multiplier") or meta.get("lotSize") or 0.0)
-                                if mult > 0:
-                                    qty_base = qty_base * mult
-                            except Exception:
-                                pass
-                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, KrakenFuturesClient) and market_type == "swap":
-                    resp = client.get_open_positions()
-                    positions = (resp.get("openPositions") if isinstance(resp, dict) else None) or (resp.get("open_positions") if isinstance(resp, dict) else None) or []
-                    if isinstance(positions, list):
-                        for p in positions:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or p.get("instrument") or "").strip()
-                            try:
-                                sz = float(p.get("size") or p.get("positionSize") or 0.0)
-                            except Exception:
-                                sz = 0.0
-                            if not sym or abs(sz) <= 0:
-                                continue
-                            side = "long" if sz > 0 else "short"
-                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
-
-                elif isinstance(client, BitfinexDerivativesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    items = resp if isinstance(resp, list) else []
-                    if isinstance(items, list):
-                        for p in items:
-                            # Bitfinex positions are arrays; best-effort parse:
-                            # [symbol, status, amount, base_price, ...]
-                            try:
-                                if isinstance(p, list) and len(p) >= 3:
-                                    sym = str(p[0] or "")
-                                    amt = float(p[2] or 0.0)
-                                    if not sym or abs(amt) <= 0:
-                                        continue
-                                    side = "long" if amt > 0 else "short"
-                                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
-                            except Exception:
-                                continue
+            except Exception as e:
+                logger.info(f"position sync: strategy_id={sid} failed: {e}")
+                continue
+            market_type = (sc.get("market_type") or exchange_config.get("market_type") or "swap")
+            market_type = str(market_type or "swap").strip().lower()
+            if market_type in ("futures", "future", "perp", "perpetual"):
+                market_type = "swap"
+            exchange_id, account = exchange_account_key(exchange_config, sid)
+            product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "")
+            entry = accounts.setdefault(
+                (exchange_id, account, market_type, product_type),
+                {"exchange_config": exchange_config, "market_type": market_type, "strategy_ids": []},
+            )
+            entry["strategy_ids"].append(sid)
 
-                else:
-                    # Spot reconciliation is optional; skip for now (keeps self-check low-risk).
-                    logger.debug(f"position sync: skip unsupported market/client: sid={sid}, cfg={safe_cfg}, market_type={market_type}, client={type(client)}")
-                    continue
-
-                # 3) Apply reconciliation to local rows.
-                to_delete_ids: List[int] = []
-                to_update: List[Dict[str, Any]] = []
-                eps = 1e-12
-
-                for r in plist:
-                    rid = int(r.get("id") or 0)
-                    sym = str(r.get("symbol") or "").strip()
-                    side = str(r.get("side") or "").strip().lower()
-                    if not rid or not sym or side not in ("long", "short"):
+        busy_accounts, busy_sids = self._busy_accounts(sync_started)
+        accounts = {k: e for k, e in accounts.items() if not self._account_busy(k, e, busy_accounts, busy_sids)}
+        if not accounts:
+            return
+
+        # 3) One exchange snapshot per account, fetched in parallel
+        def _fetch(key: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Optional[Dict[str, Dict[str, float]]]]:
+            entry = accounts[key]
+            try:
+                client = create_client(entry["exchange_config"], market_type=entry["market_type"])
+                return key, self._fetch_position_snapshot(client, entry["exchange_config"], entry["market_type"])
+            except Exception as e:
+                logger.info(f"position sync: account {key[0]}/{key[1]} failed (strategies={entry['strategy_ids']}): {e}")
+                return key, None
+
+        workers = min(self._position_sync_concurrency, len(accounts))
+        if workers <= 1:
+            snapshots = dict(_fetch(k) for k in accounts)
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="PositionSync") as pool:
+                snapshots = dict(pool.map(_fetch, list(accounts)))
+
+        # 4) Fan the snapshot out to every strategy on the account
+        busy_accounts, busy_sids = self._busy_accounts(sync_started)
+        for key, entry in accounts.items():
+            exch_size = snapshots.get(key)
+            if exch_size is None:
+                continue
+            if self._account_busy(key, entry, busy_accounts, busy_sids):
+                logger.debug(f"position sync: account {key[0]}/{key[1]} had order activity during the fetch; skipped")
+                continue
+            for sid in entry["strategy_ids"]:
+                try:
+                    self._apply_position_snapshot(sid, sid_to_rows[sid], exch_size)
+                except Exception as e:
+                    logger.info(f"position sync: strategy_id={sid} failed: {e}")
+
+    def _busy_accounts(self, since: float) -> Tuple[Set[Tuple[Any, Any]], Set[int]]:
+        """(exchange, account) pairs and fallback-keyed strategy ids with dispatcher activity since `since`."""
+        accounts: Set[Tuple[Any, Any]] = set()
+        sids: Set[int] = set()
+        for key in self._dispatcher.keys_busy_since(since):
+            if not isinstance(key, tuple) or len(key) < 2 or key[0] == "signal":
+                continue
+            if key[0] == "strategy":
+                sids.add(int(key[1] or 0))
+            else:
+                accounts.add((key[0], key[1]))
+        return accounts, sids
+
+    @staticmethod
+    def _account_busy(key: Tuple[str, ...], entry: Dict[str, Any], busy_accounts: Set[Tuple[Any, Any]],
+                      busy_sids: Set[int]) -> bool:
+        return (key[0], key[1]) in busy_accounts or any(sid in busy_sids for sid in entry["strategy_ids"])
+
+    def _contract_multiplier(self, exchange_id: str, instrument: str, loader: Any) -> float:
+        """Contracts -> base multiplier (OKX ctVal, Gate quanto_multiplier, KuCoin multiplier), cached per instrument."""
+        key = (exchange_id, instrument)
+        now = time.time()
+        with self._contract_meta_lock:
+            hit = self._contract_meta.get(key)
+        if hit is not None and now - hit[0] < self._contract_meta_ttl_sec:
+            return hit[1]
+        try:
+            value = float(loader() or 0.0)
+        except Exception:
+            # Not cached: retried on the next sync.
+            return 0.0
+        with self._contract_meta_lock:
+            self._contract_meta[key] = (now, value)
+        return value
+
+    def _fetch_position_snapshot(
+        self, client: Any, exchange_config: Dict[str, Any], market_type: str
+    ) -> Optional[Dict[str, Dict[str, float]]]:
+        """Exchange positions as {symbol: {long: size, short: size}} in base quantity; None if unsupported."""
+        exch_size: Dict[str, Dict[str, float]] = {}  # {symbol: {long: size, short: size}}
+
+        if isinstance(client, BinanceFuturesClient) and market_type == "swap":
+            all_pos = client.get_positions() or []
+            if isinstance(all_pos, list):
+                for p in all_pos:
+                    sym = str(p.get("symbol") or "").strip().upper()
+                    try:
+                        amt = float(p.get("positionAmt") or 0.0)
+                    except Exception:
+                        amt = 0.0
+                    if not sym or abs(amt) <= 0:
                         continue
+                    # Map to our symbol format: BTCUSDT -> BTC/USDT (best-effort)
+                    hb_sym = sym
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if amt > 0 else "short"
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
+
+        elif isinstance(client, OkxClient) and market_type == "swap":
+            resp = client.get_positions()
+            data = (resp.get("data") or []) if isinstance(resp, dict) else []
+            if isinstance(data, list):
+                for p in data:
+                    inst_id = str(p.get("instId") or "")
+                    pos_side = str(p.get("posSide") or "").lower()
                     try:
-                        local_size = float(r.get("size") or 0.0)
+                        pos = float(p.get("pos") or 0.0)
                     except Exception:
-                        local_size = 0.0
+                        pos = 0.0
+                    if not inst_id or abs(pos) <= 0:
+                        continue
+                    # instId: BTC-USDT-SWAP -> BTC/USDT
+                    hb_sym = inst_id.replace("-SWAP", "").replace("-", "/")
+                    side = "long" if pos_side == "long" else ("short" if pos_side == "short" else ("long" if pos > 0 else "short"))
+                    # IMPORTANT: OKX swap positions `pos` is in contracts (张数), but our system uses base-asset quantity.
+                    # Convert contracts -> base using ctVal when available.
+                    qty_base = abs(float(pos))
+                    ct_val = self._contract_multiplier(
+                        "okx", inst_id,
+                        lambda inst_id=inst_id: (client.get_instrument(inst_type="SWAP", inst_id=inst_id) or {}).get("ctVal"))
+                    if ct_val > 0:
+                        qty_base = qty_base * ct_val
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, BitgetMixClient) and market_type == "swap":
+            product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "USDT-FUTURES")
+            resp = client.get_positions(product_type=product_type)
+            data = resp.get("data") if isinstance(resp, dict) else None
+            if isinstance(data, list):
+                for p in data:
+                    sym = str(p.get("symbol") or "")
+                    hold_side = str(p.get("holdSide") or "").lower()
+                    try:
+                        total = float(p.get("total") or 0.0)
+                    except Exception:
+                        total = 0.0
+                    if not sym or abs(total) <= 0:
+                        continue
+                    # Symbol is like BTCUSDT -> BTC/USDT best-effort
+                    hb_sym = sym.upper()
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if hold_side == "long" else "short"
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(total))
+
+        elif isinstance(client, BybitClient) and market_type == "swap":
+            # Bybit linear positions
+            resp = client.get_positions()
+            lst = (((resp.get("result") or {}).get("list")) if isinstance(resp, dict) else None) or []
+            if isinstance(lst, list):
+                for p in lst:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or "").strip().upper()
+                    side0 = str(p.get("side") or "").strip().lower()  # Buy/Sell
+                    try:
+                        sz = float(p.get("size") or 0.0)
+                    except Exception:
+                        sz = 0.0
+                    if not sym or abs(sz) <= 0:
+                        continue
+                    hb_sym = sym
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if side0 == "buy" else ("short" if side0 == "sell" else ("long" if sz > 0 else "short"))
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
+
+        elif isinstance(client, GateUsdtFuturesClient) and market_type == "swap":
+            resp = client.get_positions()
+            items = resp if isinstance(resp, list) else []
+            if isinstance(items, list):
+                for p in items:
+                    if not isinstance(p, dict):
+                        continue
+                    contract = str(p.get("contract") or "").strip()
+                    try:
+                        sz_ct = float(p.get("size") or 0.0)  # contracts, signed
+                    except Exception:
+                        sz_ct = 0.0
+                    if not contract or abs(sz_ct) <= 0:
+                        continue
+                    hb_sym = contract.replace("_", "/")
+                    side = "long" if sz_ct > 0 else "short"
+                    # Convert contracts -> base using quanto_multiplier.
+                    qty_base = abs(sz_ct)
+                    qm = self._contract_multiplier("gate", contract, lambda contract=contract: _meta_value(
+                        client.get_contract(contract=contract), "quanto_multiplier", "contract_size"))
+                    if qm > 0:
+                        qty_base = qty_base * qm
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, KucoinFuturesClient) and market_type == "swap":
+            resp = client.get_positions()
+            data = (resp.get("data") if isinstance(resp, dict) else None) or []
+            if isinstance(data, list):
+                for p in data:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or "").strip()
+                    try:
+                        qty_ct = float(p.get("currentQty") or p.get("quantity") or 0.0)
+                    except Exception:
+                        qty_ct = 0.0
+                    if not sym or abs(qty_ct) <= 0:
+                        continue
+                    side = "long" if qty_ct > 0 else "short"
+                    # Convert contracts -> base using multiplier.
+                    qty_base = abs(qty_ct)
+                    mult = self._contract_multiplier("kucoin", sym, lambda sym=sym: _meta_value(
+                        client.get_contract(symbol=sym), "multiplier", "lotSize"))
+                    if mult > 0:
+                        qty_base = qty_base * mult
+                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, KrakenFuturesClient) and market_type == "swap":
+            resp = client.get_open_positions()
+            positions = (resp.get("openPositions") if isinstance(resp, dict) else None) or (resp.get("open_positions") if isinstance(resp, dict) else None) or []
+            if isinstance(positions, list):
+                for p in positions:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or p.get("instrument") or "").strip()
+                    try:
+                        sz = float(p.get("size") or p.get("positionSize") or 0.0)
+                    except Exception:
+                        sz = 0.0
+                    if not sym or abs(sz) <= 0:
+                        continue
+                    side = "long" if sz > 0 else "short"
+                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
+
+        elif isinstance(client, BitfinexDerivativesClient) and market_type == "swap":
+            resp = client.get_positions()
+            items = resp if isinstance(resp, list) else []
+            if isinstance(items, list):
+                for p in items:
+                    # Bitfinex positions are arrays; best-effort parse:
+                    # [symbol, status, amount, base_price, ...]
+                    try:
+                        if isinstance(p, list) and len(p) >= 3:
+                            sym = str(p[0] or "")
+                            amt = float(p[2] or 0.0)
+                            if not sym or abs(amt) <= 0:
+                                continue
+                            side = "long" if amt > 0 else "short"
+                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
+                    except Exception:
+                        continue
 
-                    exch = exch_size.get(sym) or {}
-                    exch_qty = float(exch.get(side) or 0.0)
+        else:
+            # Spot reconciliation is optional; skip for now (keeps self-check low-risk).
+            logger.debug(f"position sync: skip unsupported market/client: cfg={safe_exchange_config_for_log(exchange_config)}, market_type={market_type}, client={type(client)}")
+            return None
 
-                    if exch_qty <= eps:
-                        # Exchange is flat -> delete local position (self-heal).
-                        to_delete_ids.append(rid)
-                    else:
-                        # Update local size if it diverged materially (best-effort).
-                        if local_size <= 0 or abs(exch_qty - local_size) / max(1.0, local_size) > 0.01:
-                            to_update.append({"id": rid, "size": exch_qty})
-
-                if not to_delete_ids and not to_update:
-                    continue
-
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    for rid in to_delete_ids:
-                        cur.execute("DELETE FROM qd_strategy_positions WHERE id = %s", (int(rid),))
-                    now_ts = int(time.time())
-                    for u in to_update:
-                        cur.execute("UPDATE qd_strategy_positions SET size = %s, updated_at = %s WHERE id = %s", (float(u["size"]), now_ts, int(u["id"])))
-                    db.commit()
-                    cur.close()
-
-                if to_delete_ids:
-                    logger.info(f"position sync: removed {len(to_delete_ids)} ghost positions for strategy_id={sid}")
-            except Exception as e:
-                logger.info(f"position sync: strategy_id={sid} failed: {e}")
 
-    def _fetch_pending_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
-        try:
-            # Best-effort: requeue stale "processing" rows to avoid deadlocks after crashes.
+        return exch_size
+
+    def _apply_position_snapshot(
+        self, sid: int, plist: List[Dict[str, Any]], exch_size: Dict[str, Dict[str, float]]
+    ) -> None:
+        """Apply an account snapshot to one strategy's local rows."""
+        to_delete_ids: List[int] = []
+        to_update: List[Dict[str, Any]] = []
+        eps = 1e-12
+
+        for r in plist:
+            rid = int(r.get("id") or 0)
+            sym = str(r.get("symbol") or "").strip()
+            side = str(r.get("side") or "").strip().lower()
+            if not rid or not sym or side not in ("long", "short"):
+                continue
             try:
-                stale_sec = int(self._stale_processing_sec or 0)
+                local_size = float(r.get("size") or 0.0)
             except Exception:
-                stale_sec = 0
-            if stale_sec > 0:
-                now = int(time.time())
-                cutoff = now - stale_sec
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    cur.execute(
-                        """
-                        UPDATE pending_orders
-                        SET status = 'pending',
-                            updated_at = %s,
-                            dispatch_note = CASE
-                                WHEN dispatch_note IS NULL OR dispatch_note = '' THEN 'requeued_stale_processing'
-                                ELSE dispatch_note
-                            END
-                        WHERE status = 'processing'
-                          AND (updated_at IS NULL OR updated_at < %s)
-                          AND (attempts < max_attempts)
-                        """,
-                        (now, cutoff),
-                    )
-                    db.commit()
-                    cur.close()
+                local_size = 0.0
+
+            exch = exch_size.get(sym) or {}
+            exch_qty = float(exch.get(side) or 0.0)
 
+            if exch_qty <= eps:
+                # Exchange is flat -> delete local position (self-heal).
+                to_delete_ids.append(rid)
+            else:
+                # Update local size if it diverged materially (best-effort).
+                if local_size <= 0 or abs(exch_qty - local_size) / max(1.0, local_size) > 0.01:
+                    to_update.append({"id": rid, "size": exch_qty})
+
+        if not to_delete_ids and not to_update:
+            return
+
+        with get_db_connection() as db:
+            cur = db.cursor()
+            for rid in to_delete_ids:
+                cur.execute("DELETE FROM qd_strategy_positions WHERE id = %s", (int(rid),))
+            now_ts = int(time.time())
+            for u in to_update:
+                cur.execute("UPDATE qd_strategy_positions SET size = %s, updated_at = %s WHERE id = %s", (float(u["size"]), now_ts, int(u["id"])))
+            db.commit()
+            cur.close()
+        # 执行器持仓账本以数据库为准重新加载
+        invalidate_positions(sid)
+
+        if to_delete_ids:
+            logger.info(f"position sync: removed {len(to_delete_ids)} ghost positions for strategy_id={sid}")
+
+    def _maybe_requeue_stale(self) -> None:
+        """Requeue stale "processing" rows (worker crashed after claiming) on their own, slower schedule."""
+        try:
+            stale_sec = int(self._stale_processing_sec or 0)
+        except Exception:
+            stale_sec = 0
+        if stale_sec <= 0:
+            return
+        now_ts = time.time()
+        # Scan (and refresh our own claims) well within the stale window.
+        interval = min(float(self._stale_scan_interval_sec), stale_sec / 3.0)
+        if now_ts - float(self._last_stale_scan_ts or 0.0) < interval:
+            return
+        self._last_stale_scan_ts = now_ts
+        self._touch_inflight()
+        try:
+            now = int(now_ts)
+            cutoff = now - stale_sec
             with get_db_connection() as db:
                 cur = db.cursor()
                 cur.execute(
                     """
-                    SELECT *
-                    FROM pending_orders
-                    WHERE status = 'pending'
+                    UPDATE pending_orders
+                    SET status = 'pending',
+                        updated_at = %s,
+                        dispatch_note = CASE
+                            WHEN dispatch_note IS NULL OR dispatch_note = '' THEN 'requeued_stale_processing'
+                            ELSE dispatch_note
+                        END
+                    WHERE status = 'processing'
+                      AND (updated_at IS NULL OR updated_at < %s)
                       AND (attempts < max_attempts)
-                    ORDER BY priority DESC, id ASC
-                    LIMIT %s
                     """,
-                    (int(limit),),
+                    (now, cutoff),
                 )
-                rows = cur.fetchall() or []
+                db.commit()
                 cur.close()
-            return rows
         except Exception as e:
-            logger.warning(f"fetch_pending_orders failed: {e}")
+            logger.warning(f"requeue_stale_processing failed: {e}")
+
+    def _claim_pending_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
+        try:
+            return claim_pending_orders(limit=int(limit))
+        except Exception as e:
+            logger.warning(f"claim_pending_orders failed: {e}")
             return []
 
-    def _mark_processing(self, order_id: int) -> bool:
+    def _touch_inflight(self) -> None:
+        """Keep updated_at fresh for orders this process has claimed, so the stale requeue
+        (in this or another worker process) never takes back an order that is queued or running here."""
+        with self._inflight_lock:
+            ids = sorted(self._inflight_ids | self._notifying_ids)
+        if not ids:
+            return
         try:
-            now = int(time.time())
             with get_db_connection() as db:
                 cur = db.cursor()
-                # Only claim if still pending to avoid double-processing.
                 cur.execute(
-                    """
-                    UPDATE pending_orders
-                    SET status = 'processing',
-                        attempts = COALESCE(attempts, 0) + 1,
-                        processed_at = %s,
-                        updated_at = %s
-                    WHERE id = %s AND status = 'pending'
-                    """,
-                    (now, now, int(order_id)),
+                    f"UPDATE pending_orders SET updated_at = %s WHERE status = 'processing' AND id IN ({','.join(['%s'] * len(ids))})",
+                    (int(time.time()), *ids),
                 )
-                claimed = getattr(cur, "rowcount", None)
                 db.commit()
                 cur.close()
-            # Only treat as success if we actually changed a row.
-            if claimed is None:
-                return True
-            return int(claimed) > 0
         except Exception as e:
-            logger.warning(f"mark_processing failed: id={order_id}, err={e}")
-            return False
+            logger.warning(f"touch_inflight failed: {e}")
 
-    def _dispatch_one(self, order_row: Dict[str, Any]) -> None:
+    def _dispatch_one(self, order_row: Dict[str, Any], claimed_at: Optional[float] = None) -> None:
         order_id = int(order_row["id"])
-        mode = (order_row.get("execution_mode") or "signal").strip().lower()
         payload_json = order_row.get("payload_json") or ""
 
         payload: Dict[str, Any] = {}
@@ -485,6 +754,23 @@ class PendingOrderWorker:
             except Exception:
                 payload = {}
 
+        # Latency trace: stage timestamps are collected in memory and written once when dispatch ends.
+        trace = OrderTrace.from_payload(order_id, payload)
+        if claimed_at:
+            trace.marks["claimed_at"] = round(float(claimed_at), 3)
+        trace.mark("dispatched_at")
+        deferred = False
+        try:
+            deferred = self._dispatch_payload(order_row, payload, trace)
+        finally:
+            if not deferred:
+                trace.finish()
+
+    def _dispatch_payload(self, order_row: Dict[str, Any], payload: Dict[str, Any], trace: OrderTrace) -> bool:
+        """Returns True when the order is completed asynchronously (signal mode: after notifications resolve)."""
+        order_id = int(order_row["id"])
+        mode = (order_row.get("execution_mode") or "signal").strip().lower()
+
         signal_type = payload.get("signal_type") or order_row.get("signal_type")
         symbol = payload.get("symbol") or order_row.get("symbol")
         strategy_id = payload.get("strategy_id") or order_row.get("strategy_id")
@@ -515,43 +801,71 @@ class PendingOrderWorker:
             if (not notification_config) and strategy_id:
                 notification_config = self._load_notification_config(int(strategy_id))
 
-            results = self._notifier.notify_signal(
-                strategy_id=int(strategy_id or 0),
-                strategy_name=str(strategy_name or ""),
-                symbol=str(symbol or ""),
-                signal_type=str(signal_type or ""),
-                price=float(price or 0.0),
-                stake_amount=float(amount or 0.0),
-                direction=str(direction or "long"),
-                notification_config=notification_config if isinstance(notification_config, dict) else {},
-                extra={"pending_order_id": order_id, "mode": mode},
-            )
+            with self._inflight_lock:
+                self._notifying_ids.add(order_id)
+            try:
+                self._notifier.notify_signal_async(
+                    strategy_id=int(strategy_id or 0),
+                    strategy_name=str(strategy_name or ""),
+                    symbol=str(symbol or ""),
+                    signal_type=str(signal_type or ""),
+                    price=float(price or 0.0),
+                    stake_amount=float(amount or 0.0),
+                    direction=str(direction or "long"),
+                    notification_config=notification_config if isinstance(notification_config, dict) else {},
+                    extra={"pending_order_id": order_id, "mode": mode},
+                    on_complete=functools.partial(self._finish_signal_order, order_id, trace),
+                )
+            except Exception:
+                with self._inflight_lock:
+                    self._notifying_ids.discard(order_id)
+                raise
+            return True
+
+        if mode == "live":
+            self._execute_live_order(order_id=order_id, order_row=order_row, payload=payload, trace=trace)
+            return False
+
+        self._mark_failed(order_id=order_id, error=f"unsupported_execution_mode:{mode}")
+        return False
+
+    def _finish_signal_order(self, order_id: int, trace: OrderTrace, results: Dict[str, Dict[str, Any]]) -> None:
+        """Notifier thread: settle a signal-mode order once its channels delivered, failed or timed out."""
+        try:
+            # Signal mode has no exchange: the "ack" is the notification round-trip.
+            trace.mark("acked_at")
 
-            attempted = list(results.keys())
             ok_channels = [c for c, r in results.items() if (r or {}).get("ok")]
-            fail_channels = [c for c, r in results.items() if not (r or {}).get("ok")]
+            queued_channels = [c for c, r in results.items() if (r or {}).get("queued")]
+            # Still running at the channel deadline: outcome unknown (queued later only on a transient failure).
+            pending_channels = [c for c, r in results.items() if (r or {}).get("pending")]
+            fail_channels = [c for c in results if c not in ok_channels + queued_channels + pending_channels]
 
-            if ok_channels:
+            if ok_channels or queued_channels or pending_channels:
+                # Channels on the retry queue are delivered later; the order itself is done.
                 note = f"notified_ok={','.join(ok_channels)}"
+                if queued_channels:
+                    note += f";queued={','.join(queued_channels)}"
+                if pending_channels:
+                    note += f";pending={','.join(pending_channels)}"
                 if fail_channels:
                     note += f";fail={','.join(fail_channels)}"
                 self._mark_sent(order_id=order_id, note=note[:200])
             else:
-                # Nothing succeeded -> mark failed with a compact error summary.
+                # Nothing succeeded or can be retried -> mark failed with a compact error summary.
                 first_err = ""
-                for c in attempted:
+                for c in results:
                     err = (results.get(c) or {}).get("error") or ""
                     if err:
                         first_err = f"{c}:{err}"
                         break
                 self._mark_failed(order_id=order_id, error=first_err or "notify_failed")
-            return
-
-        if mode == "live":
-            self._execute_live_order(order_id=order_id, order_row=order_row, payload=payload)
-            return
-
-        self._mark_failed(order_id=order_id, error=f"unsupported_execution_mode:{mode}")
+        except Exception as e:
+            logger.warning(f"signal order settle failed: pending_id={order_id}, err={e}")
+        finally:
+            with self._inflight_lock:
+                self._notifying_ids.discard(order_id)
+            trace.finish()
 
     def _load_notification_config(self, strategy_id: int) -> Dict[str, Any]:
         try:
@@ -587,7 +901,9 @@ class PendingOrderWorker:
         except Exception:
             return ""
 
-    def _execute_live_order(self, *, order_id: int, order_row: Dict[str, Any], payload: Dict[str, Any]) -> None:
+    def _execute_live_order(
+        self, *, order_id: int, order_row: Dict[str, Any], payload: Dict[str, Any], trace: Optional[OrderTrace] = None
+    ) -> None:
         """
         Execute a pending order using direct exchange REST clients (no ccxt).
         """
@@ -609,7 +925,8 @@ class PendingOrderWorker:
             Best-effort notifications for live execution.
 
             Historically this worker only notified in execution_mode='signal'. For real trading ('live'),
-            users still want Telegram/browser alerts. This hook never blocks or changes order status.
+            users still want Telegram/browser alerts. This hook never blocks (delivery is asynchronous)
+            or changes order status.
             """
             try:
                 notification_config = payload.get("notification_config") or {}
@@ -630,7 +947,20 @@ class PendingOrderWorker:
                 px = float(price_hint) if (price_hint is not None and float(price_hint or 0.0) > 0) else ref0
                 amt = float(amount_hint) if (amount_hint is not None and float(amount_hint or 0.0) > 0) else amt0
 
-                results = self._notifier.notify_signal(
+                def _log_results(results: Dict[str, Dict[str, Any]]) -> None:
+                    ok_channels = [c for c, r in (results or {}).items() if (r or {}).get("ok")]
+                    pending_channels = [c for c, r in (results or {}).items() if (r or {}).get("pending")]
+                    fail_channels = [c for c in (results or {}) if c not in ok_channels + pending_channels]
+                    if ok_channels or fail_channels or pending_channels:
+                        logger.info(
+                            f"live notify: pending_id={order_id}, strategy_id={strategy_id}, "
+                            f"ok={','.join(ok_channels) if ok_channels else '-'} "
+                            f"fail={','.join(fail_channels) if fail_channels else '-'} "
+                            f"pending={','.join(pending_channels) if pending_channels else '-'}"
+                        )
+
+                # Fire-and-forget: the order path never waits on notification I/O.
+                self._notifier.notify_signal_async(
                     strategy_id=int(strategy_id),
                     strategy_name=str(strategy_name or ""),
                     symbol=str(sym0 or ""),
@@ -647,15 +977,8 @@ class PendingOrderWorker:
                         "exchange_id": str(exchange_id or ""),
                         "exchange_order_id": str(exchange_order_id or ""),
                     },
+                    on_complete=_log_results,
                 )
-                ok_channels = [c for c, r in (results or {}).items() if (r or {}).get("ok")]
-                fail_channels = [c for c, r in (results or {}).items() if not (r or {}).get("ok")]
-                if ok_channels or fail_channels:
-                    logger.info(
-                        f"live notify: pending_id={order_id}, strategy_id={strategy_id}, "
-                        f"ok={','.join(ok_channels) if ok_channels else '-'} "
-                        f"fail={','.join(fail_channels) if fail_channels else '-'}"
-                    )
             except Exception as e:
                 logger.info(f"live notify skipped/failed: pending_id={order_id}, strategy_id={strategy_id}, err={e}")
 
@@ -678,6 +1001,9 @@ class PendingOrderWorker:
         exchange_config = resolve_exchange_config(cfg.get("exchange_config") or {})
         safe_cfg = safe_exchange_config_for_log(exchange_config)
         exchange_id = str(exchange_config.get("exchange_id") or "").strip().lower()
+        if trace is None:
+            trace = OrderTrace(order_id)
+        trace.exchange_id = exchange_id
 
         market_type = (payload.get("market_type") or order_row.get("market_type") or cfg.get("market_type") or exchange_config.get("market_type") or "swap")
         market_type = str(market_type or "swap").strip().lower()
@@ -1036,6 +1362,7 @@ class PendingOrderWorker:
 
                 limit_order_id = str(res1.exchange_order_id or "")
                 phases["limit_place"] = res1.raw
+                trace.mark("acked_at")
 
                 # Wait for fills
                 if isinstance(client, BinanceFuturesClient):
@@ -1108,6 +1435,8 @@ class PendingOrderWorker:
                     phases["limit_query"] = q
                     _apply_fill(float(q.get("filled") or 0.0), float(q.get("avg_price") or 0.0))
 
+                if total_base > 0:
+                    trace.mark("filled_at", first=False)
                 remaining = max(0.0, float(amount or 0.0) - total_base)
 
                 # Tail guard: if remaining is below the exchange min tradable amount, do NOT chase it with a market order.
@@ -1351,6 +1680,7 @@ class PendingOrderWorker:
 
                 market_order_id = str(res2.exchange_order_id or "")
                 phases["market_place"] = res2.raw
+                trace.mark("acked_at")
 
                 # Query fills (short wait)
                 if isinstance(client, BinanceFuturesClient):
@@ -1423,6 +1753,8 @@ class PendingOrderWorker:
                     q2 = client.wait_for_fill(order_id=market_order_id, max_wait_sec=3.0)
                     phases["market_query"] = q2
                     _apply_fill(float(q2.get("filled") or 0.0), float(q2.get("avg_price") or 0.0))
+                if total_base > 0:
+                    trace.mark("filled_at", first=False)
             except LiveTradingError as e:
                 logger.warning(f"live market phase failed: pending_id={order_id}, strategy_id={strategy_id}, cfg={safe_cfg}, err={e}")
                 phases["market_error"] = str(e)
@@ -0,0 +1,425 @@
+"""
+策略持仓内存账本（write-behind 持久化）
+
+执行器原来每个 tick、每个策略都要新建 SQLite 连接查询 qd_strategy_positions，最高价/最低价每变化一次就写一次库。
+这里在进程内维护一份权威的持仓账本：
+- 启动时一次性加载全部持仓，之后读取全部走内存；
+- 持仓修改只改内存并标记脏，后台 flusher 每 POSITION_FLUSH_INTERVAL_MS 把脏行合并成一个事务写回
+  （同一行多次修改只写最后一次，删除与写入按最终状态合并）；
+- 只有执行器的开/加/减/平仓（upsert/close）会写 size/entry_price 或删除行；价格跟踪
+  （update_current_price / update_price_tracking）只标记价格列，落盘时用 UPDATE 只改 current/highest/lowest，
+  行已被外部删除时影响 0 行，不会把外部的改动覆盖回去或让已删除的持仓复活；
+- 交易记录同步写入，并与该策略尚未落盘的持仓变更放在同一个事务里提交：数据库中不会出现
+  "有成交记录但持仓未变"或"持仓已变但没有成交记录"的状态；所有写库操作串行执行，保证先后顺序。
+
+其他模块直接改库（实盘成交回写、持仓对账）后调用 invalidate_positions(strategy_id)：数量/均价以数据库为准，
+账本只落盘该策略的价格跟踪字段（current/highest/lowest），下次读取时从数据库重新加载；
+改库的进程不是运行该策略的引擎进程时，经引擎 IPC 转发给运行它的进程（分片模式下按租约找分片）。
+"""
+import atexit
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PositionKey = Tuple[int, str, str]  # (strategy_id, symbol, side)
+
+_UPSERT_SQL = """
+    INSERT INTO qd_strategy_positions (
+        strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, updated_at
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s
+    ) ON CONFLICT(strategy_id, symbol, side) DO UPDATE SET
+        size = excluded.size,
+        entry_price = excluded.entry_price,
+        current_price = excluded.current_price,
+        highest_price = CASE WHEN excluded.highest_price > 0 THEN excluded.highest_price ELSE highest_price END,
+        lowest_price = CASE WHEN excluded.lowest_price > 0 THEN excluded.lowest_price ELSE lowest_price END,
+        updated_at = excluded.updated_at
+"""
+
+_POSITION_COLUMNS = 'id, strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price'
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+def _normalize_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': row.get('id'),
+        'strategy_id': int(row.get('strategy_id') or 0),
+        'symbol': str(row.get('symbol') or ''),
+        'side': str(row.get('side') or ''),
+        'size': float(row.get('size') or 0.0),
+        'entry_price': float(row.get('entry_price') or 0.0),
+        'current_price': float(row.get('current_price') or 0.0),
+        'highest_price': float(row.get('highest_price') or 0.0),
+        'lowest_price': float(row.get('lowest_price') or 0.0),
+    }
+
+
+class PositionBook:
+    """进程内持仓账本：读写内存，后台合并写回数据库"""
+
+    def __init__(self, flush_interval_sec: Optional[float] = None):
+        self.flush_interval_sec = max(0.05, flush_interval_sec if flush_interval_sec is not None
+                                      else _env_float('POSITION_FLUSH_INTERVAL_MS', 1000) / 1000.0)
+        self._lock = threading.Condition()
+        # 数据库写入串行化：保证较早的快照不会覆盖较晚的写入
+        self._write_lock = threading.Lock()
+        self._positions: Dict[int, Dict[Tuple[str, str], Dict[str, Any]]] = {}
+        # 全量加载成功后，账本中不存在的策略即视为无持仓
+        self._complete = False
+        # 被 invalidate 的策略：下次读取时从数据库重新加载
+        self._stale: set = set()
+        # 待落盘：key -> (full, 行)；行为最终状态或 None（删除），full=False 表示只有价格列变化
+        self._dirty: Dict[PositionKey, Tuple[bool, Optional[Dict[str, Any]]]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+        self.loads = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.updates = 0
+
+    # ------------------------------------------------------------------
+    # 加载
+    # ------------------------------------------------------------------
+
+    def load_all(self) -> bool:
+        """启动时一次性加载全部持仓"""
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(f"SELECT {_POSITION_COLUMNS} FROM qd_strategy_positions")
+                rows = cur.fetchall() or []
+                cur.close()
+        except Exception as e:
+            logger.warning(f"PositionBook initial load failed, falling back to per-strategy loads: {e}")
+            return False
+        positions: Dict[int, Dict[Tuple[str, str], Dict[str, Any]]] = {}
+        for r in rows:
+            row = _normalize_row(r)
+            positions.setdefault(row['strategy_id'], {})[(row['symbol'], row['side'])] = row
+        with self._lock:
+            # 加载期间已有内存修改的策略以内存为准
+            for sid, book in positions.items():
+                self._positions.setdefault(sid, book)
+            self._complete = True
+            self.loads += 1
+        logger.info(f"PositionBook loaded {len(rows)} positions")
+        return True
+
+    def _ensure_loaded(self, strategy_id: int) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """返回策略的持仓字典（调用方不持有锁）"""
+        with self._lock:
+            book = self._positions.get(strategy_id)
+            if book is not None:
+                return book
+            if self._complete and strategy_id not in self._stale:
+                book = self._positions[strategy_id] = {}
+                return book
+
+        rows: List[Dict[str, Any]] = []
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(f"SELECT {_POSITION_COLUMNS} FROM qd_strategy_positions WHERE strategy_id = %s",
+                            (int(strategy_id),))
+                rows = cur.fetchall() or []
+                cur.close()
+        except Exception as e:
+            logger.error(f"Failed to fetch positions: {e}")
+            # 加载失败不缓存，下次再试
+            return {}
+
+        with self._lock:
+            book = self._positions.get(strategy_id)
+            if book is None:
+                book = {}
+                for r in rows:
+                    row = _normalize_row(r)
+                    book[(row['symbol'], row['side'])] = row
+                self._positions[strategy_id] = book
+                self._stale.discard(strategy_id)
+                self.loads += 1
+            return book
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+
+    def get_positions(self, strategy_id: int, symbol: str) -> List[Dict[str, Any]]:
+        """当前持仓副本（与原查询一致：只比较 ':' 之前的 symbol 部分）"""
+        book = self._ensure_loaded(int(strategy_id))
+        prefix = (symbol or '').split(':')[0]
+        with self._lock:
+            return [dict(r) for (sym, _), r in book.items() if sym.split(':')[0] == prefix]
+
+    def upsert(
+        self,
+        strategy_id: int,
+        symbol: str,
+        side: str,
+        size: float,
+        entry_price: float,
+        current_price: float,
+        highest_price: float = 0.0,
+        lowest_price: float = 0.0,
+    ) -> None:
+        """更新持仓（语义与原 UPSERT 相同：highest/lowest 只在 > 0 时覆盖）"""
+        sid = int(strategy_id)
+        book = self._ensure_loaded(sid)
+        with self._lock:
+            row = book.get((symbol, side))
+            if row is None:
+                row = _normalize_row({'strategy_id': sid, 'symbol': symbol, 'side': side})
+                book[(symbol, side)] = row
+            row['size'] = float(size or 0.0)
+            row['entry_price'] = float(entry_price or 0.0)
+            row['current_price'] = float(current_price or 0.0)
+            if highest_price and highest_price > 0:
+                row['highest_price'] = float(highest_price)
+            if lowest_price and lowest_price > 0:
+                row['lowest_price'] = float(lowest_price)
+            self._mark_dirty((sid, symbol, side), row)
+
+    def close(self, strategy_id: int, symbol: str, side: str) -> None:
+        sid = int(strategy_id)
+        book = self._ensure_loaded(sid)
+        with self._lock:
+            book.pop((symbol, side), None)
+            self._mark_dirty((sid, symbol, side), None)
+
+    def update_current_price(self, strategy_id: int, symbol: str, current_price: float) -> None:
+        sid = int(strategy_id)
+        book = self._ensure_loaded(sid)
+        with self._lock:
+            for (sym, side), row in book.items():
+                if sym == symbol:
+                    row['current_price'] = float(current_price or 0.0)
+                    self._mark_dirty((sid, sym, side), row, full=False)
+
+    def update_price_tracking(self, strategy_id: int, symbol: str, side: str, current_price: float,
+                              highest_price: float = 0.0, lowest_price: float = 0.0) -> None:
+        """只更新价格跟踪字段（current/highest/lowest 只在 > 0 时覆盖），不存在的持仓忽略"""
+        sid = int(strategy_id)
+        book = self._ensure_loaded(sid)
+        with self._lock:
+            row = book.get((symbol, side))
+            if row is None:
+                return
+            row['current_price'] = float(current_price or 0.0)
+            if highest_price and highest_price > 0:
+                row['highest_price'] = float(highest_price)
+            if lowest_price and lowest_price > 0:
+                row['lowest_price'] = float(lowest_price)
+            self._mark_dirty((sid, symbol, side), row, full=False)
+
+    def _mark_dirty(self, key: PositionKey, row: Optional[Dict[str, Any]], full: bool = True) -> None:
+        # 调用方持有 self._lock；保存引用，落盘时取最新值。尚未落盘的全量修改不会被价格更新降级
+        prev = self._dirty.get(key)
+        if not full and prev is not None and prev[0]:
+            full = True
+        self._dirty[key] = (full, row)
+        self.updates += 1
+        self._ensure_started()
+
+    # ------------------------------------------------------------------
+    # 落盘
+    # ------------------------------------------------------------------
+
+    def record_trade(self, strategy_id: int, symbol: str, type: str, price: float, amount: float,
+                     value: float, profit: Optional[float] = None, commission: Optional[float] = None) -> None:
+        """同步写入成交记录，并在同一事务中提交该策略尚未落盘的持仓变更"""
+        sid = int(strategy_id)
+        with self._write_lock:
+            ops = self._take_dirty(lambda key: key[0] == sid)
+            try:
+                with get_db_connection() as db:
+                    cur = db.cursor()
+                    self._apply_ops(cur, ops)
+                    cur.execute(
+                        """
+                        INSERT INTO qd_strategy_trades (
+                            strategy_id, symbol, type, price, amount, value, commission, profit, created_at
+                        ) VALUES (
+                            %s, %s, %s, %s, %s, %s, %s, %s, %s
+                        )
+                        """,
+                        (sid, symbol, type, price, amount, value, commission or 0, profit, int(time.time()))
+                    )
+                    db.commit()
+                    cur.close()
+                self._written(ops)
+            except Exception as e:
+                self._requeue(ops)
+                logger.error(f"Failed to record trade: {e}")
+
+    def flush(self, strategy_id: Optional[int] = None, price_only: bool = False) -> int:
+        """
+        把脏数据写回数据库（一个事务），返回写入行数。
+
+        价格类修改始终只写 current/highest/lowest；price_only=True 时全量修改也按价格写
+        （不写 size/entry、不删除），用于外部模块已经直接改过持仓时。
+        """
+        with self._write_lock:
+            ops = self._take_dirty(None if strategy_id is None else (lambda key: key[0] == int(strategy_id)))
+            if not ops:
+                return 0
+            try:
+                with get_db_connection() as db:
+                    cur = db.cursor()
+                    self._apply_ops(cur, ops, price_only=price_only)
+                    db.commit()
+                    cur.close()
+                self._written(ops)
+                return len(ops)
+            except Exception as e:
+                self._requeue(ops)
+                logger.error(f"PositionBook flush failed ({len(ops)} rows): {e}")
+                return 0
+
+    def invalidate(self, strategy_id: int) -> None:
+        """
+        其他模块直接改了数据库中的持仓（以数据库为准）：只把本地的价格跟踪字段落盘，
+        数量/均价/删除以外部写入为准，下次读取时重新加载。
+        """
+        sid = int(strategy_id)
+        self.flush(sid, price_only=True)
+        with self._lock:
+            self._positions.pop(sid, None)
+            self._stale.add(sid)
+
+    def _take_dirty(self, predicate) -> List[Tuple[PositionKey, bool, Optional[Dict[str, Any]]]]:
+        with self._lock:
+            keys = [k for k in self._dirty if predicate is None or predicate(k)]
+            ops = []
+            for k in keys:
+                full, row = self._dirty.pop(k)
+                # 取快照，避免写库期间内存行被修改
+                ops.append((k, full, dict(row) if row is not None else None))
+            return ops
+
+    def _requeue(self, ops: List[Tuple[PositionKey, bool, Optional[Dict[str, Any]]]]) -> None:
+        with self._lock:
+            for key, full, row in ops:
+                pending = self._dirty.get(key)
+                # 期间有更新的修改时以新的为准；未写成的全量修改不能被之后的价格更新降级
+                if pending is None:
+                    self._dirty[key] = (full, row)
+                elif full and not pending[0]:
+                    self._dirty[key] = (True, pending[1])
+
+    def _written(self, ops: List[Tuple[PositionKey, bool, Optional[Dict[str, Any]]]]) -> None:
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(ops)
+
+    @staticmethod
+    def _apply_ops(cur, ops: List[Tuple[PositionKey, bool, Optional[Dict[str, Any]]]], price_only: bool = False) -> None:
+        now = int(time.time())
+        for (sid, symbol, side), full, row in ops:
+            if price_only or not full:
+                if row is not None:
+                    cur.execute(
+                        """
+                        UPDATE qd_strategy_positions SET
+                            current_price = %s,
+                            highest_price = CASE WHEN %s > highest_price THEN %s ELSE highest_price END,
+                            lowest_price = CASE WHEN %s > 0 AND (lowest_price IS NULL OR lowest_price <= 0 OR %s < lowest_price)
+                                           THEN %s ELSE lowest_price END
+                        WHERE strategy_id = %s AND symbol = %s AND side = %s
+                        """,
+                        (row['current_price'], row['highest_price'], row['highest_price'],
+                         row['lowest_price'], row['lowest_price'], row['lowest_price'], sid, symbol, side)
+                    )
+                continue
+            if row is None:
+                cur.execute("DELETE FROM qd_strategy_positions WHERE strategy_id = %s AND symbol = %s AND side = %s",
+                            (sid, symbol, side))
+            else:
+                cur.execute(_UPSERT_SQL, (
+                    sid, symbol, side, row['size'], row['entry_price'], row['current_price'],
+                    row['highest_price'], row['lowest_price'], now
+                ))
+
+    def _ensure_started(self) -> None:
+        # 调用方持有 self._lock
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._flush_loop, name='PositionBookFlusher', daemon=True)
+        self._thread.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval_sec)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"PositionBook flusher error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'strategies': len(self._positions),
+                'positions': sum(len(b) for b in self._positions.values()),
+                'dirty': len(self._dirty),
+                'updates': self.updates,
+                'flushes': self.flushes,
+                'rowsWritten': self.rows_written,
+                'loads': self.loads,
+                'flushIntervalMs': int(self.flush_interval_sec * 1000),
+            }
+
+
+_book: Optional[PositionBook] = None
+_book_lock = threading.Lock()
+
+
+def get_position_book() -> PositionBook:
+    global _book
+    if _book is None:
+        with _book_lock:
+            if _book is None:
+                book = PositionBook()
+                book.load_all()
+                # 正常退出时落盘剩余的脏数据
+                atexit.register(book.flush)
+                _book = book
+    return _book
+
+
+def invalidate_local_positions(strategy_id: int) -> None:
+    """只处理本进程的账本；账本尚未创建时无需处理"""
+    if _book is not None:
+        try:
+            _book.invalidate(strategy_id)
+        except Exception as e:
+            logger.warning(f"PositionBook invalidate failed for strategy {strategy_id}: {e}")
+
+
+def invalidate_positions(strategy_id: int) -> None:
+    """
+    直接修改 qd_strategy_positions 之后调用。
+
+    策略的账本在运行它的引擎进程里（分片模式下是持有租约的分片，不一定是本进程），
+    除了本进程的账本，还要经 IPC 通知该引擎进程，否则它会继续用内存中的旧数量/均价。
+    """
+    invalidate_local_positions(strategy_id)
+    from app.services.engine import EngineUnavailable, get_engine
+    try:
+        get_engine().invalidate_positions(int(strategy_id))
+    except EngineUnavailable as e:
+        # 没有可达的引擎进程：也就没有需要失效的账本（新引擎启动时从数据库加载）
+        logger.debug(f"PositionBook invalidate for strategy {strategy_id} skipped: {e}")
+    except Exception as e:
+        logger.warning(f"PositionBook invalidate not delivered to engine for strategy {strategy_id}: {e}")
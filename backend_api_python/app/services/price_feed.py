@@ -0,0 +1,288 @@
+"""
+共享行情价格源（按交易对）
+
+运行中的策略不再各自请求 ticker：
+- 策略初始化时按 symbol 订阅，后台轮询线程每 PRICE_FEED_POLL_SEC 秒只拉取所有订阅交易对的并集，
+  数据源支持时使用一次批量请求（CCXT fetch_tickers），并把最新价推送给带回调的订阅者；
+- get_price() 优先返回未过期（PRICE_CACHE_TTL_SEC）的最新价；缓存未命中时同一交易对的并发请求
+  合并为一次在途请求（包括正在进行中的批量轮询），其余调用方等待结果。
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from app.data_sources import DataSourceFactory
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PriceCallback = Callable[[str, float], None]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+class _InflightFetch:
+    """同一交易对的一次在途请求，其他调用方等待 event"""
+
+    __slots__ = ('event', 'price')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.price: Optional[float] = None
+
+
+class PriceFeed:
+    """按交易对共享的最新价轮询 + 请求合并"""
+
+    def __init__(
+        self,
+        data_source: str = 'binance',
+        poll_interval_sec: Optional[float] = None,
+        max_age_sec: Optional[float] = None
+    ):
+        self.data_source = data_source
+        self.poll_interval_sec = max(0.5, poll_interval_sec if poll_interval_sec is not None
+                                     else _env_float('PRICE_FEED_POLL_SEC', 5))
+        # 与原执行器内存价格缓存的 TTL 保持一致；<=0 表示每次都回源（仍会合并并发请求）
+        self.max_age_sec = max_age_sec if max_age_sec is not None else _env_float('PRICE_CACHE_TTL_SEC', 10)
+        # 等待其他线程在途请求的最长时间
+        self.wait_timeout_sec = max(1.0, _env_float('PRICE_FEED_WAIT_TIMEOUT_SEC', 15))
+
+        self._lock = threading.Condition()
+        self._prices: Dict[str, Tuple[float, float]] = {}          # key -> (price, ts)
+        self._symbols: Dict[str, str] = {}                          # key -> 请求用原始 symbol
+        self._subscriptions: Dict[Any, Dict[str, Optional[PriceCallback]]] = {}  # subscriber -> {key: callback}
+        self._inflight: Dict[str, _InflightFetch] = {}
+        self._thread: Optional[threading.Thread] = None
+
+        self.polls = 0
+        self.single_requests = 0
+        self.coalesced_waits = 0
+
+    @staticmethod
+    def _key(symbol: str) -> str:
+        return (symbol or '').strip().upper()
+
+    # ------------------------------------------------------------------
+    # 订阅
+    # ------------------------------------------------------------------
+
+    def subscribe(self, subscriber_id: Any, symbol: str, callback: Optional[PriceCallback] = None) -> None:
+        """订阅交易对；callback(symbol, price) 在每次轮询拿到新价格后于轮询线程中调用"""
+        key = self._key(symbol)
+        if not key:
+            return
+        with self._lock:
+            self._subscriptions.setdefault(subscriber_id, {})[key] = callback
+            self._symbols.setdefault(key, symbol)
+            self._ensure_started()
+            self._lock.notify_all()
+
+    def unsubscribe(self, subscriber_id: Any, symbol: Optional[str] = None) -> None:
+        """取消订阅；symbol 为空时取消该订阅者的全部交易对"""
+        with self._lock:
+            subs = self._subscriptions.get(subscriber_id)
+            if not subs:
+                return
+            if symbol is None:
+                subs.clear()
+            else:
+                subs.pop(self._key(symbol), None)
+            if not subs:
+                del self._subscriptions[subscriber_id]
+            active = self._active_keys()
+            for key in list(self._symbols.keys()):
+                if key not in active:
+                    del self._symbols[key]
+
+    def _active_keys(self) -> Set[str]:
+        # 调用方持有 self._lock
+        keys: Set[str] = set()
+        for subs in self._subscriptions.values():
+            keys.update(subs.keys())
+        return keys
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def get_price(self, symbol: str, max_age_sec: Optional[float] = None) -> Optional[float]:
+        """返回最新价；缓存过期时回源，同一交易对的并发回源只发一次请求"""
+        key = self._key(symbol)
+        if not key:
+            return None
+        max_age = self.max_age_sec if max_age_sec is None else max_age_sec
+        with self._lock:
+            item = self._prices.get(key)
+            if item and max_age > 0 and time.time() - item[1] < max_age:
+                return item[0]
+            inflight = self._inflight.get(key)
+            owner = inflight is None
+            if owner:
+                inflight = _InflightFetch()
+                self._inflight[key] = inflight
+            else:
+                self.coalesced_waits += 1
+
+        if not owner:
+            inflight.event.wait(self.wait_timeout_sec)
+            return inflight.price
+
+        price = None
+        try:
+            with self._lock:
+                self.single_requests += 1
+            ds = DataSourceFactory.get_data_source(self.data_source)
+            price = self._extract_price(ds.get_ticker(symbol))
+        except Exception as e:
+            logger.warning(f"Failed to fetch price: {e}")
+        finally:
+            self._finish_inflight({key: inflight}, {key: price} if price else {})
+        return price
+
+    def update(self, symbol: str, price: float, ts: Optional[float] = None) -> None:
+        """外部推送的最新价（如行情流），写入缓存；轮询会跳过刚被推送过的交易对"""
+        key = self._key(symbol)
+        if not key or not price or price <= 0:
+            return
+        ts = float(ts or time.time())
+        with self._lock:
+            item = self._prices.get(key)
+            if item is None or ts >= item[1]:
+                self._prices[key] = (float(price), ts)
+
+    def peek(self, symbol: str) -> Optional[Tuple[float, float]]:
+        """返回缓存中的 (price, ts)，不触发请求"""
+        with self._lock:
+            return self._prices.get(self._key(symbol))
+
+    @staticmethod
+    def _extract_price(ticker: Optional[Dict[str, Any]]) -> Optional[float]:
+        if not ticker:
+            return None
+        try:
+            price = float(ticker.get('last') or ticker.get('close') or 0)
+        except Exception:
+            return None
+        return price if price > 0 else None
+
+    def _finish_inflight(self, owned: Dict[str, _InflightFetch], prices: Dict[str, float]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, price in prices.items():
+                self._prices[key] = (price, now)
+            for key, inflight in owned.items():
+                inflight.price = prices.get(key)
+                if self._inflight.get(key) is inflight:
+                    del self._inflight[key]
+                inflight.event.set()
+            # 清理已无人订阅且过期的价格
+            if len(self._prices) > 4 * max(len(self._symbols), 64):
+                for key in [k for k, (_, ts) in self._prices.items()
+                            if k not in self._symbols and now - ts > max(self.max_age_sec, self.poll_interval_sec)]:
+                    del self._prices[key]
+
+    # ------------------------------------------------------------------
+    # 轮询
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        # 调用方持有 self._lock
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._poll_loop, name='PriceFeed', daemon=True)
+        self._thread.start()
+        logger.info(f"PriceFeed started (poll={self.poll_interval_sec}s, max_age={self.max_age_sec}s)")
+
+    def _poll_loop(self) -> None:
+        while True:
+            started = time.time()
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.warning(f"PriceFeed poll error: {e}")
+            with self._lock:
+                if not self._symbols:
+                    # 没有订阅时阻塞，直到有新的订阅
+                    self._lock.wait()
+                    continue
+            time.sleep(max(self.poll_interval_sec - (time.time() - started), 0.05))
+
+    def poll_once(self) -> Dict[str, float]:
+        """拉取所有订阅交易对的最新价（一次批量请求），返回 {symbol: price}"""
+        with self._lock:
+            owned: Dict[str, _InflightFetch] = {}
+            now = time.time()
+            for key in self._symbols:
+                # 已有在途请求的交易对由该请求负责
+                if key in self._inflight:
+                    continue
+                # 行情流在最近半个轮询周期内推送过的交易对无需再轮询（REST 只作为兜底）
+                item = self._prices.get(key)
+                if item and now - item[1] < self.poll_interval_sec / 2:
+                    continue
+                owned[key] = self._inflight[key] = _InflightFetch()
+            symbols = {key: self._symbols[key] for key in owned}
+            if symbols:
+                self.polls += 1
+
+        prices: Dict[str, float] = {}
+        try:
+            if symbols:
+                ds = DataSourceFactory.get_data_source(self.data_source)
+                tickers = ds.get_tickers(list(symbols.values()))
+                for key, symbol in symbols.items():
+                    price = self._extract_price(tickers.get(symbol))
+                    if price:
+                        prices[key] = price
+        except Exception as e:
+            logger.warning(f"PriceFeed bulk fetch failed ({len(symbols)} symbols): {e}")
+        finally:
+            self._finish_inflight(owned, prices)
+
+        if prices:
+            self._publish(prices)
+        return {symbols[k]: p for k, p in prices.items()}
+
+    def _publish(self, prices: Dict[str, float]) -> None:
+        with self._lock:
+            callbacks: List[Tuple[PriceCallback, str, float]] = []
+            for subs in self._subscriptions.values():
+                for key, cb in subs.items():
+                    if cb is not None and key in prices:
+                        callbacks.append((cb, self._symbols.get(key, key), prices[key]))
+        for cb, symbol, price in callbacks:
+            try:
+                cb(symbol, price)
+            except Exception as e:
+                logger.warning(f"PriceFeed subscriber callback failed for {symbol}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'symbols': len(self._symbols),
+                'subscribers': len(self._subscriptions),
+                'polls': self.polls,
+                'singleRequests': self.single_requests,
+                'coalescedWaits': self.coalesced_waits,
+                'pollIntervalSec': self.poll_interval_sec,
+            }
+
+
+_feed: Optional[PriceFeed] = None
+_feed_lock = threading.Lock()
+
+
+def get_price_feed() -> PriceFeed:
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = PriceFeed()
+    return _feed
@@ -0,0 +1,279 @@
+"""
+跨进程共享行情（多引擎分片时由一个 feeder 进程统一接入行情）
+
+分片运行时每个引擎进程都只跑一部分策略，但如果各自连接交易所 WebSocket / 轮询 REST，
+行情请求会随进程数成倍增加。这里由 feeder（分片 0）接入行情并写入一块共享内存价格表，其他分片只读：
+
+- 价格表：固定 SLOTS 个槽位（numpy 结构化数组映射到 multiprocessing.shared_memory），
+  每槽 symbol / seq / price / ts / wanted_at；写入用 seqlock（写前 seq 变奇数，写完变偶数），读方无锁；
+- 读方（SharedMemoryTransport，作为 MarketDataHub 的传输层）为需要的交易对申请槽位并定期刷新 wanted_at，
+  轮询 seq 变化把新价格推入本进程 hub（进而驱动策略唤醒、K线滚动缓冲与共享价格源）；
+- feeder（SharedFeedPublisher）定期扫描价格表：为有人需要的交易对在本进程 hub 上订阅并把每个 tick 写入槽位，
+  超过 WANTED_TTL_SEC 无人刷新的交易对取消订阅并回收槽位。
+
+槽位分配/回收用文件锁串行化；共享内存段在进程退出时不删除，feeder 重启后直接复用。
+"""
+import hashlib
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from app.services.market_stream import MarketDataHub, MarketTransport
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+SLOTS = 1024
+WANTED_TTL_SEC = 60.0
+SLOT_DTYPE = np.dtype([
+    ('symbol', 'S32'),
+    ('seq', '<u8'),
+    ('price', '<f8'),
+    ('ts', '<f8'),
+    ('wanted_at', '<f8'),
+])
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+class SharedPriceTable:
+    """共享内存中的价格槽位表"""
+
+    def __init__(self, lock_path: str, create: bool = False):
+        self.name = 'qd_feed_' + hashlib.sha1(os.path.abspath(lock_path).encode('utf-8')).hexdigest()[:16]
+        self.alloc_lock_path = lock_path + '.feed'
+        size = SLOTS * SLOT_DTYPE.itemsize
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.name, create=create, size=size if create else 0)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        # 段的生命周期不跟随任何一个进程：不交给 resource_tracker，否则创建/挂载它的进程退出时会被删除
+        try:
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        except Exception:
+            pass
+        self.slots = np.ndarray((SLOTS,), dtype=SLOT_DTYPE, buffer=self._shm.buf)
+
+    # ---------------- 槽位分配 ----------------
+
+    def _locked(self):
+        table = self
+
+        class _Guard:
+            def __enter__(self):
+                self.fd = os.open(table.alloc_lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+                if fcntl is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_EX)
+                return self
+
+            def __exit__(self, *exc):
+                os.close(self.fd)
+
+        return _Guard()
+
+    def want(self, symbols: List[str]) -> Dict[str, int]:
+        """登记/刷新需要的交易对，返回 {symbol: 槽位}；槽位用尽时忽略多出的交易对"""
+        now = time.time()
+        out: Dict[str, int] = {}
+        with self._locked():
+            names = self.slots['symbol']
+            for sym in symbols:
+                raw = sym.upper().encode('utf-8')[:32]
+                idx = np.flatnonzero(names == raw)
+                if idx.size:
+                    i = int(idx[0])
+                else:
+                    free = np.flatnonzero(names == b'')
+                    if not free.size:
+                        logger.warning(f"Shared feed table full ({SLOTS} slots); {sym} not fed")
+                        continue
+                    i = int(free[0])
+                    self.slots['price'][i] = 0.0
+                    self.slots['ts'][i] = 0.0
+                    self.slots['symbol'][i] = raw
+                self.slots['wanted_at'][i] = now
+                out[sym] = i
+        return out
+
+    def reclaim(self, index: int) -> None:
+        with self._locked():
+            self.slots['symbol'][index] = b''
+            self.slots['wanted_at'][index] = 0.0
+
+    # ---------------- 读写 ----------------
+
+    def write(self, index: int, price: float, ts: float) -> None:
+        seq = int(self.slots['seq'][index])
+        if seq % 2:
+            seq += 1
+        self.slots['seq'][index] = seq + 1
+        self.slots['price'][index] = price
+        self.slots['ts'][index] = ts
+        self.slots['seq'][index] = seq + 2
+
+    def read(self, index: int) -> Optional[tuple]:
+        """返回 (seq, price, ts)；正在写入时返回 None"""
+        for _ in range(3):
+            s1 = int(self.slots['seq'][index])
+            if s1 % 2:
+                continue
+            price = float(self.slots['price'][index])
+            ts = float(self.slots['ts'][index])
+            if int(self.slots['seq'][index]) == s1:
+                return s1, price, ts
+        return None
+
+    def wanted(self) -> Dict[str, int]:
+        """feeder 视角：当前被需要的交易对 {symbol: 槽位}"""
+        names = self.slots['symbol']
+        fresh = self.slots['wanted_at'] >= time.time() - WANTED_TTL_SEC
+        return {names[i].decode('utf-8'): int(i) for i in np.flatnonzero((names != b'') & fresh)}
+
+    def stale(self) -> List[int]:
+        names = self.slots['symbol']
+        old = self.slots['wanted_at'] < time.time() - WANTED_TTL_SEC
+        return [int(i) for i in np.flatnonzero((names != b'') & old)]
+
+
+class SharedFeedPublisher:
+    """feeder 端：把本进程 hub 上收到的行情写入共享价格表"""
+
+    def __init__(self, hub: MarketDataHub, table: SharedPriceTable, scan_sec: float = 1.0):
+        self.hub = hub
+        self.table = table
+        self.scan_sec = scan_sec
+        self._fed: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.published = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='SharedFeedPublisher', daemon=True)
+            self._thread.start()
+            logger.info(f"Shared market feed publishing to {self.table.name}")
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.scan()
+            except Exception as e:
+                logger.warning(f"Shared feed scan failed: {e}")
+            time.sleep(self.scan_sec)
+
+    def scan(self) -> None:
+        wanted = self.table.wanted()
+        for sym, idx in wanted.items():
+            if self._fed.get(sym) != idx:
+                self._fed[sym] = idx
+                self.hub.subscribe(('shared_feed', sym), sym, self._writer(idx))
+        for sym in [s for s in self._fed if s not in wanted]:
+            self.hub.unsubscribe(('shared_feed', sym))
+            del self._fed[sym]
+        for idx in self.table.stale():
+            self.table.reclaim(idx)
+
+    def _writer(self, index: int):
+        def on_tick(symbol: str, price: float) -> None:
+            self.table.write(index, float(price), time.time())
+            self.published += 1
+        return on_tick
+
+    def stats(self) -> Dict[str, Any]:
+        return {'symbols': len(self._fed), 'published': self.published, 'segment': self.table.name}
+
+
+class SharedMemoryTransport(MarketTransport):
+    """读方传输层：从 feeder 的共享价格表读取行情（不访问交易所）"""
+
+    name = 'shm'
+
+    def __init__(self, lock_path: str):
+        super().__init__()
+        self.lock_path = lock_path
+        self.poll_sec = max(_env_float('ENGINE_FEED_POLL_MS', 50), 5) / 1000.0
+        self.refresh_sec = WANTED_TTL_SEC / 6.0
+        self.table: Optional[SharedPriceTable] = None
+        self._symbols: Set[str] = set()
+        self._slots: Dict[str, int] = {}
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.received = 0
+
+    def start(self, hub: MarketDataHub) -> None:
+        self.hub = hub
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='MarketStream-shm', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def set_symbols(self, symbols: List[str]) -> None:
+        with self._lock:
+            self._symbols = set(symbols)
+        self._refresh()
+
+    def _refresh(self) -> None:
+        if self.table is None:
+            return
+        with self._lock:
+            symbols = sorted(self._symbols)
+        slots = self.table.want(symbols) if symbols else {}
+        with self._lock:
+            self._slots = slots
+
+    def _run(self) -> None:
+        last_refresh = 0.0
+        while not self._stop.is_set():
+            if self.table is None:
+                try:
+                    # feeder 尚未创建共享内存段时重试
+                    self.table = SharedPriceTable(self.lock_path)
+                    last_refresh = 0.0
+                except FileNotFoundError:
+                    self._stop.wait(1.0)
+                    continue
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Shared feed attach failed: {e}")
+                    self._stop.wait(5.0)
+                    continue
+            now = time.time()
+            if now - last_refresh >= self.refresh_sec:
+                try:
+                    self._refresh()
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Shared feed refresh failed: {e}")
+                last_refresh = now
+            with self._lock:
+                slots = list(self._slots.items())
+            for sym, idx in slots:
+                item = self.table.read(idx)
+                if item is None:
+                    continue
+                seq, price, ts = item
+                if seq and seq != self._seen.get(sym) and price > 0:
+                    self._seen[sym] = seq
+                    self.received += 1
+                    self.hub.on_tick(sym, price, ts, source=self.name)
+            self._stop.wait(self.poll_sec)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'name': self.name, 'errors': self.errors, 'symbols': len(self._slots), 'received': self.received}
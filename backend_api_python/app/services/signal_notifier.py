@@ -13,28 +13,61 @@ notification_config = {
     "webhook": "https://example.com/webhook"
   }
 }
+
+Channels are delivered concurrently on a bounded thread pool (SIGNAL_NOTIFY_CONCURRENCY); callers wait at most
+SIGNAL_NOTIFY_CHANNEL_TIMEOUT_SEC, or not at all via notify_signal_async. Deliveries that fail with a transient
+error (network, timeout, 429/5xx) are persisted to qd_notification_retries and redelivered with exponential
+backoff by process_retries(), which the pending-order worker calls on its loop.
 """
 
 from __future__ import annotations
 
+import functools
 import html
 import hmac
 import hashlib
 import json
 import os
+import random
+import re
 import smtplib
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from email.message import EmailMessage
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import requests
 
-from app.utils.db import get_db_connection
+from app.utils import metrics
+from app.utils.db import claim_notification_retries, get_db_connection
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+_DELIVERIES = metrics.counter(
+    "qd_notify_deliveries_total", "Notification channel deliveries by outcome", ["channel", "outcome"])
+_DELIVERY_SECONDS = metrics.histogram(
+    "qd_notify_delivery_seconds", "Time spent delivering one notification to one channel", ["channel"])
+
+# A claimed retry row whose process died is reclaimed after this long (deliveries are bounded by HTTP/SMTP timeouts).
+_RETRY_STALE_SEC = 300
+
+
+def _notification_retries_by_status() -> Dict[Any, float]:
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute("SELECT status, COUNT(*) AS cnt FROM qd_notification_retries GROUP BY status")
+        rows = cur.fetchall() or []
+        cur.close()
+    return {str(r.get("status") or ""): float(r.get("cnt") or 0) for r in rows}
+
+
+metrics.gauge(
+    "qd_notification_retries", "Rows in qd_notification_retries by status", ["status"]
+).set_function(_notification_retries_by_status)
+
 
 def _as_list(value: Any) -> List[str]:
     if value is None:
@@ -62,6 +95,18 @@ def _safe_json(value: Any) -> Dict[str, Any]:
     return {}
 
 
+def _is_retryable(error: Any) -> bool:
+    """Transient delivery errors are retried; configuration errors and HTTP 4xx (except 408/429) are not."""
+    e = str(error or "")
+    if e.startswith(("missing_", "invalid_", "unsupported_channel", "webhook_signing_failed")):
+        return False
+    m = re.match(r"http_(\d+)", e)
+    if m:
+        code = int(m.group(1))
+        return code in (408, 429) or code >= 500
+    return True
+
+
 def _signal_meta(signal_type: str) -> Dict[str, str]:
     st = (signal_type or "").strip().lower()
     action = "signal"
@@ -94,6 +139,9 @@ class SignalNotifier:
 
     Provider environment variables:
     - SIGNAL_NOTIFY_TIMEOUT_SEC: HTTP timeout (default: 6)
+    - SIGNAL_NOTIFY_CONCURRENCY: concurrent channel deliveries (default: 8)
+    - SIGNAL_NOTIFY_CHANNEL_TIMEOUT_SEC: how long notify_signal waits for a channel (default: 20)
+    - SIGNAL_NOTIFY_RETRY_MAX_ATTEMPTS / _BASE_SEC / _MAX_SEC: retry queue policy (default: 6 / 10 / 900)
 
     - SIGNAL_WEBHOOK_TOKEN: optional bearer token for generic webhook channel
 
@@ -112,6 +160,32 @@ class SignalNotifier:
         except Exception:
             self.timeout_sec = 6.0
 
+        try:
+            self.concurrency = max(int(os.getenv("SIGNAL_NOTIFY_CONCURRENCY") or "8"), 1)
+        except Exception:
+            self.concurrency = 8
+        try:
+            self.channel_timeout_sec = float(os.getenv("SIGNAL_NOTIFY_CHANNEL_TIMEOUT_SEC") or "20")
+        except Exception:
+            self.channel_timeout_sec = 20.0
+        try:
+            self.retry_max_attempts = int(os.getenv("SIGNAL_NOTIFY_RETRY_MAX_ATTEMPTS") or "6")
+        except Exception:
+            self.retry_max_attempts = 6
+        try:
+            self.retry_base_sec = float(os.getenv("SIGNAL_NOTIFY_RETRY_BASE_SEC") or "10")
+        except Exception:
+            self.retry_base_sec = 10.0
+        try:
+            self.retry_max_sec = float(os.getenv("SIGNAL_NOTIFY_RETRY_MAX_SEC") or "900")
+        except Exception:
+            self.retry_max_sec = 900.0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._waiter_pool: Optional[ThreadPoolExecutor] = None
+        self._state_lock = threading.Lock()
+        self._inflight = 0
+        self._retry_inflight = 0
+
         self.webhook_token = (os.getenv("SIGNAL_WEBHOOK_TOKEN") or "").strip()
 
         self.telegram_token = (os.getenv("TELEGRAM_BOT_TOKEN") or "").strip()
@@ -145,6 +219,90 @@ class SignalNotifier:
         notification_config: Optional[Dict[str, Any]] = None,
         extra: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Dict[str, Any]]:
+        """
+        Deliver a signal to all configured channels concurrently.
+
+        Waits at most SIGNAL_NOTIFY_CHANNEL_TIMEOUT_SEC and returns {channel: {"ok", "error", "queued", "pending"}}.
+        Transient failures are put on the retry queue (queued=True). A channel still running at the deadline
+        reports error="timeout", pending=True: its outcome is unknown (it is queued by its own completion
+        only if it eventually fails with a transient error).
+        """
+        jobs, meta = self._channel_jobs(
+            strategy_id=strategy_id,
+            strategy_name=strategy_name,
+            symbol=symbol,
+            signal_type=signal_type,
+            price=price,
+            stake_amount=stake_amount,
+            direction=direction,
+            notification_config=notification_config,
+            extra=extra,
+        )
+        return self._collect(jobs, self._fan_out(jobs, meta))
+
+    def notify_signal_async(
+        self,
+        *,
+        on_complete: Optional[Callable[[Dict[str, Dict[str, Any]]], None]] = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        Non-blocking notify_signal: channel deliveries start immediately on the notifier pool and the caller
+        returns at once. on_complete(results) runs on a notifier thread with the same results notify_signal
+        would have returned.
+        """
+        jobs, meta = self._channel_jobs(**kwargs)
+        futures = self._fan_out(jobs, meta)
+        if on_complete is None:
+            return
+
+        def _wait_and_report() -> None:
+            results = self._collect(jobs, futures)
+            try:
+                on_complete(results)
+            except Exception as e:
+                logger.warning(f"notify on_complete failed: strategy_id={meta.get('strategy_id')}, err={e}")
+
+        self._executor("_waiter_pool", "SignalNotifyWait").submit(_wait_and_report)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._state_lock:
+            return {
+                "workers": self.concurrency,
+                "inflight": self._inflight,
+                "retryInflight": self._retry_inflight,
+                "channelTimeoutSec": self.channel_timeout_sec,
+            }
+
+    def _executor(self, attr: str, name: str) -> ThreadPoolExecutor:
+        pool = getattr(self, attr)
+        if pool is None:
+            with self._state_lock:
+                pool = getattr(self, attr)
+                if pool is None:
+                    pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=name)
+                    setattr(self, attr, pool)
+        return pool
+
+    def _channel_jobs(
+        self,
+        *,
+        strategy_id: int,
+        strategy_name: str,
+        symbol: str,
+        signal_type: str,
+        price: float = 0.0,
+        stake_amount: float = 0.0,
+        direction: str = "long",
+        notification_config: Optional[Dict[str, Any]] = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Tuple[str, Optional[Dict[str, Any]]]], Dict[str, Any]]:
+        """
+        Resolve channels into (channel, kwargs for _notify_<channel>) jobs.
+
+        The kwargs are plain JSON so a failed delivery can be persisted and replayed by the retry queue.
+        Unsupported channels get kwargs=None.
+        """
         cfg = _safe_json(notification_config or {})
         channels = _as_list(cfg.get("channels"))
         if not channels:
@@ -167,83 +325,250 @@ class SignalNotifier:
         title = rendered.get("title") or ""
         message_plain = rendered.get("plain") or ""
 
-        results: Dict[str, Dict[str, Any]] = {}
+        jobs: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+        seen = set()
         for ch in channels:
             c = (ch or "").strip().lower()
-            if not c:
+            if not c or c in seen:
+                continue
+            seen.add(c)
+            args: Optional[Dict[str, Any]] = None
+            if c == "browser":
+                args = {
+                    "strategy_id": int(strategy_id),
+                    "symbol": str(symbol or ""),
+                    "signal_type": str(signal_type or ""),
+                    "channels": channels,
+                    "title": title,
+                    "message": message_plain,
+                    "payload": payload,
+                }
+            elif c == "webhook":
+                args = {
+                    "url": (targets.get("webhook") or os.getenv("SIGNAL_WEBHOOK_URL") or "").strip(),
+                    "payload": payload,
+                    "headers_override": (targets.get("webhook_headers") or targets.get("webhookHeaders") or None),
+                    "token_override": (targets.get("webhook_token") or targets.get("webhookToken") or None),
+                    "signing_secret_override": (
+                        targets.get("webhook_signing_secret")
+                        or targets.get("webhookSigningSecret")
+                        or None
+                    ),
+                }
+            elif c == "discord":
+                args = {
+                    "url": (targets.get("discord") or "").strip(),
+                    "payload": payload,
+                    "fallback_text": message_plain,
+                }
+            elif c == "telegram":
+                # Support per-strategy token override (local mode). Falls back to env TELEGRAM_BOT_TOKEN.
+                token_override = ""
+                if not self.telegram_token:
+                    try:
+                        token_override = str(
+                            targets.get("telegram_bot_token")
+                            or targets.get("telegram_token")
+                            or cfg.get("telegram_bot_token")
+                            or cfg.get("telegram_token")
+                            or ""
+                        ).strip()
+                    except Exception:
+                        token_override = ""
+                args = {
+                    "chat_id": (targets.get("telegram") or "").strip(),
+                    "text": rendered.get("telegram_html") or message_plain,
+                    "token_override": token_override,
+                    "parse_mode": "HTML",
+                }
+            elif c == "email":
+                args = {
+                    "to_email": (targets.get("email") or "").strip(),
+                    "subject": title,
+                    "body_text": message_plain,
+                    "body_html": rendered.get("email_html") or "",
+                }
+            elif c == "phone":
+                args = {"to_phone": (targets.get("phone") or "").strip(), "body": message_plain}
+            jobs.append((c, args))
+
+        meta = {
+            "strategy_id": int(strategy_id or 0),
+            "pending_order_id": (payload.get("trace") or {}).get("pending_order_id"),
+            "symbol": str(symbol or ""),
+            "signal_type": str(signal_type or ""),
+        }
+        return jobs, meta
+
+    def _deliver(self, channel: str, args: Optional[Dict[str, Any]]) -> Tuple[bool, str]:
+        fn = {
+            "browser": self._notify_browser,
+            "webhook": self._notify_webhook,
+            "discord": self._notify_discord,
+            "telegram": self._notify_telegram,
+            "email": self._notify_email,
+            "phone": self._notify_phone,
+        }.get(channel)
+        if fn is None or args is None:
+            return False, f"unsupported_channel:{channel}"
+        started = time.perf_counter()
+        try:
+            ok, err = fn(**args)
+        except Exception as e:
+            ok, err = False, str(e)
+        _DELIVERY_SECONDS.labels(channel).observe(time.perf_counter() - started)
+        return bool(ok), (err or "")
+
+    def _fan_out(
+        self, jobs: List[Tuple[str, Optional[Dict[str, Any]]]], meta: Dict[str, Any]
+    ) -> Dict[str, Future]:
+        pool = self._executor("_pool", "SignalNotify")
+        futures: Dict[str, Future] = {}
+        for c, args in jobs:
+            with self._state_lock:
+                self._inflight += 1
+            fut = pool.submit(self._deliver, c, args)
+            fut.add_done_callback(functools.partial(self._on_delivered, c, args, meta))
+            futures[c] = fut
+        return futures
+
+    def _collect(
+        self, jobs: List[Tuple[str, Optional[Dict[str, Any]]]], futures: Dict[str, Future]
+    ) -> Dict[str, Dict[str, Any]]:
+        # All channels started together, so one shared deadline is each channel's own timeout.
+        wait(list(futures.values()), timeout=self.channel_timeout_sec)
+        results: Dict[str, Dict[str, Any]] = {}
+        for c, args in jobs:
+            fut = futures[c]
+            if not fut.done():
+                results[c] = {"ok": False, "error": "timeout", "queued": False, "pending": True}
                 continue
             try:
-                if c == "browser":
-                    ok, err = self._notify_browser(
-                        strategy_id=strategy_id,
-                        symbol=symbol,
-                        signal_type=signal_type,
-                        channels=channels,
-                        title=title,
-                        message=message_plain,
-                        payload=payload,
-                    )
-                elif c == "webhook":
-                    url = (targets.get("webhook") or os.getenv("SIGNAL_WEBHOOK_URL") or "").strip()
-                    ok, err = self._notify_webhook(
-                        url=url,
-                        payload=payload,
-                        headers_override=(targets.get("webhook_headers") or targets.get("webhookHeaders") or None),
-                        token_override=(targets.get("webhook_token") or targets.get("webhookToken") or None),
-                        signing_secret_override=(
-                            targets.get("webhook_signing_secret")
-                            or targets.get("webhookSigningSecret")
-                            or None
-                        ),
-                    )
-                elif c == "discord":
-                    url = (targets.get("discord") or "").strip()
-                    ok, err = self._notify_discord(url=url, payload=payload, fallback_text=message_plain)
-                elif c == "telegram":
-                    chat_id = (targets.get("telegram") or "").strip()
-                    # Support per-strategy token override (local mode). Falls back to env TELEGRAM_BOT_TOKEN.
-                    token_override = ""
-                    if not self.telegram_token:
-                        try:
-                            token_override = str(
-                                targets.get("telegram_bot_token")
-                                or targets.get("telegram_token")
-                                or cfg.get("telegram_bot_token")
-                                or cfg.get("telegram_token")
-                                or ""
-                            ).strip()
-                        except Exception:
-                            token_override = ""
-                    ok, err = self._notify_telegram(
-                        chat_id=chat_id,
-                        text=rendered.get("telegram_html") or message_plain,
-                        token_override=token_override,
-                        parse_mode="HTML",
-                    )
-                elif c == "email":
-                    to_email = (targets.get("email") or "").strip()
-                    ok, err = self._notify_email(
-                        to_email=to_email,
-                        subject=title,
-                        body_text=message_plain,
-                        body_html=rendered.get("email_html") or "",
-                    )
-                elif c == "phone":
-                    to_phone = (targets.get("phone") or "").strip()
-                    ok, err = self._notify_phone(to_phone=to_phone, body=message_plain)
-                else:
-                    ok, err = False, f"unsupported_channel:{c}"
+                ok, err = fut.result()
             except Exception as e:
                 ok, err = False, str(e)
+            queued = (not ok) and args is not None and _is_retryable(err)
+            results[c] = {"ok": bool(ok), "error": (err or ""), "queued": queued, "pending": False}
+        return results
 
-            results[c] = {"ok": bool(ok), "error": (err or "")}
-            if not ok and c in ("webhook", "discord"):
-                # Keep logs high-signal and avoid leaking full URLs (webhook URLs contain secrets).
-                logger.info(
-                    f"notify failed: channel={c} strategy_id={strategy_id} symbol={symbol} signal={signal_type} err={err}"
+    def _on_delivered(self, channel: str, args: Optional[Dict[str, Any]], meta: Dict[str, Any], fut: Future) -> None:
+        with self._state_lock:
+            self._inflight -= 1
+        try:
+            ok, err = fut.result()
+        except Exception as e:
+            ok, err = False, str(e)
+        if ok:
+            _DELIVERIES.labels(channel, "ok").inc()
+            return
+        if channel in ("webhook", "discord"):
+            # Keep logs high-signal and avoid leaking full URLs (webhook URLs contain secrets).
+            logger.info(
+                f"notify failed: channel={channel} strategy_id={meta.get('strategy_id')} symbol={meta.get('symbol')} "
+                f"signal={meta.get('signal_type')} err={err}"
+            )
+        if args is None or not _is_retryable(err):
+            _DELIVERIES.labels(channel, "failed").inc()
+            return
+        _DELIVERIES.labels(channel, "queued").inc()
+        self._enqueue_retry(channel, args, meta, err)
+
+    def _backoff_sec(self, attempts: int) -> float:
+        """Exponential backoff with +/-20% jitter: base * 2^(attempts-1), capped at SIGNAL_NOTIFY_RETRY_MAX_SEC."""
+        delay = min(self.retry_base_sec * (2 ** max(int(attempts) - 1, 0)), self.retry_max_sec)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _enqueue_retry(self, channel: str, args: Dict[str, Any], meta: Dict[str, Any], error: str) -> None:
+        if self.retry_max_attempts <= 1:
+            return
+        now = int(time.time())
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(
+                    """
+                    INSERT INTO qd_notification_retries
+                    (strategy_id, pending_order_id, channel, job_json, status, attempts, max_attempts,
+                     last_error, next_attempt_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, 'pending', 1, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        int(meta.get("strategy_id") or 0),
+                        meta.get("pending_order_id"),
+                        str(channel),
+                        json.dumps({"args": args, "meta": meta}, ensure_ascii=False),
+                        int(self.retry_max_attempts),
+                        str(error or "")[:500],
+                        now + int(self._backoff_sec(1)),
+                        now,
+                        now,
+                    ),
                 )
+                db.commit()
+                cur.close()
+        except Exception as e:
+            logger.warning(f"notify retry enqueue failed: channel={channel} strategy_id={meta.get('strategy_id')}, err={e}")
 
-        return results
+    def process_retries(self) -> int:
+        """
+        Claim due rows from qd_notification_retries and redeliver them on the notifier pool.
+
+        Non-blocking (safe to call from the pending-order loop); returns the number of rows claimed.
+        """
+        with self._state_lock:
+            room = self.concurrency - self._retry_inflight
+        if room <= 0:
+            return 0
+        now = int(time.time())
+        rows = claim_notification_retries(limit=room, now=now, stale_before=now - _RETRY_STALE_SEC)
+        pool = self._executor("_pool", "SignalNotify")
+        for r in rows:
+            try:
+                job = json.loads(r.get("job_json") or "{}") or {}
+            except Exception:
+                job = {}
+            with self._state_lock:
+                self._retry_inflight += 1
+            fut = pool.submit(self._deliver, str(r.get("channel") or ""), job.get("args"))
+            fut.add_done_callback(functools.partial(self._on_retry_done, r))
+        return len(rows)
+
+    def _on_retry_done(self, row: Dict[str, Any], fut: Future) -> None:
+        with self._state_lock:
+            self._retry_inflight -= 1
+        try:
+            ok, err = fut.result()
+        except Exception as e:
+            ok, err = False, str(e)
+        channel = str(row.get("channel") or "")
+        attempts = int(row.get("attempts") or 0)
+        now = int(time.time())
+        if ok:
+            status, next_at = "sent", None
+        elif attempts >= int(row.get("max_attempts") or 0) or not _is_retryable(err):
+            status, next_at = "dead", None
+            logger.warning(
+                f"notify retry gave up: id={row.get('id')} channel={channel} strategy_id={row.get('strategy_id')} "
+                f"attempts={attempts} err={err}"
+            )
+        else:
+            status, next_at = "pending", now + int(self._backoff_sec(attempts))
+        _DELIVERIES.labels(channel, "retry_ok" if ok else ("dead" if status == "dead" else "queued")).inc()
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(
+                    """
+                    UPDATE qd_notification_retries
+                    SET status = ?, last_error = ?, next_attempt_at = COALESCE(?, next_attempt_at), updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (status, str(err or "")[:500], next_at, now, int(row.get("id") or 0)),
+                )
+                db.commit()
+                cur.close()
+        except Exception as e:
+            logger.warning(f"notify retry update failed: id={row.get('id')}, err={e}")
 
     def _build_payload(
         self,
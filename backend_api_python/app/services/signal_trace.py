@@ -0,0 +1,213 @@
+"""
+信号延迟追踪（K线收盘 -> 交易所确认/成交）
+
+- 指标产生待触发信号时生成 trace（trace_id + emitted_at），随信号在 runtime 中保留，
+  后续 tick 重新提取到同一信号（类型 + K线时间相同）时沿用原 trace；
+- 入队时 trace 写入 pending_orders.payload_json，并在同一事务中插入 qd_signal_traces 一行；
+- PendingOrderWorker 记录 claim / dispatch / ack / fill 时间，订单处理结束后一次性 UPDATE；
+- latency_summary() 按阶段、按交易所统计 p50/p95/p99（毫秒），供 /api/strategies/latency 使用。
+"""
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# (阶段名, 起点字段, 终点字段)
+STAGES = (
+    ('signal', 'bar_close_at', 'emitted_at'),
+    ('enqueue', 'emitted_at', 'enqueued_at'),
+    ('queue_wait', 'enqueued_at', 'claimed_at'),
+    ('claim_to_dispatch', 'claimed_at', 'dispatched_at'),
+    ('exchange_ack', 'dispatched_at', 'acked_at'),
+    ('fill', 'acked_at', 'filled_at'),
+)
+TIMESTAMP_FIELDS = ('bar_close_at', 'emitted_at', 'enqueued_at', 'claimed_at', 'dispatched_at', 'acked_at', 'filled_at')
+
+
+def new_trace() -> Dict[str, Any]:
+    return {'trace_id': uuid.uuid4().hex, 'emitted_at': round(time.time(), 3)}
+
+
+def attach_traces(signals: Iterable[Dict[str, Any]], previous: Optional[Iterable[Dict[str, Any]]] = None) -> None:
+    """给新提取的信号挂 trace；与上一轮相同（类型 + K线时间）的信号沿用原 trace，保留最早的产生时间"""
+    carried: Dict[Any, Dict[str, Any]] = {}
+    for s in previous or ():
+        trace = s.get('trace')
+        if trace:
+            carried[(s.get('type'), s.get('timestamp'))] = trace
+    for s in signals:
+        s['trace'] = carried.get((s.get('type'), s.get('timestamp'))) or s.get('trace') or new_trace()
+
+
+def trace_for_signal(signal: Dict[str, Any], timeframe_seconds: int) -> Dict[str, Any]:
+    """执行信号时的 trace：补上 K线收盘时间（信号时间为K线开盘时间）；服务端止盈止损等无 trace 的信号现场生成"""
+    trace = dict(signal.get('trace') or new_trace())
+    signal_ts = int(signal.get('timestamp') or 0)
+    if signal_ts > 0 and timeframe_seconds > 0:
+        trace['bar_close_at'] = float(signal_ts + int(timeframe_seconds))
+    return trace
+
+
+def insert_trace(cur: Any, pending_order_id: int, trace: Dict[str, Any], strategy_id: int, symbol: str,
+                 signal_type: str, execution_mode: str, enqueued_at: float) -> None:
+    """在入队事务中插入 trace 行（由调用方提交）"""
+    cur.execute(
+        """
+        INSERT OR IGNORE INTO qd_signal_traces
+        (pending_order_id, trace_id, strategy_id, symbol, signal_type, execution_mode,
+         bar_close_at, emitted_at, enqueued_at, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (
+            int(pending_order_id),
+            str(trace.get('trace_id') or ''),
+            int(strategy_id),
+            str(symbol or ''),
+            str(signal_type or ''),
+            str(execution_mode or ''),
+            trace.get('bar_close_at'),
+            trace.get('emitted_at'),
+            round(float(enqueued_at), 3),
+            int(enqueued_at),
+        ),
+    )
+
+
+class OrderTrace:
+    """PendingOrderWorker 处理单个订单期间收集的阶段时间，finish() 一次写库"""
+
+    __slots__ = ('order_id', 'trace_id', 'marks', 'exchange_id')
+
+    def __init__(self, order_id: int, trace_id: str = ''):
+        self.order_id = int(order_id)
+        self.trace_id = trace_id
+        self.marks: Dict[str, float] = {}
+        self.exchange_id = ''
+
+    @classmethod
+    def from_payload(cls, order_id: int, payload: Optional[Dict[str, Any]]) -> 'OrderTrace':
+        trace = (payload or {}).get('trace') or {}
+        return cls(order_id, str(trace.get('trace_id') or '') if isinstance(trace, dict) else '')
+
+    def mark(self, stage: str, first: bool = True) -> None:
+        """记录阶段时间；first=True 时只保留第一次（例如限价单与市价单两次下单，ack 取第一次）"""
+        if first and stage in self.marks:
+            return
+        self.marks[stage] = round(time.time(), 3)
+
+    def finish(self) -> None:
+        """写入阶段时间；状态取订单处理后的 pending_orders.status"""
+        if not self.trace_id:
+            # 旧版本入队的订单没有 trace
+            return
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(
+                    """
+                    UPDATE qd_signal_traces
+                    SET claimed_at = %s, dispatched_at = %s, acked_at = %s, filled_at = %s,
+                        exchange_id = %s,
+                        status = (SELECT status FROM pending_orders WHERE id = %s)
+                    WHERE pending_order_id = %s
+                    """,
+                    (
+                        self.marks.get('claimed_at'),
+                        self.marks.get('dispatched_at'),
+                        self.marks.get('acked_at'),
+                        self.marks.get('filled_at'),
+                        str(self.exchange_id or ''),
+                        self.order_id,
+                        self.order_id,
+                    ),
+                )
+                db.commit()
+                cur.close()
+        except Exception as e:
+            logger.debug(f"signal trace update failed: pending_id={self.order_id}, err={e}")
+
+
+def _percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    arr = np.asarray(values, dtype='float64') * 1000.0
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        'count': int(arr.size),
+        'p50': round(float(p50), 1),
+        'p95': round(float(p95), 1),
+        'p99': round(float(p99), 1),
+        'max': round(float(arr.max()), 1),
+    }
+
+
+def _stage_breakdown(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for name, start, end in STAGES:
+        values = []
+        for r in rows:
+            a, b = r.get(start), r.get(end)
+            if a is None or b is None:
+                continue
+            d = float(b) - float(a)
+            # 形成中K线上的信号：产生时间早于收盘，不计入 signal 阶段
+            if d >= 0:
+                values.append(d)
+        out[name] = _percentiles(values)
+
+    totals = []
+    for r in rows:
+        end = r.get('filled_at') or r.get('acked_at')
+        start = r.get('bar_close_at')
+        if start is None or (end is not None and float(end) < float(start)):
+            start = r.get('emitted_at')
+        if start is not None and end is not None:
+            totals.append(max(float(end) - float(start), 0.0))
+    out['total'] = _percentiles(totals)
+    return out
+
+
+def latency_summary(since_ts: Optional[int] = None, strategy_id: Optional[int] = None,
+                    limit: int = 20000) -> Dict[str, Any]:
+    """各阶段延迟分位数（毫秒），整体与按交易所分别统计；信号模式订单的 exchange 记为 signal"""
+    where = []
+    args: List[Any] = []
+    if since_ts:
+        where.append("created_at >= %s")
+        args.append(int(since_ts))
+    if strategy_id:
+        where.append("strategy_id = %s")
+        args.append(int(strategy_id))
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            f"""
+            SELECT exchange_id, execution_mode, {', '.join(TIMESTAMP_FIELDS)}
+            FROM qd_signal_traces
+            {where_sql}
+            ORDER BY id DESC
+            LIMIT %s
+            """,
+            tuple(args + [int(limit)]),
+        )
+        rows = cur.fetchall() or []
+        cur.close()
+
+    by_exchange: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        key = str(r.get('exchange_id') or '') or ('signal' if r.get('execution_mode') == 'signal' else 'unknown')
+        by_exchange.setdefault(key, []).append(r)
+
+    return {
+        'orders': len(rows),
+        'unit': 'ms',
+        'stages': _stage_breakdown(rows),
+        'byExchange': {k: _stage_breakdown(v) for k, v in sorted(by_exchange.items())},
+    }
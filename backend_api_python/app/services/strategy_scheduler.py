@@ -0,0 +1,299 @@
+"""
+策略 Tick 调度器
+
+替代原来的"每个策略一个线程 + 1s 分片 sleep"模型：
+- 一个调度线程维护按下一次 tick 截止时间排序的最小堆；
+- 到期的 tick 投递到固定大小的工作线程池（STRATEGY_WORKER_THREADS）执行；
+- 同一策略同一时刻最多只有一个 tick 在执行，tick 结束后才根据间隔重新入堆；
+- tick 执行时间超过其间隔、或因线程池繁忙而延迟超过一个间隔时记为 overrun，
+  错过的 tick 会被合并（不补跑），并限频打印告警。
+
+运行中的策略数量因此不再受线程数限制，只受 tick 总耗时 / 工作线程数约束。
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# tick 回调返回 False 表示策略结束（不再调度）；返回数字表示覆盖下一次的间隔（秒）；返回 None 使用默认间隔
+TickCallback = Callable[[], Any]
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+class _ScheduledStrategy:
+    """单个策略的调度状态（每次 add 生成新对象，旧的 tick 结束后不会再被重新调度）"""
+
+    __slots__ = (
+        'strategy_id', 'callback', 'interval', 'deadline', 'running', 'cancelled',
+        'ticks', 'overruns', 'errors', 'last_duration', 'max_duration', 'last_lag',
+        'last_overrun_log', 'wake_at', 'wakes',
+    )
+
+    def __init__(self, strategy_id: int, callback: TickCallback, interval: float):
+        self.strategy_id = strategy_id
+        self.callback = callback
+        self.interval = interval
+        self.deadline = 0.0
+        self.running = False
+        self.cancelled = False
+        self.ticks = 0
+        self.overruns = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.last_lag = 0.0
+        self.last_overrun_log = 0.0
+        self.wake_at: Optional[float] = None
+        self.wakes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'strategyId': self.strategy_id,
+            'intervalSec': self.interval,
+            'running': self.running,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'errors': self.errors,
+            'wakes': self.wakes,
+            'lastDurationMs': round(self.last_duration * 1000, 1),
+            'maxDurationMs': round(self.max_duration * 1000, 1),
+            'lastLagMs': round(self.last_lag * 1000, 1),
+            'nextTickIn': round(max(self.deadline - time.time(), 0.0), 3) if not self.running else 0.0,
+        }
+
+
+class StrategyScheduler:
+    """基于最小堆的策略 tick 调度器（固定工作线程数）"""
+
+    def __init__(self, max_workers: Optional[int] = None, error_backoff_sec: float = 5.0):
+        if max_workers is None:
+            max_workers = _env_int('STRATEGY_WORKER_THREADS', 8)
+        self.max_workers = max(1, int(max_workers))
+        self.error_backoff_sec = float(error_backoff_sec)
+        # 同一策略 overrun 告警的最小间隔，避免慢策略刷屏
+        self.overrun_log_interval_sec = 60.0
+
+        self._cond = threading.Condition()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._entries: Dict[int, _ScheduledStrategy] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    # ------------------------------------------------------------------
+    # 注册 / 注销
+    # ------------------------------------------------------------------
+
+    def add(self, strategy_id: int, callback: TickCallback, interval_sec: float, delay_sec: float = 0.0) -> bool:
+        """注册策略；已存在时返回 False"""
+        with self._cond:
+            if strategy_id in self._entries:
+                return False
+            self._ensure_started()
+            entry = _ScheduledStrategy(strategy_id, callback, max(float(interval_sec), 0.1))
+            self._entries[strategy_id] = entry
+            self._push(entry, time.time() + max(float(delay_sec), 0.0))
+            return True
+
+    def remove(self, strategy_id: int) -> bool:
+        """注销策略；正在执行的 tick 会执行完，但不会再被调度"""
+        with self._cond:
+            entry = self._entries.pop(strategy_id, None)
+            if entry is None:
+                return False
+            entry.cancelled = True
+            self._cond.notify()
+            return True
+
+    def wake(self, strategy_id: int, not_before: Optional[float] = None) -> bool:
+        """
+        提前执行策略的下一次 tick（不早于 not_before）。
+
+        用于行情推送：tick 正在执行时记下唤醒时间，执行结束后按其重新入堆；
+        多次唤醒自然合并为一次（每个策略在堆中只有一个有效截止时间）。
+        """
+        with self._cond:
+            entry = self._entries.get(strategy_id)
+            if entry is None or self._stopped:
+                return False
+            at = max(float(not_before or 0.0), time.time())
+            if entry.running:
+                if entry.wake_at is None or at < entry.wake_at:
+                    entry.wake_at = at
+                return True
+            if at < entry.deadline:
+                entry.wakes += 1
+                self._push(entry, at)
+            return True
+
+    def contains(self, strategy_id: int) -> bool:
+        with self._cond:
+            return strategy_id in self._entries
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stopped = True
+            for entry in self._entries.values():
+                entry.cancelled = True
+            self._entries.clear()
+            self._heap.clear()
+            self._cond.notify_all()
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _ensure_started(self) -> None:
+        # 调用方持有 self._cond
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='StrategyTick')
+        self._stopped = False
+        self._thread = threading.Thread(target=self._timer_loop, name='StrategyScheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"StrategyScheduler started (workers={self.max_workers})")
+
+    def _push(self, entry: _ScheduledStrategy, deadline: float) -> None:
+        # 调用方持有 self._cond
+        entry.deadline = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), entry))
+        if self._heap[0][2] is entry:
+            self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # 调度 / 执行
+    # ------------------------------------------------------------------
+
+    def _timer_loop(self) -> None:
+        while True:
+            due: List[_ScheduledStrategy] = []
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.time()
+                while self._heap:
+                    deadline, _, entry = self._heap[0]
+                    if entry.cancelled or entry.deadline != deadline:
+                        heapq.heappop(self._heap)
+                        continue
+                    if deadline > now:
+                        break
+                    heapq.heappop(self._heap)
+                    entry.running = True
+                    due.append(entry)
+                if not due:
+                    timeout = (self._heap[0][0] - now) if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+            for entry in due:
+                try:
+                    self._executor.submit(self._run_tick, entry)
+                except RuntimeError:
+                    # 解释器退出 / shutdown 后线程池拒绝新任务，调度线程随之退出
+                    return
+                except Exception as e:
+                    logger.warning(f"StrategyScheduler failed to dispatch strategy {entry.strategy_id}: {e}")
+                    with self._cond:
+                        entry.running = False
+                        if not entry.cancelled and not self._stopped:
+                            self._push(entry, time.time() + self.error_backoff_sec)
+
+    def _run_tick(self, entry: _ScheduledStrategy) -> None:
+        started = time.time()
+        lag = max(started - entry.deadline, 0.0)
+        next_delay: Optional[float] = None
+        finished = False
+        try:
+            ret = entry.callback()
+            if ret is False:
+                finished = True
+            elif isinstance(ret, (int, float)) and not isinstance(ret, bool):
+                next_delay = max(float(ret), 0.0)
+        except Exception as e:
+            entry.errors += 1
+            next_delay = self.error_backoff_sec
+            logger.error(f"Strategy {entry.strategy_id} tick error: {e}")
+            logger.error(traceback.format_exc())
+
+        ended = time.time()
+        duration = ended - started
+        with self._cond:
+            entry.running = False
+            entry.ticks += 1
+            entry.last_duration = duration
+            entry.last_lag = lag
+            if duration > entry.max_duration:
+                entry.max_duration = duration
+
+            # Overrun：执行时间超过间隔，或在线程池排队超过一个间隔；期间错过的 tick 合并为一次
+            if duration > entry.interval or lag > entry.interval:
+                entry.overruns += 1
+                if ended - entry.last_overrun_log >= self.overrun_log_interval_sec:
+                    entry.last_overrun_log = ended
+                    logger.warning(
+                        f"Strategy {entry.strategy_id} tick overrun: duration={duration:.2f}s lag={lag:.2f}s "
+                        f"interval={entry.interval:.0f}s (overruns={entry.overruns}, workers={self.max_workers}, "
+                        f"strategies={len(self._entries)})"
+                    )
+
+            if finished:
+                if self._entries.get(entry.strategy_id) is entry:
+                    del self._entries[entry.strategy_id]
+                entry.cancelled = True
+                return
+            if entry.cancelled or self._stopped:
+                return
+
+            if next_delay is not None:
+                deadline = ended + next_delay
+            else:
+                # 与原线程循环一致：下一次 = 本次开始 + 间隔；已过期则立即执行一次（错过的 tick 不补跑）
+                deadline = started + entry.interval
+            if entry.wake_at is not None:
+                if entry.wake_at < deadline:
+                    entry.wakes += 1
+                    deadline = entry.wake_at
+                entry.wake_at = None
+            self._push(entry, deadline)
+
+    # ------------------------------------------------------------------
+    # 观测
+    # ------------------------------------------------------------------
+
+    def stats(self, include_strategies: bool = False) -> Dict[str, Any]:
+        with self._cond:
+            entries = list(self._entries.values())
+            out = {
+                'workers': self.max_workers,
+                'strategies': len(entries),
+                'inFlight': sum(1 for e in entries if e.running),
+                'overruns': sum(e.overruns for e in entries),
+            }
+            if include_strategies:
+                out['strategyStats'] = [e.snapshot() for e in entries]
+            return out
+
+    def strategy_stats(self, strategy_id: int) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            entry = self._entries.get(strategy_id)
+            return entry.snapshot() if entry is not None else None
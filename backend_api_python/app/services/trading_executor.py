@@ -4,6 +4,7 @@
 import time
 import threading
 import traceback
+import functools
 import os
 try:
     import resource  # Linux/Unix only
@@ -19,25 +20,59 @@ import ccxt
 
 from app.utils.logger import get_logger
 from app.utils.db import get_db_connection
-from app.data_sources import DataSourceFactory
 from app.services.kline import KlineService
+from app.services.strategy_scheduler import StrategyScheduler
+from app.services.price_feed import get_price_feed
+from app.services.market_stream import get_market_stream
+from app.services.candle_ring import get_candle_rings
+from app.services.indicator_dedup import dedup_enabled, get_indicator_dedup
+from app.services.position_book import get_position_book
+from app.services import signal_trace
+from app.services.pending_order_wakeup import notify_pending_orders
+from app.utils.indicator_sandbox import SandboxUnavailableError, get_indicator_sandbox
+from app.utils.incremental_indicators import IncrementalSession, get_incremental_helpers, incremental_enabled
+from app.utils import metrics
+from app.utils.safe_exec import get_code_cache
 
 logger = get_logger(__name__)
 
+_TICK_SECONDS = metrics.histogram(
+    'qd_strategy_tick_seconds', 'Strategy tick duration (full: indicator + signals; price: trigger evaluation only)', ['kind'])
+_TICK_ERRORS = metrics.counter('qd_strategy_tick_errors_total', 'Strategy ticks that raised')
+_INDICATOR_SECONDS = metrics.histogram('qd_indicator_exec_seconds', 'Indicator script execution time', ['mode'])
+_INDICATOR_ERRORS = metrics.counter('qd_indicator_exec_errors_total', 'Indicator script executions that failed', ['mode'])
+_PRICE_FETCH_SECONDS = metrics.histogram(
+    'qd_price_fetch_seconds', 'Current price lookup latency (shared price feed)',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+_PRICE_FETCH_MISSES = metrics.counter('qd_price_fetch_misses_total', 'Current price lookups that returned no price')
+
 
 class TradingExecutor:
     """实时交易执行器 (Signal Provider Mode)"""
     
     def __init__(self):
         # 不再使用全局连接，改为每次使用时从连接池获取
-        self.running_strategies = {}  # {strategy_id: thread}
+        self.running_strategies = {}  # {strategy_id: runtime state dict}
         self.lock = threading.Lock()
-        # Local-only lightweight in-memory price cache (symbol -> (price, expiry_ts)).
-        # This replaces the old Redis-based PriceCache for local deployments.
-        self._price_cache = {}
-        self._price_cache_lock = threading.Lock()
-        # Default to 10s to match the unified tick cadence.
-        self._price_cache_ttl_sec = int(os.getenv("PRICE_CACHE_TTL_SEC", "10"))
+        # 共享价格源：只轮询运行中策略用到的交易对并集（批量 fetch_tickers），并合并同一交易对的并发请求。
+        # 价格有效期沿用 PRICE_CACHE_TTL_SEC（默认 10s，与统一 tick 节奏一致）。
+        self.price_feed = get_price_feed()
+        # 按 (symbol, timeframe) 共享的实时K线滚动缓冲
+        self.candle_rings = get_candle_rings()
+        # 相同代码 + symbol + timeframe + 相关参数的策略共享一次指标执行；启用时完整 tick 对齐到间隔的整数倍
+        self.indicator_dedup = get_indicator_dedup() if dedup_enabled() else None
+
+        # 行情流（WebSocket / REST 兜底 / 回放）：行情到达时提前唤醒策略，只用最新价评估触发条件和服务端止盈止损；
+        # 指标重算仍按 STRATEGY_TICK_INTERVAL_SEC 进行。同一策略两次行情评估的最小间隔为 STRATEGY_STREAM_MIN_EVAL_MS。
+        try:
+            self.market_stream = get_market_stream()
+        except Exception as e:
+            logger.warning(f"Market stream disabled: {e}")
+            self.market_stream = None
+        try:
+            self.stream_min_eval_sec = max(float(os.getenv('STRATEGY_STREAM_MIN_EVAL_MS', '250')), 0.0) / 1000.0
+        except Exception:
+            self.stream_min_eval_sec = 0.25
 
         # In-memory signal de-dup cache to prevent repeated orders on the same candle signal.
         # Keyed by (strategy_id, symbol, signal_type, signal_timestamp).
@@ -45,12 +80,19 @@ class TradingExecutor:
         self._signal_dedup_lock = threading.Lock()
         self.kline_service = KlineService()   # K线服务（带缓存）
         
-        # 单实例线程上限，避免无限制创建线程导致 can't start new thread/OOM
-        self.max_threads = int(os.getenv('STRATEGY_MAX_THREADS', '64'))
+        # 中央 tick 调度器：所有策略共享固定数量的工作线程（STRATEGY_WORKER_THREADS），
+        # 运行中的策略数量不再受线程数限制
+        self.scheduler = StrategyScheduler()
+
+        # 指标脚本单次执行的墙钟超时（仅沙箱进程池模式下生效）
+        self.indicator_timeout_sec = float(os.getenv('INDICATOR_EXEC_TIMEOUT_SEC', '30'))
         
         # 确保数据库字段存在
         self._ensure_db_columns()
 
+        # 持仓内存账本：启动时加载一次，tick 内读写内存，后台合并写回 qd_strategy_positions
+        self.position_book = get_position_book()
+
     def _ensure_db_columns(self):
         """确保必要的数据库字段存在"""
         try:
@@ -372,9 +414,25 @@ class TradingExecutor:
             },
         }
     
+    def _tick_interval_sec(self) -> int:
+        """
+        Unified tick cadence (default: 10s).
+
+        One tick = fetch current price once + evaluate triggers once + (if needed) refresh K-lines / recalc indicator.
+        Note: `pending_orders` scanning stays at 1s (see PendingOrderWorker) to reduce live dispatch latency.
+        """
+        try:
+            # Global-only (no per-strategy override)
+            tick_interval_sec = int(os.getenv('STRATEGY_TICK_INTERVAL_SEC', '10'))
+        except Exception:
+            tick_interval_sec = 10
+        if tick_interval_sec < 1:
+            tick_interval_sec = 1
+        return tick_interval_sec
+
     def start_strategy(self, strategy_id: int) -> bool:
         """
-        启动策略
+        启动策略（注册到调度器，不再单独创建线程）
         
         Args:
             strategy_id: 策略ID
@@ -384,36 +442,28 @@ class TradingExecutor:
         """
         try:
             with self.lock:
-                # 清理已退出的线程，防止计数膨胀
-                stale_ids = [sid for sid, th in self.running_strategies.items() if not th.is_alive()]
-                for sid in stale_ids:
-                    del self.running_strategies[sid]
-
-                if len(self.running_strategies) >= self.max_threads:
-                    logger.error(
-                        f"Thread limit reached ({self.max_threads}); refuse to start strategy {strategy_id}. "
-                        f"Reduce running strategies or increase STRATEGY_MAX_THREADS."
-                    )
-                    self._log_resource_status(prefix="start_denied: ")
-                    return False
-
                 if strategy_id in self.running_strategies:
                     logger.warning(f"Strategy {strategy_id} is already running")
                     return False
-                
-                # 创建并启动线程
-                thread = threading.Thread(
-                    target=self._run_strategy_loop,
-                    args=(strategy_id,),
-                    daemon=True
-                )
+
+                tick_interval_sec = self._tick_interval_sec()
+                runtime = {'initialized': False, 'tick_interval_sec': tick_interval_sec}
+                self.running_strategies[strategy_id] = runtime
                 try:
-                    thread.start()
+                    # 首次 tick 立即执行（完成初始化后紧接着执行第一次 tick）
+                    added = self.scheduler.add(
+                        strategy_id,
+                        functools.partial(self._run_strategy_tick, strategy_id, runtime),
+                        tick_interval_sec
+                    )
                 except Exception as e:
-                    # 捕获 can't start new thread 等异常，记录资源状态
+                    del self.running_strategies[strategy_id]
                     self._log_resource_status(prefix="启动异常")
                     raise e
-                self.running_strategies[strategy_id] = thread
+                if not added:
+                    del self.running_strategies[strategy_id]
+                    logger.warning(f"Strategy {strategy_id} is already scheduled")
+                    return False
                 
                 logger.info(f"Strategy {strategy_id} started")
                 self._console_print(f"[strategy:{strategy_id}] started")
@@ -424,13 +474,14 @@ class TradingExecutor:
             logger.error(traceback.format_exc())
             return False
     
-    def stop_strategy(self, strategy_id: int) -> bool:
+    def stop_strategy(self, strategy_id: int, mark_stopped: bool = True) -> bool:
         """
         停止策略
-        
+
         Args:
             strategy_id: 策略ID
-            
+            mark_stopped: 是否把数据库状态改为 stopped；引擎分片迁移策略时为 False（策略仍在运行，只是换到其他进程）
+
         Returns:
             是否成功
         """
@@ -439,559 +490,645 @@ class TradingExecutor:
                 if strategy_id not in self.running_strategies:
                     logger.warning(f"Strategy {strategy_id} is not running")
                     return False
-                
+
                 # 标记策略为停止状态
-                with get_db_connection() as db:
-                    cursor = db.cursor()
-                    cursor.execute(
-                        "UPDATE qd_strategies_trading SET status = 'stopped' WHERE id = %s",
-                        (strategy_id,)
-                    )
-                    db.commit()
-                    cursor.close()
-                
-                # 从运行列表中移除（线程会在下次循环检查状态时退出）
-                del self.running_strategies[strategy_id]
-                
-                logger.info(f"Strategy {strategy_id} stopped")
-                self._console_print(f"[strategy:{strategy_id}] stopped (requested)")
+                if mark_stopped:
+                    with get_db_connection() as db:
+                        cursor = db.cursor()
+                        cursor.execute(
+                            "UPDATE qd_strategies_trading SET status = 'stopped' WHERE id = %s",
+                            (strategy_id,)
+                        )
+                        db.commit()
+                        cursor.close()
+
+                # 从运行列表和调度器中移除（正在执行的 tick 会执行完，但不会再被调度）
+                runtime = self.running_strategies.pop(strategy_id)
+                self.scheduler.remove(strategy_id)
+                self._release_strategy_resources(strategy_id, runtime)
+
+                logger.info(f"Strategy {strategy_id} {'stopped' if mark_stopped else 'released'}")
+                self._console_print(f"[strategy:{strategy_id}] {'stopped (requested)' if mark_stopped else 'released (moved to another engine shard)'}")
                 return True
                 
         except Exception as e:
             logger.error(f"Failed to stop strategy {strategy_id}: {str(e)}")
             logger.error(traceback.format_exc())
             return False
-    
-    def _run_strategy_loop(self, strategy_id: int):
+
+    def _finish_strategy(self, strategy_id: int, runtime: Dict[str, Any]) -> None:
+        """策略退出（停止/初始化失败）时清理运行列表"""
+        with self.lock:
+            if self.running_strategies.get(strategy_id) is runtime:
+                del self.running_strategies[strategy_id]
+                self._release_strategy_resources(strategy_id, runtime)
+            else:
+                # 初始化期间被停止/重启：stop_strategy 已取消订阅，这里只归还本次初始化占用的K线缓冲
+                self._release_candle_ring(strategy_id, runtime)
+        self._console_print(f"[strategy:{strategy_id}] loop exited")
+        logger.info(f"Strategy {strategy_id} loop exited")
+
+    def _run_strategy_tick(self, strategy_id: int, runtime: Dict[str, Any]):
         """
-        策略运行循环
-        
-        Args:
-            strategy_id: 策略ID
+        调度器回调：首次调用完成初始化，之后每次执行一个 tick。
+
+        Returns:
+            False 表示策略结束（不再调度）；数字表示下一次 tick 的延迟秒数；None 使用默认间隔
         """
-        logger.info(f"Strategy {strategy_id} loop starting")
-        self._console_print(f"[strategy:{strategy_id}] loop initializing")
+        # 策略已被停止或重新启动（runtime 已被替换），不再继续
+        if self.running_strategies.get(strategy_id) is not runtime:
+            return False
+
+        if not runtime.get('initialized'):
+            logger.info(f"Strategy {strategy_id} loop starting")
+            self._console_print(f"[strategy:{strategy_id}] loop initializing")
+            try:
+                ok = self._init_strategy_runtime(strategy_id, runtime)
+            except Exception as e:
+                logger.error(f"Strategy {strategy_id} crashed: {str(e)}")
+                logger.error(traceback.format_exc())
+                self._console_print(f"[strategy:{strategy_id}] fatal error: {e}")
+                ok = False
+            if not ok:
+                self._finish_strategy(strategy_id, runtime)
+                return False
+
+        interval = float(runtime.get('tick_interval_sec') or 10)
+        now = time.time()
+        try:
+            # 还没到下一次完整 tick：说明是行情推送提前唤醒，只做价格触发评估
+            if now < float(runtime.get('next_full_tick_at') or 0.0) - 0.05:
+                runtime['last_eval_at'] = now
+                self._strategy_tick(strategy_id, runtime, price_only=True)
+                _TICK_SECONDS.labels('price').observe(time.time() - now)
+            else:
+                # 检查策略状态
+                if not self._is_strategy_running(strategy_id):
+                    logger.info(f"Strategy {strategy_id} stopped")
+                    self._finish_strategy(strategy_id, runtime)
+                    return False
+
+                if self.indicator_dedup is not None:
+                    # 对齐到间隔整数倍，同组策略在同一批次执行，共享一次指标计算
+                    runtime['next_full_tick_at'] = (int(now // interval) + 1) * interval
+                else:
+                    runtime['next_full_tick_at'] = now + interval
+                runtime['last_eval_at'] = now
+                self._strategy_tick(strategy_id, runtime)
+                _TICK_SECONDS.labels('full').observe(time.time() - now)
+            # 下一次完整 tick 的时间不受行情唤醒影响
+            return max(float(runtime['next_full_tick_at']) - time.time(), 0.0)
+        except Exception as e:
+            _TICK_ERRORS.inc()
+            logger.error(f"Strategy {strategy_id} loop error: {str(e)}")
+            logger.error(traceback.format_exc())
+            self._console_print(f"[strategy:{strategy_id}] loop error: {e}")
+            # 出错后 5s 内不再响应行情唤醒
+            runtime['last_eval_at'] = time.time() + 5.0
+            return 5.0
+
+    def _on_market_tick(self, strategy_id: int, symbol: str, price: float) -> None:
+        """行情流回调（在传输层线程中执行，必须轻量）：提前唤醒策略评估触发条件"""
+        runtime = self.running_strategies.get(strategy_id)
+        if not runtime or not runtime.get('initialized'):
+            return
+        self.scheduler.wake(strategy_id, not_before=float(runtime.get('last_eval_at') or 0.0) + self.stream_min_eval_sec)
+
+    def _subscribe_market_data(self, strategy_id: int, symbol: str) -> None:
+        if self.market_stream is not None:
+            self.market_stream.subscribe(strategy_id, symbol, functools.partial(self._on_market_tick, strategy_id))
+            # K线滚动缓冲按交易对只订阅一次，行情到达即原地更新
+            self.market_stream.subscribe(('candle_ring', symbol.upper()), symbol, self.candle_rings.on_price)
+        else:
+            self.price_feed.subscribe(strategy_id, symbol)
+
+    def _release_strategy_resources(self, strategy_id: int, runtime: Dict[str, Any]) -> None:
+        """取消行情订阅、退出指标分组，并释放K线滚动缓冲（最后一个使用者释放时才真正回收）"""
+        if self.indicator_dedup is not None:
+            self.indicator_dedup.remove_member(strategy_id)
+        # 策略停止时尽快把内存持仓落盘
+        self.position_book.flush(strategy_id)
+        if self.market_stream is not None:
+            self.market_stream.unsubscribe(strategy_id)
+        self.price_feed.unsubscribe(strategy_id)
+        self._release_candle_ring(strategy_id, runtime)
+
+    def _release_candle_ring(self, strategy_id: int, runtime: Dict[str, Any]) -> None:
+        symbol = runtime.get('symbol')
+        if symbol:
+            self.candle_rings.release((strategy_id, id(runtime)), symbol, runtime.get('timeframe'))
+            if self.market_stream is not None and not self.candle_rings.rings_for_symbol(symbol):
+                self.market_stream.unsubscribe(('candle_ring', symbol.upper()))
+
+    def _init_strategy_runtime(self, strategy_id: int, runtime: Dict[str, Any]) -> bool:
+        """
+        策略初始化：加载配置、获取历史K线并计算指标，结果写入 runtime
+
+        Returns:
+            是否初始化成功
+        """
+        # 加载策略配置
+        strategy = self._load_strategy(strategy_id)
+        if not strategy:
+            logger.error(f"Strategy {strategy_id} not found")
+            return False
+        
+        if strategy['strategy_type'] != 'IndicatorStrategy':
+            logger.error(f"Strategy {strategy_id} has unsupported strategy_type for realtime execution: {strategy['strategy_type']}")
+            return False
         
+        # 初始化策略状态
+        trading_config = strategy['trading_config']
+        indicator_config = strategy['indicator_config']
+        ai_model_config = strategy.get('ai_model_config') or {}
+        execution_mode = (strategy.get('execution_mode') or 'signal').strip().lower()
+        if execution_mode not in ['signal', 'live']:
+            execution_mode = 'signal'
+        notification_config = strategy.get('notification_config') or {}
+        strategy_name = strategy.get('strategy_name') or f"strategy_{int(strategy_id)}"
+        symbol = trading_config.get('symbol', '')
+        timeframe = trading_config.get('timeframe', '1H')
+        
+        # 安全获取 leverage 和 trade_direction
         try:
-            # 加载策略配置
-            strategy = self._load_strategy(strategy_id)
-            if not strategy:
-                logger.error(f"Strategy {strategy_id} not found")
-                return
-            
-            if strategy['strategy_type'] != 'IndicatorStrategy':
-                logger.error(f"Strategy {strategy_id} has unsupported strategy_type for realtime execution: {strategy['strategy_type']}")
-                return
-            
-            # 初始化策略状态
-            trading_config = strategy['trading_config']
-            indicator_config = strategy['indicator_config']
-            ai_model_config = strategy.get('ai_model_config') or {}
-            execution_mode = (strategy.get('execution_mode') or 'signal').strip().lower()
-            if execution_mode not in ['signal', 'live']:
-                execution_mode = 'signal'
-            notification_config = strategy.get('notification_config') or {}
-            strategy_name = strategy.get('strategy_name') or f"strategy_{int(strategy_id)}"
-            symbol = trading_config.get('symbol', '')
-            timeframe = trading_config.get('timeframe', '1H')
-            
-            # 安全获取 leverage 和 trade_direction
+            leverage_val = trading_config.get('leverage', 1)
+            if isinstance(leverage_val, (list, tuple)):
+                leverage_val = leverage_val[0] if leverage_val else 1
+            leverage = float(leverage_val)
+        except:
+            logger.warning(f"Strategy {strategy_id} invalid leverage format, reset to 1: {trading_config.get('leverage')}")
+            leverage = 1.0
+        
+        # 获取市场类型，默认为合约
+        # 根据杠杆自动判断：杠杆=1为现货，杠杆>1为合约
+        market_type = trading_config.get('market_type', 'swap')
+        if market_type not in ['swap', 'spot']:
+            logger.error(f"Strategy {strategy_id} invalid market_type={market_type} (only swap/spot supported); refusing to start")
+            return False
+        
+        # 根据杠杆自动调整市场类型
+        if leverage == 1.0:
+            market_type = 'spot'  # 现货固定1倍杠杆
+            logger.info(f"Strategy {strategy_id} leverage=1; auto-switch market_type to spot")
+        else:
+            # 合约市场：统一使用 swap（永续），避免 futures/delivery 混淆导致持仓/下单查错市场
+            market_type = 'swap'
+            logger.info(f"Strategy {strategy_id} derivatives trading; normalize market_type to: {market_type}")
+        
+        # 根据市场类型限制杠杆
+        if market_type == 'spot':
+            leverage = 1.0  # 现货固定1倍杠杆
+        elif leverage < 1:
+            leverage = 1.0
+        elif leverage > 125:
+            leverage = 125.0
+            logger.warning(f"Strategy {strategy_id} leverage > 125; capped to 125")
+        
+        # 获取交易方向，现货只能做多
+        trade_direction = trading_config.get('trade_direction', 'long')
+        if market_type == 'spot':
+            trade_direction = 'long'  # 现货只能做多
+            logger.info(f"Strategy {strategy_id} spot trading; force trade_direction=long")
+
+        # 初始化交易所连接（信号模式下无需真实连接）
+        exchange = None
+        
+        # 安全获取 initial_capital
+        try:
+            initial_capital_val = strategy.get('initial_capital', 1000)
+            if isinstance(initial_capital_val, (list, tuple)):
+                initial_capital_val = initial_capital_val[0] if initial_capital_val else 1000
+            initial_capital = float(initial_capital_val)
+        except:
+            logger.warning(f"Strategy {strategy_id} invalid initial_capital format, reset to 1000: {strategy.get('initial_capital')}")
+            initial_capital = 1000.0
+        
+        # 净值会在首次更新持仓时自动计算和更新
+        
+        # 获取指标代码
+        indicator_id = indicator_config.get('indicator_id')
+        indicator_code = indicator_config.get('indicator_code', '')
+        
+        # 如果代码为空，尝试从数据库获取
+        if not indicator_code and indicator_id:
+            indicator_code = self._get_indicator_code_from_db(indicator_id)
+        
+        if not indicator_code:
+            logger.error(f"Strategy {strategy_id} indicator_code is empty")
+            return False
+        
+        # 确保 indicator_code 是字符串（处理 JSON 转义问题）
+        if not isinstance(indicator_code, str):
+            indicator_code = str(indicator_code)
+        
+        # 处理可能的 JSON 转义问题
+        if '\\n' in indicator_code and '\n' not in indicator_code:
             try:
-                leverage_val = trading_config.get('leverage', 1)
-                if isinstance(leverage_val, (list, tuple)):
-                    leverage_val = leverage_val[0] if leverage_val else 1
-                leverage = float(leverage_val)
-            except:
-                logger.warning(f"Strategy {strategy_id} invalid leverage format, reset to 1: {trading_config.get('leverage')}")
-                leverage = 1.0
-            
-            # 获取市场类型，默认为合约
-            # 根据杠杆自动判断：杠杆=1为现货，杠杆>1为合约
-            market_type = trading_config.get('market_type', 'swap')
-            if market_type not in ['swap', 'spot']:
-                logger.error(f"Strategy {strategy_id} invalid market_type={market_type} (only swap/spot supported); refusing to start")
-                return
-            
-            # 根据杠杆自动调整市场类型
-            if leverage == 1.0:
-                market_type = 'spot'  # 现货固定1倍杠杆
-                logger.info(f"Strategy {strategy_id} leverage=1; auto-switch market_type to spot")
+                import json
+                decoded = json.loads(f'"{indicator_code}"')
+                if isinstance(decoded, str):
+                    indicator_code = decoded
+                    logger.info(f"Strategy {strategy_id} decoded escaped indicator_code")
+            except Exception as e:
+                logger.warning(f"Strategy {strategy_id} JSON decode failed; falling back to manual unescape: {str(e)}")
+                indicator_code = (
+                    indicator_code
+                    .replace('\\n', '\n')
+                    .replace('\\t', '\t')
+                    .replace('\\r', '\r')
+                    .replace('\\"', '"')
+                    .replace("\\'", "'")
+                    .replace('\\\\', '\\')
+                )
+        
+        # ============================================
+        # 初始化阶段：获取历史K线并计算指标
+        # ============================================
+        # logger.info(f"策略 {strategy_id} 初始化：获取历史K线数据...")
+        # 同一 (symbol, timeframe) 的策略共享一个K线滚动缓冲，只有第一个策略会真正拉取K线
+        runtime['symbol'] = symbol
+        runtime['timeframe'] = timeframe
+        candle_ring = self.candle_rings.acquire((strategy_id, id(runtime)), symbol, timeframe, 500, self._fetch_latest_kline)
+        if not candle_ring.ensure_loaded():
+            logger.error(f"Strategy {strategy_id} failed to fetch K-lines")
+            return False
+        
+        # 零拷贝 DataFrame 视图
+        df = candle_ring.frame()
+        if len(df) == 0:
+            logger.error(f"Strategy {strategy_id} K-lines are empty after normalization")
+            return False
+
+        # ============================================
+        # 启动时：完全依赖本地数据库的持仓状态（虚拟持仓）
+        # ============================================
+        # 信号模式下，不再同步交易所持仓
+        pass
+
+        # 获取当前持仓最高价（从本地数据库读取）
+        current_pos_list = self._get_current_positions(strategy_id, symbol)
+        initial_highest = 0.0
+        initial_position = 0  # 0=无持仓, 1=多头, -1=空头
+        initial_avg_entry_price = 0.0
+        initial_position_count = 0
+        initial_last_add_price = 0.0
+        
+        if current_pos_list:
+            pos = current_pos_list[0]  # 取第一个持仓（单向持仓模式）
+            initial_highest = float(pos.get('highest_price', 0) or 0)
+            pos_side = pos.get('side', 'long')
+            initial_position = 1 if pos_side == 'long' else -1
+            initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
+            initial_position_count = 1  # 简化处理，假设是单笔持仓
+            initial_last_add_price = initial_avg_entry_price
+
+        # 关键诊断日志：确认指标是否拿到了持仓状态
+        logger.info(
+            f"策略 {strategy_id} 指标注入持仓状态: count={len(current_pos_list)}, "
+            f"position={initial_position}, entry_price={initial_avg_entry_price}, highest={initial_highest}"
+        )
+
+        # 执行指标代码，获取信号和触发价格
+        indicator_result = self._execute_indicator_with_prices(
+            indicator_code, df, trading_config, 
+            initial_highest_price=initial_highest,
+            initial_position=initial_position,
+            initial_avg_entry_price=initial_avg_entry_price,
+            initial_position_count=initial_position_count,
+            initial_last_add_price=initial_last_add_price,
+            strategy_id=strategy_id,
+            candle_ring=candle_ring
+        )
+        if indicator_result is None:
+            logger.error(f"Strategy {strategy_id} indicator execution failed")
+            return False
+        incremental = self._start_incremental(strategy_id, indicator_result, df, candle_ring)
+        
+        # 提取信号和触发价格
+        pending_signals = indicator_result.get('pending_signals', [])  # 待触发的信号列表
+        
+        logger.info(f"Strategy {strategy_id} initialized; pending_signals={len(pending_signals)}")
+        if pending_signals:
+            logger.info(f"Initial signals: {pending_signals}")
+
+        # 计算K线周期（秒）
+        from app.data_sources.base import TIMEFRAME_SECONDS
+        timeframe_seconds = TIMEFRAME_SECONDS.get(timeframe, 3600)
+
+        runtime.update({
+            'strategy_name': strategy_name,
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'timeframe_seconds': timeframe_seconds,
+            'market_type': market_type,
+            'leverage': leverage,
+            'trade_direction': trade_direction,
+            'initial_capital': initial_capital,
+            'exchange': exchange,
+            'execution_mode': execution_mode,
+            'notification_config': notification_config,
+            'trading_config': trading_config,
+            'ai_model_config': ai_model_config,
+            'indicator_code': indicator_code,
+            'candle_ring': candle_ring,
+            'incremental': incremental,
+            # 增量会话 init 时注入的持仓状态；持仓变化后会话里的 initial_* 已过期，需要全量重算
+            'incremental_position': (initial_position, initial_avg_entry_price, initial_position_count,
+                                     initial_last_add_price, initial_highest),
+            'pending_signals': pending_signals,
+            'initialized': True,
+        })
+        # 订阅行情流 / 共享价格源（初始化期间策略可能已被停止）
+        with self.lock:
+            if self.running_strategies.get(strategy_id) is runtime:
+                self._subscribe_market_data(strategy_id, symbol)
             else:
-                # 合约市场：统一使用 swap（永续），避免 futures/delivery 混淆导致持仓/下单查错市场
-                market_type = 'swap'
-                logger.info(f"Strategy {strategy_id} derivatives trading; normalize market_type to: {market_type}")
-            
-            # 根据市场类型限制杠杆
-            if market_type == 'spot':
-                leverage = 1.0  # 现货固定1倍杠杆
-            elif leverage < 1:
-                leverage = 1.0
-            elif leverage > 125:
-                leverage = 125.0
-                logger.warning(f"Strategy {strategy_id} leverage > 125; capped to 125")
-            
-            # 获取交易方向，现货只能做多
-            trade_direction = trading_config.get('trade_direction', 'long')
-            if market_type == 'spot':
-                trade_direction = 'long'  # 现货只能做多
-                logger.info(f"Strategy {strategy_id} spot trading; force trade_direction=long")
-
-            # 初始化交易所连接（信号模式下无需真实连接）
-            exchange = None
-            
-            # 安全获取 initial_capital
-            try:
-                initial_capital_val = strategy.get('initial_capital', 1000)
-                if isinstance(initial_capital_val, (list, tuple)):
-                    initial_capital_val = initial_capital_val[0] if initial_capital_val else 1000
-                initial_capital = float(initial_capital_val)
-            except:
-                logger.warning(f"Strategy {strategy_id} invalid initial_capital format, reset to 1000: {strategy.get('initial_capital')}")
-                initial_capital = 1000.0
-            
-            # 净值会在首次更新持仓时自动计算和更新
-            
-            # 获取指标代码
-            indicator_id = indicator_config.get('indicator_id')
-            indicator_code = indicator_config.get('indicator_code', '')
-            
-            # 如果代码为空，尝试从数据库获取
-            if not indicator_code and indicator_id:
-                indicator_code = self._get_indicator_code_from_db(indicator_id)
-            
-            if not indicator_code:
-                logger.error(f"Strategy {strategy_id} indicator_code is empty")
-                return
-            
-            # 确保 indicator_code 是字符串（处理 JSON 转义问题）
-            if not isinstance(indicator_code, str):
-                indicator_code = str(indicator_code)
-            
-            # 处理可能的 JSON 转义问题
-            if '\\n' in indicator_code and '\n' not in indicator_code:
-                try:
-                    import json
-                    decoded = json.loads(f'"{indicator_code}"')
-                    if isinstance(decoded, str):
-                        indicator_code = decoded
-                        logger.info(f"Strategy {strategy_id} decoded escaped indicator_code")
-                except Exception as e:
-                    logger.warning(f"Strategy {strategy_id} JSON decode failed; falling back to manual unescape: {str(e)}")
-                    indicator_code = (
-                        indicator_code
-                        .replace('\\n', '\n')
-                        .replace('\\t', '\t')
-                        .replace('\\r', '\r')
-                        .replace('\\"', '"')
-                        .replace("\\'", "'")
-                        .replace('\\\\', '\\')
-                    )
-            
+                self._release_strategy_resources(strategy_id, runtime)
+        return True
+
+    def _strategy_tick(self, strategy_id: int, runtime: Dict[str, Any], price_only: bool = False) -> None:
+        """
+        执行一次 tick（由调度器在工作线程池中调用，同一策略不会并发执行）
+
+        price_only=True 时为行情推送触发的快速评估：跳过K线刷新/指标重算，只用最新价评估待触发信号与服务端止盈止损。
+        """
+        strategy_name = runtime['strategy_name']
+        exchange = runtime['exchange']
+        symbol = runtime['symbol']
+        timeframe_seconds = runtime['timeframe_seconds']
+        market_type = runtime['market_type']
+        leverage = runtime['leverage']
+        trade_direction = runtime['trade_direction']
+        initial_capital = runtime['initial_capital']
+        execution_mode = runtime['execution_mode']
+        notification_config = runtime['notification_config']
+        trading_config = runtime['trading_config']
+        ai_model_config = runtime['ai_model_config']
+        indicator_code = runtime['indicator_code']
+        candle_ring = runtime['candle_ring']
+        pending_signals = runtime['pending_signals']
+
+        try:
             # ============================================
-            # 初始化阶段：获取历史K线并计算指标
+            # 0. 虚拟持仓模式，无需同步交易所
             # ============================================
-            # logger.info(f"策略 {strategy_id} 初始化：获取历史K线数据...")
-            klines = self._fetch_latest_kline(symbol, timeframe, limit=500)
-            if not klines or len(klines) < 2:
-                logger.error(f"Strategy {strategy_id} failed to fetch K-lines")
-                return
-            
-            # 转换为DataFrame
-            df = self._klines_to_dataframe(klines)
-            if len(df) == 0:
-                logger.error(f"Strategy {strategy_id} K-lines are empty after normalization")
+            # pass
+        
+            # ============================================
+            # 1. Fetch current price once per tick
+            # ============================================
+            current_price = self._fetch_current_price(exchange, symbol, market_type=market_type)
+            if current_price is None:
+                logger.warning(f"Strategy {strategy_id} failed to fetch current price")
                 return
 
             # ============================================
-            # 启动时：完全依赖本地数据库的持仓状态（虚拟持仓）
+            # 2. K线：同一 (symbol, timeframe) 的所有策略共享滚动缓冲，行情原地更新最后一根/跨周期滚动，
+            #    只在滚动后或定期与交易所对账；指标在零拷贝视图上重算（统一tick节奏）
             # ============================================
-            # 信号模式下，不再同步交易所持仓
-            pass
+            candle_ring.on_price(current_price)
+            if price_only:
+                # 行情推送触发：指标沿用上一次完整 tick 的计算结果
+                pass
+            else:
+                candle_ring.maybe_reconcile()
+                df = candle_ring.frame()
+                if len(df) > 0:
+                    try:
+                        current_pos_list = self._get_current_positions(strategy_id, symbol)
+                        initial_highest = 0.0
+                        initial_position = 0
+                        initial_avg_entry_price = 0.0
+                        initial_position_count = 0
+                        initial_last_add_price = 0.0
+
+                        if current_pos_list:
+                            pos = current_pos_list[0]
+                            initial_highest = float(pos.get('highest_price', 0) or 0)
+                            pos_side = pos.get('side', 'long')
+                            initial_position = 1 if pos_side == 'long' else -1
+                            initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
+                            initial_position_count = 1
+                            initial_last_add_price = initial_avg_entry_price
+
+                        # 增量协议：只推进最新K线（O(1)）；对账修正过K线、持仓状态变化或增量执行失败时退回全量重算
+                        position_state = (initial_position, initial_avg_entry_price, initial_position_count,
+                                          initial_last_add_price, initial_highest)
+                        indicator_result = self._incremental_indicator_result(
+                            strategy_id, runtime, candle_ring, trading_config, position_state
+                        )
+                        if indicator_result is None:
+                            indicator_result = self._execute_indicator_with_prices(
+                                indicator_code, df, trading_config,
+                                initial_highest_price=initial_highest,
+                                initial_position=initial_position,
+                                initial_avg_entry_price=initial_avg_entry_price,
+                                initial_position_count=initial_position_count,
+                                initial_last_add_price=initial_last_add_price,
+                                strategy_id=strategy_id,
+                                candle_ring=candle_ring
+                            )
+                            if indicator_result:
+                                runtime['incremental'] = self._start_incremental(strategy_id, indicator_result, df, candle_ring)
+                                runtime['incremental_position'] = position_state
+                        if indicator_result:
+                            # 重新提取到的同一信号沿用首次产生时的 trace
+                            signal_trace.attach_traces(indicator_result.get('pending_signals', []), pending_signals)
+                            pending_signals = indicator_result.get('pending_signals', [])
+                            new_hp = indicator_result.get('new_highest_price', 0)
+
+                            if new_hp > 0 and current_pos_list:
+                                for p in current_pos_list:
+                                    self._update_position_prices(
+                                        strategy_id, p['symbol'], p['side'],
+                                        current_price,
+                                        highest_price=new_hp
+                                    )
+                    except Exception as e:
+                        logger.warning(f"Strategy {strategy_id} realtime indicator recompute failed: {str(e)}")
 
-            # 获取当前持仓最高价（从本地数据库读取）
-            current_pos_list = self._get_current_positions(strategy_id, symbol)
-            initial_highest = 0.0
-            initial_position = 0  # 0=无持仓, 1=多头, -1=空头
-            initial_avg_entry_price = 0.0
-            initial_position_count = 0
-            initial_last_add_price = 0.0
-            
-            if current_pos_list:
-                pos = current_pos_list[0]  # 取第一个持仓（单向持仓模式）
-                initial_highest = float(pos.get('highest_price', 0) or 0)
-                pos_side = pos.get('side', 'long')
-                initial_position = 1 if pos_side == 'long' else -1
-                initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                initial_position_count = 1  # 简化处理，假设是单笔持仓
-                initial_last_add_price = initial_avg_entry_price
-
-            # 关键诊断日志：确认指标是否拿到了持仓状态
-            logger.info(
-                f"策略 {strategy_id} 指标注入持仓状态: count={len(current_pos_list)}, "
-                f"position={initial_position}, entry_price={initial_avg_entry_price}, highest={initial_highest}"
-            )
+            # ============================================
+            # 4. Evaluate triggers once per tick
+            # ============================================
+            # 优化点4: 信号有效期清理 (Signal Expiration)
+            current_ts = int(time.time())
+            if pending_signals:
+                expiration_threshold = timeframe_seconds * 2
+                valid_signals = []
+                for s in pending_signals:
+                    signal_time = s.get('timestamp', 0)
+                    if signal_time == 0 or (current_ts - signal_time) < expiration_threshold:
+                        valid_signals.append(s)
+                    else:
+                        logger.warning(f"Signal expired and removed: {s}")
+                if len(valid_signals) != len(pending_signals):
+                    pending_signals = valid_signals
 
-            # 执行指标代码，获取信号和触发价格
-            indicator_result = self._execute_indicator_with_prices(
-                indicator_code, df, trading_config, 
-                initial_highest_price=initial_highest,
-                initial_position=initial_position,
-                initial_avg_entry_price=initial_avg_entry_price,
-                initial_position_count=initial_position_count,
-                initial_last_add_price=initial_last_add_price
-            )
-            if indicator_result is None:
-                logger.error(f"Strategy {strategy_id} indicator execution failed")
-                return
+            # Unified cadence log: at most once per (full) tick.
+            if pending_signals and not price_only:
+                logger.info(f"[monitoring] strategy={strategy_id} price={current_price}, pending_signals={len(pending_signals)}")
+
+            # 检查是否有待触发的信号
+            triggered_signals = []
+            signals_to_remove = []
             
-            # 提取信号和触发价格
-            pending_signals = indicator_result.get('pending_signals', [])  # 待触发的信号列表
-            last_kline_time = indicator_result.get('last_kline_time', 0)  # 最后一根K线的时间
+            for signal_info in pending_signals:
+                signal_type = signal_info.get('type')  # 'open_long', 'close_long', 'open_short', 'close_short'
+                trigger_price = signal_info.get('trigger_price', 0)
             
-            logger.info(f"Strategy {strategy_id} initialized; pending_signals={len(pending_signals)}")
-            if pending_signals:
-                logger.info(f"Initial signals: {pending_signals}")
+                # 检查价格是否触发
+                triggered = False
+
+                # 【关键修复】平仓/止损止盈信号默认“立即触发”
+                exit_trigger_mode = trading_config.get('exit_trigger_mode', 'immediate')  # 'immediate' or 'price'
+                if signal_type in ['close_long', 'close_short'] and exit_trigger_mode == 'immediate':
+                    triggered = True
             
+                # 【可选】开仓/加仓信号是否“立即触发”
+                entry_trigger_mode = trading_config.get('entry_trigger_mode', 'price')  # 'price' or 'immediate'
+                if signal_type in ['open_long', 'open_short', 'add_long', 'add_short'] and entry_trigger_mode == 'immediate':
+                    triggered = True
+
+                if trigger_price > 0:
+                    if signal_type in ['open_long', 'close_short', 'add_long']:
+                        if current_price >= trigger_price:
+                            triggered = True
+                    elif signal_type in ['open_short', 'close_long', 'add_short']:
+                        if current_price <= trigger_price:
+                            triggered = True
+                else:
+                    triggered = True
+            
+                if triggered:
+                    triggered_signals.append(signal_info)
+                    signals_to_remove.append(signal_info)
+
             # ============================================
-            # Main loop: unified tick cadence (default: 10s)
+            # 4.1 Server-side exits (config-driven): SL / TP / trailing
             # ============================================
-            # One tick = fetch current price once + evaluate triggers once + (if needed) refresh K-lines / recalc indicator.
-            # Note: `pending_orders` scanning stays at 1s (see PendingOrderWorker) to reduce live dispatch latency.
-            try:
-                # Global-only (no per-strategy override)
-                tick_interval_sec = int(os.getenv('STRATEGY_TICK_INTERVAL_SEC', '10'))
-            except Exception:
-                tick_interval_sec = 10
-            if tick_interval_sec < 1:
-                tick_interval_sec = 1
+            # Note: stop-loss is only applied when stop_loss_pct > 0. No default fallback.
+            risk_tp = self._server_side_take_profit_or_trailing_signal(
+                strategy_id=strategy_id,
+                symbol=symbol,
+                current_price=float(current_price),
+                market_type=market_type,
+                leverage=float(leverage),
+                trading_config=trading_config,
+                timeframe_seconds=int(timeframe_seconds or 60),
+            )
+            if risk_tp:
+                triggered_signals.append(risk_tp)
 
-            last_tick_time = 0.0
-            last_kline_update_time = time.time()
+            risk_sl = self._server_side_stop_loss_signal(
+                strategy_id=strategy_id,
+                symbol=symbol,
+                current_price=float(current_price),
+                market_type=market_type,
+                leverage=float(leverage),
+                trading_config=trading_config,
+                timeframe_seconds=int(timeframe_seconds or 60),
+            )
+            if risk_sl:
+                triggered_signals.append(risk_sl)
             
-            # 计算K线周期（秒）
-            from app.data_sources.base import TIMEFRAME_SECONDS
-            timeframe_seconds = TIMEFRAME_SECONDS.get(timeframe, 3600)
-            kline_update_interval = timeframe_seconds  # 每个K线周期更新一次
+            # 从待触发列表中移除已触发的信号
+            for signal_info in signals_to_remove:
+                if signal_info in pending_signals:
+                    pending_signals.remove(signal_info)
             
-            while True:
-                try:
-                    # 检查策略状态
-                    if not self._is_strategy_running(strategy_id):
-                        logger.info(f"Strategy {strategy_id} stopped")
-                        break
-                    
-                    current_time = time.time()
-
-                    # Sleep until next tick to avoid CPU spin.
-                    if last_tick_time > 0:
-                        sleep_sec = (last_tick_time + tick_interval_sec) - current_time
-                        if sleep_sec > 0:
-                            time.sleep(min(sleep_sec, 1.0))
-                            continue
-                    last_tick_time = current_time
-
-                    # ============================================
-                    # 0. 虚拟持仓模式，无需同步交易所
-                    # ============================================
-                    # pass
-                    
-                    # ============================================
-                    # 1. Fetch current price once per tick
-                    # ============================================
-                    current_price = self._fetch_current_price(exchange, symbol, market_type=market_type)
-                    if current_price is None:
-                        logger.warning(f"Strategy {strategy_id} failed to fetch current price")
-                        continue
-
-                    # ============================================
-                    # 2. 检查是否需要更新K线（每个K线周期更新一次，从API拉取）
-                    # ============================================
-                    if current_time - last_kline_update_time >= kline_update_interval:
-                        klines = self._fetch_latest_kline(symbol, timeframe, limit=500)
-                        if klines and len(klines) >= 2:
-                            df = self._klines_to_dataframe(klines)
-                            if len(df) > 0:
-                                current_pos_list = self._get_current_positions(strategy_id, symbol)
-                                initial_highest = 0.0
-                                initial_position = 0
-                                initial_avg_entry_price = 0.0
-                                initial_position_count = 0
-                                initial_last_add_price = 0.0
-
-                                if current_pos_list:
-                                    pos = current_pos_list[0]
-                                    initial_highest = float(pos.get('highest_price', 0) or 0)
-                                    pos_side = pos.get('side', 'long')
-                                    initial_position = 1 if pos_side == 'long' else -1
-                                    initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                                    initial_position_count = 1
-                                    initial_last_add_price = initial_avg_entry_price
-
-                                indicator_result = self._execute_indicator_with_prices(
-                                    indicator_code, df, trading_config,
-                                    initial_highest_price=initial_highest,
-                                    initial_position=initial_position,
-                                    initial_avg_entry_price=initial_avg_entry_price,
-                                    initial_position_count=initial_position_count,
-                                    initial_last_add_price=initial_last_add_price
-                                )
-                                if indicator_result:
-                                    pending_signals = indicator_result.get('pending_signals', [])
-                                    last_kline_time = indicator_result.get('last_kline_time', 0)
-                                    new_hp = indicator_result.get('new_highest_price', 0)
-
-                                    last_kline_update_time = current_time
-
-                                    # 更新 highest_price（使用最新 close 作为 current_price 的近似）
-                                    if new_hp > 0 and current_pos_list:
-                                        current_close = float(df['close'].iloc[-1])
-                                        for p in current_pos_list:
-                                            self._update_position(
-                                                strategy_id, p['symbol'], p['side'],
-                                                float(p['size']), float(p['entry_price']),
-                                                current_close,
-                                                highest_price=new_hp
-                                            )
-                    else:
-                        # ============================================
-                        # 3. 非K线更新tick：用当前价更新最后一根K线并重算指标（统一tick节奏）
-                        # ============================================
-                        if 'df' in locals() and df is not None and len(df) > 0:
-                            try:
-                                realtime_df = df.copy()
-                                realtime_df = self._update_dataframe_with_current_price(realtime_df, current_price, timeframe)
-
-                                current_pos_list = self._get_current_positions(strategy_id, symbol)
-                                initial_highest = 0.0
-                                initial_position = 0
-                                initial_avg_entry_price = 0.0
-                                initial_position_count = 0
-                                initial_last_add_price = 0.0
-
-                                if current_pos_list:
-                                    pos = current_pos_list[0]
-                                    initial_highest = float(pos.get('highest_price', 0) or 0)
-                                    pos_side = pos.get('side', 'long')
-                                    initial_position = 1 if pos_side == 'long' else -1
-                                    initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                                    initial_position_count = 1
-                                    initial_last_add_price = initial_avg_entry_price
-
-                                indicator_result = self._execute_indicator_with_prices(
-                                    indicator_code, realtime_df, trading_config,
-                                    initial_highest_price=initial_highest,
-                                    initial_position=initial_position,
-                                    initial_avg_entry_price=initial_avg_entry_price,
-                                    initial_position_count=initial_position_count,
-                                    initial_last_add_price=initial_last_add_price
-                                )
-                                if indicator_result:
-                                    pending_signals = indicator_result.get('pending_signals', [])
-                                    new_hp = indicator_result.get('new_highest_price', 0)
-
-                                    if new_hp > 0 and current_pos_list:
-                                        for p in current_pos_list:
-                                            self._update_position(
-                                                strategy_id, p['symbol'], p['side'],
-                                                float(p['size']), float(p['entry_price']),
-                                                current_price,
-                                                highest_price=new_hp
-                                            )
-                            except Exception as e:
-                                logger.warning(f"Strategy {strategy_id} realtime indicator recompute failed: {str(e)}")
-                    
-                    # ============================================
-                    # 4. Evaluate triggers once per tick
-                    # ============================================
-                    # 优化点4: 信号有效期清理 (Signal Expiration)
-                    current_ts = int(time.time())
-                    if pending_signals:
-                        expiration_threshold = timeframe_seconds * 2
-                        valid_signals = []
-                        for s in pending_signals:
-                            signal_time = s.get('timestamp', 0)
-                            if signal_time == 0 or (current_ts - signal_time) < expiration_threshold:
-                                valid_signals.append(s)
-                            else:
-                                logger.warning(f"Signal expired and removed: {s}")
-                        if len(valid_signals) != len(pending_signals):
-                            pending_signals = valid_signals
-
-                    # Unified cadence log: at most once per tick.
-                    if pending_signals:
-                        logger.info(f"[monitoring] strategy={strategy_id} price={current_price}, pending_signals={len(pending_signals)}")
-
-                    # 检查是否有待触发的信号
-                    triggered_signals = []
-                    signals_to_remove = []
-                        
-                    for signal_info in pending_signals:
-                        signal_type = signal_info.get('type')  # 'open_long', 'close_long', 'open_short', 'close_short'
-                        trigger_price = signal_info.get('trigger_price', 0)
-                        
-                        # 检查价格是否触发
-                        triggered = False
-
-                        # 【关键修复】平仓/止损止盈信号默认“立即触发”
-                        exit_trigger_mode = trading_config.get('exit_trigger_mode', 'immediate')  # 'immediate' or 'price'
-                        if signal_type in ['close_long', 'close_short'] and exit_trigger_mode == 'immediate':
-                            triggered = True
-                        
-                        # 【可选】开仓/加仓信号是否“立即触发”
-                        entry_trigger_mode = trading_config.get('entry_trigger_mode', 'price')  # 'price' or 'immediate'
-                        if signal_type in ['open_long', 'open_short', 'add_long', 'add_short'] and entry_trigger_mode == 'immediate':
-                            triggered = True
+            # 执行触发的信号
+            if triggered_signals:
+                logger.info(f"Strategy {strategy_id} triggered signals: {triggered_signals}")
+
+                current_positions = self._get_current_positions(strategy_id, symbol)
+                state = self._position_state(current_positions)
+
+                # Strict state machine + priority:
+                # - Only allow signals matching current state (flat/long/short).
+                # - Always prefer close_* over open_*/add_*.
+                # - Execute at most ONE signal per tick to avoid duplicated/re-entrant orders.
+                candidates = [s for s in triggered_signals if self._is_signal_allowed(state, s.get('type'))]
+
+                # If both directions are present while flat, choose by trade_direction (deterministic).
+                if state == "flat" and candidates:
+                    td = (trade_direction or "both").strip().lower()
+                    if td == "long":
+                        candidates = [s for s in candidates if s.get("type") == "open_long"]
+                    elif td == "short":
+                        candidates = [s for s in candidates if s.get("type") == "open_short"]
+
+                candidates = sorted(
+                    candidates,
+                    key=lambda s: (
+                        self._signal_priority(s.get("type")),
+                        int(s.get("timestamp") or 0),
+                        str(s.get("type") or ""),
+                    ),
+                )
 
-                        if trigger_price > 0:
-                            if signal_type in ['open_long', 'close_short', 'add_long']:
-                                if current_price >= trigger_price:
-                                    triggered = True
-                            elif signal_type in ['open_short', 'close_long', 'add_short']:
-                                if current_price <= trigger_price:
-                                    triggered = True
-                        else:
-                            triggered = True
-                        
-                        if triggered:
-                            triggered_signals.append(signal_info)
-                            signals_to_remove.append(signal_info)
-
-                    # ============================================
-                    # 4.1 Server-side exits (config-driven): SL / TP / trailing
-                    # ============================================
-                    # Note: stop-loss is only applied when stop_loss_pct > 0. No default fallback.
-                    risk_tp = self._server_side_take_profit_or_trailing_signal(
+                selected = None
+                now_i = int(time.time())
+                for s in candidates:
+                    stype = s.get("type")
+                    sts = int(s.get("timestamp") or 0)
+                    if self._should_skip_signal_once_per_candle(
                         strategy_id=strategy_id,
                         symbol=symbol,
-                        current_price=float(current_price),
-                        market_type=market_type,
-                        leverage=float(leverage),
-                        trading_config=trading_config,
+                        signal_type=str(stype or ""),
+                        signal_ts=sts,
                         timeframe_seconds=int(timeframe_seconds or 60),
-                    )
-                    if risk_tp:
-                        triggered_signals.append(risk_tp)
-
-                    risk_sl = self._server_side_stop_loss_signal(
+                        now_ts=now_i,
+                    ):
+                        continue
+                    selected = s
+                    break
+
+                if selected:
+                    signal_type = selected.get('type')
+                    position_size = selected.get('position_size', 0)
+                    trigger_price = selected.get('trigger_price', current_price)
+                    execute_price = trigger_price if trigger_price > 0 else current_price
+                    signal_ts = int(selected.get("timestamp") or 0)
+                    trace = signal_trace.trace_for_signal(selected, int(timeframe_seconds or 0))
+
+                    ok = self._execute_signal(
                         strategy_id=strategy_id,
+                        strategy_name=strategy_name,
+                        exchange=exchange,
                         symbol=symbol,
-                        current_price=float(current_price),
+                        current_price=execute_price,
+                        signal_type=signal_type,
+                        position_size=position_size,
+                        signal_ts=signal_ts,
+                        current_positions=current_positions,
+                        trade_direction=trade_direction,
+                        leverage=leverage,
+                        initial_capital=initial_capital,
                         market_type=market_type,
-                        leverage=float(leverage),
+                        execution_mode=execution_mode,
+                        notification_config=notification_config,
                         trading_config=trading_config,
-                        timeframe_seconds=int(timeframe_seconds or 60),
+                        ai_model_config=ai_model_config,
+                        trace=trace,
                     )
-                    if risk_sl:
-                        triggered_signals.append(risk_sl)
-                        
-                    # 从待触发列表中移除已触发的信号
-                    for signal_info in signals_to_remove:
-                        if signal_info in pending_signals:
-                            pending_signals.remove(signal_info)
-                        
-                    # 执行触发的信号
-                    if triggered_signals:
-                        logger.info(f"Strategy {strategy_id} triggered signals: {triggered_signals}")
-
-                        current_positions = self._get_current_positions(strategy_id, symbol)
-                        state = self._position_state(current_positions)
-
-                        # Strict state machine + priority:
-                        # - Only allow signals matching current state (flat/long/short).
-                        # - Always prefer close_* over open_*/add_*.
-                        # - Execute at most ONE signal per tick to avoid duplicated/re-entrant orders.
-                        candidates = [s for s in triggered_signals if self._is_signal_allowed(state, s.get('type'))]
-
-                        # If both directions are present while flat, choose by trade_direction (deterministic).
-                        if state == "flat" and candidates:
-                            td = (trade_direction or "both").strip().lower()
-                            if td == "long":
-                                candidates = [s for s in candidates if s.get("type") == "open_long"]
-                            elif td == "short":
-                                candidates = [s for s in candidates if s.get("type") == "open_short"]
-
-                        candidates = sorted(
-                            candidates,
-                            key=lambda s: (
-                                self._signal_priority(s.get("type")),
-                                int(s.get("timestamp") or 0),
-                                str(s.get("type") or ""),
-                            ),
-                        )
+                    if ok:
+                        logger.info(f"Strategy {strategy_id} signal executed: {signal_type} @ {execute_price}")
+                    else:
+                        logger.warning(f"Strategy {strategy_id} signal rejected/failed: {signal_type}")
 
-                        selected = None
-                        now_i = int(time.time())
-                        for s in candidates:
-                            stype = s.get("type")
-                            sts = int(s.get("timestamp") or 0)
-                            if self._should_skip_signal_once_per_candle(
-                                strategy_id=strategy_id,
-                                symbol=symbol,
-                                signal_type=str(stype or ""),
-                                signal_ts=sts,
-                                timeframe_seconds=int(timeframe_seconds or 60),
-                                now_ts=now_i,
-                            ):
-                                continue
-                            selected = s
-                            break
-
-                        if selected:
-                            signal_type = selected.get('type')
-                            position_size = selected.get('position_size', 0)
-                            trigger_price = selected.get('trigger_price', current_price)
-                            execute_price = trigger_price if trigger_price > 0 else current_price
-                            signal_ts = int(selected.get("timestamp") or 0)
-
-                            ok = self._execute_signal(
-                                strategy_id=strategy_id,
-                                strategy_name=strategy_name,
-                                exchange=exchange,
-                                symbol=symbol,
-                                current_price=execute_price,
-                                signal_type=signal_type,
-                                position_size=position_size,
-                                signal_ts=signal_ts,
-                                current_positions=current_positions,
-                                trade_direction=trade_direction,
-                                leverage=leverage,
-                                initial_capital=initial_capital,
-                                market_type=market_type,
-                                execution_mode=execution_mode,
-                                notification_config=notification_config,
-                                trading_config=trading_config,
-                                ai_model_config=ai_model_config,
-                            )
-                            if ok:
-                                logger.info(f"Strategy {strategy_id} signal executed: {signal_type} @ {execute_price}")
-                            else:
-                                logger.warning(f"Strategy {strategy_id} signal rejected/failed: {signal_type}")
+            if price_only:
+                return
 
-                    # Update positions once per tick.
-                    self._update_positions(strategy_id, symbol, current_price)
+            # Update positions once per tick.
+            self._update_positions(strategy_id, symbol, current_price)
 
-                    # Heartbeat for UI observability (once per tick).
-                    self._console_print(
-                        f"[strategy:{strategy_id}] tick price={float(current_price or 0.0):.8f} pending_signals={len(pending_signals or [])}"
-                    )
-                    
-                except Exception as e:
-                    logger.error(f"Strategy {strategy_id} loop error: {str(e)}")
-                    logger.error(traceback.format_exc())
-                    self._console_print(f"[strategy:{strategy_id}] loop error: {e}")
-                    time.sleep(5)
-                    
-        except Exception as e:
-            logger.error(f"Strategy {strategy_id} crashed: {str(e)}")
-            logger.error(traceback.format_exc())
-            self._console_print(f"[strategy:{strategy_id}] fatal error: {e}")
+            # Heartbeat for UI observability (once per tick).
+            self._console_print(
+                f"[strategy:{strategy_id}] tick price={float(current_price or 0.0):.8f} pending_signals={len(pending_signals or [])}"
+            )
         finally:
-            # 清理
-            with self.lock:
-                if strategy_id in self.running_strategies:
-                    del self.running_strategies[strategy_id]
-            self._console_print(f"[strategy:{strategy_id}] loop exited")
-            logger.info(f"Strategy {strategy_id} loop exited")
+            # 即使 tick 中途异常，也保留已刷新的信号状态（与原线程循环的局部变量语义一致）
+            runtime['pending_signals'] = pending_signals
     
     def _sync_positions_with_exchange(self, strategy_id: int, exchange: Any, symbol: str, market_type: str):
         """
@@ -1087,44 +1224,13 @@ class TradingExecutor:
             return []
     
     def _fetch_current_price(self, exchange: Any, symbol: str, market_type: str = None) -> Optional[float]:
-        """获取当前价格 (改用 DataSource)"""
-        # Local in-memory cache first
-        cache_key = (symbol or "").strip().upper()
-        if cache_key and self._price_cache_ttl_sec > 0:
-            now = time.time()
-            try:
-                with self._price_cache_lock:
-                    item = self._price_cache.get(cache_key)
-                    if item:
-                        price, expiry = item
-                        if expiry > now:
-                            return float(price)
-                        # expired
-                        del self._price_cache[cache_key]
-            except Exception:
-                pass
-            
-        try:
-            # 默认使用 binance 获取价格 (或者根据配置)
-            # 简单起见，这里硬编码或使用 generic source
-            ds = DataSourceFactory.get_data_source('binance')
-            # normalized symbol handling is tricky without exchange object. 
-            # But usually DataSource expects standard 'BTC/USDT'
-            ticker = ds.get_ticker(symbol)
-            if ticker:
-                price = float(ticker.get('last') or ticker.get('close') or 0)
-                if price > 0:
-                    if cache_key and self._price_cache_ttl_sec > 0:
-                        try:
-                            with self._price_cache_lock:
-                                self._price_cache[cache_key] = (float(price), time.time() + self._price_cache_ttl_sec)
-                        except Exception:
-                            pass
-                    return price
-        except Exception as e:
-            logger.warning(f"Failed to fetch price: {e}")
-            
-        return None
+        """获取当前价格（共享价格源：同一交易对的所有策略共用一次轮询/请求）"""
+        started = time.perf_counter()
+        price = self.price_feed.get_price(symbol)
+        _PRICE_FETCH_SECONDS.observe(time.perf_counter() - started)
+        if price is None:
+            _PRICE_FETCH_MISSES.inc()
+        return price
 
     def _server_side_stop_loss_signal(
         self,
@@ -1294,14 +1400,12 @@ class TradingExecutor:
                 lp = entry_price
             lp = min(lp, float(current_price))
 
-            # Persist best-effort
+            # Persist best-effort (price tracking only; size/entry stay as stored)
             try:
-                self._update_position(
+                self._update_position_prices(
                     strategy_id=strategy_id,
                     symbol=pos.get('symbol') or symbol,
                     side=side,
-                    size=float(pos.get('size') or 0.0),
-                    entry_price=entry_price,
                     current_price=float(current_price),
                     highest_price=hp,
                     lowest_price=lp,
@@ -1373,116 +1477,56 @@ class TradingExecutor:
         except Exception:
             return None
     
-    def _klines_to_dataframe(self, klines: List[Dict[str, Any]]) -> pd.DataFrame:
-        """将K线数据转换为DataFrame"""
-        if not klines:
-            # 返回空的 DataFrame，包含正确的列
-            return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'])
-        
-        # 创建 DataFrame
-        df = pd.DataFrame(klines)
-        
-        # Convert time column.
-        # IMPORTANT: use UTC tz-aware index to avoid timezone skew when computing candle boundaries.
-        if 'time' in df.columns:
-            df['time'] = pd.to_datetime(df['time'], unit='s', utc=True)
-            df = df.set_index('time')
-        elif 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s', utc=True)
-            df = df.set_index('timestamp')
-        
-        # 确保只包含需要的列
-        required_columns = ['open', 'high', 'low', 'close', 'volume']
-        available_columns = [col for col in required_columns if col in df.columns]
-        if not available_columns:
-            logger.warning("K-lines are missing required columns")
-            return pd.DataFrame(columns=required_columns)
-        
-        df = df[available_columns]
-        
-        # 强制转换所有数值列为 float64 类型
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            if col in df.columns:
-                # 先转换为数值类型，然后强制转换为 float64
-                df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
-        
-        # 删除包含 NaN 的行
-        df = df.dropna()
-        
-        return df
-
-    def _update_dataframe_with_current_price(self, df: pd.DataFrame, current_price: float, timeframe: str) -> pd.DataFrame:
-        """
-        使用当前价格更新DataFrame的最后一根K线（用于实时计算）
-        """
-        if df is None or len(df) == 0:
-            return df
-            
-        try:
-            # 获取最后一根K线的时间
-            last_time = df.index[-1]
-            
-            # 计算当前时间对应的K线起始时间
-            from app.data_sources.base import TIMEFRAME_SECONDS
-            timeframe_key = timeframe
-            if timeframe_key not in TIMEFRAME_SECONDS:
-                timeframe_key = str(timeframe_key).upper()
-            if timeframe_key not in TIMEFRAME_SECONDS:
-                timeframe_key = str(timeframe_key).lower()
-            tf_seconds = TIMEFRAME_SECONDS.get(timeframe_key, 60)
-            
-            # Use epoch seconds directly to avoid naive datetime timezone conversion issues.
-            last_ts = float(last_time.timestamp())
-            now_ts = float(time.time())
-            
-            # 计算当前价格所属的 K 线开始时间
-            current_period_start = int(now_ts // tf_seconds) * tf_seconds
-            
-            # 检查最后一根K线是否就是当前周期的
-            if abs(last_ts - current_period_start) < 2:
-                # 更新最后一根
-                df.iloc[-1, df.columns.get_loc('close')] = current_price
-                df.iloc[-1, df.columns.get_loc('high')] = max(df.iloc[-1]['high'], current_price)
-                df.iloc[-1, df.columns.get_loc('low')] = min(df.iloc[-1]['low'], current_price)
-            elif current_period_start > last_ts:
-                # 追加新行
-                new_row = pd.DataFrame({
-                    'open': [current_price],
-                    'high': [current_price],
-                    'low': [current_price],
-                    'close': [current_price],
-                    'volume': [0.0]
-                }, index=[pd.to_datetime(current_period_start, unit='s', utc=True)])
-                
-                df = pd.concat([df, new_row])
-            
-            return df
-            
-        except Exception as e:
-            logger.error(f"Failed to update realtime candle: {str(e)}")
-            return df
-    
     def _execute_indicator_with_prices(
         self, indicator_code: str, df: pd.DataFrame, trading_config: Dict[str, Any], 
         initial_highest_price: float = 0.0,
         initial_position: int = 0,
         initial_avg_entry_price: float = 0.0,
         initial_position_count: int = 0,
-        initial_last_add_price: float = 0.0
+        initial_last_add_price: float = 0.0,
+        strategy_id: Optional[int] = None,
+        candle_ring: Any = None
     ) -> Optional[Dict[str, Any]]:
         """
         执行指标代码并提取待触发的信号和价格
+
+        传入 strategy_id 与 candle_ring 时按分组去重：同组策略在同一份K线上共享一次执行结果，
+        信号提取仍使用各自的 trading_config。
         """
         try:
             # 执行指标代码
-            executed_df, exec_env = self._execute_indicator_df(
-                indicator_code, df, trading_config, 
-                initial_highest_price=initial_highest_price,
-                initial_position=initial_position,
-                initial_avg_entry_price=initial_avg_entry_price,
-                initial_position_count=initial_position_count,
-                initial_last_add_price=initial_last_add_price
-            )
+            def run():
+                return self._execute_indicator_df(
+                    indicator_code, df, trading_config, 
+                    initial_highest_price=initial_highest_price,
+                    initial_position=initial_position,
+                    initial_avg_entry_price=initial_avg_entry_price,
+                    initial_position_count=initial_position_count,
+                    initial_last_add_price=initial_last_add_price
+                )
+
+            if self.indicator_dedup is not None and strategy_id is not None and candle_ring is not None:
+                group_key = self.indicator_dedup.group_key(indicator_code, candle_ring.symbol, candle_ring.timeframe, {
+                    'trading_config': trading_config or {},
+                    'leverage': float(trading_config.get('leverage', 1)),
+                    'initial_capital': float(trading_config.get('initial_capital', 1000)),
+                    'trade_direction': str(trading_config.get('trade_direction', 'long')),
+                    'initial_highest_price': float(initial_highest_price),
+                    'initial_position': int(initial_position),
+                    'initial_avg_entry_price': float(initial_avg_entry_price),
+                    'initial_position_count': int(initial_position_count),
+                    'initial_last_add_price': float(initial_last_add_price),
+                })
+                self.indicator_dedup.assign(strategy_id, group_key)
+                def run_shared():
+                    result = run()
+                    # 执行失败不缓存
+                    return result if result[0] is not None else None
+
+                shared = self.indicator_dedup.compute(group_key, (id(candle_ring), candle_ring.version), run_shared)
+                executed_df, exec_env = shared if shared is not None else (None, {})
+            else:
+                executed_df, exec_env = run()
             if executed_df is None:
                 return None
             
@@ -1492,210 +1536,16 @@ class TradingExecutor:
             # 提取最后一根K线的时间
             last_kline_time = int(df.index[-1].timestamp()) if hasattr(df.index[-1], 'timestamp') else int(time.time())
             
-            # 提取待触发的信号
-            pending_signals = []
-            
-            # Supported indicator signal formats:
-            # - Preferred (simple): df['buy'], df['sell'] as boolean
-            # - Internal (4-way): df['open_long'], df['close_long'], df['open_short'], df['close_short'] as boolean
-            if all(col in executed_df.columns for col in ['buy', 'sell']) and not all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
-                # Normalize buy/sell into 4-way columns for execution.
-                td = trading_config.get('trade_direction', trading_config.get('tradeDirection', 'both'))
-                td = str(td or 'both').lower()
-                if td not in ['long', 'short', 'both']:
-                    td = 'both'
-
-                buy = executed_df['buy'].fillna(False).astype(bool)
-                sell = executed_df['sell'].fillna(False).astype(bool)
-
-                executed_df = executed_df.copy()
-                if td == 'long':
-                    executed_df['open_long'] = buy
-                    executed_df['close_long'] = sell
-                    executed_df['open_short'] = False
-                    executed_df['close_short'] = False
-                elif td == 'short':
-                    executed_df['open_long'] = False
-                    executed_df['close_long'] = False
-                    executed_df['open_short'] = sell
-                    executed_df['close_short'] = buy
-                else:
-                    executed_df['open_long'] = buy
-                    executed_df['close_short'] = buy
-                    executed_df['open_short'] = sell
-                    executed_df['close_long'] = sell
-
-            # Check for 4-way columns after normalization
-            if all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
-                # 优化点3: 防“信号闪烁” (Repainting)
-                signal_mode = trading_config.get('signal_mode', 'confirmed') # 'confirmed' or 'aggressive'
-                exit_signal_mode = trading_config.get('exit_signal_mode', 'aggressive') # 'confirmed' or 'aggressive'
-                
-                entry_check_set = set()
-                exit_check_set = set()
-                
-                if len(executed_df) > 1:
-                    # 始终检查上一根已完成K线
-                    entry_check_set.add(len(executed_df) - 2)
-                    exit_check_set.add(len(executed_df) - 2)
-                
-                if signal_mode == 'aggressive' and len(executed_df) > 0:
-                    entry_check_set.add(len(executed_df) - 1)
-                
-                if exit_signal_mode == 'aggressive' and len(executed_df) > 0:
-                    exit_check_set.add(len(executed_df) - 1)
-                
-                # 统一遍历索引（保持确定性排序）
-                check_indices = sorted(entry_check_set.union(exit_check_set), reverse=True)
-                
-                for idx in check_indices:
-                    # 获取该K线的收盘价（作为默认触发价）
-                    close_price = float(executed_df['close'].iloc[idx])
-                    # 该信号的时间戳
-                    signal_timestamp = int(executed_df.index[idx].timestamp()) if hasattr(executed_df.index[idx], 'timestamp') else last_kline_time
-                    
-                    # 开多信号（仅在 entry_check_set 中检查）
-                    if idx in entry_check_set and executed_df['open_long'].iloc[idx]:
-                        trigger_price = close_price
-                        position_size = 0.08
-                        if 'position_size' in executed_df.columns:
-                            pos_size = executed_df['position_size'].iloc[idx]
-                            if pos_size > 0:
-                                position_size = float(pos_size)
-                        
-                        if not any(s['type'] == 'open_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'open_long',
-                                'trigger_price': trigger_price,
-                                'position_size': position_size,
-                                'timestamp': signal_timestamp
-                            })
-                    
-                    # 平多信号
-                    if idx in exit_check_set and executed_df['close_long'].iloc[idx]:
-                        trigger_price = close_price
-                        if not any(s['type'] == 'close_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'close_long',
-                                'trigger_price': trigger_price,
-                                'position_size': 0,
-                                'timestamp': signal_timestamp
-                            })
-                    
-                    # 开空信号
-                    if idx in entry_check_set and executed_df['open_short'].iloc[idx]:
-                        trigger_price = close_price
-                        position_size = 0.08
-                        if 'position_size' in executed_df.columns:
-                            pos_size = executed_df['position_size'].iloc[idx]
-                            if pos_size > 0:
-                                position_size = float(pos_size)
-                        
-                        if not any(s['type'] == 'open_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'open_short',
-                                'trigger_price': trigger_price,
-                                'position_size': position_size,
-                                'timestamp': signal_timestamp
-                            })
-                    
-                    # 平空信号
-                    if idx in exit_check_set and executed_df['close_short'].iloc[idx]:
-                        trigger_price = close_price
-                        if not any(s['type'] == 'close_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'close_short',
-                                'trigger_price': trigger_price,
-                                'position_size': 0,
-                                'timestamp': signal_timestamp
-                            })
-                            
-                    # 加多信号
-                    if idx in entry_check_set and 'add_long' in executed_df.columns and executed_df['add_long'].iloc[idx]:
-                        trigger_price = close_price
-                        position_size = 0.06
-                        if 'position_size' in executed_df.columns:
-                            pos_size = executed_df['position_size'].iloc[idx]
-                            if pos_size > 0:
-                                position_size = float(pos_size)
-
-                        if not any(s['type'] == 'add_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'add_long',
-                                'trigger_price': trigger_price,
-                                'position_size': position_size,
-                                'timestamp': signal_timestamp
-                            })
-                            
-                    # 加空信号
-                    if idx in entry_check_set and 'add_short' in executed_df.columns and executed_df['add_short'].iloc[idx]:
-                        trigger_price = close_price
-                        position_size = 0.06
-                        if 'position_size' in executed_df.columns:
-                            pos_size = executed_df['position_size'].iloc[idx]
-                            if pos_size > 0:
-                                position_size = float(pos_size)
-
-                        if not any(s['type'] == 'add_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'add_short',
-                                'trigger_price': trigger_price,
-                                'position_size': position_size,
-                                'timestamp': signal_timestamp
-                            })
-
-                    # Reduce / scale-out signals (optional)
-                    # These are used by position management rules (trend/adverse reduce) and should be treated as exits.
-                    if idx in exit_check_set and 'reduce_long' in executed_df.columns and executed_df['reduce_long'].iloc[idx]:
-                        trigger_price = close_price
-                        reduce_pct = 0.1
-                        if 'reduce_size' in executed_df.columns:
-                            try:
-                                reduce_pct = float(executed_df['reduce_size'].iloc[idx] or 0)
-                            except Exception:
-                                reduce_pct = 0.1
-                        elif 'position_size' in executed_df.columns:
-                            try:
-                                reduce_pct = float(executed_df['position_size'].iloc[idx] or 0)
-                            except Exception:
-                                reduce_pct = 0.1
-                        if reduce_pct <= 0:
-                            reduce_pct = 0.1
-                        if not any(s['type'] == 'reduce_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'reduce_long',
-                                'trigger_price': trigger_price,
-                                'position_size': reduce_pct,
-                                'timestamp': signal_timestamp
-                            })
-
-                    if idx in exit_check_set and 'reduce_short' in executed_df.columns and executed_df['reduce_short'].iloc[idx]:
-                        trigger_price = close_price
-                        reduce_pct = 0.1
-                        if 'reduce_size' in executed_df.columns:
-                            try:
-                                reduce_pct = float(executed_df['reduce_size'].iloc[idx] or 0)
-                            except Exception:
-                                reduce_pct = 0.1
-                        elif 'position_size' in executed_df.columns:
-                            try:
-                                reduce_pct = float(executed_df['position_size'].iloc[idx] or 0)
-                            except Exception:
-                                reduce_pct = 0.1
-                        if reduce_pct <= 0:
-                            reduce_pct = 0.1
-                        if not any(s['type'] == 'reduce_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'reduce_short',
-                                'trigger_price': trigger_price,
-                                'position_size': reduce_pct,
-                                'timestamp': signal_timestamp
-                            })
-            
+            # 提取待触发的信号（每个信号带 trace，用于追踪从K线收盘到交易所成交的延迟）
+            pending_signals = self._extract_pending_signals(executed_df, trading_config, last_kline_time)
+            signal_trace.attach_traces(pending_signals)
+
             return {
                 'pending_signals': pending_signals,
                 'last_kline_time': last_kline_time,
-                'new_highest_price': new_highest_price
+                'new_highest_price': new_highest_price,
+                # 脚本实现了增量协议（init/update）且在进程内执行时，后续 tick 可逐K线推进
+                'incremental': IncrementalSession.from_env(exec_env) if incremental_enabled() else None
             }
             
         except Exception as e:
@@ -1703,6 +1553,258 @@ class TradingExecutor:
             logger.error(traceback.format_exc())
             return None
     
+    def _start_incremental(
+        self, strategy_id: int, indicator_result: Dict[str, Any], df: pd.DataFrame, candle_ring: Any
+    ) -> Optional[IncrementalSession]:
+        """全量执行后，脚本实现了增量协议时在同一份K线上 init，返回会话（不支持/失败返回 None）"""
+        session = indicator_result.get('incremental')
+        if session is None:
+            return None
+        try:
+            session.start(df, candle_ring.reconciles)
+            return session
+        except Exception as e:
+            logger.warning(f"Strategy {strategy_id} incremental indicator init failed, using full recompute: {e}")
+            return None
+
+    def _incremental_indicator_result(
+        self, strategy_id: int, runtime: Dict[str, Any], candle_ring: Any, trading_config: Dict[str, Any],
+        position_state: Tuple[Any, ...] = ()
+    ) -> Optional[Dict[str, Any]]:
+        """
+        按增量协议推进到K线缓冲的最新一根；无法增量时返回 None
+
+        会话的执行环境里是 init 时注入的 initial_position / initial_avg_entry_price / initial_highest_price 等，
+        持仓状态（position_state）与当时不同就退回全量重算（之后以新的持仓状态重新 init）。
+        """
+        session = runtime.get('incremental')
+        if session is None or session.reconciles != candle_ring.reconciles:
+            return None
+        if runtime.get('incremental_position') != tuple(position_state):
+            runtime['incremental'] = None
+            return None
+        try:
+            times, ohlcv = candle_ring.arrays()
+            session.advance(times, ohlcv)
+            last_kline_time = int(times[-1])
+            pending_signals = self._extract_pending_signals(session.frame(), trading_config, last_kline_time)
+            signal_trace.attach_traces(pending_signals)
+            return {
+                'pending_signals': pending_signals,
+                'last_kline_time': last_kline_time,
+                'new_highest_price': session.highest_price(),
+            }
+        except Exception as e:
+            logger.warning(f"Strategy {strategy_id} incremental indicator update failed, using full recompute: {e}")
+            runtime['incremental'] = None
+            return None
+
+    def _extract_pending_signals(
+        self, executed_df: pd.DataFrame, trading_config: Dict[str, Any], last_kline_time: int
+    ) -> List[Dict[str, Any]]:
+        """从执行后 df 的最后两根K线提取待触发信号（全量执行与增量执行共用）"""
+        pending_signals = []
+
+        
+        # Supported indicator signal formats:
+        # - Preferred (simple): df['buy'], df['sell'] as boolean
+        # - Internal (4-way): df['open_long'], df['close_long'], df['open_short'], df['close_short'] as boolean
+        if all(col in executed_df.columns for col in ['buy', 'sell']) and not all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
+            # Normalize buy/sell into 4-way columns for execution.
+            td = trading_config.get('trade_direction', trading_config.get('tradeDirection', 'both'))
+            td = str(td or 'both').lower()
+            if td not in ['long', 'short', 'both']:
+                td = 'both'
+
+            buy = executed_df['buy'].fillna(False).astype(bool)
+            sell = executed_df['sell'].fillna(False).astype(bool)
+
+            executed_df = executed_df.copy()
+            if td == 'long':
+                executed_df['open_long'] = buy
+                executed_df['close_long'] = sell
+                executed_df['open_short'] = False
+                executed_df['close_short'] = False
+            elif td == 'short':
+                executed_df['open_long'] = False
+                executed_df['close_long'] = False
+                executed_df['open_short'] = sell
+                executed_df['close_short'] = buy
+            else:
+                executed_df['open_long'] = buy
+                executed_df['close_short'] = buy
+                executed_df['open_short'] = sell
+                executed_df['close_long'] = sell
+
+        # Check for 4-way columns after normalization
+        if all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
+            # 优化点3: 防“信号闪烁” (Repainting)
+            signal_mode = trading_config.get('signal_mode', 'confirmed') # 'confirmed' or 'aggressive'
+            exit_signal_mode = trading_config.get('exit_signal_mode', 'aggressive') # 'confirmed' or 'aggressive'
+            
+            entry_check_set = set()
+            exit_check_set = set()
+            
+            if len(executed_df) > 1:
+                # 始终检查上一根已完成K线
+                entry_check_set.add(len(executed_df) - 2)
+                exit_check_set.add(len(executed_df) - 2)
+            
+            if signal_mode == 'aggressive' and len(executed_df) > 0:
+                entry_check_set.add(len(executed_df) - 1)
+            
+            if exit_signal_mode == 'aggressive' and len(executed_df) > 0:
+                exit_check_set.add(len(executed_df) - 1)
+            
+            # 统一遍历索引（保持确定性排序）
+            check_indices = sorted(entry_check_set.union(exit_check_set), reverse=True)
+            
+            for idx in check_indices:
+                # 获取该K线的收盘价（作为默认触发价）
+                close_price = float(executed_df['close'].iloc[idx])
+                # 该信号的时间戳
+                signal_timestamp = int(executed_df.index[idx].timestamp()) if hasattr(executed_df.index[idx], 'timestamp') else last_kline_time
+                
+                # 开多信号（仅在 entry_check_set 中检查）
+                if idx in entry_check_set and executed_df['open_long'].iloc[idx]:
+                    trigger_price = close_price
+                    position_size = 0.08
+                    if 'position_size' in executed_df.columns:
+                        pos_size = executed_df['position_size'].iloc[idx]
+                        if pos_size > 0:
+                            position_size = float(pos_size)
+                    
+                    if not any(s['type'] == 'open_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'open_long',
+                            'trigger_price': trigger_price,
+                            'position_size': position_size,
+                            'timestamp': signal_timestamp
+                        })
+                
+                # 平多信号
+                if idx in exit_check_set and executed_df['close_long'].iloc[idx]:
+                    trigger_price = close_price
+                    if not any(s['type'] == 'close_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'close_long',
+                            'trigger_price': trigger_price,
+                            'position_size': 0,
+                            'timestamp': signal_timestamp
+                        })
+                
+                # 开空信号
+                if idx in entry_check_set and executed_df['open_short'].iloc[idx]:
+                    trigger_price = close_price
+                    position_size = 0.08
+                    if 'position_size' in executed_df.columns:
+                        pos_size = executed_df['position_size'].iloc[idx]
+                        if pos_size > 0:
+                            position_size = float(pos_size)
+                    
+                    if not any(s['type'] == 'open_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'open_short',
+                            'trigger_price': trigger_price,
+                            'position_size': position_size,
+                            'timestamp': signal_timestamp
+                        })
+                
+                # 平空信号
+                if idx in exit_check_set and executed_df['close_short'].iloc[idx]:
+                    trigger_price = close_price
+                    if not any(s['type'] == 'close_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'close_short',
+                            'trigger_price': trigger_price,
+                            'position_size': 0,
+                            'timestamp': signal_timestamp
+                        })
+                        
+                # 加多信号
+                if idx in entry_check_set and 'add_long' in executed_df.columns and executed_df['add_long'].iloc[idx]:
+                    trigger_price = close_price
+                    position_size = 0.06
+                    if 'position_size' in executed_df.columns:
+                        pos_size = executed_df['position_size'].iloc[idx]
+                        if pos_size > 0:
+                            position_size = float(pos_size)
+
+                    if not any(s['type'] == 'add_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'add_long',
+                            'trigger_price': trigger_price,
+                            'position_size': position_size,
+                            'timestamp': signal_timestamp
+                        })
+                        
+                # 加空信号
+                if idx in entry_check_set and 'add_short' in executed_df.columns and executed_df['add_short'].iloc[idx]:
+                    trigger_price = close_price
+                    position_size = 0.06
+                    if 'position_size' in executed_df.columns:
+                        pos_size = executed_df['position_size'].iloc[idx]
+                        if pos_size > 0:
+                            position_size = float(pos_size)
+
+                    if not any(s['type'] == 'add_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'add_short',
+                            'trigger_price': trigger_price,
+                            'position_size': position_size,
+                            'timestamp': signal_timestamp
+                        })
+
+                # Reduce / scale-out signals (optional)
+                # These are used by position management rules (trend/adverse reduce) and should be treated as exits.
+                if idx in exit_check_set and 'reduce_long' in executed_df.columns and executed_df['reduce_long'].iloc[idx]:
+                    trigger_price = close_price
+                    reduce_pct = 0.1
+                    if 'reduce_size' in executed_df.columns:
+                        try:
+                            reduce_pct = float(executed_df['reduce_size'].iloc[idx] or 0)
+                        except Exception:
+                            reduce_pct = 0.1
+                    elif 'position_size' in executed_df.columns:
+                        try:
+                            reduce_pct = float(executed_df['position_size'].iloc[idx] or 0)
+                        except Exception:
+                            reduce_pct = 0.1
+                    if reduce_pct <= 0:
+                        reduce_pct = 0.1
+                    if not any(s['type'] == 'reduce_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'reduce_long',
+                            'trigger_price': trigger_price,
+                            'position_size': reduce_pct,
+                            'timestamp': signal_timestamp
+                        })
+
+                if idx in exit_check_set and 'reduce_short' in executed_df.columns and executed_df['reduce_short'].iloc[idx]:
+                    trigger_price = close_price
+                    reduce_pct = 0.1
+                    if 'reduce_size' in executed_df.columns:
+                        try:
+                            reduce_pct = float(executed_df['reduce_size'].iloc[idx] or 0)
+                        except Exception:
+                            reduce_pct = 0.1
+                    elif 'position_size' in executed_df.columns:
+                        try:
+                            reduce_pct = float(executed_df['position_size'].iloc[idx] or 0)
+                        except Exception:
+                            reduce_pct = 0.1
+                    if reduce_pct <= 0:
+                        reduce_pct = 0.1
+                    if not any(s['type'] == 'reduce_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'reduce_short',
+                            'trigger_price': trigger_price,
+                            'position_size': reduce_pct,
+                            'timestamp': signal_timestamp
+                        })
+
+        return pending_signals
+
     def _execute_indicator_df(
         self, indicator_code: str, df: pd.DataFrame, trading_config: Dict[str, Any], 
         initial_highest_price: float = 0.0,
@@ -1712,6 +1814,8 @@ class TradingExecutor:
         initial_last_add_price: float = 0.0
     ) -> tuple[Optional[pd.DataFrame], dict]:
         """执行指标代码，返回执行后的DataFrame和执行环境"""
+        started = time.perf_counter()
+        mode = 'inprocess'
         try:
             # 确保 DataFrame 的所有数值列都是 float64 类型
             df = df.copy()
@@ -1759,32 +1863,48 @@ class TradingExecutor:
                 'initial_position': int(initial_position),
                 'initial_avg_entry_price': float(initial_avg_entry_price),
                 'initial_position_count': int(initial_position_count),
-                'initial_last_add_price': float(initial_last_add_price)
+                'initial_last_add_price': float(initial_last_add_price),
+                **get_incremental_helpers()
             }
             
-            import builtins
-            def safe_import(name, *args, **kwargs):
-                allowed_modules = ['numpy', 'pandas', 'math', 'json', 'time']
-                if name in allowed_modules or name.split('.')[0] in allowed_modules:
-                    return builtins.__import__(name, *args, **kwargs)
-                raise ImportError(f"不允许导入模块: {name}")
-            
-            safe_builtins = {k: getattr(builtins, k) for k in dir(builtins) 
-                           if not k.startswith('_') and k not in [
-                               'eval', 'exec', 'compile', 'open', 'input',
-                               'help', 'exit', 'quit', '__import__',
-                               'copyright', 'credits', 'license'
-                           ]}
-            safe_builtins['__import__'] = safe_import
-            
+            sandbox = get_indicator_sandbox()
+            if sandbox is not None:
+                mode = 'sandbox'
+                # 在沙箱进程中执行：策略线程里 signal 超时无效，由子进程提供墙钟超时与内存上限
+                sandbox_env = {k: v for k, v in local_vars.items()
+                               if k not in ('df', 'open', 'high', 'low', 'close', 'volume', 'signals', 'np', 'pd')}
+                try:
+                    executed_df, exec_env = sandbox.execute(
+                        indicator_code,
+                        df,
+                        env=sandbox_env,
+                        allowed_modules=['numpy', 'pandas', 'math', 'json', 'time'],
+                        signals_dtype='float64',
+                        return_keys=('output', 'highest_price'),
+                        timeout=self.indicator_timeout_sec
+                    )
+                except SandboxUnavailableError as e:
+                    # 沙箱自身故障不应让实盘 tick 失败：本次退回进程内执行
+                    logger.warning(f"Indicator sandbox unavailable, executing in-process: {e}")
+                    sandbox = None
+                    mode = 'inprocess'
+            if sandbox is not None:
+                output_obj = exec_env.get('output')
+                has_output_signals = isinstance(output_obj, dict) and isinstance(output_obj.get('signals'), list) and len(output_obj.get('signals')) > 0
+                if has_output_signals and not all(col in executed_df.columns for col in ['buy', 'sell']):
+                    raise ValueError(
+                        "Invalid indicator script: output['signals'] is provided, but df['buy'] and df['sell'] are missing. "
+                        "Please set df['buy'] and df['sell'] as boolean columns (len == len(df))."
+                    )
+                return executed_df, exec_env
+
+            # 编译结果与受限 builtins 按代码哈希缓存，避免每个 tick 重复编译
+            code_cache = get_code_cache()
             exec_env = local_vars.copy()
-            exec_env['__builtins__'] = safe_builtins
-            
-            pre_import_code = "import numpy as np\nimport pandas as pd\n"
-            exec(pre_import_code, exec_env)
+            exec_env['__builtins__'] = code_cache.safe_builtins(('numpy', 'pandas', 'math', 'json', 'time'))
             
-            # 这里的 safe_exec_code 假设已存在
-            exec(indicator_code, exec_env)
+            exec(code_cache.compile("import numpy as np\nimport pandas as pd\n"), exec_env)
+            exec(code_cache.compile(indicator_code), exec_env)
             
             executed_df = exec_env.get('df', df)
 
@@ -1800,9 +1920,12 @@ class TradingExecutor:
             return executed_df, exec_env
             
         except Exception as e:
+            _INDICATOR_ERRORS.labels(mode).inc()
             logger.error(f"Failed to execute indicator script: {str(e)}")
             logger.error(traceback.format_exc())
             return None, {}
+        finally:
+            _INDICATOR_SECONDS.labels(mode).observe(time.perf_counter() - started)
     
     def _execute_indicator(self, indicator_code: str, df: pd.DataFrame, trading_config: Dict[str, Any]) -> Optional[Any]:
         """兼容旧版本"""
@@ -1812,26 +1935,9 @@ class TradingExecutor:
         return 0
 
     def _get_current_positions(self, strategy_id: int, symbol: str) -> List[Dict[str, Any]]:
-        """获取当前持仓（支持symbol规范化匹配）"""
+        """获取当前持仓（支持symbol规范化匹配；读内存持仓账本，不再每个 tick 查库）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                query = """
-                    SELECT id, symbol, side, size, entry_price, highest_price, lowest_price
-                    FROM qd_strategy_positions
-                    WHERE strategy_id = %s
-                """
-                cursor.execute(query, (strategy_id,))
-                all_positions = cursor.fetchall()
-                
-                matched_positions = []
-                for pos in all_positions:
-                    # 简化匹配逻辑：只匹配前缀
-                    if pos['symbol'].split(':')[0] == symbol.split(':')[0]:
-                        matched_positions.append(pos)
-                
-                cursor.close()
-                return matched_positions
+            return self.position_book.get_positions(strategy_id, symbol)
         except Exception as e:
             logger.error(f"Failed to fetch positions: {str(e)}")
             return []
@@ -1862,6 +1968,7 @@ class TradingExecutor:
         trading_config: Optional[Dict[str, Any]] = None,
         ai_model_config: Optional[Dict[str, Any]] = None,
         signal_ts: int = 0,
+        trace: Optional[Dict[str, Any]] = None,
     ):
         """执行具体的交易信号"""
         try:
@@ -1984,6 +2091,7 @@ class TradingExecutor:
                 execution_mode=execution_mode,
                 notification_config=notification_config,
                 signal_ts=int(signal_ts or 0),
+                trace=trace,
             )
             
             if order_result and order_result.get('success'):
@@ -1993,11 +2101,8 @@ class TradingExecutor:
                     return True
 
                 # 更新数据库状态 (signal mode / local simulation)
+                # 先改内存持仓，再写成交记录：成交记录与该策略的持仓变更在同一事务中落盘
                 if 'open' in sig or 'add' in sig:
-                    self._record_trade(
-                        strategy_id=strategy_id, symbol=symbol, type=signal_type,
-                        price=current_price, amount=amount, value=amount*current_price
-                    )
                     side = 'short' if 'short' in signal_type else 'long'
                     
                     # 查找现有持仓以计算均价
@@ -2014,33 +2119,36 @@ class TradingExecutor:
                         strategy_id=strategy_id, symbol=symbol, side=side,
                         size=new_size, entry_price=new_entry, current_price=current_price
                     )
-                elif sig.startswith("reduce_"):
-                    # Partial scale-out: reduce position size, keep entry price unchanged.
                     self._record_trade(
                         strategy_id=strategy_id, symbol=symbol, type=signal_type,
                         price=current_price, amount=amount, value=amount*current_price
                     )
+                elif sig.startswith("reduce_"):
+                    # Partial scale-out: reduce position size, keep entry price unchanged.
                     side = 'short' if 'short' in signal_type else 'long'
                     old_pos = next((p for p in current_positions if p.get('side') == side), None)
-                    if not old_pos:
-                        return True
-                    old_size = float(old_pos.get('size') or 0.0)
-                    old_entry = float(old_pos.get('entry_price') or 0.0)
-                    new_size = max(0.0, old_size - float(amount or 0.0))
-                    if new_size <= old_size * 0.001:
-                        self._close_position(strategy_id, symbol, side)
-                    else:
-                        self._update_position(
-                            strategy_id=strategy_id, symbol=symbol, side=side,
-                            size=new_size, entry_price=old_entry, current_price=current_price
-                        )
-                elif 'close' in sig:
+                    if old_pos:
+                        old_size = float(old_pos.get('size') or 0.0)
+                        old_entry = float(old_pos.get('entry_price') or 0.0)
+                        new_size = max(0.0, old_size - float(amount or 0.0))
+                        if new_size <= old_size * 0.001:
+                            self._close_position(strategy_id, symbol, side)
+                        else:
+                            self._update_position(
+                                strategy_id=strategy_id, symbol=symbol, side=side,
+                                size=new_size, entry_price=old_entry, current_price=current_price
+                            )
                     self._record_trade(
                         strategy_id=strategy_id, symbol=symbol, type=signal_type,
                         price=current_price, amount=amount, value=amount*current_price
                     )
+                elif 'close' in sig:
                     side = 'short' if 'short' in signal_type else 'long'
                     self._close_position(strategy_id, symbol, side)
+                    self._record_trade(
+                        strategy_id=strategy_id, symbol=symbol, type=signal_type,
+                        price=current_price, amount=amount, value=amount*current_price
+                    )
 
                 return True
 
@@ -2229,6 +2337,7 @@ class TradingExecutor:
         execution_mode: str = 'signal',
         notification_config: Optional[Dict[str, Any]] = None,
         signal_ts: int = 0,
+        trace: Optional[Dict[str, Any]] = None,
     ) -> Optional[Dict[str, Any]]:
         """
         Convert a signal into a concrete pending order and enqueue it into DB.
@@ -2255,6 +2364,8 @@ class TradingExecutor:
                 "close_fallback_to_market": bool(close_fallback_to_market),
                 "open_fallback_to_market": bool(open_fallback_to_market),
             }
+            if trace:
+                extra_payload["trace"] = trace
             pending_id = self._enqueue_pending_order(
                 strategy_id=strategy_id,
                 symbol=symbol,
@@ -2437,8 +2548,17 @@ class TradingExecutor:
                     ),
                 )
                 pending_id = cur.lastrowid
+                trace = payload.get("trace")
+                if pending_id is not None and isinstance(trace, dict):
+                    try:
+                        signal_trace.insert_trace(cur, int(pending_id), trace, int(strategy_id), symbol,
+                                                  signal_type, mode, time.time())
+                    except Exception as e:
+                        logger.debug(f"signal trace insert failed: pending_id={pending_id}, err={e}")
                 db.commit()
                 cur.close()
+            # 提交后立即唤醒 PendingOrderWorker（不再等待它的轮询）
+            notify_pending_orders()
             return int(pending_id) if pending_id is not None else None
         except Exception as e:
             logger.error(f"enqueue_pending_order failed: {e}")
@@ -2455,20 +2575,11 @@ class TradingExecutor:
         return initial_capital
 
     def _record_trade(self, strategy_id: int, symbol: str, type: str, price: float, amount: float, value: float, profit: float = None, commission: float = None):
-        """记录交易到数据库"""
+        """记录交易到数据库（同步写入，与该策略尚未落盘的持仓变更在同一事务中提交）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                query = """
-                    INSERT INTO qd_strategy_trades (
-                        strategy_id, symbol, type, price, amount, value, commission, profit, created_at
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                """
-                cursor.execute(query, (strategy_id, symbol, type, price, amount, value, commission or 0, profit, int(time.time())))
-                db.commit()
-                cursor.close()
+            self.position_book.record_trade(
+                strategy_id, symbol, type, price, amount, value, profit=profit, commission=commission
+            )
         except Exception as e:
             logger.error(f"Failed to record trade: {e}")
 
@@ -2483,40 +2594,37 @@ class TradingExecutor:
         highest_price: float = 0.0,
         lowest_price: float = 0.0,
     ):
-        """更新持仓状态"""
+        """更新持仓状态（内存账本，后台合并写回）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                # 简化：直接 Update 或 Insert
-                upsert_query = """
-                    INSERT INTO qd_strategy_positions (
-                        strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, updated_at
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    ) ON CONFLICT(strategy_id, symbol, side) DO UPDATE SET
-                        size = excluded.size,
-                        entry_price = excluded.entry_price,
-                        current_price = excluded.current_price,
-                        highest_price = CASE WHEN excluded.highest_price > 0 THEN excluded.highest_price ELSE highest_price END,
-                        lowest_price = CASE WHEN excluded.lowest_price > 0 THEN excluded.lowest_price ELSE lowest_price END,
-                        updated_at = excluded.updated_at
-                """
-                cursor.execute(upsert_query, (
-                    strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, int(time.time())
-                ))
-                db.commit()
-                cursor.close()
+            self.position_book.upsert(
+                strategy_id, symbol, side, size, entry_price, current_price,
+                highest_price=highest_price, lowest_price=lowest_price
+            )
         except Exception as e:
             logger.error(f"Failed to update position: {e}")
 
+    def _update_position_prices(
+        self,
+        strategy_id: int,
+        symbol: str,
+        side: str,
+        current_price: float,
+        highest_price: float = 0.0,
+        lowest_price: float = 0.0,
+    ):
+        """只更新持仓的价格跟踪字段（current/highest/lowest），不写 size/entry_price"""
+        try:
+            self.position_book.update_price_tracking(
+                strategy_id, symbol, side, current_price,
+                highest_price=highest_price, lowest_price=lowest_price
+            )
+        except Exception as e:
+            logger.error(f"Failed to update position prices: {e}")
+
     def _close_position(self, strategy_id: int, symbol: str, side: str):
         """平仓：删除持仓记录"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                cursor.execute("DELETE FROM qd_strategy_positions WHERE strategy_id = %s AND symbol = %s AND side = %s", (strategy_id, symbol, side))
-                db.commit()
-                cursor.close()
+            self.position_book.close(strategy_id, symbol, side)
         except Exception as e:
             logger.error(f"Failed to close position: {e}")
     
@@ -2526,11 +2634,7 @@ class TradingExecutor:
     def _update_positions(self, strategy_id: int, symbol: str, current_price: float):
         """更新所有持仓的当前价格"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                cursor.execute("UPDATE qd_strategy_positions SET current_price = %s WHERE strategy_id = %s AND symbol = %s", (current_price, strategy_id, symbol))
-                db.commit()
-                cursor.close()
+            self.position_book.update_current_price(strategy_id, symbol, current_price)
         except Exception:
             pass
             
@@ -6,6 +6,7 @@ import sqlite3
 import os
 import threading
 import shutil
+import time
 from typing import Optional, Any, List, Dict
 from contextlib import contextmanager
 from app.utils.logger import get_logger
@@ -215,6 +216,8 @@ def _init_db_schema(conn):
         "processed_at": "INTEGER",
         "sent_at": "INTEGER",
     })
+    # Batch claim: status = 'pending' ORDER BY priority DESC, id ASC
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pending_orders_claim ON pending_orders(status, priority, id)")
 
     # 3.2 Strategy notifications (browser polling / audit trail)
     cursor.execute("""
@@ -242,6 +245,70 @@ def _init_db_schema(conn):
         "created_at": "INTEGER",
     })
 
+    # 3.3 Signal latency traces (one row per pending order; stage timestamps in epoch seconds, ms precision)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS qd_signal_traces (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pending_order_id INTEGER UNIQUE,
+        trace_id TEXT DEFAULT '',
+        strategy_id INTEGER,
+        symbol TEXT DEFAULT '',
+        signal_type TEXT DEFAULT '',
+        execution_mode TEXT DEFAULT '',
+        exchange_id TEXT DEFAULT '',
+        status TEXT DEFAULT '',
+        bar_close_at REAL,
+        emitted_at REAL,
+        enqueued_at REAL,
+        claimed_at REAL,
+        dispatched_at REAL,
+        acked_at REAL,
+        filled_at REAL,
+        created_at INTEGER
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_signal_traces_created ON qd_signal_traces(created_at)")
+
+    # 3.4 Engine shards (ENGINE_SHARDS > 1): shard heartbeats and strategy ownership leases
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS qd_engine_shards (
+        shard_id INTEGER PRIMARY KEY,
+        pid INTEGER,
+        strategies INTEGER DEFAULT 0,
+        started_at INTEGER,
+        heartbeat_at INTEGER
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS qd_strategy_leases (
+        strategy_id INTEGER PRIMARY KEY,
+        shard_id INTEGER NOT NULL,
+        pid INTEGER,
+        updated_at INTEGER
+    )
+    """)
+
+    # 3.5 Notification retry queue: one row per failed channel delivery (pending/processing/sent/dead)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS qd_notification_retries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        strategy_id INTEGER,
+        pending_order_id INTEGER,
+        channel TEXT NOT NULL,
+        job_json TEXT DEFAULT '', -- channel delivery arguments
+        status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        max_attempts INTEGER DEFAULT 6,
+        last_error TEXT DEFAULT '',
+        next_attempt_at INTEGER,
+        created_at INTEGER,
+        updated_at INTEGER
+    )
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notification_retries_due ON qd_notification_retries(status, next_attempt_at)"
+    )
+
     # 4. 指标代码表（参考 MySQL: qd_indicator_codes）
     # 说明：
     # - 本地化后统一使用 SQLite，但字段保持与 MySQL 结构接近，便于前端/业务复用。
@@ -371,10 +438,14 @@ def _init_db_schema(conn):
         leverage INTEGER DEFAULT 1,
         trade_direction TEXT DEFAULT 'long',
         strategy_config TEXT DEFAULT '', -- JSON string
-        status TEXT DEFAULT 'success',   -- success/failed
+        status TEXT DEFAULT 'success',   -- queued/running/success/failed
         error_message TEXT DEFAULT '',
         result_json TEXT DEFAULT '',     -- JSON string
-        created_at INTEGER
+        run_type TEXT DEFAULT 'single',  -- single/walk_forward/portfolio
+        progress_json TEXT DEFAULT '',   -- JSON string (async jobs)
+        worker_pid INTEGER,              -- process that owns a queued/running async job
+        created_at INTEGER,
+        updated_at INTEGER
     )
     """)
 
@@ -395,9 +466,25 @@ def _init_db_schema(conn):
         "status": "TEXT DEFAULT 'success'",
         "error_message": "TEXT DEFAULT ''",
         "result_json": "TEXT DEFAULT ''",
-        "created_at": "INTEGER"
+        "run_type": "TEXT DEFAULT 'single'",
+        "progress_json": "TEXT DEFAULT ''",
+        "worker_pid": "INTEGER",
+        "created_at": "INTEGER",
+        "updated_at": "INTEGER"
     })
 
+    # 9.1 Backtest result cache (content-addressed: hash of inputs + kline data)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS qd_backtest_cache (
+        cache_key TEXT PRIMARY KEY,
+        result_json TEXT NOT NULL DEFAULT '',
+        size_bytes INTEGER DEFAULT 0,
+        hit_count INTEGER DEFAULT 0,
+        created_at INTEGER,
+        last_hit_at INTEGER
+    )
+    """)
+
     # 10. Exchange credentials vault (local-only)
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS qd_exchange_credentials (
@@ -544,3 +631,121 @@ def get_db_connection_sync():
 
 def close_db_connection():
     pass
+
+
+# UPDATE ... RETURNING 需要 SQLite >= 3.35
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def claim_pending_orders(limit: int, now: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    原子领取最多 limit 条待分发挂单：pending -> processing（attempts + 1，processed_at/updated_at = now），
+    返回领取到的行（按 priority DESC, id ASC）。
+
+    - SQLite >= 3.35：一条 UPDATE ... WHERE id IN (SELECT ... LIMIT n) RETURNING *；
+    - 旧版本：BEGIN IMMEDIATE 事务内 SELECT + UPDATE + SELECT。
+    两种方式都在 SQLite 写锁内完成，多个 worker 进程同时领取时同一行只会被一个进程拿到。
+    """
+    now = int(now if now is not None else time.time())
+    limit = int(limit)
+    if limit <= 0:
+        return []
+    pick_sql = """
+        SELECT id FROM pending_orders
+        WHERE status = 'pending' AND (attempts < max_attempts)
+        ORDER BY priority DESC, id ASC
+        LIMIT ?
+    """
+    with get_db_connection() as db:
+        conn = db._conn
+        if _SQLITE_HAS_RETURNING:
+            cur = conn.execute(
+                f"""
+                UPDATE pending_orders
+                SET status = 'processing',
+                    attempts = COALESCE(attempts, 0) + 1,
+                    processed_at = ?,
+                    updated_at = ?
+                WHERE status = 'pending' AND id IN ({pick_sql})
+                RETURNING *
+                """,
+                (now, now, limit),
+            )
+            rows = [dict(r) for r in cur.fetchall()]
+            cur.close()
+            conn.commit()
+        else:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [int(r[0]) for r in conn.execute(pick_sql, (limit,)).fetchall()]
+            rows = []
+            if ids:
+                marks = ','.join('?' * len(ids))
+                conn.execute(
+                    f"""
+                    UPDATE pending_orders
+                    SET status = 'processing',
+                        attempts = COALESCE(attempts, 0) + 1,
+                        processed_at = ?,
+                        updated_at = ?
+                    WHERE id IN ({marks})
+                    """,
+                    (now, now, *ids),
+                )
+                rows = [dict(r) for r in conn.execute(f"SELECT * FROM pending_orders WHERE id IN ({marks})", ids).fetchall()]
+            conn.commit()
+    rows.sort(key=lambda r: (-int(r.get('priority') or 0), int(r.get('id') or 0)))
+    return rows
+
+
+def claim_notification_retries(limit: int, now: Optional[int] = None, stale_before: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    原子领取最多 limit 条到期的通知重试：pending（next_attempt_at <= now）-> processing（attempts + 1）。
+    stale_before 不为空时，updated_at 早于它的 processing 行（领取后进程退出）也会被重新领取；
+    其中已用完 max_attempts 的行（最后一次投递的进程退出）标记为 dead，不再停留在 processing。
+    与 claim_pending_orders 相同，在 SQLite 写锁内完成，多进程不会重复投递。
+    """
+    now = int(now if now is not None else time.time())
+    limit = int(limit)
+    if limit <= 0:
+        return []
+    stale_before = int(stale_before if stale_before is not None else 0)
+    pick_sql = """
+        SELECT id FROM qd_notification_retries
+        WHERE ((status = 'pending' AND next_attempt_at <= ?)
+               OR (status = 'processing' AND updated_at < ?))
+          AND attempts < max_attempts
+        ORDER BY next_attempt_at ASC, id ASC
+        LIMIT ?
+    """
+    set_sql = "SET status = 'processing', attempts = COALESCE(attempts, 0) + 1, updated_at = ?"
+    with get_db_connection() as db:
+        conn = db._conn
+        conn.execute(
+            """
+            UPDATE qd_notification_retries
+            SET status = 'dead', last_error = 'worker exited during final attempt', updated_at = ?
+            WHERE status = 'processing' AND updated_at < ? AND attempts >= max_attempts
+            """,
+            (now, stale_before),
+        )
+        conn.commit()
+        if _SQLITE_HAS_RETURNING:
+            cur = conn.execute(
+                f"UPDATE qd_notification_retries {set_sql} WHERE id IN ({pick_sql}) RETURNING *",
+                (now, now, stale_before, limit),
+            )
+            rows = [dict(r) for r in cur.fetchall()]
+            cur.close()
+            conn.commit()
+        else:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [int(r[0]) for r in conn.execute(pick_sql, (now, stale_before, limit)).fetchall()]
+            rows = []
+            if ids:
+                marks = ','.join('?' * len(ids))
+                conn.execute(f"UPDATE qd_notification_retries {set_sql} WHERE id IN ({marks})", (now, *ids))
+                rows = [dict(r) for r in conn.execute(
+                    f"SELECT * FROM qd_notification_retries WHERE id IN ({marks})", ids).fetchall()]
+            conn.commit()
+    rows.sort(key=lambda r: int(r.get('id') or 0))
+    return rows
@@ -0,0 +1,383 @@
+"""
+增量（逐K线）指标
+
+实盘策略每个 tick 都在 500 根K线上重算整个指标，最后却只看最后两行。指标脚本可以选择额外实现增量协议：
+
+    def init(df):
+        # df 为已收盘K线（不含最后两根），返回任意状态对象（通常是 dict）
+        return {'fast': INC_SMA(5).seed(df['close']), 'slow': INC_SMA(20).seed(df['close']),
+                'cross_up': INC_CROSSOVER(), 'cross_down': INC_CROSSUNDER()}
+
+    def update(state, bar):
+        # bar: {'time', 'open', 'high', 'low', 'close', 'volume'}；同一根K线会随行情多次调用
+        fast = state['fast'].update(bar['close'], bar['time'])
+        slow = state['slow'].update(bar['close'], bar['time'])
+        return {'buy': state['cross_up'].update(fast, slow, bar['time']),
+                'sell': state['cross_down'].update(fast, slow, bar['time'])}
+
+update 返回该K线的信号列（buy/sell 或 open_long/close_long/open_short/close_short，可带 add_*/reduce_*/position_size），
+state 中的 highest_price（如有）会作为新的持仓最高价。脚本顶层代码照常计算 df 的信号列（回测/图表仍走全量）。
+
+INC_* 为 SMA/EMA/RSI/MACD/BOLL/ATR/CROSSOVER/CROSSUNDER 的增量版本，与 BacktestService._get_indicator_functions
+的全量结果一致；每次 update 都是 O(1)。最后一个参数是K线时间：时间不变时只重算"正在形成"的K线，
+时间变化时先把上一根提交为已收盘K线。
+"""
+import math
+import os
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+NAN = float('nan')
+
+
+def incremental_enabled() -> bool:
+    return str(os.getenv('INDICATOR_INCREMENTAL_ENABLED', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _bar_times(series: pd.Series) -> List[Any]:
+    index = series.index
+    if isinstance(index, pd.DatetimeIndex):
+        return [int(ts.timestamp()) for ts in index]
+    return list(index)
+
+
+class _BarIndicator:
+    """逐K线增量指标基类：缓存正在形成的K线输入，K线时间变化时提交"""
+
+    def __init__(self):
+        self._bar_time: Any = None
+        self._pending: Optional[tuple] = None
+        self.value: Any = None
+
+    def _step(self, bar_time: Any, values: tuple) -> Any:
+        if self._pending is not None and bar_time != self._bar_time:
+            self._commit(*self._pending)
+        self._bar_time = bar_time
+        self._pending = values
+        self.value = self._compute(*values)
+        return self.value
+
+    def seed(self, *series: pd.Series) -> '_BarIndicator':
+        """用历史序列初始化（O(N)，只在 init 时调用）；最后一个元素按正在形成的K线处理"""
+        if not series:
+            return self
+        times = _bar_times(series[0])
+        arrays = [np.asarray(s, dtype='float64') for s in series]
+        for i, t in enumerate(times):
+            self._step(t, tuple(float(a[i]) for a in arrays))
+        return self
+
+    def _commit(self, *values: float) -> None:
+        raise NotImplementedError
+
+    def _compute(self, *values: float) -> Any:
+        raise NotImplementedError
+
+
+class _RollingWindow:
+    """最近 period-1 个已收盘值的滑动和（加上正在形成的值即为完整窗口）"""
+
+    __slots__ = ('period', 'values', 'total', 'total_sq', 'nan_count')
+
+    def __init__(self, period: int):
+        self.period = max(int(period), 1)
+        self.values: deque = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.nan_count = 0
+
+    def push(self, x: float) -> None:
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count += 1
+        else:
+            self.total += x
+            self.total_sq += x * x
+        if len(self.values) > self.period - 1:
+            old = self.values.popleft()
+            if math.isnan(old):
+                self.nan_count -= 1
+            else:
+                self.total -= old
+                self.total_sq -= old * old
+
+    def full_with(self, x: float) -> bool:
+        return len(self.values) >= self.period - 1 and self.nan_count == 0 and not math.isnan(x)
+
+    def mean_with(self, x: float) -> float:
+        if not self.full_with(x):
+            return NAN
+        return (self.total + x) / self.period
+
+    def std_with(self, x: float) -> float:
+        # 样本标准差（ddof=1），与 pandas rolling().std() 一致
+        if self.period < 2 or not self.full_with(x):
+            return NAN
+        n = self.period
+        s = self.total + x
+        var = (self.total_sq + x * x - s * s / n) / (n - 1)
+        return math.sqrt(var) if var > 0 else 0.0
+
+
+class IncSMA(_BarIndicator):
+    def __init__(self, period: int):
+        super().__init__()
+        self._window = _RollingWindow(period)
+
+    def update(self, value: float, bar_time: Any) -> float:
+        return self._step(bar_time, (float(value),))
+
+    def _commit(self, value: float) -> None:
+        self._window.push(value)
+
+    def _compute(self, value: float) -> float:
+        return self._window.mean_with(value)
+
+
+class IncEMA(_BarIndicator):
+    """ewm(span=period, adjust=False)"""
+
+    def __init__(self, period: int):
+        super().__init__()
+        self.alpha = 2.0 / (int(period) + 1)
+        self._prev: Optional[float] = None
+
+    def update(self, value: float, bar_time: Any) -> float:
+        return self._step(bar_time, (float(value),))
+
+    def _commit(self, value: float) -> None:
+        self._prev = self._compute(value)
+
+    def _compute(self, value: float) -> float:
+        if self._prev is None or math.isnan(self._prev):
+            return value
+        if math.isnan(value):
+            return self._prev
+        return self.alpha * value + (1 - self.alpha) * self._prev
+
+
+class IncRSI(_BarIndicator):
+    """与全量 RSI 相同：涨跌幅的简单滑动平均"""
+
+    def __init__(self, period: int = 14):
+        super().__init__()
+        self._gains = _RollingWindow(period)
+        self._losses = _RollingWindow(period)
+        self._prev_close: Optional[float] = None
+
+    def update(self, close: float, bar_time: Any) -> float:
+        return self._step(bar_time, (float(close),))
+
+    def _split(self, close: float) -> tuple:
+        # 与 delta.where(delta > 0, 0) 一致：首根（diff 为 NaN）计为 0
+        if self._prev_close is None:
+            return 0.0, 0.0
+        delta = close - self._prev_close
+        if math.isnan(delta):
+            return 0.0, 0.0
+        return (delta if delta > 0 else 0.0), (-delta if delta < 0 else 0.0)
+
+    def _commit(self, close: float) -> None:
+        gain, loss = self._split(close)
+        self._gains.push(gain)
+        self._losses.push(loss)
+        self._prev_close = close
+
+    def _compute(self, close: float) -> float:
+        gain, loss = self._split(close)
+        avg_gain = self._gains.mean_with(gain)
+        avg_loss = self._losses.mean_with(loss)
+        if math.isnan(avg_gain) or math.isnan(avg_loss):
+            return NAN
+        if avg_loss == 0:
+            return NAN if avg_gain == 0 else 100.0
+        return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+class IncMACD(_BarIndicator):
+    """返回 (macd, signal, hist)"""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        super().__init__()
+        self._fast = IncEMA(fast)
+        self._slow = IncEMA(slow)
+        self._signal = IncEMA(signal)
+
+    def update(self, value: float, bar_time: Any) -> tuple:
+        return self._step(bar_time, (float(value),))
+
+    def _step(self, bar_time: Any, values: tuple) -> tuple:
+        # 子指标各自按K线时间提交
+        macd = self._fast.update(values[0], bar_time) - self._slow.update(values[0], bar_time)
+        signal = self._signal.update(macd, bar_time)
+        self.value = (macd, signal, macd - signal)
+        return self.value
+
+
+class IncBOLL(_BarIndicator):
+    """返回 (upper, middle, lower)"""
+
+    def __init__(self, period: int = 20, std_dev: float = 2):
+        super().__init__()
+        self.std_dev = float(std_dev)
+        self._window = _RollingWindow(period)
+
+    def update(self, value: float, bar_time: Any) -> tuple:
+        return self._step(bar_time, (float(value),))
+
+    def _commit(self, value: float) -> None:
+        self._window.push(value)
+
+    def _compute(self, value: float) -> tuple:
+        middle = self._window.mean_with(value)
+        std = self._window.std_with(value)
+        return middle + self.std_dev * std, middle, middle - self.std_dev * std
+
+
+class IncATR(_BarIndicator):
+    def __init__(self, period: int = 14):
+        super().__init__()
+        self._window = _RollingWindow(period)
+        self._prev_close: Optional[float] = None
+
+    def update(self, high: float, low: float, close: float, bar_time: Any) -> float:
+        return self._step(bar_time, (float(high), float(low), float(close)))
+
+    def _true_range(self, high: float, low: float) -> float:
+        if self._prev_close is None:
+            return high - low
+        return max(high - low, abs(high - self._prev_close), abs(low - self._prev_close))
+
+    def _commit(self, high: float, low: float, close: float) -> None:
+        self._window.push(self._true_range(high, low))
+        self._prev_close = close
+
+    def _compute(self, high: float, low: float, close: float) -> float:
+        return self._window.mean_with(self._true_range(high, low))
+
+
+class IncCROSSOVER(_BarIndicator):
+    """a 上穿 b：本根 a > b 且上一根 a <= b"""
+
+    def __init__(self):
+        super().__init__()
+        self._prev: Optional[tuple] = None
+
+    def update(self, a: float, b: float, bar_time: Any) -> bool:
+        return self._step(bar_time, (float(a), float(b)))
+
+    def _commit(self, a: float, b: float) -> None:
+        self._prev = (a, b)
+
+    def _compute(self, a: float, b: float) -> bool:
+        return self._prev is not None and a > b and self._prev[0] <= self._prev[1]
+
+
+class IncCROSSUNDER(IncCROSSOVER):
+    """a 下穿 b：本根 a < b 且上一根 a >= b"""
+
+    def _compute(self, a: float, b: float) -> bool:
+        return self._prev is not None and a < b and self._prev[0] >= self._prev[1]
+
+
+def get_incremental_helpers() -> Dict[str, Any]:
+    """注入指标脚本执行环境的增量指标类"""
+    return {
+        'INC_SMA': IncSMA,
+        'INC_EMA': IncEMA,
+        'INC_RSI': IncRSI,
+        'INC_MACD': IncMACD,
+        'INC_BOLL': IncBOLL,
+        'INC_ATR': IncATR,
+        'INC_CROSSOVER': IncCROSSOVER,
+        'INC_CROSSUNDER': IncCROSSUNDER,
+    }
+
+
+class IncrementalSession:
+    """
+    单个策略的增量指标会话：持有脚本的 init/update 与状态，按K线滚动缓冲逐根推进。
+
+    K线缓冲与交易所对账（已收盘K线可能被修正）后需要重新 init，调用方通过 reconciles 判断。
+    """
+
+    def __init__(self, init_fn: Callable[[pd.DataFrame], Any], update_fn: Callable[[Any, Dict[str, Any]], Any]):
+        self.init_fn = init_fn
+        self.update_fn = update_fn
+        self.state: Any = None
+        self.reconciles = -1
+        self._last_time: Optional[int] = None
+        # 最近两根K线各自最后一次 update 的结果：[(time, close, row)]
+        self._rows: List[tuple] = []
+        self.updates = 0
+
+    @classmethod
+    def from_env(cls, exec_env: Dict[str, Any]) -> Optional['IncrementalSession']:
+        init_fn = exec_env.get('init')
+        update_fn = exec_env.get('update')
+        if callable(init_fn) and callable(update_fn):
+            return cls(init_fn, update_fn)
+        return None
+
+    def start(self, df: pd.DataFrame, reconciles: int) -> None:
+        """在已收盘K线（去掉最后两根）上 init，再逐根 update 最后两根"""
+        if len(df) < 3:
+            raise ValueError("not enough K-lines for incremental indicator")
+        self.state = self.init_fn(df.iloc[:-2])
+        self.reconciles = reconciles
+        self._last_time = None
+        self._rows = []
+        times = df.index
+        values = df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype='float64')
+        for i in (len(df) - 2, len(df) - 1):
+            self._feed(int(times[i].timestamp()), values[i])
+
+    def advance(self, times: np.ndarray, ohlcv: np.ndarray) -> None:
+        """喂入上次之后的新K线（含上一根正在形成、现已可能收盘的K线），通常每次只有 1~2 根"""
+        start = int(np.searchsorted(times, self._last_time)) if self._last_time is not None else 0
+        for i in range(start, len(times)):
+            self._feed(int(times[i]), ohlcv[i])
+
+    def _feed(self, bar_time: int, row: np.ndarray) -> None:
+        bar = {
+            'time': bar_time,
+            'open': float(row[0]), 'high': float(row[1]), 'low': float(row[2]),
+            'close': float(row[3]), 'volume': float(row[4]),
+        }
+        result = self.update_fn(self.state, bar) or {}
+        if not isinstance(result, dict):
+            raise ValueError("incremental update(state, bar) must return a dict of signal columns")
+        self.updates += 1
+        if self._rows and self._rows[-1][0] == bar_time:
+            self._rows[-1] = (bar_time, bar['close'], result)
+        else:
+            self._rows = (self._rows + [(bar_time, bar['close'], result)])[-2:]
+        self._last_time = bar_time
+
+    def frame(self) -> pd.DataFrame:
+        """最近两根K线的信号列（与全量执行后 df 的最后两行结构一致）"""
+        index = pd.to_datetime([t for t, _, _ in self._rows], unit='s', utc=True)
+        columns: Dict[str, list] = {'close': [c for _, c, _ in self._rows]}
+        for _, _, row in self._rows:
+            for key in row:
+                columns.setdefault(key, [])
+        for key in columns:
+            if key == 'close':
+                continue
+            columns[key] = [row.get(key, False) for _, _, row in self._rows]
+        return pd.DataFrame(columns, index=index)
+
+    def highest_price(self) -> float:
+        if isinstance(self.state, dict):
+            try:
+                return float(self.state.get('highest_price') or 0.0)
+            except Exception:
+                return 0.0
+        return 0.0
@@ -0,0 +1,450 @@
+"""
+指标代码沙箱进程池
+
+safe_exec_code 的 signal 超时只在主线程生效，策略线程 / Flask 请求线程里执行用户代码时既没有超时也没有内存限制，
+慢脚本会直接拖住 API 进程。这里维护一组预先 fork 出来的工作进程（继承已导入的 numpy/pandas）专门执行指标代码：
+
+- OHLCV 通过 multiprocessing.shared_memory 传给子进程，不走 pickle；
+- 每次调用有真实的墙钟超时（超时直接杀掉并重建该工作进程），每个工作进程有 RLIMIT_AS 内存上限
+  （在 fork 时继承的虚拟内存之上再给 INDICATOR_SANDBOX_MAX_MEMORY_MB）；
+- 子进程只回传执行后 df 中新增/被修改的列（NumPy 数组）以及调用方关心的少量变量。
+
+不支持 fork 的平台（Windows）或 INDICATOR_SANDBOX_ENABLED=false 时 get_indicator_sandbox() 返回 None，
+调用方退回进程内执行。沙箱自身故障（共享内存、进程通信等）抛 SandboxUnavailableError，调用方同样退回进程内执行；
+脚本错误与超时仍然失败。
+"""
+import gc
+import multiprocessing
+import os
+import pickle
+import queue
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.utils.logger import get_logger
+from app.utils.safe_exec import TimeoutError, get_code_cache
+
+logger = get_logger(__name__)
+
+
+class SandboxUnavailableError(RuntimeError):
+    """沙箱基础设施故障（不是脚本本身的错误），调用方应退回进程内执行"""
+
+
+def sandbox_enabled() -> bool:
+    return str(os.getenv('INDICATOR_SANDBOX_ENABLED', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# ----------------------------------------------------------------------
+# 子进程
+# ----------------------------------------------------------------------
+
+def _helper_functions(name: Optional[str]) -> Dict[str, Any]:
+    if name == 'backtest':
+        from app.services.backtest import BacktestService
+        return BacktestService._get_indicator_functions(BacktestService.__new__(BacktestService))
+    return {}
+
+
+def _picklable(value: Any) -> bool:
+    try:
+        pickle.dumps(value)
+        return True
+    except Exception:
+        return False
+
+
+def _run_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    n = int(task['rows'])
+    float_cols = task['float_cols']
+
+    try:
+        shm = shared_memory.SharedMemory(name=task['shm'])
+        try:
+            idx_view = np.ndarray((n,), dtype='int64', buffer=shm.buf)
+            data_view = np.ndarray((len(float_cols), n), dtype='float64', buffer=shm.buf, offset=8 * n)
+            index_ns = np.array(idx_view)
+            data = np.array(data_view)
+            del idx_view, data_view
+        finally:
+            shm.close()
+    except Exception as e:
+        return {'ok': False, 'infra': True, 'error': f"shared memory attach failed: {type(e).__name__}: {e}"}
+
+    if task.get('index') is not None:
+        index = task['index']
+    elif task.get('tz'):
+        index = pd.to_datetime(index_ns, utc=True).tz_convert(task['tz'])
+    else:
+        index = pd.DatetimeIndex(index_ns)
+    if task.get('index') is None:
+        index.name = task.get('index_name')
+
+    columns = {c: data[i] for i, c in enumerate(float_cols)}
+    columns.update(task.get('other_cols') or {})
+    df = pd.DataFrame(columns, index=index)[task['columns']]
+
+    local_vars = {
+        'df': df.copy(),
+        'signals': pd.Series(0, index=df.index, dtype=task.get('signals_dtype')),
+        'np': np,
+        'pd': pd,
+    }
+    for col in ('open', 'high', 'low', 'close', 'volume'):
+        if col in df.columns:
+            local_vars[col] = df[col]
+    local_vars.update(task.get('env') or {})
+    local_vars.update(_helper_functions(task.get('helpers')))
+
+    # 子进程内同样按代码哈希缓存编译结果与 safe builtins
+    code_cache = get_code_cache()
+    exec_env = local_vars
+    exec_env['__builtins__'] = code_cache.safe_builtins(task.get('allowed_modules') or ())
+    exec(code_cache.compile("import numpy as np\nimport pandas as pd\n"), exec_env)
+    exec(code_cache.compile(task['code']), exec_env)
+
+    values = {}
+    for key in task.get('return_keys') or ():
+        if key in exec_env and _picklable(exec_env[key]):
+            values[key] = exec_env[key]
+
+    executed = exec_env.get('df', df)
+    if not isinstance(executed, pd.DataFrame) or len(executed) != n or not executed.index.equals(df.index):
+        # 行数/索引被脚本改变：整体回传
+        return {'ok': True, 'df': executed, 'values': values}
+
+    changed = {}
+    for col in executed.columns:
+        arr = executed[col].to_numpy()
+        if col in df.columns and df[col].dtype == executed[col].dtype:
+            src = df[col].to_numpy()
+            same = np.array_equal(src, arr, equal_nan=True) if arr.dtype.kind == 'f' else np.array_equal(src, arr)
+            if same:
+                continue
+        changed[col] = arr
+    return {'ok': True, 'columns': list(executed.columns), 'changed': changed, 'values': values}
+
+
+def _current_vsz() -> int:
+    """当前进程虚拟内存大小（字节）；无法读取时返回 0"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        return 0
+
+
+def _close_inherited_fds(keep: Iterable[int]) -> None:
+    """
+    关闭从父进程继承的 fd，只保留 keep、标准输入输出、resource tracker 与日志文件。
+
+    父进程是多线程的引擎 / web 进程：不关闭的话子进程会一直持有其他工作进程管道的父端
+    （那些子进程永远收不到 EOF）、数据库文件、引擎锁与 IPC socket。
+    """
+    import logging
+
+    fds = {0, 1, 2}
+    fds.update(int(fd) for fd in keep)
+    tracker_fd = getattr(resource_tracker._resource_tracker, '_fd', None)
+    if tracker_fd is not None:
+        fds.add(tracker_fd)
+    for handler in list(logging.root.handlers) + [h for lg in logging.Logger.manager.loggerDict.values()
+                                                  for h in getattr(lg, 'handlers', ())]:
+        stream = getattr(handler, 'stream', None)
+        try:
+            fds.add(stream.fileno())
+        except Exception:
+            pass
+    try:
+        max_fd = max(int(fd) for fd in os.listdir('/proc/self/fd'))
+    except Exception:
+        max_fd = os.sysconf('SC_OPEN_MAX') if hasattr(os, 'sysconf') else 1024
+    low = 0
+    for fd in sorted(fds) + [max_fd + 1]:
+        if fd > low:
+            os.closerange(low, fd)
+        low = max(low, fd + 1)
+
+
+def _worker_main(conn, parent_conn, parent_pid: int, max_memory_mb: int) -> None:
+    parent_conn.close()
+    _close_inherited_fds([conn.fileno()])
+
+    if max_memory_mb and max_memory_mb > 0 and sys.platform != 'win32':
+        # 子进程从多线程的引擎进程 fork，继承了父进程的全部地址空间（线程栈、已导入的库等），
+        # 上限必须是“继承的 VSZ + 预算”，否则上限衡量的其实是父进程大小，mmap 共享内存都会失败
+        base = _current_vsz()
+        if base > 0:
+            try:
+                import resource
+                limit = base + int(max_memory_mb) * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            except Exception:
+                pass
+
+    while True:
+        try:
+            # 父进程被 SIGKILL 时管道未必 EOF：定期检查父进程是否还在，不在就退出
+            while not conn.poll(1.0):
+                if os.getppid() != parent_pid:
+                    return
+            task = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            return
+        if task is None:
+            return
+        try:
+            reply = _run_task(task)
+        except MemoryError:
+            reply = {'ok': False, 'error': f"代码执行内存不足（超过{max_memory_mb}MB限制）"}
+        except BaseException as e:
+            reply = {'ok': False, 'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}
+        try:
+            conn.send(reply)
+        except Exception as e:
+            try:
+                conn.send({'ok': False, 'error': f"Indicator result is not serializable: {e}"})
+            except Exception:
+                return
+        finally:
+            reply = None
+            gc.collect()
+
+
+# ----------------------------------------------------------------------
+# 父进程
+# ----------------------------------------------------------------------
+
+class _SandboxWorker:
+    def __init__(self, ctx, max_memory_mb: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.conn, os.getpid(), max_memory_mb),
+            name='IndicatorSandbox',
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class IndicatorSandboxPool:
+    """预启动的指标执行进程池（线程安全）"""
+
+    def __init__(self, workers: Optional[int] = None, max_memory_mb: Optional[int] = None):
+        self.workers = max(1, int(workers or os.getenv('INDICATOR_SANDBOX_WORKERS', '2') or 2))
+        self.max_memory_mb = int(max_memory_mb if max_memory_mb is not None else (os.getenv('INDICATOR_SANDBOX_MAX_MEMORY_MB', '1024') or 1024))
+        self.pid = os.getpid()
+
+        # 与回测进程池一致使用 fork：spawn/forkserver 会在子进程里重新执行 __main__（run.py 会再次 create_app）
+        self._ctx = multiprocessing.get_context('fork')
+        # 先启动 resource tracker 再 fork，子进程共享它；否则子进程各自启动 tracker，
+        # 被杀掉时会把仍在使用的共享内存当作泄漏清理掉
+        resource_tracker.ensure_running()
+        self._idle: "queue.Queue[_SandboxWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {'calls': 0, 'timeouts': 0, 'crashes': 0, 'errors': 0, 'restarts': 0}
+        for _ in range(self.workers):
+            self._idle.put(_SandboxWorker(self._ctx, self.max_memory_mb))
+
+    def _replace(self, worker: _SandboxWorker) -> None:
+        worker.kill()
+        with self._lock:
+            self.stats['restarts'] += 1
+            if self._closed:
+                return
+        self._idle.put(_SandboxWorker(self._ctx, self.max_memory_mb))
+
+    def _dispatch(self, task: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        deadline = time.time() + timeout
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"代码执行超时（等待沙箱进程超过{timeout}秒）")
+
+        try:
+            if not worker.process.is_alive():
+                # 空闲期间退出：与本次脚本无关
+                self._replace(worker)
+                raise SandboxUnavailableError('sandbox worker exited while idle')
+            try:
+                worker.conn.send(task)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                # 任务无法序列化（例如 env 中有不可 pickle 的对象），工作进程本身仍可用
+                self._idle.put(worker)
+                raise SandboxUnavailableError(f"sandbox task is not serializable: {e}")
+            if not worker.conn.poll(max(0.0, deadline - time.time())):
+                with self._lock:
+                    self.stats['timeouts'] += 1
+                self._replace(worker)
+                raise TimeoutError(f"代码执行超时（超过{timeout}秒）")
+            reply = worker.conn.recv()
+        except (TimeoutError, SandboxUnavailableError):
+            raise
+        except (EOFError, OSError) as e:
+            with self._lock:
+                self.stats['crashes'] += 1
+            self._replace(worker)
+            raise RuntimeError(f"指标沙箱进程异常退出（可能超出内存限制 {self.max_memory_mb}MB）: {e}")
+        except BaseException:
+            self._replace(worker)
+            raise
+        self._idle.put(worker)
+        return reply
+
+    def execute(
+        self,
+        code: str,
+        df: pd.DataFrame,
+        env: Optional[Dict[str, Any]] = None,
+        helpers: Optional[str] = None,
+        allowed_modules: Iterable[str] = ('numpy', 'pandas', 'math', 'json', 'time'),
+        signals_dtype: Optional[str] = None,
+        return_keys: Iterable[str] = (),
+        timeout: float = 30
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        在沙箱进程中执行指标代码
+
+        Args:
+            code: 指标代码（调用方负责 validate_code_safety）
+            df: K线 DataFrame（float64 列走共享内存，其余列随任务 pickle）
+            env: 额外注入的变量（需可 pickle）
+            helpers: 注入的内置指标函数集（'backtest' -> BacktestService._get_indicator_functions）
+            allowed_modules: 允许 import 的模块
+            signals_dtype: 预置 signals Series 的 dtype
+            return_keys: 需要从执行环境回传的变量名
+            timeout: 墙钟超时（秒），包含等待空闲进程的时间
+
+        Returns:
+            (executed_df, values)
+
+        Raises:
+            TimeoutError: 超时
+            SandboxUnavailableError: 沙箱自身故障（调用方应退回进程内执行）
+            RuntimeError: 代码执行失败或沙箱进程崩溃
+        """
+        n = len(df)
+        float_cols = [c for c in df.columns if isinstance(c, str) and df[c].dtype == np.float64]
+        other_cols = {c: df[c].to_numpy() for c in df.columns if c not in float_cols}
+        is_dt_index = isinstance(df.index, pd.DatetimeIndex)
+
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=max(8, 8 * n * (len(float_cols) + 1)))
+        except OSError as e:
+            raise SandboxUnavailableError(f"shared memory unavailable: {e}")
+        try:
+            idx_view = np.ndarray((n,), dtype='int64', buffer=shm.buf)
+            data_view = np.ndarray((len(float_cols), n), dtype='float64', buffer=shm.buf, offset=8 * n)
+            if is_dt_index:
+                idx_view[:] = df.index.asi8
+            for i, c in enumerate(float_cols):
+                data_view[i] = df[c].to_numpy()
+            del idx_view, data_view
+
+            task = {
+                'code': code,
+                'shm': shm.name,
+                'rows': n,
+                'float_cols': float_cols,
+                'other_cols': other_cols,
+                'columns': list(df.columns),
+                'index': None if is_dt_index else df.index,
+                'index_name': df.index.name,
+                'tz': str(df.index.tz) if is_dt_index and df.index.tz is not None else None,
+                'env': env or {},
+                'helpers': helpers,
+                'allowed_modules': list(allowed_modules),
+                'signals_dtype': signals_dtype,
+                'return_keys': list(return_keys),
+            }
+            with self._lock:
+                self.stats['calls'] += 1
+            reply = self._dispatch(task, timeout)
+        finally:
+            shm.close()
+            shm.unlink()
+
+        if reply.get('infra'):
+            raise SandboxUnavailableError(reply.get('error') or 'sandbox failure')
+        if not reply.get('ok'):
+            with self._lock:
+                self.stats['errors'] += 1
+            if reply.get('traceback'):
+                logger.debug(reply['traceback'])
+            raise RuntimeError(f"代码执行失败: {reply.get('error')}")
+
+        values = reply.get('values') or {}
+        if 'df' in reply:
+            return reply['df'], values
+
+        executed = df.copy()
+        for col, arr in (reply.get('changed') or {}).items():
+            executed[col] = arr
+        columns = reply.get('columns') or []
+        if list(executed.columns) != columns:
+            executed = executed[columns]
+        return executed, values
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+            worker.kill()
+
+
+_pool: Optional[IndicatorSandboxPool] = None
+_pool_lock = threading.Lock()
+_pool_failed = False
+
+
+def get_indicator_sandbox() -> Optional[IndicatorSandboxPool]:
+    """
+    返回全局沙箱进程池；未启用、平台不支持、启动失败，或当前处于 fork 出来的子进程
+    （例如回测进程池里的 worker）时返回 None，调用方应退回进程内执行。
+    """
+    global _pool, _pool_failed
+    if not sandbox_enabled() or _pool_failed:
+        return None
+    if _pool is not None:
+        return _pool if _pool.pid == os.getpid() else None
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        _pool_failed = True
+        return None
+    with _pool_lock:
+        if _pool is None and not _pool_failed:
+            try:
+                _pool = IndicatorSandboxPool()
+                logger.info(f"Indicator sandbox started: {_pool.workers} workers, {_pool.max_memory_mb}MB limit")
+            except Exception as e:
+                _pool_failed = True
+                logger.warning(f"Indicator sandbox unavailable, falling back to in-process exec: {e}")
+                return None
+    return _pool if _pool is not None and _pool.pid == os.getpid() else None
@@ -0,0 +1,509 @@
+"""
+进程内指标（Prometheus 文本格式）
+
+轻量实现，不依赖 prometheus_client：
+- Counter / Gauge / Histogram（固定桶），支持标签；每个带标签的子序列一把锁，热路径开销为一次加锁 + 加法；
+- render() 输出 Prometheus text exposition format 0.0.4，由 /metrics 路由返回；
+- gunicorn 多进程：每个进程每 METRICS_SNAPSHOT_SEC 秒把自己的快照写到 METRICS_MULTIPROC_DIR/<pid>.json，
+  /metrics 合并所有存活进程的快照（counter/histogram 求和；gauge 按 pid 标签分别输出）；
+  未设置 METRICS_MULTIPROC_DIR 时只输出当前进程。
+- 进程退出后其 counter/histogram 累加进 aggregate.json（与 prometheus_client multiprocess 模式相同），
+  合并结果单调不减，Prometheus 不会把 worker 重启误判为计数器重置；只有该进程的 gauge 被丢弃。
+- 回调型 gauge（set_function）只在抓取时于当前进程计算（例如 pending_orders 队列深度），不写入快照。
+"""
+import atexit
+import bisect
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.utils.logger import get_logger
+
+if sys.platform != 'win32':
+    import fcntl
+else:  # 多进程快照只用于 gunicorn（POSIX）
+    fcntl = None
+
+logger = get_logger(__name__)
+
+_AGGREGATE_FILE = 'aggregate.json'
+_LOCK_FILE = 'aggregate.lock'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(v: float) -> str:
+    if v == float('inf'):
+        return '+Inf'
+    if v == float('-inf'):
+        return '-Inf'
+    if v != v:
+        return 'NaN'
+    if float(v).is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels_text(names: Iterable[str], values: Iterable[str], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra.items())
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[LabelValues, Any] = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any, **kwargs: Any) -> Any:
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def samples(self) -> Dict[LabelValues, Any]:
+        with self._lock:
+            children = list(self._children.items())
+        return {k: c.snapshot() for k, c in children}
+
+
+class _CounterChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], Any]] = None
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.dec(amount)
+
+    def set_function(self, fn: Callable[[], Any]) -> None:
+        """抓取时调用 fn 取值：无标签返回数字，有标签返回 {label_values_tuple: value}"""
+        self._function = fn
+
+    @property
+    def is_callback(self) -> bool:
+        return self._function is not None
+
+    def samples(self) -> Dict[LabelValues, Any]:
+        if self._function is None:
+            return super().samples()
+        try:
+            value = self._function()
+        except Exception as e:
+            logger.debug(f"metrics gauge callback {self.name} failed: {e}")
+            return {}
+        if isinstance(value, dict):
+            return {tuple(str(x) for x in (k if isinstance(k, tuple) else (k,))): float(v) for k, v in value.items()}
+        return {(): float(value or 0.0)}
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', 'bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'counts': list(self.counts), 'sum': self.sum}
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != float('inf')))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._snapshot_thread: Optional[threading.Thread] = None
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Iterable[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} already registered as {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    # ------------------------------------------------------------------
+    # 多进程快照
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        out: Dict[str, Any] = {}
+        for m in metrics:
+            if isinstance(m, Gauge) and m.is_callback:
+                continue
+            out[m.name] = {
+                'type': m.type_name,
+                'help': m.documentation,
+                'labelnames': list(m.labelnames),
+                'buckets': list(getattr(m, 'buckets', ())),
+                'samples': [[list(k), v] for k, v in m.samples().items()],
+            }
+        return out
+
+    def write_snapshot(self, directory: str) -> None:
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'pid': os.getpid(), 'ts': time.time(), 'metrics': self.snapshot()}, f)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except Exception:
+                pass
+            raise
+
+    def start_snapshot_writer(self) -> None:
+        """多进程模式下启动后台快照写入线程（幂等）"""
+        directory = multiproc_dir()
+        if not directory:
+            return
+        with self._lock:
+            if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+                return
+            self._snapshot_thread = threading.Thread(target=self._snapshot_loop, args=(directory,),
+                                                     name='MetricsSnapshot', daemon=True)
+            self._snapshot_thread.start()
+            # 正常退出时写最后一次快照，退出前最后一个周期内的计数不会丢失
+            atexit.register(self._final_snapshot, directory)
+
+    def _final_snapshot(self, directory: str) -> None:
+        try:
+            self.write_snapshot(directory)
+        except Exception:
+            pass
+
+    def _snapshot_loop(self, directory: str) -> None:
+        try:
+            interval = max(float(os.getenv('METRICS_SNAPSHOT_SEC', '5') or 5), 0.5)
+        except Exception:
+            interval = 5.0
+        os.makedirs(directory, exist_ok=True)
+        while True:
+            try:
+                self.write_snapshot(directory)
+            except Exception as e:
+                logger.debug(f"metrics snapshot failed: {e}")
+            time.sleep(interval)
+
+    # ------------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------------
+
+    def render(self) -> str:
+        """合并本进程、其他存活进程的快照与已退出进程的累计值，输出 Prometheus 文本格式"""
+        local = self.snapshot()
+        merged: Dict[str, Dict[str, Any]] = {}
+        pid = os.getpid()
+        self._merge(merged, local, pid)
+        directory = multiproc_dir()
+        if directory and os.path.isdir(directory):
+            dead = [p for p in _snapshot_pids(directory) if p != pid and not _pid_alive(p)]
+            for other in dead:
+                fold_dead_snapshot(directory, other)
+            # 共享锁：读取期间不会有快照被折叠进 aggregate（否则同一进程的计数可能被读到两次或零次）
+            with _dir_lock(directory, exclusive=False):
+                aggregate = _read_json(os.path.join(directory, _AGGREGATE_FILE))
+                if aggregate:
+                    self._merge(merged, aggregate.get('metrics') or {}, 0)
+                for other in _snapshot_pids(directory):
+                    if other == pid:
+                        continue
+                    data = _read_json(os.path.join(directory, f"{other}.json"))
+                    if data:
+                        self._merge(merged, data.get('metrics') or {}, other)
+
+        # 回调型 gauge：只在抓取进程计算
+        with self._lock:
+            callbacks = [m for m in self._metrics.values() if isinstance(m, Gauge) and m.is_callback]
+        for m in callbacks:
+            merged[m.name] = {
+                'type': 'gauge', 'help': m.documentation, 'labelnames': list(m.labelnames),
+                'samples': {tuple(k): v for k, v in m.samples().items()},
+            }
+
+        lines: List[str] = []
+        for name in sorted(merged):
+            m = merged[name]
+            lines.append(f"# HELP {name} {m['help']}")
+            lines.append(f"# TYPE {name} {m['type']}")
+            labelnames = m['labelnames']
+            for key, value in sorted(m['samples'].items(), key=lambda kv: kv[0]):
+                if m['type'] == 'gauge' and m.get('per_pid'):
+                    values, proc = key[:-1], key[-1]
+                    lines.append(f"{name}{_labels_text(labelnames, values, {'pid': proc})} {_format_value(value)}")
+                elif m['type'] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(list(m['buckets']) + [float('inf')], value['counts']):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels_text(labelnames, key, {'le': _format_value(bound)})} {cumulative}")
+                    lines.append(f"{name}_sum{_labels_text(labelnames, key)} {_format_value(value['sum'])}")
+                    lines.append(f"{name}_count{_labels_text(labelnames, key)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_labels_text(labelnames, key)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _merge(merged: Dict[str, Dict[str, Any]], snapshot: Dict[str, Any], pid: int) -> None:
+        for name, m in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {
+                    'type': m['type'], 'help': m['help'], 'labelnames': list(m['labelnames']),
+                    'buckets': list(m.get('buckets') or ()), 'samples': {},
+                    # gauge 不能跨进程相加，按 pid 分开输出
+                    'per_pid': m['type'] == 'gauge',
+                }
+            if target['type'] != m['type']:
+                continue
+            samples = target['samples']
+            for labels, value in m['samples']:
+                key = tuple(labels)
+                if m['type'] == 'gauge':
+                    samples[key + (str(pid),)] = value
+                elif m['type'] == 'histogram':
+                    cur = samples.get(key)
+                    if cur is None or len(cur['counts']) != len(value['counts']):
+                        samples[key] = {'counts': list(value['counts']), 'sum': value['sum']}
+                    else:
+                        cur['counts'] = [a + b for a, b in zip(cur['counts'], value['counts'])]
+                        cur['sum'] += value['sum']
+                else:
+                    samples[key] = samples.get(key, 0.0) + value
+
+
+def multiproc_dir() -> str:
+    return (os.getenv('METRICS_MULTIPROC_DIR') or '').strip()
+
+
+def _snapshot_pids(directory: str) -> List[int]:
+    pids = []
+    for fname in os.listdir(directory):
+        if fname.endswith('.json') and fname[:-5].isdigit():
+            pids.append(int(fname[:-5]))
+    return pids
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug(f"metrics snapshot {path} unreadable: {e}")
+        return None
+
+
+@contextmanager
+def _dir_lock(directory: str, exclusive: bool):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, _LOCK_FILE), 'a+') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def fold_dead_snapshot(directory: str, pid: int) -> None:
+    """
+    把已退出进程的 counter/histogram 累加进 aggregate.json 并删除其快照（gauge 直接丢弃）。
+    gunicorn child_exit 与 render() 都会调用；在目录排他锁内完成，同一快照只会被折叠一次。
+    """
+    path = os.path.join(directory, f"{int(pid)}.json")
+    try:
+        with _dir_lock(directory, exclusive=True):
+            data = _read_json(path)
+            if data is None:
+                return
+            agg_path = os.path.join(directory, _AGGREGATE_FILE)
+            metrics = (_read_json(agg_path) or {}).get('metrics') or {}
+            for name, m in (data.get('metrics') or {}).items():
+                if m.get('type') not in ('counter', 'histogram'):
+                    continue
+                target = metrics.get(name)
+                if target is None or target.get('type') != m['type']:
+                    target = metrics[name] = {**m, 'samples': []}
+                samples = {tuple(k): v for k, v in target['samples']}
+                for labels, value in m['samples']:
+                    key = tuple(labels)
+                    cur = samples.get(key)
+                    if m['type'] == 'counter':
+                        samples[key] = (cur or 0.0) + value
+                    elif cur is None or len(cur['counts']) != len(value['counts']):
+                        samples[key] = {'counts': list(value['counts']), 'sum': value['sum']}
+                    else:
+                        samples[key] = {'counts': [a + b for a, b in zip(cur['counts'], value['counts'])],
+                                        'sum': cur['sum'] + value['sum']}
+                target['samples'] = [[list(k), v] for k, v in samples.items()]
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'ts': time.time(), 'metrics': metrics}, f)
+            os.replace(tmp, agg_path)
+            os.unlink(path)
+    except Exception as e:
+        logger.debug(f"metrics fold of pid {pid} failed: {e}")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except Exception:
+        return True
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.counter(name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return REGISTRY.gauge(name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (),
+              buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
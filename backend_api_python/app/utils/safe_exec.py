@@ -2,12 +2,15 @@
 安全的代码执行工具
 提供超时、资源限制和沙箱环境
 """
+import hashlib
 import signal
 import sys
 import os
 import threading
 import traceback
-from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from types import CodeType
+from typing import Dict, Any, Iterable, Optional, Tuple, Union
 from contextlib import contextmanager
 
 from app.utils.logger import get_logger
@@ -70,7 +73,7 @@ def timeout_context(seconds: int):
 
 
 def safe_exec_code(
-    code: str,
+    code: Union[str, CodeType],
     exec_globals: Dict[str, Any],
     exec_locals: Optional[Dict[str, Any]] = None,
     timeout: int = 30,
@@ -80,7 +83,7 @@ def safe_exec_code(
     安全执行Python代码
     
     Args:
-        code: 要执行的Python代码
+        code: 要执行的Python代码（源码或已编译的 code object）
         exec_globals: 全局变量字典
         exec_locals: 局部变量字典（如果为None，则使用exec_globals）
         timeout: 超时时间（秒），默认30秒
@@ -310,3 +313,142 @@ def validate_code_safety(code: str) -> Tuple[bool, Optional[str]]:
         logger.warning(f"AST parse failed; skipping safety checks: {str(e)}")
     
     return True, None
+
+
+# 策略/回测允许脚本 import 的模块（与各执行入口保持一致）
+DEFAULT_ALLOWED_MODULES = ('numpy', 'pandas', 'math', 'json', 'time')
+
+
+def build_safe_builtins(allowed_modules: Iterable[str] = DEFAULT_ALLOWED_MODULES) -> Dict[str, Any]:
+    """
+    构建受限的 __builtins__：移除 eval/exec/open 等，并替换 __import__ 为白名单导入
+    """
+    import builtins
+
+    allowed = tuple(allowed_modules)
+
+    def safe_import(name, *args, **kwargs):
+        """只允许导入白名单内的安全模块"""
+        if name in allowed or name.split('.')[0] in allowed:
+            return builtins.__import__(name, *args, **kwargs)
+        raise ImportError(f"不允许导入模块: {name}")
+
+    safe_builtins = {k: getattr(builtins, k) for k in dir(builtins)
+                     if not k.startswith('_') and k not in [
+                         'eval', 'exec', 'compile', 'open', 'input',
+                         'help', 'exit', 'quit',
+                         'copyright', 'credits', 'license'
+                     ]}
+    safe_builtins['__import__'] = safe_import
+    return safe_builtins
+
+
+class CompiledCodeCache:
+    """
+    指标代码编译缓存（LRU，按代码 sha256）
+
+    同一份指标代码每个 tick 都会重复做安全检查（几十条正则 + ast.walk）并重新编译，
+    这里缓存安全检查结论与编译后的 code object，并缓存按白名单构建好的 safe builtins。
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        if max_entries is None:
+            try:
+                max_entries = int(os.getenv('INDICATOR_CODE_CACHE_SIZE', '256') or 256)
+            except Exception:
+                max_entries = 256
+        self.max_entries = max(1, int(max_entries))
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._builtins: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def code_hash(code: str) -> str:
+        return hashlib.sha256((code or '').encode('utf-8')).hexdigest()
+
+    def _lookup(self, code: str) -> Dict[str, Any]:
+        key = self.code_hash(code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # 在锁外做校验与编译（较慢），并发 miss 时最多重复计算一次
+        entry = {'validated': None, 'code_obj': None, 'compile_error': None}
+        try:
+            entry['code_obj'] = compile(code, '<indicator>', 'exec')
+        except SyntaxError as e:
+            # 只缓存错误信息（msg, (filename, lineno, offset, text, ...)）：反复 raise 同一个异常对象
+            # 会把每次调用的栈帧追加到它的 __traceback__ 上，一直持有调用方的 DataFrame 等局部变量
+            entry['compile_error'] = e.args
+
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                return existing
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def validate(self, code: str) -> Tuple[bool, Optional[str]]:
+        """带缓存的 validate_code_safety"""
+        entry = self._lookup(code)
+        verdict = entry.get('validated')
+        if verdict is None:
+            verdict = validate_code_safety(code)
+            entry['validated'] = verdict
+        return verdict
+
+    def compile(self, code: str) -> CodeType:
+        """返回编译后的 code object（语法错误时抛出 SyntaxError）"""
+        entry = self._lookup(code)
+        if entry['compile_error'] is not None:
+            raise SyntaxError(*entry['compile_error'])
+        return entry['code_obj']
+
+    def safe_builtins(self, allowed_modules: Iterable[str] = DEFAULT_ALLOWED_MODULES) -> Dict[str, Any]:
+        """返回受限 builtins 的副本（缓存构建结果，副本避免脚本之间互相污染）"""
+        key = tuple(allowed_modules)
+        with self._lock:
+            cached = self._builtins.get(key)
+        if cached is None:
+            cached = build_safe_builtins(key)
+            with self._lock:
+                self._builtins[key] = cached
+        return dict(cached)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._builtins.clear()
+
+
+_code_cache: Optional[CompiledCodeCache] = None
+_code_cache_lock = threading.Lock()
+
+
+def get_code_cache() -> CompiledCodeCache:
+    """进程内共享的指标代码缓存（BacktestService / TradingExecutor / 沙箱子进程）"""
+    global _code_cache
+    if _code_cache is None:
+        with _code_cache_lock:
+            if _code_cache is None:
+                _code_cache = CompiledCodeCache()
+    return _code_cache
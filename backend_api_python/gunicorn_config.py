@@ -2,6 +2,19 @@
 Gunicorn 配置文件（生产环境）
 """
 import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+
+# 多进程指标：各 worker 把快照写到此目录，/metrics 合并所有存活 worker 的数据
+os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join("logs", "metrics"))
+
+# 后台引擎（策略循环、挂单分发、行情）不在 web worker 里运行：sync worker 处理长请求时会被 timeout 杀掉，
+# 多线程进程里 fork 回测进程池也不安全。worker 固定为 ENGINE_ROLE=web，引擎由 master 启动独立进程
+# run_engine.py（--supervise，退出后自动重启）；引擎已单独部署（systemd / 另一个容器）时设置 GUNICORN_SPAWN_ENGINE=false
+os.environ["ENGINE_ROLE"] = "web"
+_engine_proc = None
 
 # 服务器 socket
 bind = "0.0.0.0:5000"
@@ -35,3 +48,39 @@ tmp_upload_dir = None
 # keyfile = None
 # certfile = None
 
+
+def on_starting(server):
+    """启动时清空上一次运行遗留的指标快照"""
+    path = os.environ.get("METRICS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def when_ready(server):
+    global _engine_proc
+    if str(os.environ.get("GUNICORN_SPAWN_ENGINE", "true")).strip().lower() in ("0", "false", "no", "off"):
+        return
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    env = os.environ.copy()
+    env.pop("ENGINE_ROLE", None)
+    _engine_proc = subprocess.Popen([sys.executable, os.path.join(base_dir, "run_engine.py"), "--supervise"],
+                                    cwd=base_dir, env=env)
+    server.log.info(f"Started engine supervisor (pid {_engine_proc.pid})")
+
+
+def on_exit(server):
+    if _engine_proc is not None and _engine_proc.poll() is None:
+        _engine_proc.terminate()
+        try:
+            _engine_proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            _engine_proc.kill()
+
+
+def child_exit(server, worker):
+    """worker 退出后把其 counter/histogram 折叠进累计文件（gauge 丢弃），避免合并结果出现计数器回退"""
+    path = os.environ.get("METRICS_MULTIPROC_DIR")
+    if path:
+        from app.utils.metrics import fold_dead_snapshot
+        fold_dead_snapshot(path, worker.pid)
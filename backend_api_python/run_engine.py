@@ -0,0 +1,99 @@
+"""
+QuantDinger background engine entrypoint (no HTTP server).
+
+Runs strategy loops, the pending-order worker and other background services in a dedicated
+process, while gunicorn web workers stay request-only and forward strategy start/stop over IPC:
+
+    GUNICORN_SPAWN_ENGINE=false gunicorn -c gunicorn_config.py "run:app"
+    python run_engine.py
+
+(gunicorn_config.py always runs its workers as ENGINE_ROLE=web and, unless GUNICORN_SPAWN_ENGINE=false,
+starts `run_engine.py --supervise` itself.) To spread running strategies over several engine processes
+(see ENGINE_SHARDS in env.example):
+
+    ENGINE_SHARDS=4 GUNICORN_SPAWN_ENGINE=false gunicorn -c gunicorn_config.py "run:app"
+    python run_engine.py --shards 4
+
+--shards N starts N engine processes and restarts any that exit; --supervise does the same with
+N = ENGINE_SHARDS (from the environment or .env, default 1).
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+os.environ["ENGINE_ROLE"] = "engine"
+
+
+def run_engine():
+    # Importing run loads .env / proxy settings and builds the app, which joins the engine election.
+    from run import app  # noqa: F401
+
+    # Exit through SystemExit on SIGTERM so atexit hooks run (an engine shard hands its strategies over at once).
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print("QuantDinger engine started (background services only)")
+    while True:
+        time.sleep(3600)
+
+
+def _env_shards() -> int:
+    try:
+        from dotenv import load_dotenv
+        this_dir = os.path.dirname(os.path.abspath(__file__))
+        load_dotenv(os.path.join(this_dir, ".env"), override=False)
+        load_dotenv(os.path.join(os.path.dirname(this_dir), ".env"), override=False)
+    except Exception:
+        pass
+    try:
+        return max(int(os.getenv("ENGINE_SHARDS") or 1), 1)
+    except ValueError:
+        return 1
+
+
+def supervise(shards: int):
+    os.environ["ENGINE_SHARDS"] = str(shards)
+    cmd = [sys.executable, os.path.abspath(__file__)]
+    children = {}
+    print(f"QuantDinger engine supervisor started ({shards} shards)")
+    try:
+        while True:
+            for slot in range(shards):
+                proc = children.get(slot)
+                if proc is not None and proc.poll() is None:
+                    continue
+                if proc is not None:
+                    print(f"Engine shard process {proc.pid} exited with {proc.returncode}; restarting")
+                children[slot] = subprocess.Popen(cmd, env=os.environ.copy())
+            time.sleep(2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in children.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in children.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QuantDinger background engine")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="start N engine shard processes under a supervisor (sets ENGINE_SHARDS)")
+    parser.add_argument("--supervise", action="store_true",
+                        help="run under the supervisor with ENGINE_SHARDS processes (used by gunicorn_config.py)")
+    args = parser.parse_args()
+    if args.shards > 1:
+        supervise(args.shards)
+    elif args.supervise:
+        supervise(_env_shards())
+    else:
+        run_engine()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Offline benchmark for the market-data ingestion pipeline.
+
+Pipeline under test:
+    ReplayTransport -> MarketDataHub -> StrategyScheduler.wake -> TradingExecutor price-only evaluation
+
+- Generates (or reads) a replay file of ticks for a few symbols
+- Starts N indicator strategies on synthetic K-lines (no network, isolated SQLite DB)
+- Replays the ticks and reports ingestion throughput and tick -> trigger-evaluation latency
+
+Usage:
+    python scripts/benchmark_market_stream.py --strategies 200 --symbols 5 --ticks 20000 --speed 0
+    python scripts/benchmark_market_stream.py --replay-file ticks.csv --speed 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Isolated runtime: never touch the real DB / network.
+os.environ.setdefault("SQLITE_DATABASE_FILE", os.path.join(tempfile.mkdtemp(prefix="qd_bench_"), "bench.db"))
+os.environ["MARKET_STREAM_TRANSPORT"] = "off"
+os.environ.setdefault("STRATEGY_TICK_INTERVAL_SEC", "10")
+os.environ.setdefault("PRICE_FEED_POLL_SEC", "3600")
+
+
+def _ensure_backend_on_syspath() -> None:
+    backend_root = Path(__file__).resolve().parents[1]
+    p = str(backend_root)
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+
+_ensure_backend_on_syspath()
+
+from app.services.market_stream import MarketDataHub, ReplayTransport  # noqa: E402
+from app.services.trading_executor import TradingExecutor  # noqa: E402
+from app.utils.db import get_db_connection  # noqa: E402
+
+INDICATOR_CODE = """
+fast = df['close'].rolling(5).mean()
+slow = df['close'].rolling(20).mean()
+df['buy'] = (fast > slow) & (fast.shift(1) <= slow.shift(1))
+df['sell'] = (fast < slow) & (fast.shift(1) >= slow.shift(1))
+output = {'name': 'bench_sma', 'plots': [], 'signals': []}
+"""
+
+
+def _make_klines(base: float, n: int = 300) -> List[Dict[str, Any]]:
+    now = int(time.time())
+    klines, price = [], base
+    for i in range(n):
+        price *= 1 + random.uniform(-0.003, 0.003)
+        klines.append({"time": now - (n - i) * 60, "open": price, "high": price * 1.001,
+                       "low": price * 0.999, "close": price, "volume": 1.0})
+    return klines
+
+
+def _write_replay_file(path: str, symbols: List[str], ticks: int, base_prices: Dict[str, float]) -> None:
+    ts = time.time()
+    prices = dict(base_prices)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ts,symbol,price\n")
+        for i in range(ticks):
+            sym = symbols[i % len(symbols)]
+            prices[sym] *= 1 + random.uniform(-0.0005, 0.0005)
+            ts += 0.01
+            f.write(f"{ts:.3f},{sym},{prices[sym]:.6f}\n")
+
+
+def _insert_strategy(symbol: str) -> int:
+    now = int(time.time())
+    trading_config = {
+        "symbol": symbol, "initial_capital": 1000.0, "leverage": 5, "trade_direction": "both",
+        "timeframe": "1m", "market_type": "swap", "stop_loss_pct": 0.02, "entry_pct": 1.0,
+    }
+    indicator_config = {"indicator_id": 0, "indicator_name": "bench", "indicator_code": INDICATOR_CODE}
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            """
+            INSERT INTO qd_strategies_trading
+            (strategy_name, strategy_type, market_category, execution_mode, notification_config,
+             status, symbol, timeframe, initial_capital, leverage, market_type,
+             exchange_config, indicator_config, trading_config, ai_model_config, decide_interval,
+             created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            ("BENCH", "IndicatorStrategy", "Crypto", "signal", "{}", "running", symbol, "1m", 1000.0, 5, "swap",
+             "{}", json.dumps(indicator_config), json.dumps(trading_config), "{}", 300, now, now),
+        )
+        sid = int(cur.lastrowid)
+        db.commit()
+        cur.close()
+    return sid
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--strategies", type=int, default=100)
+    ap.add_argument("--symbols", type=int, default=5)
+    ap.add_argument("--ticks", type=int, default=10000)
+    ap.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace, 0 = as fast as possible")
+    ap.add_argument("--replay-file", default="")
+    args = ap.parse_args()
+
+    symbols = [f"SYM{i}/USDT" for i in range(args.symbols)]
+    base_prices = {s: 100.0 * (i + 1) for i, s in enumerate(symbols)}
+    klines = {s: _make_klines(base_prices[s]) for s in symbols}
+
+    replay_file = args.replay_file
+    if not replay_file:
+        replay_file = os.path.join(tempfile.mkdtemp(prefix="qd_replay_"), "ticks.csv")
+        _write_replay_file(replay_file, symbols, args.ticks, base_prices)
+
+    ex = TradingExecutor()
+    ex._console_print = lambda _msg: None  # type: ignore[assignment]
+    ex._fetch_latest_kline = lambda symbol, _tf, limit=500: klines.get(symbol, [])  # type: ignore[assignment]
+
+    transport = ReplayTransport(replay_file, speed=args.speed)
+    hub = MarketDataHub([transport])
+    ex.market_stream = hub
+
+    # tick -> evaluation latency: time between the hub receiving a symbol's latest tick and a
+    # strategy on that symbol starting a price-only evaluation.
+    latencies: List[float] = []
+    lat_lock = threading.Lock()
+    orig_tick = ex._strategy_tick
+
+    def timed_tick(strategy_id, runtime, price_only=False):
+        if price_only:
+            st = hub.get_state(runtime["symbol"])
+            if st:
+                with lat_lock:
+                    latencies.append(time.time() - st["recvTs"])
+        return orig_tick(strategy_id, runtime, price_only=price_only)
+
+    ex._strategy_tick = timed_tick  # type: ignore[assignment]
+
+    # Seed the shared price cache so the first full tick does not go to the network.
+    for sym in symbols:
+        ex.price_feed.update(sym, klines[sym][-1]["close"])
+
+    ids = [_insert_strategy(symbols[i % len(symbols)]) for i in range(args.strategies)]
+    for sid in ids:
+        ex.start_strategy(sid)
+    deadline = time.time() + 120
+    while time.time() < deadline and not all(ex.running_strategies.get(s, {}).get("initialized") for s in ids):
+        time.sleep(0.1)
+    print(f"{len(ids)} strategies initialized on {len(symbols)} symbols; replaying {replay_file}")
+
+    t0 = time.time()
+    hub.start()
+    transport.done.wait()
+    ingest_sec = time.time() - t0
+    time.sleep(1.0)
+
+    sched = ex.scheduler.stats()
+    print(f"ingested {transport.replayed} ticks in {ingest_sec:.2f}s ({transport.replayed / max(ingest_sec, 1e-9):.0f} ticks/s)")
+    print(f"price-only evaluations: {len(latencies)}  "
+          f"latency p50={_pct(latencies, 0.5) * 1000:.1f}ms p95={_pct(latencies, 0.95) * 1000:.1f}ms "
+          f"p99={_pct(latencies, 0.99) * 1000:.1f}ms max={max(latencies or [0]) * 1000:.1f}ms")
+    print(f"scheduler: {sched}")
+
+    for sid in ids:
+        ex.stop_strategy(sid)
+    hub.stop()
+
+
+if __name__ == "__main__":
+    main()